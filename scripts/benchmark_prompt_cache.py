@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+scripts/benchmark_prompt_cache.py
+Benchmark do reaproveitamento de cache de prompt (prefixo estático) do Ollama
+
+Sobe um servidor local que imita o /api/generate do Ollama com cache KV de
+prefixo (como o runner llama.cpp: só os tokens após o maior prefixo comum com
+o prompt anterior são processados) e mede o tempo até o primeiro token (TTFT)
+dos prompts do NCMAgent em dois layouts:
+
+- legado: dados do produto antes dos blocos de contexto
+- prefixo estático: system + instruções primeiro, produto por último
+
+Uso:
+    python scripts/benchmark_prompt_cache.py [--produtos 20] [--ms-por-token 2.0]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+# Adicionar o diretório src ao path
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from llm.ollama_client import OllamaClient
+from agents.ncm_agent import NCMAgent
+
+
+class StandInOllamaHandler(BaseHTTPRequestHandler):
+    """Imita o /api/generate do Ollama com um único slot de cache KV."""
+
+    ms_por_token = 2.0
+    tempo_carga_modelo = 0.5
+    cache_tokens = None  # None = modelo descarregado
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        tokens = f"{payload.get('system', '')}\n{payload.get('prompt', '')}".split()
+        cls = StandInOllamaHandler
+
+        atraso = 0.0
+        if cls.cache_tokens is None:
+            atraso += cls.tempo_carga_modelo
+            cls.cache_tokens = []
+
+        comum = 0
+        for a, b in zip(cls.cache_tokens, tokens):
+            if a != b:
+                break
+            comum += 1
+        atraso += (len(tokens) - comum) * cls.ms_por_token / 1000
+        time.sleep(atraso)
+
+        cls.cache_tokens = tokens
+        if str(payload.get("keep_alive", "5m")) in ("0", "0s"):
+            cls.cache_tokens = None
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        primeiro = {"model": payload.get("model"), "response": "{", "done": False}
+        final = {"model": payload.get("model"), "response": "}", "done": True,
+                 "prompt_eval_count": len(tokens) - comum}
+        self.wfile.write((json.dumps(primeiro) + "\n").encode())
+        self.wfile.flush()
+        self.wfile.write((json.dumps(final) + "\n").encode())
+
+
+class PromptRecorder:
+    """Cliente LLM falso que apenas registra os prompts montados pelo agente."""
+
+    def __init__(self):
+        self.chamadas = []
+
+    def generate(self, prompt, system=None, **kwargs):
+        self.chamadas.append((system, prompt))
+        return {"response": "{}"}
+
+
+def gerar_prompts(total: int):
+    """Monta os prompts reais do NCMAgent para produtos sintéticos."""
+    recorder = PromptRecorder()
+    agent = NCMAgent(recorder, config=None)
+
+    for i in range(total):
+        produto = {
+            "produto_original": f"PRODUTO TESTE {i} 500MG CX {i % 7 + 1} UN",
+            "descricao_expandida": f"Produto sintético número {i} para benchmark de cache de prompt",
+            "expansion_data": {"categoria_principal": "Medicamento", "palavras_chave_fiscais": ["teste", str(i)]},
+        }
+        semantic = [
+            {"text": f"Exemplo similar {i}-{j} classificado anteriormente", "metadata": {"ncm": "30049069"}, "score": 0.9 - j / 10}
+            for j in range(3)
+        ]
+        agent.run(produto, {
+            "structured_context": "Nenhum contexto estruturado específico disponível.",
+            "semantic_context": semantic,
+        })
+
+    return recorder.chamadas
+
+
+def layout_legado(prompt: str) -> str:
+    """Reconstrói o layout antigo movendo o bloco do produto para o início."""
+    marcador = "**Produto para Classificar:**"
+    inicio = prompt.index(marcador)
+    produto = prompt[inicio:].strip()
+    return f"\n{produto}\n\n{prompt[:inicio].strip()}\n"
+
+
+def medir_ttft(client: OllamaClient, system: str, prompt: str) -> float:
+    """Mede o tempo até o primeiro token usando a API em streaming."""
+    payload = client._build_payload({"prompt": prompt, "stream": True, "temperature": 0.1})
+    payload["system"] = system
+    inicio = time.perf_counter()
+    with client.session.post(f"{client.base_url}/api/generate", json=payload, stream=True, timeout=120) as response:
+        for _ in response.iter_lines():
+            return time.perf_counter() - inicio
+    return time.perf_counter() - inicio
+
+
+def executar_cenario(client: OllamaClient, chamadas, transformar, warm_up: bool = False):
+    StandInOllamaHandler.cache_tokens = None  # modelo descarregado no início
+    if warm_up:
+        system, prompt = chamadas[0]
+        prefixo = prompt[:prompt.index("**Contexto Semântico")]
+        client.warm_up(system, prefixo)
+    return [medir_ttft(client, system, transformar(prompt)) * 1000 for system, prompt in chamadas]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de TTFT com prefixo estático de prompt")
+    parser.add_argument("--produtos", type=int, default=20)
+    parser.add_argument("--ms-por-token", type=float, default=2.0)
+    args = parser.parse_args()
+
+    StandInOllamaHandler.ms_por_token = args.ms_por_token
+    server = HTTPServer(("127.0.0.1", 0), StandInOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OllamaClient(f"http://127.0.0.1:{server.server_port}", "stand-in", keep_alive="30m")
+
+    chamadas = gerar_prompts(args.produtos)
+    cenarios = [
+        ("Layout legado (produto primeiro)", executar_cenario(client, chamadas, layout_legado)),
+        ("Prefixo estático", executar_cenario(client, chamadas, lambda p: p)),
+        ("Prefixo estático + warm_up", executar_cenario(client, chamadas, lambda p: p, warm_up=True)),
+    ]
+    server.shutdown()
+
+    print(f"\n📊 TTFT do NCMAgent em {args.produtos} produtos ({args.ms_por_token} ms/token de prompt)")
+    print(f"{'Cenário':<36}{'1ª req (ms)':>12}{'p50 (ms)':>10}{'média (ms)':>12}")
+    base = statistics.mean(cenarios[0][1])
+    for nome, tempos in cenarios:
+        media = statistics.mean(tempos)
+        reducao = f"  (-{(1 - media / base) * 100:.0f}% vs legado)" if media < base else ""
+        print(f"{nome:<36}{tempos[0]:>12.1f}{statistics.median(tempos):>10.1f}{media:>12.1f}{reducao}")
+
+
+if __name__ == "__main__":
+    main()
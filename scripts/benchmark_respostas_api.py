@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+scripts/benchmark_respostas_api.py
+Benchmark da serialização das respostas das listagens da API unificada
+
+Cria um banco unificado temporário com N classificações e mede a latência
+(p50/p99) das listagens em duas formas, pelo TestClient (sem rede):
+
+- antes: dicts devolvidos ao FastAPI (response_model + jsonable_encoder +
+  json.dumps do JSONResponse), como as rotas eram servidas
+- depois: RespostaJSONRapida devolvida diretamente (orjson, sem revalidação)
+
+Uso:
+    python scripts/benchmark_respostas_api.py [--itens 1000] [--requisicoes 200]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+# Adicionar o diretório src ao path
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+
+def _popular(service, itens: int):
+    from sqlalchemy import text
+    with service.engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO classificacoes_revisao (produto_id, descricao_produto, codigo_produto, ncm_sugerido, "
+            "cest_sugerido, confianca_sugerida, justificativa_sistema, status_revisao, data_criacao) "
+            "VALUES (:p, :d, :c, '30049069', '1300100', 0.87, :j, 'PENDENTE_REVISAO', :dt)"
+        ), [{"p": i, "d": f"DIPIRONA SODICA 500MG COMPRIMIDO CAIXA {i}", "c": f"SKU{i:06d}",
+             "j": "Medicamento para uso humano, dosado, acondicionado para venda a retalho",
+             "dt": f"2024-01-{1 + i % 28:02d} 10:{i % 60:02d}:00"} for i in range(1, itens + 1)])
+
+
+def _medir(client, url: str, requisicoes: int) -> dict:
+    for _ in range(5):
+        client.get(url)
+    tempos: List[float] = []
+    tamanho = 0
+    for _ in range(requisicoes):
+        inicio = time.perf_counter()
+        resposta = client.get(url)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+        assert resposta.status_code == 200, (url, resposta.status_code, resposta.text[:200])
+        tamanho = len(resposta.content)
+    tempos.sort()
+    return {
+        "p50": statistics.median(tempos),
+        "p99": tempos[min(len(tempos) - 1, int(len(tempos) * 0.99))],
+        "kb": tamanho / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da serialização das listagens da API")
+    parser.add_argument("--itens", type=int, default=1000, help="Itens por página")
+    parser.add_argument("--requisicoes", type=int, default=200, help="Requisições por cenário")
+    args = parser.parse_args()
+
+    # A API abre data/unified_rag_system.db relativo ao diretório atual
+    pasta = tempfile.mkdtemp(prefix="bench_api_")
+    os.chdir(pasta)
+    os.makedirs("data")
+    os.environ["BATCH_JOB_WORKERS"] = "0"
+
+    from fastapi import Query
+    from fastapi.responses import JSONResponse
+    from fastapi.testclient import TestClient
+    import api.api_unified as api
+    from api.respostas_json import ORJSON_AVAILABLE
+
+    _popular(api.unified_service, args.itens)
+
+    # Rotas "antes": mesmo serviço, serialização padrão do FastAPI
+    @api.app.get("/bench/antes/produtos", response_class=JSONResponse)
+    async def produtos_antes(limit: int = Query(50)):
+        pagina = api.unified_service.pagina_classificacoes(limite=limit, incluir_total=True)
+        return {"produtos": pagina["itens"], "pagination": {"total": pagina["total"]}}
+
+    @api.app.get("/bench/antes/pendentes", response_model=List[api.ClassificacaoResponse],
+                 response_class=JSONResponse)
+    async def pendentes_antes(limite: int = Query(50)):
+        return api.unified_service.pagina_classificacoes("PENDENTE_REVISAO", limite)["itens"]
+
+    n = args.itens
+    cenarios = [
+        ("produtos", f"/bench/antes/produtos?limit={n}", f"/api/v1/produtos?limit={n}"),
+        ("pendentes", f"/bench/antes/pendentes?limite={n}", f"/api/v1/classificacoes/pendentes?limite={n}"),
+        ("pendentes fields=", f"/bench/antes/pendentes?limite={n}",
+         f"/api/v1/classificacoes/pendentes?limite={n}&fields=id,produto_id,ncm_sugerido,status_revisao"),
+    ]
+
+    print(f"📊 {n} itens por página, {args.requisicoes} requisições por cenário "
+          f"(orjson {'disponível' if ORJSON_AVAILABLE else 'indisponível: fallback json'})\n")
+    print(f"{'cenário':<20} {'antes p50':>10} {'antes p99':>10} {'depois p50':>11} {'depois p99':>11} "
+          f"{'ganho p50':>10} {'KB':>8}")
+    with TestClient(api.app) as client:
+        for nome, url_antes, url_depois in cenarios:
+            antes = _medir(client, url_antes, args.requisicoes)
+            depois = _medir(client, url_depois, args.requisicoes)
+            print(f"{nome:<20} {antes['p50']:>8.2f}ms {antes['p99']:>8.2f}ms {depois['p50']:>9.2f}ms "
+                  f"{depois['p99']:>9.2f}ms {antes['p50'] / depois['p50']:>9.2f}x {depois['kb']:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,18 @@ Este script migra todas as fontes de dados (JSON/CSV) para um banco SQLite únic
 Substitui o antigo ncm_mapping.json por consultas SQL eficientes.
 """
 
+import argparse
 import json
+import os
+import time
+import numpy as np
 import pandas as pd
 import sys
+from bisect import bisect_left
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Iterable, Callable, List, Tuple
 import logging
 from datetime import datetime
 
@@ -26,28 +33,361 @@ from database.knowledge_models import (
     ProdutoExemplo, KnowledgeBaseMetadata, create_performance_indexes
 )
 from services.knowledge_base_service import KnowledgeBaseService
-from sqlalchemy import and_
+from database.sqlite_connection import conectar_sqlite, PERFIL_LEITURA
+from sqlalchemy import and_, create_engine, event, text
+from sqlalchemy.schema import CreateTable
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# ============================================================================
+# TRANSFORMAÇÕES VETORIZADAS DO MODO BULK
+# ============================================================================
+
+# Níveis válidos da estrutura NCM, do mais específico para o mais genérico
+NIVEIS_PAI_NCM = (6, 4, 2)
+
+# Palavras-chave -> categoria, na mesma precedência de _extract_product_category
+CATEGORIAS_CEST = (
+    (("medicamento",), "MEDICAMENTOS"),
+    (("alimento", "bebida"), "ALIMENTOS_BEBIDAS"),
+    (("combustível",), "COMBUSTIVEIS"),
+    (("construção", "material"), "MATERIAIS_CONSTRUCAO"),
+)
+
+FONTES_UTILIZADAS = [
+    "descricoes_ncm.json",
+    "CEST_RO.json",
+    "Anexos_conv_92_15_corrigido.json",
+    "produtos_selecionados.json"
+]
+
+
+def _texto(serie: pd.Series) -> pd.Series:
+    """Converte uma coluna para texto sem espaços nas pontas ('' para nulos)."""
+    return serie.fillna("").astype(str).str.strip()
+
+
+def _normalizar_ncms(serie: pd.Series) -> pd.Series:
+    """Versão vetorizada de SQLiteKnowledgeBaseBuilder._normalize_ncm."""
+    return serie.str.replace(".", "", regex=False).str.replace(" ", "", regex=False).str.strip()
+
+
+def _coluna_com_alternativa(df: pd.DataFrame, principal: str, alternativa: str) -> pd.Series:
+    """Equivalente a item.get(principal, "") or item.get(alternativa, "")."""
+    valores = df[principal] if principal in df.columns else pd.Series("", index=df.index, dtype=object)
+    if alternativa in df.columns:
+        vazios = valores.map(lambda v: v is None or (isinstance(v, str) and v == ""))
+        valores = valores.where(~vazios, df[alternativa])
+    return valores
+
+
+def preparar_ncms(ncm_data: list) -> pd.DataFrame:
+    """
+    Normaliza as descrições NCM: código sem pontuação, nível pelo tamanho do
+    código e pai no maior nível válido (2, 4 ou 6) abaixo dele.
+    """
+    colunas = ["codigo_ncm", "descricao_oficial", "descricao_curta", "nivel_hierarquico", "codigo_pai"]
+    df = pd.DataFrame(ncm_data or [])
+    if df.empty or "Código" not in df.columns:
+        return pd.DataFrame(columns=colunas)
+    
+    descricao = df["Descricao_Completa"] if "Descricao_Completa" in df.columns else pd.Series("", index=df.index)
+    ncms = pd.DataFrame({
+        "codigo_ncm": _normalizar_ncms(_texto(df["Código"])),
+        "descricao_oficial": _texto(descricao),
+    })
+    ncms = ncms[ncms["codigo_ncm"] != ""].drop_duplicates("codigo_ncm", keep="first")
+    
+    ncms["descricao_curta"] = ncms["descricao_oficial"].str[:200]
+    ncms["nivel_hierarquico"] = ncms["codigo_ncm"].str.len()
+    tamanho_pai = np.select(
+        [ncms["nivel_hierarquico"] > nivel for nivel in NIVEIS_PAI_NCM], NIVEIS_PAI_NCM, 0
+    )
+    ncms["codigo_pai"] = [
+        codigo[:tamanho] if tamanho else None
+        for codigo, tamanho in zip(ncms["codigo_ncm"], tamanho_pai)
+    ]
+    return ncms[colunas].reset_index(drop=True)
+
+
+def _categorizar_cests(descricoes: pd.Series) -> np.ndarray:
+    minusculas = descricoes.str.lower()
+    condicoes = [
+        np.logical_or.reduce([minusculas.str.contains(chave, regex=False).to_numpy() for chave in chaves])
+        for chaves, _ in CATEGORIAS_CEST
+    ]
+    return np.select(condicoes, [categoria for _, categoria in CATEGORIAS_CEST], "GERAL")
+
+
+def preparar_cests(cest_data: pd.DataFrame) -> pd.DataFrame:
+    """CESTs únicos (primeira ocorrência) com descrição e categoria do produto."""
+    colunas = ["codigo_cest", "descricao_cest", "categoria_produto"]
+    if cest_data is None or cest_data.empty or "CEST" not in cest_data.columns:
+        return pd.DataFrame(columns=colunas)
+    
+    cests = pd.DataFrame({
+        "codigo_cest": cest_data["CEST"].astype(str).str.strip(),
+        "descricao_cest": _texto(_coluna_com_alternativa(cest_data, "DESCRICAO", "DESCRIÇÃO")),
+    })
+    cests = cests[(cests["codigo_cest"] != "") & (cests["codigo_cest"] != "nan")]
+    cests = cests.drop_duplicates("codigo_cest", keep="first")
+    cests["categoria_produto"] = _categorizar_cests(cests["descricao_cest"])
+    return cests[colunas].reset_index(drop=True)
+
+
+def preparar_pares_ncm_cest(cest_data: pd.DataFrame) -> pd.DataFrame:
+    """Pares (NCM normalizado, CEST) únicos das tabelas CEST, ainda sem resolver o NCM."""
+    colunas = ["ncm_normalizado", "cest_codigo"]
+    if cest_data is None or cest_data.empty or "CEST" not in cest_data.columns:
+        return pd.DataFrame(columns=colunas)
+    
+    ncm_input = _coluna_com_alternativa(cest_data, "NCM_SH", "NCM/SH").astype(str).str.strip()
+    pares = pd.DataFrame({
+        "ncm_normalizado": _normalizar_ncms(ncm_input),
+        "cest_codigo": cest_data["CEST"].astype(str).str.strip(),
+    })
+    pares = pares[(ncm_input != "") & (pares["cest_codigo"] != "")]
+    return pares.drop_duplicates().reset_index(drop=True)
+
+
+def preparar_exemplos(produtos: pd.DataFrame) -> pd.DataFrame:
+    """Produtos com NCM e GTIN preenchidos, ainda sem resolver o NCM."""
+    colunas = ["ncm_normalizado", "gtin", "descricao_produto"]
+    if produtos is None or produtos.empty or not {"ncm", "gtin"} <= set(produtos.columns):
+        return pd.DataFrame(columns=colunas)
+    
+    descricao = produtos["descricao"] if "descricao" in produtos.columns else pd.Series("", index=produtos.index)
+    exemplos = pd.DataFrame({
+        "ncm_normalizado": _normalizar_ncms(_texto(produtos["ncm"])),
+        "gtin": _texto(produtos["gtin"]),
+        "descricao_produto": _texto(descricao),
+    })
+    exemplos = exemplos[(exemplos["ncm_normalizado"] != "") & (exemplos["gtin"] != "")]
+    return exemplos[colunas].reset_index(drop=True)
+
+
+class NCMMatcher:
+    """
+    Resolve códigos NCM de entrada para NCMs existentes na hierarquia, com as
+    mesmas regras de _find_best_ncm_match: correspondência exata, NCM mais
+    específico que começa com o código ou o prefixo existente mais longo.
+    """
+    
+    def __init__(self, codigos: Iterable[str]):
+        self._codigos = set(codigos)
+        self._ordenados = sorted(self._codigos)
+    
+    def melhor(self, ncm: str) -> Optional[str]:
+        if not ncm:
+            return None
+        if ncm in self._codigos:
+            return ncm
+        
+        # Primeiro NCM (em ordem) que começa com o código de entrada
+        posicao = bisect_left(self._ordenados, ncm)
+        if posicao < len(self._ordenados) and self._ordenados[posicao].startswith(ncm):
+            return self._ordenados[posicao]
+        
+        for tamanho in range(len(ncm) - 1, 1, -1):
+            if ncm[:tamanho] in self._codigos:
+                return ncm[:tamanho]
+        return None
+    
+    def resolver(self, ncms: pd.Series) -> pd.Series:
+        """Resolve cada código distinto uma única vez e mapeia o resultado."""
+        resolvidos = {ncm: self.melhor(ncm) for ncm in ncms.unique()}
+        return ncms.map(resolvidos)
+
+
+def resolver_mapeamentos(pares: pd.DataFrame, matcher: NCMMatcher, cests: Iterable[str]) -> pd.DataFrame:
+    """Mapeamentos DIRETO para os NCMs resolvidos e CESTs existentes."""
+    mapeamentos = pares.assign(ncm_codigo=matcher.resolver(pares["ncm_normalizado"]))
+    mapeamentos = mapeamentos[
+        mapeamentos["ncm_codigo"].notna() & mapeamentos["cest_codigo"].isin(set(cests))
+    ]
+    mapeamentos = mapeamentos.drop_duplicates(["ncm_codigo", "cest_codigo"], keep="first")
+    return pd.DataFrame({
+        "ncm_codigo": mapeamentos["ncm_codigo"],
+        "cest_codigo": mapeamentos["cest_codigo"],
+        "tipo_relacao": "DIRETO",
+        "confianca_mapeamento": 1.0,
+        "fonte_dados": "CEST_RO",
+    }).reset_index(drop=True)
+
+
+def resolver_exemplos(exemplos: pd.DataFrame, matcher: NCMMatcher) -> pd.DataFrame:
+    """Produtos exemplo com NCM resolvido, um por GTIN (primeira ocorrência)."""
+    exemplos = exemplos.assign(ncm_codigo=matcher.resolver(exemplos["ncm_normalizado"]))
+    exemplos = exemplos[exemplos["ncm_codigo"].notna()].drop_duplicates("gtin", keep="first")
+    return pd.DataFrame({
+        "ncm_codigo": exemplos["ncm_codigo"],
+        "gtin": exemplos["gtin"],
+        "descricao_produto": exemplos["descricao_produto"],
+        "fonte_dados": "PRODUTOS_SELECIONADOS",
+        "qualidade_classificacao": 0.8,
+    }).reset_index(drop=True)
+
+
+def calcular_heranca(ncms: pd.DataFrame, mapeamentos: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mapeamentos HERDADO para NCMs sem CEST, a partir dos mapeamentos DIRETO
+    do ancestral mais próximo que os possui (mesma regra de _find_parent_cests).
+    """
+    colunas = ["ncm_codigo", "cest_codigo", "tipo_relacao", "confianca_mapeamento", "fonte_dados"]
+    diretos: Dict[str, list] = {}
+    for ncm, cest, confianca, fonte in mapeamentos.loc[
+        mapeamentos["tipo_relacao"] == "DIRETO",
+        ["ncm_codigo", "cest_codigo", "confianca_mapeamento", "fonte_dados"]
+    ].itertuples(index=False):
+        diretos.setdefault(ncm, []).append((cest, confianca, fonte))
+    
+    com_mapeamento = set(mapeamentos["ncm_codigo"])
+    sem_cest = ncms.loc[~ncms["codigo_ncm"].isin(com_mapeamento)].sort_values(
+        "nivel_hierarquico", ascending=False, kind="stable"
+    )
+    
+    linhas = []
+    for codigo in sem_cest["codigo_ncm"]:
+        for tamanho in range(len(codigo) - 1, 1, -1):
+            herdados = diretos.get(codigo[:tamanho])
+            if herdados:
+                linhas.extend(
+                    (codigo, cest, "HERDADO", confianca * 0.8, f"HERANCA_{fonte}")
+                    for cest, confianca, fonte in herdados
+                )
+                break
+    return pd.DataFrame(linhas, columns=colunas)
+
+
+def _registros(df: pd.DataFrame) -> list:
+    """Linhas do DataFrame como dicts de tipos Python nativos (None para nulos)."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+# ============================================================================
+# PIPELINE EM ESTÁGIOS
+# ============================================================================
+
+# Estágios de leitura/transformação: cada um carrega sua própria fonte com um
+# DataLoader criado no processo do pool, sem estado compartilhado.
+
+def estagio_ncms(fabrica_loader: Callable) -> pd.DataFrame:
+    return preparar_ncms(fabrica_loader().load_ncm_descriptions())
+
+
+def estagio_cests(fabrica_loader: Callable) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    cest_data = fabrica_loader().load_cest_mapping()
+    return preparar_cests(cest_data), preparar_pares_ncm_cest(cest_data)
+
+
+def estagio_produtos(fabrica_loader: Callable) -> pd.DataFrame:
+    return preparar_exemplos(fabrica_loader().load_produtos_selecionados())
+
+
+def estagio_mapeamentos(ncms: pd.DataFrame, pares: pd.DataFrame,
+                        codigos_cest: pd.Series) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    mapeamentos = resolver_mapeamentos(pares, NCMMatcher(ncms["codigo_ncm"]), codigos_cest)
+    return mapeamentos, calcular_heranca(ncms, mapeamentos)
+
+
+def estagio_exemplos(codigos_ncm: pd.Series, exemplos: pd.DataFrame) -> pd.DataFrame:
+    return resolver_exemplos(exemplos, NCMMatcher(codigos_ncm))
+
+
+def _cronometrar(funcao: Callable, *args) -> Tuple[Any, float]:
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def _contar_linhas(resultado) -> int:
+    if isinstance(resultado, tuple):
+        return sum(_contar_linhas(parte) for parte in resultado)
+    return len(resultado) if isinstance(resultado, pd.DataFrame) else 0
+
+
+class PipelineEstagios:
+    """
+    Executa estágios de transformação em um pool de processos (ou no processo
+    principal com max_workers <= 1) e registra o tempo de cada estágio.
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers if max_workers is not None else min(4, os.cpu_count() or 1)
+        self.tempos: List[Tuple[str, str, float, int]] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._futuros: Dict[str, Future] = {}
+        self._inicio = time.perf_counter()
+    
+    def __enter__(self):
+        if self.max_workers > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self
+    
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        return False
+    
+    def submeter(self, nome: str, funcao: Callable, *args):
+        """Agenda um estágio; o resultado é obtido com resultado(nome)."""
+        if self._pool is not None:
+            self._futuros[nome] = self._pool.submit(_cronometrar, funcao, *args)
+            return
+        
+        futuro = Future()
+        try:
+            futuro.set_result(_cronometrar(funcao, *args))
+        except Exception as e:
+            futuro.set_exception(e)
+        self._futuros[nome] = futuro
+    
+    def resultado(self, nome: str):
+        resultado, segundos = self._futuros.pop(nome).result()
+        execucao = "pool" if self._pool is not None else "principal"
+        self.tempos.append((nome, execucao, segundos, _contar_linhas(resultado)))
+        return resultado
+    
+    @contextmanager
+    def medir(self, nome: str):
+        """Cronometra um estágio serial executado no processo principal."""
+        inicio = time.perf_counter()
+        yield
+        self.tempos.append((nome, "principal", time.perf_counter() - inicio, 0))
+    
+    def tabela(self) -> List[str]:
+        """Linhas da tabela de tempos por estágio, com o tempo total de parede."""
+        linhas = [f"{'Estágio':<16} {'Execução':<10} {'Tempo (s)':>10} {'Linhas':>10}"]
+        for nome, execucao, segundos, total in self.tempos:
+            total_linhas = f"{total:,}" if total else ""
+            linhas.append(f"{nome:<16} {execucao:<10} {segundos:>10.2f} {total_linhas:>10}")
+        linhas.append(f"{'total (parede)':<16} {'':<10} {time.perf_counter() - self._inicio:>10.2f}")
+        return linhas
+
+
 class SQLiteKnowledgeBaseBuilder:
     """
     Construtor da Base de Conhecimento SQLite Unificada
     Migra todos os dados de JSON/CSV para SQLite com estrutura otimizada
     """
     
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None):
         self.config = Config()
         self.data_loader = DataLoader()
         
+        # Modo bulk: cada estágio cria seu DataLoader no processo do pool
+        self.data_loader_factory = DataLoader
+        self.max_workers = max_workers
+        
         # Garantir que os diretórios existam
         knowledge_dir = Path("data/knowledge_base")
         knowledge_dir.mkdir(parents=True, exist_ok=True)
         
-        # Inicializar serviço da base de conhecimento
-        self.kb_service = KnowledgeBaseService()
+        # Inicializar serviço da base de conhecimento (a base ainda será reconstruída)
+        self.kb_service = KnowledgeBaseService(carregar_grafo=False)
         
         # Contadores para estatísticas
         self.stats = {
@@ -86,10 +426,13 @@ class SQLiteKnowledgeBaseBuilder:
             # 7. Criar metadados
             self._create_metadata()
             
-            # 8. Verificar integridade
+            # 8. Gerar snapshot binário do grafo fiscal
+            self._build_snapshot()
+            
+            # 9. Verificar integridade
             self._verify_integrity()
             
-            # 9. Estatísticas finais
+            # 10. Estatísticas finais
             self._print_final_statistics()
             
             logger.info("🎉 Base de conhecimento SQLite construída com sucesso!")
@@ -99,6 +442,168 @@ class SQLiteKnowledgeBaseBuilder:
             logger.error(f"❌ Erro na construção da base: {e}")
             return False
     
+    def build_sqlite_knowledge_base_bulk(self) -> bool:
+        """
+        Reconstrói a base em modo bulk, como pipeline em estágios: leitura e
+        transformação vetorizada das fontes em um pool de processos, seguida
+        da escrita serializada em um banco temporário sem journal (índices
+        criados após a carga) e troca atômica pelo arquivo final.
+        """
+        logger.info("🚀 Iniciando construção bulk da Base de Conhecimento SQLite")
+        destino = self.kb_service.db_path
+        temporario = destino.with_name(destino.name + ".building")
+        
+        try:
+            if temporario.exists():
+                temporario.unlink()
+            
+            with PipelineEstagios(self.max_workers) as pipeline:
+                # 1-6. Carregar fontes e transformar em paralelo
+                tabelas = self._transformar_fontes(pipeline)
+            
+            # 7. Carga em lote no banco temporário (único estágio de escrita)
+            with pipeline.medir("escrita"):
+                self._carregar_banco_temporario(temporario, tabelas)
+            
+            # 8. Substituir a base atual
+            with pipeline.medir("troca"):
+                self._substituir_base(temporario, destino)
+            
+            # 9. Gerar snapshot binário do grafo fiscal
+            with pipeline.medir("snapshot"):
+                self._build_snapshot()
+            
+            # 10. Verificar integridade
+            with pipeline.medir("integridade"):
+                self._verify_integrity()
+            
+            # 11. Estatísticas finais
+            self._print_final_statistics()
+            self._print_stage_timings(pipeline)
+            
+            logger.info("🎉 Base de conhecimento reconstruída com sucesso!")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Erro na construção bulk da base: {e}")
+            if temporario.exists():
+                temporario.unlink()
+            return False
+    
+    def _transformar_fontes(self, pipeline: PipelineEstagios) -> Dict[str, pd.DataFrame]:
+        """
+        Carrega as fontes e produz as linhas de cada tabela. A leitura das três
+        fontes é independente; a resolução de NCMs depende apenas da hierarquia.
+        """
+        logger.info(f"📋 Transformando fontes de dados ({pipeline.max_workers} processos)...")
+        
+        pipeline.submeter("ncms", estagio_ncms, self.data_loader_factory)
+        pipeline.submeter("cests", estagio_cests, self.data_loader_factory)
+        pipeline.submeter("produtos", estagio_produtos, self.data_loader_factory)
+        
+        ncms = pipeline.resultado("ncms")
+        pipeline.submeter("exemplos", estagio_exemplos, ncms["codigo_ncm"], pipeline.resultado("produtos"))
+        cests, pares = pipeline.resultado("cests")
+        pipeline.submeter("mapeamentos", estagio_mapeamentos, ncms, pares, cests["codigo_cest"])
+        
+        mapeamentos, herdados = pipeline.resultado("mapeamentos")
+        exemplos = pipeline.resultado("exemplos")
+        
+        self.stats['ncms_inseridos'] = len(ncms)
+        self.stats['cests_inseridos'] = len(cests)
+        self.stats['mapeamentos_inseridos'] = len(mapeamentos)
+        self.stats['exemplos_inseridos'] = len(exemplos)
+        
+        logger.info(
+            f"✅ {len(ncms):,} NCMs, {len(cests):,} CESTs, {len(mapeamentos):,} mapeamentos, "
+            f"{len(herdados):,} herdados, {len(exemplos):,} exemplos"
+        )
+        return {
+            NCMHierarchy.__tablename__: ncms,
+            CestCategory.__tablename__: cests,
+            NCMCestMapping.__tablename__: pd.concat([mapeamentos, herdados], ignore_index=True),
+            ProdutoExemplo.__tablename__: exemplos,
+        }
+    
+    def _carregar_banco_temporario(self, path: Path, tabelas: Dict[str, pd.DataFrame]):
+        """
+        Cria as tabelas sem índices, insere todas as linhas em uma transação
+        (executemany) e só então cria os índices
+        """
+        logger.info(f"🏗️ Carregando banco temporário {path}...")
+        
+        engine = create_engine(f"sqlite:///{path}")
+        
+        @event.listens_for(engine, "connect")
+        def _pragmas_de_carga(dbapi_connection, connection_record):
+            # Banco descartável até a troca: sem journal e sem fsync por transação
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=OFF")
+            cursor.execute("PRAGMA synchronous=OFF")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.close()
+        
+        try:
+            with engine.begin() as conn:
+                for tabela in KnowledgeBase.metadata.sorted_tables:
+                    conn.execute(CreateTable(tabela))
+                
+                for tabela in KnowledgeBase.metadata.sorted_tables:
+                    df = tabelas.get(tabela.name)
+                    if df is not None and not df.empty:
+                        conn.execute(tabela.insert(), _registros(df))
+                
+                conn.execute(KnowledgeBaseMetadata.__table__.insert(), [{
+                    'versao_base': "1.0.0",
+                    'total_ncms': self.stats['ncms_inseridos'],
+                    'total_cests': self.stats['cests_inseridos'],
+                    'total_mapeamentos': self.stats['mapeamentos_inseridos'],
+                    'total_exemplos': self.stats['exemplos_inseridos'],
+                    'fontes_utilizadas': json.dumps(FONTES_UTILIZADAS),
+                    'ativo': True,
+                }])
+                
+                for tabela in KnowledgeBase.metadata.sorted_tables:
+                    for indice in tabela.indexes:
+                        indice.create(conn)
+            
+            create_performance_indexes(engine)
+            
+            with engine.connect() as conn:
+                conn.execute(text("ANALYZE"))
+                conn.commit()
+        finally:
+            engine.dispose()
+        
+        # synchronous=OFF não garante os dados em disco antes da troca
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        logger.info("✅ Carga e índices concluídos")
+    
+    def _substituir_base(self, temporario: Path, destino: Path):
+        """
+        Troca atômica do arquivo da base; o serviço é recriado para abrir o novo arquivo
+        """
+        logger.info(f"🔄 Substituindo {destino}...")
+        
+        self.kb_service.engine.dispose()
+        if destino.exists():
+            # A base roda em WAL: esvazia o -wal do arquivo antigo para que não
+            # seja reaplicado sobre o arquivo novo
+            conn = conectar_sqlite(destino, PERFIL_LEITURA)
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                conn.close()
+        os.replace(temporario, destino)
+        self.kb_service = KnowledgeBaseService(str(destino), carregar_grafo=False)
+        
+        logger.info("✅ Base substituída")
+    
     def _create_database_structure(self):
         """
         Cria a estrutura do banco SQLite
@@ -515,6 +1020,17 @@ class SQLiteKnowledgeBaseBuilder:
         
         logger.info("✅ Metadados criados")
     
+    def _build_snapshot(self):
+        """
+        Gera o snapshot binário usado na inicialização do KnowledgeBaseService
+        """
+        logger.info("💾 Gerando snapshot binário do grafo fiscal...")
+        
+        checksum = self.kb_service.gerar_snapshot()
+        tamanho_kb = self.kb_service.snapshot_path.stat().st_size / 1024
+        
+        logger.info(f"✅ Snapshot gravado em {self.kb_service.snapshot_path} ({tamanho_kb:,.0f} KB, checksum {checksum[:12]})")
+    
     def _verify_integrity(self):
         """
         Verifica integridade da base construída
@@ -530,6 +1046,16 @@ class SQLiteKnowledgeBaseBuilder:
             for problema in integrity_check['problemas']:
                 logger.warning(f"  - {problema}")
     
+    def _print_stage_timings(self, pipeline: PipelineEstagios):
+        """
+        Imprime a tabela de tempos por estágio do pipeline bulk
+        """
+        logger.info("\n⏱️ TEMPOS POR ESTÁGIO:")
+        logger.info("=" * 60)
+        for linha in pipeline.tabela():
+            logger.info(linha)
+        logger.info("=" * 60)
+    
     def _print_final_statistics(self):
         """
         Imprime estatísticas finais
@@ -555,8 +1081,22 @@ class SQLiteKnowledgeBaseBuilder:
 
 
 if __name__ == "__main__":
-    builder = SQLiteKnowledgeBaseBuilder()
-    success = builder.build_sqlite_knowledge_base()
+    parser = argparse.ArgumentParser(description="Constrói a base de conhecimento SQLite")
+    parser.add_argument(
+        "--bulk", action="store_true",
+        help="Reconstrução completa com carga em lote e troca atômica do arquivo"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Processos para os estágios de transformação do modo bulk (1 = sem pool)"
+    )
+    args = parser.parse_args()
+    
+    builder = SQLiteKnowledgeBaseBuilder(max_workers=args.workers)
+    if args.bulk:
+        success = builder.build_sqlite_knowledge_base_bulk()
+    else:
+        success = builder.build_sqlite_knowledge_base()
     
     if success:
         logger.info("🎉 Migração para SQLite concluída com sucesso!")
@@ -1,55 +1,38 @@
 """
 Script para criar tabela de sessões de processamento
+Cria (ou converte do layout anterior) as tabelas da fila durável de
+processamento em lote: sessoes_processamento e sessoes_processamento_blocos
 """
 
-import sqlite3
-import os
+import sys
 from pathlib import Path
 
+# Adicionar o diretório src ao path
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from database.sqlite_connection import criar_engine_sqlite, PERFIL_OLTP
+from database.fila_processamento import garantir_fila_processamento
+
+
 def create_sessoes_table():
-    """Criar tabela para controlar sessões de processamento"""
-    
+    """Criar tabelas para controlar sessões de processamento"""
+
     # Caminho do banco SQLite unificado
-    db_path = Path("../data/unified_rag_system.db")
-    
+    db_path = Path(__file__).parent.parent / "data" / "unified_rag_system.db"
+
     if not db_path.exists():
         print("❌ Banco de dados unificado não encontrado. Execute primeiro o setup.")
         return
-    
+
     try:
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
-        
-        # Criar tabela de sessões de processamento
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sessoes_processamento (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sessao_id TEXT UNIQUE NOT NULL,
-                tipo_processo TEXT NOT NULL,
-                status TEXT DEFAULT 'iniciado',
-                progresso INTEGER DEFAULT 0,
-                total_items INTEGER DEFAULT 0,
-                items_processados INTEGER DEFAULT 0,
-                mensagem TEXT,
-                parametros TEXT,
-                data_inicio TEXT NOT NULL,
-                data_atualizacao TEXT NOT NULL,
-                data_conclusao TEXT,
-                erro_detalhes TEXT
-            )
-        """)
-        
-        # Criar índices para performance
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessao_id ON sessoes_processamento(sessao_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_status ON sessoes_processamento(status)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_data_inicio ON sessoes_processamento(data_inicio)")
-        
-        conn.commit()
-        conn.close()
-        
-        print("✅ Tabela 'sessoes_processamento' criada com sucesso")
-        print("📊 Índices criados para otimização de consultas")
-        
+        engine = criar_engine_sqlite(db_path, PERFIL_OLTP)
+        with engine.begin() as conn:
+            garantir_fila_processamento(conn)
+        engine.dispose()
+
+        print("✅ Tabelas 'sessoes_processamento' e 'sessoes_processamento_blocos' prontas")
+        print("📊 Índice da fila criado para otimização de consultas")
+
     except Exception as e:
         print(f"❌ Erro ao criar tabela: {str(e)}")
 
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+scripts/migrar_explicacoes_compactas.py
+Migração de explicacoes_agentes para o payload compactado
+
+Converte os campos JSON volumosos (contexto, etapas, resultado, similares e
+exemplos) de cada linha em um único payload msgpack + zstd (ou JSON + zlib
+sem as bibliotecas opcionais), treinando antes um dicionário com amostras
+das próprias explicações. As colunas escalares não são alteradas.
+
+Também converte, no próprio lugar, as colunas JSON volumosas que o codec
+grava sem dicionário: classificacoes_revisao.dados_trace_json e
+agente_acoes.input_dados/output_resultado dos bancos por empresa.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, Sequence
+
+# Adicionar o diretório src ao path
+src_path = Path(__file__).parent.parent / "src"
+sys.path.append(str(src_path))
+
+from database.sqlite_connection import conectar_sqlite, PERFIL_OLTP
+from database.payload_codec import (
+    CAMPOS_PAYLOAD_EXPLICACAO, CAMPOS_PAYLOAD_ACAO, LIMITE_COMPACTACAO, ZSTD_AVAILABLE, MSGPACK_AVAILABLE,
+    garantir_esquema_payload, carregar_codec, treinar_dicionario, salvar_dicionario,
+    payload_explicacao, tamanho_payload_legado, compactar_json, expandir_json
+)
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+_COLUNAS = ", ".join(CAMPOS_PAYLOAD_EXPLICACAO)
+_LIMPAR_COLUNAS = ", ".join(f"{campo} = NULL" for campo in CAMPOS_PAYLOAD_EXPLICACAO)
+
+
+def _linhas_legadas(conn, ultimo_id: int, limite: int):
+    cursor = conn.execute(
+        f"SELECT id, {_COLUNAS} FROM explicacoes_agentes "
+        f"WHERE payload_compactado IS NULL AND id > ? ORDER BY id LIMIT ?",
+        (ultimo_id, limite)
+    )
+    nomes = [d[0] for d in cursor.description]
+    return [dict(zip(nomes, linha)) for linha in cursor.fetchall()]
+
+
+def treinar_dicionario_explicacoes(conn, amostras: int = 2000) -> int:
+    """Treina e grava um dicionário com amostras aleatórias; retorna dict_id (0 se não treinado)."""
+    cursor = conn.execute(
+        f"SELECT {_COLUNAS} FROM explicacoes_agentes ORDER BY RANDOM() LIMIT ?", (amostras,)
+    )
+    nomes = [d[0] for d in cursor.description]
+    payloads = [payload_explicacao(dict(zip(nomes, linha))) for linha in cursor.fetchall()]
+
+    dados = treinar_dicionario([p for p in payloads if p])
+    if dados is None:
+        return 0
+
+    dict_id = salvar_dicionario(conn, dados, total_amostras=len(payloads))
+    conn.commit()
+    logger.info(f"📚 Dicionário {dict_id} treinado com {len(payloads)} amostras ({len(dados)} bytes)")
+    return dict_id
+
+
+def migrar_explicacoes(db_path, lote: int = 1000, amostras_dicionario: int = 2000,
+                       treinar: bool = True, vacuum: bool = False) -> Dict[str, Any]:
+    """
+    Converte as linhas ainda em JSON; pode ser interrompida e retomada.
+
+    Cada lote é gravado em uma transação, e cada payload é decodificado e
+    comparado ao original antes de as colunas JSON serem esvaziadas.
+
+    Returns:
+        Dict com linhas migradas, bytes antes/depois e tempo
+    """
+    inicio = time.time()
+    conn = conectar_sqlite(db_path, PERFIL_OLTP)
+    try:
+        garantir_esquema_payload(conn)
+        conn.commit()
+
+        if treinar:
+            treinar_dicionario_explicacoes(conn, amostras_dicionario)
+        codec = carregar_codec(conn)
+
+        stats = {"linhas": 0, "bytes_json": 0, "bytes_compactados": 0}
+        ultimo_id = 0
+        while True:
+            linhas = _linhas_legadas(conn, ultimo_id, lote)
+            if not linhas:
+                break
+
+            atualizacoes = []
+            for linha in linhas:
+                campos = payload_explicacao(linha)
+                payload = codec.codificar(campos)
+                if codec.decodificar(payload) != campos:
+                    raise ValueError(f"Payload da explicação {linha['id']} não confere após decodificação")
+                atualizacoes.append((payload, linha["id"]))
+                stats["bytes_compactados"] += len(payload)
+
+            stats["bytes_json"] += tamanho_payload_legado(linhas)
+            with conn:
+                conn.executemany(
+                    f"UPDATE explicacoes_agentes SET payload_compactado = ?, {_LIMPAR_COLUNAS} WHERE id = ?",
+                    atualizacoes
+                )
+
+            stats["linhas"] += len(linhas)
+            ultimo_id = linhas[-1]["id"]
+            logger.info(f"🔄 {stats['linhas']} explicações migradas (id até {ultimo_id})")
+
+        if vacuum and stats["linhas"]:
+            logger.info("🧹 VACUUM para devolver o espaço das colunas JSON...")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    stats["tempo_s"] = round(time.time() - inicio, 2)
+    stats["razao"] = round(stats["bytes_json"] / stats["bytes_compactados"], 2) if stats["bytes_compactados"] else None
+    return stats
+
+
+def migrar_colunas_json(conn, tabela: str, colunas: Sequence[str], lote: int = 1000) -> Dict[str, Any]:
+    """
+    Converte no próprio lugar as colunas JSON em texto de uma tabela para o
+    payload do codec; retomável (só seleciona valores ainda em texto).
+
+    Valores menores que LIMITE_COMPACTACAO e textos que não são JSON válido
+    ficam como estão.
+    """
+    stats = {"linhas": 0, "bytes_json": 0, "bytes_compactados": 0}
+    tabelas = {linha[0] for linha in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    if tabela not in tabelas:
+        return stats
+
+    filtro = " OR ".join(f"(typeof({c}) = 'text' AND length({c}) >= {LIMITE_COMPACTACAO})" for c in colunas)
+    atribuicoes = ", ".join(f"{c} = ?" for c in colunas)
+    ultimo_id = 0
+    while True:
+        linhas = conn.execute(
+            f"SELECT id, {', '.join(colunas)} FROM {tabela} WHERE id > ? AND ({filtro}) ORDER BY id LIMIT ?",
+            (ultimo_id, lote)
+        ).fetchall()
+        if not linhas:
+            break
+
+        atualizacoes = []
+        for linha in linhas:
+            valores = list(linha[1:])
+            for i, valor in enumerate(valores):
+                if not isinstance(valor, str) or len(valor) < LIMITE_COMPACTACAO:
+                    continue
+                try:
+                    obj = json.loads(valor)
+                except ValueError:
+                    continue
+                novo = compactar_json(obj)
+                if expandir_json(novo) != obj:
+                    raise ValueError(f"{tabela}.{colunas[i]} da linha {linha[0]} não confere após decodificação")
+                stats["bytes_json"] += len(valor.encode("utf-8"))
+                stats["bytes_compactados"] += len(novo)
+                valores[i] = novo
+            atualizacoes.append((*valores, linha[0]))
+
+        with conn:
+            conn.executemany(f"UPDATE {tabela} SET {atribuicoes} WHERE id = ?", atualizacoes)
+
+        stats["linhas"] += len(linhas)
+        ultimo_id = linhas[-1][0]
+        logger.info(f"🔄 {tabela}: {stats['linhas']} linhas migradas (id até {ultimo_id})")
+
+    return stats
+
+
+def migrar_traces_revisao(db_path, lote: int = 1000) -> Dict[str, Any]:
+    """Compacta classificacoes_revisao.dados_trace_json do banco unificado."""
+    conn = conectar_sqlite(db_path, PERFIL_OLTP)
+    try:
+        return migrar_colunas_json(conn, "classificacoes_revisao", ("dados_trace_json",), lote)
+    finally:
+        conn.close()
+
+
+def migrar_acoes_empresas(base_path, lote: int = 1000) -> Dict[str, Any]:
+    """Compacta input_dados/output_resultado de agente_acoes em cada banco de empresa."""
+    total = {"bancos": 0, "linhas": 0, "bytes_json": 0, "bytes_compactados": 0}
+    for db_path in sorted(Path(base_path).glob("empresa_*.db")):
+        conn = conectar_sqlite(db_path, PERFIL_OLTP)
+        try:
+            stats = migrar_colunas_json(conn, "agente_acoes", CAMPOS_PAYLOAD_ACAO, lote)
+        finally:
+            conn.close()
+        total["bancos"] += 1
+        for chave, valor in stats.items():
+            total[chave] += valor
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compacta os payloads de explicacoes_agentes, dos traces de revisão e de agente_acoes"
+    )
+    parser.add_argument(
+        "--db", default=str(Path(__file__).parent.parent / "data" / "unified_rag_system.db"),
+        help="Banco SQLite com a tabela explicacoes_agentes"
+    )
+    parser.add_argument(
+        "--empresas", default=str(Path(__file__).parent.parent / "data" / "empresas"),
+        help="Diretório dos bancos por empresa (agente_acoes)"
+    )
+    parser.add_argument("--lote", type=int, default=1000, help="Linhas por transação")
+    parser.add_argument("--amostras", type=int, default=2000, help="Amostras para treinar o dicionário zstd")
+    parser.add_argument("--sem-dicionario", action="store_true", help="Não treina um novo dicionário")
+    parser.add_argument("--vacuum", action="store_true", help="Executa VACUUM ao final")
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        logger.error(f"❌ Banco não encontrado: {args.db}")
+        sys.exit(1)
+
+    if not (ZSTD_AVAILABLE and MSGPACK_AVAILABLE):
+        logger.warning("⚠️ msgpack/zstandard não instalados; usando JSON compacto + zlib sem dicionário")
+
+    resultado = migrar_explicacoes(
+        args.db, lote=args.lote, amostras_dicionario=args.amostras,
+        treinar=not args.sem_dicionario
+    )
+    logger.info(
+        f"✅ {resultado['linhas']} explicações migradas em {resultado['tempo_s']}s: "
+        f"{resultado['bytes_json']} → {resultado['bytes_compactados']} bytes (razão {resultado['razao']})"
+    )
+
+    traces = migrar_traces_revisao(args.db, lote=args.lote)
+    logger.info(
+        f"✅ {traces['linhas']} traces de revisão migrados: "
+        f"{traces['bytes_json']} → {traces['bytes_compactados']} bytes"
+    )
+
+    if args.vacuum and (resultado["linhas"] or traces["linhas"]):
+        logger.info("🧹 VACUUM para devolver o espaço das colunas JSON...")
+        conn = conectar_sqlite(args.db, PERFIL_OLTP)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    if Path(args.empresas).is_dir():
+        acoes = migrar_acoes_empresas(args.empresas, lote=args.lote)
+        logger.info(
+            f"✅ {acoes['linhas']} ações de agentes migradas em {acoes['bancos']} bancos de empresa: "
+            f"{acoes['bytes_json']} → {acoes['bytes_compactados']} bytes"
+        )
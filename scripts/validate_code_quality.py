@@ -9,6 +9,7 @@ Este script verifica:
 - Docstrings ausentes
 - Complexidade de funções
 - Padrões de código
+- Chamadas bloqueantes (banco, LLM, I/O síncrono) dentro de corrotinas
 """
 
 import os
@@ -19,6 +20,118 @@ from pathlib import Path
 from typing import List, Dict, Tuple
 from collections import defaultdict
 
+# Objetos síncronos cujas chamadas bloqueiam o event loop (receptor imediato);
+# os serviços do projeto (service, *_service) são todos síncronos
+BLOCKING_RECEIVERS = {
+    "db", "session", "motor_processamento", "conn", "connection", "cursor", "engine",
+    "router", "hybrid_router", "ollama_client", "requests", "sqlite3", "subprocess"
+}
+# Métodos bloqueantes em qualquer objeto (DB-API, SQLAlchemy, roteador de classificação)
+BLOCKING_METHODS = {"execute", "executemany", "executescript", "commit", "fetchone", "fetchall", "classify_products"}
+BLOCKING_FUNCTIONS = {"open", "time.sleep"}
+# Recebem funções para executar depois da resposta ou em outra thread
+DEFERRED_CALLS = {"add_task", "to_thread", "run_in_threadpool", "run_in_executor", "submit"}
+# Marca de linha para chamadas síncronas conferidas como não bloqueantes
+NON_BLOCKING_MARKER = "# nao-bloqueante"
+
+
+def _call_name(func: ast.AST) -> str:
+    """Nome pontilhado de quem é chamado (ex.: 'unified_service.buscar_ncm')."""
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        base = _call_name(func.value)
+        return f"{base}.{func.attr}" if base else func.attr
+    return ""
+
+
+def _direct_calls(node: ast.AST):
+    """
+    Chamadas executadas pelo próprio corpo de `node`: não desce em funções e
+    lambdas aninhadas e ignora as aguardadas (await) — essas são assíncronas
+    ou referências repassadas a asyncio.to_thread/run_in_threadpool
+    """
+    awaited = set()
+    pending = list(ast.iter_child_nodes(node))
+    while pending:
+        child = pending.pop()
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            continue
+        if isinstance(child, ast.Await) and isinstance(child.value, ast.Call):
+            awaited.add(id(child.value))
+        if isinstance(child, ast.Call) and id(child) not in awaited:
+            yield child
+        pending.extend(ast.iter_child_nodes(child))
+
+
+def _is_blocking_call(call: ast.Call, blocking_helpers: set) -> bool:
+    name = _call_name(call.func)
+    if name in BLOCKING_FUNCTIONS or name in blocking_helpers:
+        return True
+    if isinstance(call.func, ast.Attribute):
+        receiver = call.func.value
+        if isinstance(receiver, ast.Name) and (
+            receiver.id in BLOCKING_RECEIVERS or receiver.id == "service" or receiver.id.endswith("_service")
+        ):
+            return True
+        return call.func.attr in BLOCKING_METHODS
+    return False
+
+
+def find_blocking_calls(tree: ast.AST, source: str = "") -> List[Tuple[int, str, str]]:
+    """
+    Chamadas bloqueantes dentro de corrotinas: (linha, corrotina, chamada).
+    Funções síncronas do módulo que bloqueiam também contam quando chamadas
+    diretamente de uma corrotina; rotas síncronas (def) rodam no threadpool
+    do FastAPI e não entram na verificação.
+    """
+    lines = source.split("\n")
+    module_functions = {
+        node.name: node for node in getattr(tree, "body", []) if isinstance(node, ast.FunctionDef)
+    }
+
+    # Funções síncronas bloqueantes do módulo, por propagação até estabilizar
+    blocking_helpers: set = set()
+    changed = True
+    while changed:
+        changed = False
+        for name, function in module_functions.items():
+            if name not in blocking_helpers and any(
+                _is_blocking_call(call, blocking_helpers) for call in _direct_calls(function)
+            ):
+                blocking_helpers.add(name)
+                changed = True
+
+    def _blocking_body(function: ast.AST) -> bool:
+        return any(_is_blocking_call(call, blocking_helpers) for call in _direct_calls(function))
+
+    found = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.AsyncFunctionDef):
+            continue
+        # Funções aninhadas bloqueantes: chamadas ou repassadas sem await (ex.:
+        # consulta do cache executada na hora) rodam no event loop
+        blocking_locals = {
+            child.name for child in ast.walk(node)
+            if isinstance(child, ast.FunctionDef) and _blocking_body(child)
+        }
+        for call in _direct_calls(node):
+            blocking = _is_blocking_call(call, blocking_helpers) or _call_name(call.func) in blocking_locals
+            if not blocking and _call_name(call.func).split(".")[-1] not in DEFERRED_CALLS:
+                blocking = any(
+                    (isinstance(arg, ast.Name) and arg.id in blocking_locals)
+                    or (isinstance(arg, ast.Lambda) and _blocking_body(arg))
+                    for arg in list(call.args) + [keyword.value for keyword in call.keywords]
+                )
+            if not blocking:
+                continue
+            line = lines[call.lineno - 1] if call.lineno <= len(lines) else ""
+            if NON_BLOCKING_MARKER in line:
+                continue
+            found.append((call.lineno, node.name, _call_name(call.func)))
+    return sorted(found)
+
+
 class CodeQualityValidator:
     def __init__(self, project_root: str):
         self.project_root = Path(project_root)
@@ -54,6 +167,7 @@ class CodeQualityValidator:
                 tree = ast.parse(content)
                 self._check_docstrings(file_path, tree)
                 self._check_function_complexity(file_path, tree)
+                self._check_blocking_calls(file_path, tree, content)
             except SyntaxError as e:
                 self.issues[str(file_path)].append(f"Erro de sintaxe: {e}")
                 
@@ -133,6 +247,14 @@ class CodeQualityValidator:
                         f"Linha {node.lineno}: Função '{node.name}' muito complexa (complexidade: {complexity})"
                     )
     
+    def _check_blocking_calls(self, file_path: Path, tree: ast.AST, content: str):
+        """Verifica chamadas bloqueantes dentro de corrotinas (async def)."""
+        for line_num, coroutine, call in find_blocking_calls(tree, content):
+            self.issues[str(file_path)].append(
+                f"Linha {line_num}: Chamada bloqueante '{call}' na corrotina '{coroutine}' - "
+                f"use def (threadpool) ou asyncio.to_thread"
+            )
+    
     def _calculate_complexity(self, node: ast.FunctionDef) -> int:
         """Calcula complexidade ciclomática básica."""
         complexity = 1  # Base
@@ -180,6 +302,8 @@ class CodeQualityValidator:
                     categories["Complexidade"] += 1
                 elif "Import" in issue:
                     categories["Imports"] += 1
+                elif "bloqueante" in issue:
+                    categories["Bloqueio do event loop"] += 1
                 else:
                     categories["Outros"] += 1
         
@@ -219,6 +343,10 @@ class CodeQualityValidator:
         if categories["Imports"] > 0:
             report.append("- **Imports**: Organizar e otimizar imports usando ferramentas como `isort`")
         
+        if categories["Bloqueio do event loop"] > 0:
+            report.append("- **Event loop**: Rotas com banco/LLM síncronos como `def` (threadpool) "
+                          "ou chamadas via `asyncio.to_thread`")
+        
         return "\n".join(report)
 
 def main():
@@ -9,6 +9,8 @@ import time
 import tracemalloc
 from datetime import datetime
 
+from llm.tokenizer import get_token_counter
+
 class BaseAgent(ABC):
     """Classe base para todos os agentes do sistema."""
     
@@ -34,6 +36,16 @@ class BaseAgent(ABC):
         self.tempo_inicio = None
         self.memoria_inicial = None
         self.tokens_utilizados = 0
+        
+        # Estatísticas acumuladas de tokens por agente (todas as chamadas)
+        self.token_counter = get_token_counter()
+        self.estatisticas_tokens = {
+            "chamadas_llm": 0,
+            "tokens_prompt": 0,
+            "tokens_resposta": 0,
+            "prompts_acima_orcamento": 0
+        }
+        self.ultimo_relatorio_prompt = {}
     
     def configurar_rastreamento_consultas(self, consulta_service, produto_id: str):
         """Configura o serviço de rastreamento de consultas para este agente."""
@@ -123,6 +135,7 @@ class BaseAgent(ABC):
         self.produtos_similares = []
         self.exemplos_utilizados = []
         self.tokens_utilizados = 0
+        self.ultimo_relatorio_prompt = {}
     
     def adicionar_etapa(self, nome_etapa: str, descricao: str, resultado: Any = None):
         """Adiciona uma etapa de processamento ao rastreamento."""
@@ -155,15 +168,43 @@ class BaseAgent(ABC):
             return
         self.exemplos_utilizados.append(exemplo)
     
-    def contar_tokens_llm(self, prompt: str, resposta: str):
-        """Conta tokens aproximados utilizados em chamadas LLM."""
+    def contar_tokens_llm(self, prompt: str, resposta: str, llm_response: Dict[str, Any] = None,
+                          system: str = "", relatorio_prompt: Dict[str, Any] = None):
+        """
+        Contabiliza os tokens de uma chamada LLM.
+        Usa as contagens reais do Ollama (prompt_eval_count/eval_count) quando
+        presentes na resposta; caso contrário, estima com o tokenizador.
+        """
+        llm_response = llm_response or {}
+        tokens_prompt = llm_response.get("prompt_eval_count")
+        if tokens_prompt is None:
+            tokens_prompt = self.token_counter.count(system) + self.token_counter.count(prompt)
+        tokens_resposta = llm_response.get("eval_count")
+        if tokens_resposta is None:
+            tokens_resposta = self.token_counter.count(resposta)
+        
+        self.estatisticas_tokens["chamadas_llm"] += 1
+        self.estatisticas_tokens["tokens_prompt"] += tokens_prompt
+        self.estatisticas_tokens["tokens_resposta"] += tokens_resposta
+        if relatorio_prompt:
+            self.ultimo_relatorio_prompt = relatorio_prompt
+            if relatorio_prompt.get("excedeu_orcamento"):
+                self.estatisticas_tokens["prompts_acima_orcamento"] += 1
+        
         if not self.explicacao_ativa:
             return
-        # Aproximação simples: 1 token ≈ 4 caracteres
-        tokens_prompt = len(prompt) // 4
-        tokens_resposta = len(resposta) // 4
         self.tokens_utilizados += tokens_prompt + tokens_resposta
     
+    def obter_estatisticas_tokens(self) -> Dict[str, Any]:
+        """Retorna as estatísticas acumuladas de tokens do agente."""
+        chamadas = self.estatisticas_tokens["chamadas_llm"]
+        return {
+            "agente": self.name,
+            **self.estatisticas_tokens,
+            "media_tokens_prompt": round(self.estatisticas_tokens["tokens_prompt"] / chamadas, 1) if chamadas else 0.0,
+            "ultimo_prompt": self.ultimo_relatorio_prompt
+        }
+    
     def finalizar_explicacao(self, resultado: Dict[str, Any], 
                            explicacao_detalhada: str = "", 
                            justificativa_tecnica: str = "",
@@ -201,6 +242,7 @@ class BaseAgent(ABC):
             "tempo_processamento_ms": tempo_processamento,
             "memoria_utilizada_mb": round(memoria_utilizada, 2),
             "tokens_llm_utilizados": self.tokens_utilizados,
+            "relatorio_prompt": self.ultimo_relatorio_prompt,
             "data_execucao": datetime.now().isoformat()
         }
         
@@ -209,6 +251,10 @@ class BaseAgent(ABC):
         
         return resultado
     
+    def _modelo_llm(self, llm_response: Dict[str, Any]) -> Optional[str]:
+        """Nome do modelo que gerou a resposta (para métricas por modelo)."""
+        return llm_response.get("model") or getattr(self.llm_client, "model", None)
+    
     def _create_trace(self, action: str, input_data: Any, output: Any, reasoning: str = "") -> Dict[str, Any]:
         """Cria um trace de auditoria para rastreabilidade."""
         trace = {
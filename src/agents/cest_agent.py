@@ -2,9 +2,10 @@
 # src/agents/cest_agent.py - Agente Especialista em CEST
 # ============================================================================
 
-import json
-from typing import Dict, Any
+from typing import Dict, Any, List
 from agents.base_agent import BaseAgent
+from llm.response_parser import ResponseParser, ResponseParseError
+from agents.prompt_builder import PromptBuilder, compact_json
 
 class CESTAgent(BaseAgent):
     """
@@ -14,6 +15,8 @@ class CESTAgent(BaseAgent):
     
     def __init__(self, llm_client, config):
         super().__init__("CESTAgent", llm_client, config)
+        self.prompt_builder = PromptBuilder.from_config("cest", config)
+        self.response_parser = ResponseParser("cest")
         
         self.system_prompt = """Você é um especialista em classificação CEST (Código Especificador da Substituição Tributária).
 
@@ -34,24 +37,62 @@ FORMATO DE RESPOSTA:
   "cest_alternativos": ["<CEST alternativo 1>", "<CEST alternativo 2>", "..."]
 }"""
 
-    def run(self, produto_expandido: Dict, ncm_resultado: Dict, context: Dict[str, Any] = None) -> Dict[str, Any]:
-        """Determina o código CEST para o produto."""
-        
-        prompt = f"""Determine o código CEST para o seguinte produto:
+    # Instruções fixas primeiro, contexto do NCM (compartilhado por produtos do
+    # mesmo NCM) em seguida e dados do produto por último, para reuso do cache KV
+    PROMPT_INSTRUCTION = """Determine o código CEST do produto descrito ao final e forneça sua análise no formato JSON especificado.
 
-PRODUTO:
-{produto_expandido['produto_original']}
+"""
+
+    ITEM_TEMPLATE = """CONTEXTO ESTRUTURADO DISPONÍVEL:
+{structured_context}
 
 NCM DETERMINADO:
-{ncm_resultado.get('ncm_recomendado', 'Não determinado')}
+{ncm}
+
+PRODUTO:
+{produto}
 
 CARACTERÍSTICAS EXPANDIDAS:
-{produto_expandido.get('descricao_expandida', 'Nenhuma característica adicional')}
+{caracteristicas}
+
+ATRIBUTOS RELEVANTES:
+{atributos}"""
 
-CONTEXTO ESTRUTURADO DISPONÍVEL:
-{context.get('structured_context', 'Nenhum contexto estruturado disponível') if context else 'Nenhum contexto disponível'}
+    PROMPT_TEMPLATE = PROMPT_INSTRUCTION + ITEM_TEMPLATE
 
-Forneça sua análise no formato JSON especificado."""
+    # Modo em lote: K produtos numerados em uma única geração
+    BATCH_INSTRUCTION = """MODO EM LOTE: determine o código CEST de CADA produto numerado abaixo, usando o contexto e o NCM de cada um. Responda APENAS com um array JSON contendo um objeto no formato especificado por produto, na mesma ordem, acrescentando o campo "indice" com o número do produto.
+"""
+
+    def _montar_prompt(self, template: str, produto_expandido: Dict, ncm_resultado: Dict,
+                       context: Dict[str, Any] = None) -> str:
+        """Monta o prompt de um produto respeitando o orçamento de tokens."""
+        builder = self.prompt_builder
+        produto = builder.select_product_fields(produto_expandido)
+        produto_original = produto.pop('produto_original', None) or produto.pop('descricao_produto', '')
+        descricao_expandida = produto.pop('descricao_expandida', 'Nenhuma característica adicional')
+        structured_context = context.get('structured_context', 'Nenhum contexto estruturado disponível') if context else 'Nenhum contexto disponível'
+        
+        return builder.render(
+            template,
+            fixed={
+                "produto": produto_original,
+                "ncm": ncm_resultado.get('ncm_recomendado', 'Não determinado'),
+                "caracteristicas": descricao_expandida,
+                "atributos": compact_json(produto) if produto else "{}"
+            },
+            flexible=[
+                ("structured_context", builder.split_context_lines(structured_context),
+                 "Nenhum contexto estruturado disponível"),
+            ],
+            system=self.system_prompt
+        )
+
+    def run(self, produto_expandido: Dict, ncm_resultado: Dict, context: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Determina o código CEST para o produto."""
+        
+        prompt = self._montar_prompt(self.PROMPT_TEMPLATE, produto_expandido, ncm_resultado, context)
+        builder = self.prompt_builder
 
         try:
             response = self.llm_client.generate(
@@ -59,6 +100,8 @@ Forneça sua análise no formato JSON especificado."""
                 system=self.system_prompt,
                 temperature=0.2
             )
+            self.contar_tokens_llm(prompt, response.get("response", ""), response,
+                                   system=self.system_prompt, relatorio_prompt=builder.ultimo_relatorio)
             
             if "error" in response:
                 result = {
@@ -71,9 +114,9 @@ Forneça sua análise no formato JSON especificado."""
                 reasoning = f"Erro na classificação CEST: {response['error']}"
             else:
                 try:
-                    result = json.loads(response["response"])
+                    result = self.response_parser.parse(response["response"], self._modelo_llm(response))
                     reasoning = f"CEST determinado: {result.get('cest_recomendado')} (tem_cest: {result.get('tem_cest')})"
-                except json.JSONDecodeError:
+                except ResponseParseError:
                     result = {
                         "tem_cest": False,
                         "cest_recomendado": None,
@@ -109,3 +152,52 @@ Forneça sua análise no formato JSON especificado."""
                 "result": result,
                 "trace": trace
             }
+
+    def run_batch(self, produtos_expandidos: List[Dict], ncm_resultados: List[Dict],
+                  contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Determina o CEST de K produtos em uma única chamada ao LLM.
+
+        Itens ausentes ou inválidos no array de resposta são reclassificados
+        individualmente com run().
+
+        Returns:
+            Lista de dicionários {"result", "trace"} na mesma ordem dos produtos.
+        """
+        entradas = list(zip(produtos_expandidos, ncm_resultados, contexts))
+        if len(entradas) <= 1:
+            return [self.run(*entrada) for entrada in entradas]
+
+        blocos = [
+            f"\n=== PRODUTO {indice} ===\n" + self._montar_prompt(self.ITEM_TEMPLATE, *entrada)
+            for indice, entrada in enumerate(entradas, 1)
+        ]
+        prompt = self.BATCH_INSTRUCTION + "\n".join(blocos)
+
+        itens = [None] * len(entradas)
+        try:
+            response = self.llm_client.generate(
+                prompt=prompt,
+                system=self.system_prompt,
+                temperature=0.2
+            )
+            self.contar_tokens_llm(prompt, response.get("response", ""), response, system=self.system_prompt)
+            if "error" not in response:
+                itens = self.response_parser.parse_batch(
+                    response["response"], len(entradas), self._modelo_llm(response)
+                )
+        except Exception as e:
+            self.adicionar_etapa("classify_cest_batch", f"Falha no lote de {len(entradas)} produtos: {e}")
+
+        resultados = []
+        for (produto_expandido, ncm_resultado, context), result in zip(entradas, itens):
+            if result is None:
+                resultados.append(self.run(produto_expandido, ncm_resultado, context))
+                continue
+            reasoning = f"CEST determinado (lote): {result.get('cest_recomendado')} (tem_cest: {result.get('tem_cest')})"
+            trace = self._create_trace("classify_cest",
+                                     f"{produto_expandido.get('produto_original', '')} -> NCM {ncm_resultado.get('ncm_recomendado')}",
+                                     result, reasoning)
+            resultados.append({"result": result, "trace": trace})
+
+        return resultados
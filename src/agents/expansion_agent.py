@@ -1,5 +1,5 @@
-import json
 from typing import Dict, Any
+from llm.response_parser import ResponseParser, ResponseParseError
 from .base_agent import BaseAgent
 
 class ExpansionAgent(BaseAgent):
@@ -10,6 +10,7 @@ class ExpansionAgent(BaseAgent):
 
     def __init__(self, llm_client, config):
         super().__init__("ExpansionAgent", llm_client, config)
+        self.response_parser = ResponseParser("expansion")
         self.system_prompt = """
 Você é um especialista em análise de produtos para fins fiscais. Sua tarefa é analisar a descrição de um produto e expandi-la para um formato JSON estruturado.
 
@@ -45,24 +46,21 @@ Responda APENAS com o objeto JSON. Não inclua texto adicional ou markdown.
                 system=self.system_prompt,
                 temperature=0.3
             )
+            self.contar_tokens_llm(prompt, response.get("response", ""), response, system=self.system_prompt)
 
             if "error" in response:
                 result = {"error": f"Erro no LLM: {response['error']}"}
                 reasoning = result["error"]
             else:
                 try:
-                    # Tenta carregar a resposta JSON, limpando quaisquer caracteres extras
-                    response_text = response["response"].strip()
-                    if response_text.startswith("```json"):
-                        response_text = response_text[7:-3].strip()
-
-                    result = json.loads(response_text)
+                    # Extrai o objeto JSON ignorando prosa e blocos de código ao redor
+                    result = self.response_parser.parse(response["response"], self._modelo_llm(response))
                     # Garante que a descrição original esteja no resultado
                     if 'produto_original' not in result:
                         result['produto_original'] = input_data
                     reasoning = "Expansão bem-sucedida a partir da análise do LLM."
-                except json.JSONDecodeError:
-                    result = {"error": "Resposta do LLM não é um JSON válido.", "raw_response": response["response"]}
+                except ResponseParseError as e:
+                    result = {"error": f"Resposta do LLM não é um JSON válido: {e}", "raw_response": response["response"]}
                     reasoning = result["error"]
 
             trace = self._create_trace("expand_description", input_data, result, reasoning)
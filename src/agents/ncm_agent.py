@@ -1,6 +1,7 @@
-import json
-from typing import Dict, Any
+from typing import Dict, Any, List
+from llm.response_parser import ResponseParser, ResponseParseError
 from .base_agent import BaseAgent
+from .prompt_builder import PromptBuilder, compact_json
 
 class NCMAgent(BaseAgent):
     """
@@ -10,6 +11,8 @@ class NCMAgent(BaseAgent):
 
     def __init__(self, llm_client, config):
         super().__init__("NCMAgent", llm_client, config)
+        self.prompt_builder = PromptBuilder.from_config("ncm", config)
+        self.response_parser = ResponseParser("ncm")
         self.system_prompt = """
 Você é um especialista em classificação fiscal aduaneira e deve determinar o código NCM (Nomenclatura Comum do Mercosul) de 8 dígitos para um produto.
 
@@ -30,6 +33,57 @@ O formato JSON deve ser:
 }
 """
 
+    # Instruções fixas primeiro e dados do produto por último: o prefixo
+    # (system + instruções) é idêntico entre produtos e fica no cache KV do Ollama
+    PROMPT_INSTRUCTION = """
+Baseado em TODAS as informações abaixo, determine o NCM de 8 dígitos do produto no final e forneça a classificação no formato JSON especificado.
+"""
+
+    ITEM_TEMPLATE = """
+**Contexto Estruturado (Regras e Descrições Oficiais):**
+---
+{structured_context}
+---
+
+**Contexto Semântico (Exemplos de Produtos Similares, mais relevantes primeiro):**
+---
+{semantic_context}
+---
+
+**Produto para Classificar:**
+```json
+{produto}
+```
+"""
+
+    PROMPT_TEMPLATE = PROMPT_INSTRUCTION + ITEM_TEMPLATE
+
+    # Modo em lote: K produtos numerados em uma única geração
+    BATCH_INSTRUCTION = """
+MODO EM LOTE: determine o NCM de 8 dígitos de CADA produto numerado abaixo, usando o contexto de cada um. Responda APENAS com um array JSON contendo um objeto no formato especificado por produto, na mesma ordem, acrescentando o campo "indice" com o número do produto.
+"""
+
+    def _montar_prompt(self, template: str, input_data: Dict, context: Dict[str, Any]) -> str:
+        """Monta o prompt de um produto respeitando o orçamento de tokens."""
+        builder = self.prompt_builder
+        produto_str = compact_json(builder.select_product_fields(input_data))
+        structured_context = context.get('structured_context', 'Nenhum contexto estruturado fornecido.')
+        semantic_context = context.get('semantic_context', 'Nenhum contexto semântico fornecido.')
+
+        # Contexto estruturado tem prioridade; exemplos semânticos entram por
+        # relevância até o limite do orçamento de tokens do agente
+        return builder.render(
+            template,
+            fixed={"produto": produto_str},
+            flexible=[
+                ("structured_context", builder.split_context_lines(structured_context),
+                 "Nenhum contexto estruturado fornecido."),
+                ("semantic_context", builder.rank_semantic_context(semantic_context),
+                 "Nenhum contexto semântico fornecido."),
+            ],
+            system=self.system_prompt
+        )
+
     def run(self, input_data: Dict, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Determina o NCM de um produto usando contexto híbrido.
@@ -42,33 +96,7 @@ O formato JSON deve ser:
             Um dicionário com o resultado da classificação e um trace de auditoria.
         """
 
-        produto_str = json.dumps(input_data, indent=2, ensure_ascii=False)
-        structured_context = context.get('structured_context', 'Nenhum contexto estruturado fornecido.')
-        semantic_context = context.get('semantic_context', 'Nenhum contexto semântico fornecido.')
-
-        # Limitar o tamanho do contexto para não exceder o limite do prompt
-        semantic_context_str = json.dumps(semantic_context, indent=2, ensure_ascii=False)[:2000]
-
-        prompt = f"""
-Analise o produto a seguir e determine seu NCM de 8 dígitos.
-
-**Produto para Classificar:**
-```json
-{produto_str}
-```
-
-**Contexto Estruturado (Regras e Descrições Oficiais):**
----
-{structured_context}
----
-
-**Contexto Semântico (Exemplos de Produtos Similares):**
----
-{semantic_context_str}
----
-
-Baseado em TODAS as informações, forneça a classificação NCM no formato JSON especificado.
-"""
+        prompt = self._montar_prompt(self.PROMPT_TEMPLATE, input_data, context)
 
         try:
             response = self.llm_client.generate(
@@ -76,19 +104,18 @@ Baseado em TODAS as informações, forneça a classificação NCM no formato JSO
                 system=self.system_prompt,
                 temperature=0.1
             )
+            self.contar_tokens_llm(prompt, response.get("response", ""), response,
+                                   system=self.system_prompt, relatorio_prompt=self.prompt_builder.ultimo_relatorio)
 
             if "error" in response:
                 result = {"error": f"Erro no LLM: {response['error']}"}
                 reasoning = result["error"]
             else:
                 try:
-                    response_text = response["response"].strip()
-                    if response_text.startswith("```json"):
-                        response_text = response_text[7:-3].strip()
-                    result = json.loads(response_text)
+                    result = self.response_parser.parse(response["response"], self._modelo_llm(response))
                     reasoning = f"NCM recomendado: {result.get('ncm_recomendado', 'N/A')}. Justificativa: {result.get('justificativa', '')}"
-                except json.JSONDecodeError:
-                    result = {"error": "Resposta do LLM não é um JSON válido.", "raw_response": response["response"]}
+                except ResponseParseError as e:
+                    result = {"error": f"Resposta do LLM não é um JSON válido: {e}", "raw_response": response["response"]}
                     reasoning = result["error"]
 
             trace = self._create_trace("classify_ncm", input_data.get('produto_original', ''), result, reasoning)
@@ -105,3 +132,52 @@ Baseado em TODAS as informações, forneça a classificação NCM no formato JSO
                 "result": result,
                 "trace": trace
             }
+
+    def run_batch(self, produtos: List[Dict], contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Determina o NCM de K produtos em uma única chamada ao LLM.
+
+        Itens ausentes ou inválidos no array de resposta são reclassificados
+        individualmente com run().
+
+        Args:
+            produtos: Lista de produtos expandidos.
+            contexts: Lista de contextos, um por produto.
+
+        Returns:
+            Lista de dicionários {"result", "trace"} na mesma ordem dos produtos.
+        """
+        if len(produtos) <= 1:
+            return [self.run(produto, context) for produto, context in zip(produtos, contexts)]
+
+        blocos = [
+            f"\n=== PRODUTO {indice} ===" + self._montar_prompt(self.ITEM_TEMPLATE, produto, context)
+            for indice, (produto, context) in enumerate(zip(produtos, contexts), 1)
+        ]
+        prompt = self.BATCH_INSTRUCTION + "".join(blocos)
+
+        itens = [None] * len(produtos)
+        try:
+            response = self.llm_client.generate(
+                prompt=prompt,
+                system=self.system_prompt,
+                temperature=0.1
+            )
+            self.contar_tokens_llm(prompt, response.get("response", ""), response, system=self.system_prompt)
+            if "error" not in response:
+                itens = self.response_parser.parse_batch(
+                    response["response"], len(produtos), self._modelo_llm(response)
+                )
+        except Exception as e:
+            self.adicionar_etapa("classify_ncm_batch", f"Falha no lote de {len(produtos)} produtos: {e}")
+
+        resultados = []
+        for produto, context, result in zip(produtos, contexts, itens):
+            if result is None:
+                resultados.append(self.run(produto, context))
+                continue
+            reasoning = f"NCM recomendado (lote): {result.get('ncm_recomendado', 'N/A')}. Justificativa: {result.get('justificativa', '')}"
+            trace = self._create_trace("classify_ncm", produto.get('produto_original', ''), result, reasoning)
+            resultados.append({"result": result, "trace": trace})
+
+        return resultados
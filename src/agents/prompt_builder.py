@@ -0,0 +1,200 @@
+# ============================================================================
+# src/agents/prompt_builder.py - Montagem Compacta de Prompts dos Agentes
+# ============================================================================
+
+import json
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from llm.tokenizer import TokenCounter, get_token_counter
+
+
+# Campos do produto relevantes para cada agente (em ordem de importância)
+AGENT_PRODUCT_FIELDS = {
+    "ncm": (
+        "produto_original", "descricao_produto", "descricao_expandida",
+        "categoria_principal", "material_predominante", "caracteristicas_tecnicas",
+        "aplicacoes_uso", "palavras_chave_fiscais", "codigo_barra",
+    ),
+    "cest": (
+        "produto_original", "descricao_produto", "descricao_expandida",
+        "categoria_principal", "palavras_chave_fiscais", "codigo_barra",
+    ),
+    "reconciler": (
+        "produto_original", "descricao_produto", "descricao_expandida",
+        "categoria_principal", "codigo_barra",
+    ),
+}
+
+# Campos dos resultados de agentes anteriores repassados adiante
+AGENT_RESULT_FIELDS = {
+    "ncm": ("ncm_recomendado", "confianca", "justificativa", "ncm_alternativos"),
+    "cest": ("tem_cest", "cest_recomendado", "confianca", "justificativa", "cest_alternativos"),
+}
+
+# Orçamento padrão de tokens do prompt (system + user) por agente
+DEFAULT_TOKEN_BUDGETS = {
+    "ncm": 2000,
+    "cest": 1500,
+    "reconciler": 1800,
+}
+
+
+def compact_json(data: Any) -> str:
+    """Serializa em JSON sem indentação nem espaços supérfluos."""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class PromptBuilder:
+    """
+    Monta prompts enxutos para um agente: seleciona apenas os campos do
+    produto que o agente usa, ordena o contexto por relevância e respeita
+    um orçamento de tokens descartando itens inteiros de menor prioridade.
+    """
+
+    def __init__(self, agent: str, token_budget: Optional[int] = None,
+                 token_counter: Optional[TokenCounter] = None):
+        self.agent = agent
+        self.token_budget = token_budget or DEFAULT_TOKEN_BUDGETS.get(agent, 2000)
+        self.token_counter = token_counter or get_token_counter()
+        self.ultimo_relatorio: Dict[str, Any] = {}
+
+    @classmethod
+    def from_config(cls, agent: str, config) -> "PromptBuilder":
+        """Cria o builder lendo o orçamento de PROMPT_TOKEN_BUDGETS da configuração."""
+        budgets = getattr(config, "PROMPT_TOKEN_BUDGETS", None) or {}
+        return cls(agent, budgets.get(agent))
+
+    def count_tokens(self, text: str) -> int:
+        return self.token_counter.count(text)
+
+    def select_product_fields(self, produto: Dict[str, Any],
+                              fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Extrai do produto (e de seu 'expansion_data') apenas os campos usados
+        pelo agente, ignorando valores vazios e campos internos ('_...').
+        """
+        fields = fields or AGENT_PRODUCT_FIELDS.get(self.agent, ())
+        expansion_data = produto.get("expansion_data") or {}
+        if not isinstance(expansion_data, dict):
+            expansion_data = {}
+
+        selecionados = {}
+        for campo in fields:
+            valor = produto.get(campo)
+            if valor in (None, "", [], {}):
+                valor = expansion_data.get(campo)
+            if valor in (None, "", [], {}):
+                continue
+            selecionados[campo] = valor
+
+        # Descrição original e expandida repetidas não agregam informação
+        if selecionados.get("descricao_produto") == selecionados.get("produto_original"):
+            selecionados.pop("descricao_produto", None)
+
+        return selecionados
+
+    def select_result_fields(self, resultado: Dict[str, Any], origem: str) -> Dict[str, Any]:
+        """Mantém apenas os campos decisivos do resultado de outro agente."""
+        campos = AGENT_RESULT_FIELDS.get(origem)
+        if not campos or not isinstance(resultado, dict):
+            return resultado or {}
+        return {c: resultado[c] for c in campos if resultado.get(c) not in (None, "", [])}
+
+    def rank_semantic_context(self, resultados: Any) -> List[str]:
+        """
+        Ordena exemplos semânticos por relevância (score × peso, exemplos do
+        Golden Set primeiro em caso de empate), remove textos repetidos e
+        devolve cada exemplo como uma linha JSON compacta.
+        """
+        if not resultados:
+            return []
+        if isinstance(resultados, str):
+            return [linha for linha in resultados.splitlines() if linha.strip()]
+
+        ordenados = sorted(
+            (r for r in resultados if isinstance(r, dict)),
+            key=lambda r: (
+                float(r.get("score", 0) or 0) * float(r.get("peso", 1.0) or 1.0),
+                r.get("fonte") == "golden_set",
+            ),
+            reverse=True,
+        )
+
+        itens = []
+        vistos = set()
+        for resultado in ordenados:
+            texto = " ".join(str(resultado.get("text", "")).split())
+            if not texto or texto in vistos:
+                continue
+            vistos.add(texto)
+
+            metadata = resultado.get("metadata") or {}
+            item = {"texto": texto}
+            for campo in ("ncm", "cest"):
+                if metadata.get(campo):
+                    item[campo] = metadata[campo]
+            item["score"] = round(float(resultado.get("score", 0) or 0), 3)
+            itens.append(compact_json(item))
+
+        return itens
+
+    @staticmethod
+    def split_context_lines(context: Any) -> List[str]:
+        """Quebra um contexto textual em linhas não vazias (já em ordem de prioridade)."""
+        if not context:
+            return []
+        if not isinstance(context, str):
+            context = compact_json(context)
+        return [linha.rstrip() for linha in context.splitlines() if linha.strip()]
+
+    def render(self, template: str, fixed: Dict[str, str],
+               flexible: List[Tuple[str, List[str], str]], system: str = "") -> str:
+        """
+        Preenche o template respeitando o orçamento de tokens.
+
+        Args:
+            template: Template com campos nomeados no formato str.format.
+            fixed: Campos sempre incluídos integralmente.
+            flexible: Lista (nome, itens, texto_vazio) em ordem de prioridade;
+                      itens são incluídos por inteiro enquanto couberem.
+            system: Prompt de sistema, contabilizado no orçamento.
+
+        Returns:
+            O prompt final. O relatório de tokens fica em ultimo_relatorio.
+        """
+        vazios = {nome: vazio for nome, _, vazio in flexible}
+        base = template.format(**fixed, **vazios)
+        tokens_fixos = self.count_tokens(system) + self.count_tokens(base)
+        restante = self.token_budget - tokens_fixos
+
+        valores = {}
+        descartados = {}
+        for nome, itens, vazio in flexible:
+            # O texto de "vazio" já foi contabilizado na base
+            restante += self.count_tokens(vazio)
+            escolhidos = []
+            for item in itens:
+                custo = self.count_tokens(item) + 1  # +1 pela quebra de linha
+                if custo > restante:
+                    break
+                escolhidos.append(item)
+                restante -= custo
+            descartados[nome] = len(itens) - len(escolhidos)
+            if escolhidos:
+                valores[nome] = "\n".join(escolhidos)
+            else:
+                valores[nome] = vazio
+                restante -= self.count_tokens(vazio)
+
+        prompt = template.format(**fixed, **valores)
+        tokens_prompt = self.count_tokens(system) + self.count_tokens(prompt)
+
+        self.ultimo_relatorio = {
+            "agente": self.agent,
+            "tokens_prompt": tokens_prompt,
+            "orcamento_tokens": self.token_budget,
+            "excedeu_orcamento": tokens_prompt > self.token_budget,
+            "itens_descartados": descartados,
+            "metodo_contagem": self.token_counter.metodo,
+        }
+        return prompt
@@ -1,6 +1,7 @@
-import json
 from typing import Dict, Any
+from llm.response_parser import ResponseParser, ResponseParseError
 from .base_agent import BaseAgent
+from .prompt_builder import PromptBuilder, compact_json
 
 class ReconcilerAgent(BaseAgent):
     """
@@ -10,6 +11,8 @@ class ReconcilerAgent(BaseAgent):
 
     def __init__(self, llm_client, config):
         super().__init__("ReconcilerAgent", llm_client, config)
+        self.prompt_builder = PromptBuilder.from_config("reconciler", config)
+        self.response_parser = ResponseParser("reconciler")
         self.system_prompt = """
 Você é um auditor fiscal sênior. Sua função é revisar as recomendações de classificação de NCM e CEST para um produto e produzir uma classificação final e auditada.
 
@@ -34,6 +37,31 @@ Você é um auditor fiscal sênior. Sua função é revisar as recomendações d
   },
   "justificativa_final": "<Justificativa detalhada da decisão final.>"
 }
+"""
+
+    # Instruções fixas primeiro e dados variáveis por último (reuso do cache KV)
+    PROMPT_TEMPLATE = """
+Baseado em TODAS as informações abaixo, audite e reconcilie a classificação fiscal do produto no final e forneça a auditoria e a classificação final no formato JSON especificado.
+
+**Contexto Estruturado para Validação (Fonte da Verdade):**
+---
+{structured_context}
+---
+
+**Recomendação do Agente NCM:**
+```json
+{ncm}
+```
+
+**Recomendação do Agente CEST:**
+```json
+{cest}
+```
+
+**Produto:**
+```json
+{produto}
+```
 """
 
     def run(self, produto_expandido: Dict, ncm_result: Dict, cest_result: Dict, context: Dict[str, Any]) -> Dict[str, Any]:
@@ -50,36 +78,21 @@ Você é um auditor fiscal sênior. Sua função é revisar as recomendações d
             Um dicionário com a classificação final e um trace de auditoria.
         """
 
-        produto_str = json.dumps(produto_expandido, indent=2, ensure_ascii=False)
-        ncm_str = json.dumps(ncm_result, indent=2, ensure_ascii=False)
-        cest_str = json.dumps(cest_result, indent=2, ensure_ascii=False)
+        builder = self.prompt_builder
+        produto_str = compact_json(builder.select_product_fields(produto_expandido))
+        ncm_str = compact_json(builder.select_result_fields(ncm_result, "ncm"))
+        cest_str = compact_json(builder.select_result_fields(cest_result, "cest"))
         structured_context = context.get('structured_context', 'Nenhum contexto estruturado fornecido.')
 
-        prompt = f"""
-Audite e reconcilie a seguinte classificação fiscal.
-
-**Produto:**
-```json
-{produto_str}
-```
-
-**Recomendação do Agente NCM:**
-```json
-{ncm_str}
-```
-
-**Recomendação do Agente CEST:**
-```json
-{cest_str}
-```
-
-**Contexto Estruturado para Validação (Fonte da Verdade):**
----
-{structured_context}
----
-
-Baseado em TODAS as informações, forneça a auditoria e a classificação final no formato JSON especificado.
-"""
+        prompt = builder.render(
+            self.PROMPT_TEMPLATE,
+            fixed={"produto": produto_str, "ncm": ncm_str, "cest": cest_str},
+            flexible=[
+                ("structured_context", builder.split_context_lines(structured_context),
+                 "Nenhum contexto estruturado fornecido."),
+            ],
+            system=self.system_prompt
+        )
 
         try:
             response = self.llm_client.generate(
@@ -87,19 +100,18 @@ Baseado em TODAS as informações, forneça a auditoria e a classificação fina
                 system=self.system_prompt,
                 temperature=0.0
             )
+            self.contar_tokens_llm(prompt, response.get("response", ""), response,
+                                   system=self.system_prompt, relatorio_prompt=builder.ultimo_relatorio)
 
             if "error" in response:
                 result = {"error": f"Erro no LLM: {response['error']}"}
                 reasoning = result["error"]
             else:
                 try:
-                    response_text = response["response"].strip()
-                    if response_text.startswith("```json"):
-                        response_text = response_text[7:-3].strip()
-                    result = json.loads(response_text)
+                    result = self.response_parser.parse(response["response"], self._modelo_llm(response))
                     reasoning = f"Reconciliação completa. Consistente: {result.get('auditoria', {}).get('consistente', 'N/A')}."
-                except json.JSONDecodeError:
-                    result = {"error": "Resposta do LLM não é um JSON válido.", "raw_response": response["response"]}
+                except ResponseParseError as e:
+                    result = {"error": f"Resposta do LLM não é um JSON válido: {e}", "raw_response": response["response"]}
                     reasoning = result["error"]
 
             trace = self._create_trace("reconcile_classification", produto_expandido.get('produto_original', ''), result, reasoning)
@@ -10,21 +10,35 @@ from pathlib import Path
 # Configurar path
 sys.path.append('src')
 
-from fastapi import FastAPI, HTTPException, Depends, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, Query, BackgroundTasks, Response, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel, validator
+from sqlalchemy import text
 from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
 import logging
 import uuid
 import time
+import json
 import asyncio
+from anyio import to_thread
 
 # Imports do sistema unificado
 from services.unified_sqlite_service import get_unified_service
 from database.unified_sqlite_models import UnifiedBase
+from database.sqlite_connection import verificar_perfil_sqlite
+from database.paginacao_cursor import CursorInvalidoError
+from database.fila_processamento import STATUS_FINAIS
+from services.eventos_progresso import EVENTO_ETAPA
+from services.cache_respostas import (
+    CacheRespostas, etag_corresponde, TABELAS_NCM, TABELAS_CEST, TABELAS_EXEMPLOS, TABELAS_GOLDEN_SET,
+    TABELAS_EXPLICACOES
+)
+from api.respostas_json import RespostaJSONRapida, serializar_json, opcoes_campos, campos_modelo, enxugar_lista
+from services.processamento_lote import MotorProcessamento, evento_progresso
+from config import Config
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -36,7 +50,8 @@ app = FastAPI(
     description="API completa integrada com SQLite unificado para classificação fiscal NCM/CEST",
     version="3.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=RespostaJSONRapida
 )
 
 # Configurar CORS
@@ -51,6 +66,50 @@ app.add_middleware(
 # Serviço unificado
 unified_service = get_unified_service("data/unified_rag_system.db")
 
+@app.on_event("startup")
+async def configurar_threadpool():
+    """
+    Rotas com banco ou LLM síncronos são `def`: o FastAPI as executa no
+    threadpool e o event loop segue atendendo as demais requisições
+    """
+    limite = getattr(Config(), 'API_THREADPOOL_SIZE', 40)
+    to_thread.current_default_thread_limiter().total_tokens = limite
+    logger.info(f"🧵 Threadpool das rotas síncronas: {limite} threads")
+
+@app.on_event("startup")
+async def verificar_sqlite():
+    """Registra os PRAGMAs efetivos do banco unificado (WAL, cache, mmap)"""
+    verificar_perfil_sqlite(unified_service.engine, nome="unified_rag_system")
+
+async def _reconciliar_estatisticas_periodicamente(intervalo_minutos: int):
+    """Confere os contadores materializados do dashboard com varredura completa"""
+    while True:
+        await asyncio.sleep(intervalo_minutos * 60)
+        try:
+            await asyncio.to_thread(unified_service.reconciliar_estatisticas)
+        except Exception as e:
+            logger.error(f"Erro na reconciliação das estatísticas: {e}")
+
+@app.on_event("startup")
+async def agendar_reconciliacao_estatisticas():
+    """Agenda a reconciliação periódica dos contadores do dashboard"""
+    intervalo = getattr(Config(), 'STATS_RECONCILE_INTERVAL_MINUTES', 60)
+    if intervalo > 0:
+        asyncio.create_task(_reconciliar_estatisticas_periodicamente(intervalo))
+
+# Fila durável de processamento em lote (workers em processos separados)
+motor_processamento = MotorProcessamento(unified_service)
+
+@app.on_event("startup")
+async def iniciar_workers_processamento():
+    """Sobe os workers da fila de processamento em lote"""
+    await asyncio.to_thread(motor_processamento.iniciar)
+
+@app.on_event("shutdown")
+async def parar_workers_processamento():
+    """Workers devolvem as sessões em andamento à fila após o bloco atual"""
+    await asyncio.to_thread(motor_processamento.parar)
+
 # ==================
 # MODELOS PYDANTIC
 # ==================
@@ -190,89 +249,140 @@ class ContextoClassificacaoResponse(BaseModel):
     cest_especifico_aplicavel: Optional[str]
     justificativa_contexto: str
 
+# ==================
+# CACHE DE RESPOSTAS (CONSULTAS DE REFERÊNCIA)
+# ==================
+
+cache_respostas = CacheRespostas(
+    max_entradas=getattr(Config(), 'RESPONSE_CACHE_MAX_ENTRIES', 512),
+    ttl_segundos=getattr(Config(), 'RESPONSE_CACHE_TTL_SECONDS', 300)
+)
+
+def _responder_cacheado(request: Request, chave: tuple, tabelas, consultar) -> Response:
+    """
+    Corpo serializado do cache (ou de `consultar()` numa falta) com ETag;
+    If-None-Match com a mesma ETag recebe 304 sem corpo
+    """
+    entrada = cache_respostas.obter(chave, tabelas)
+    if entrada is None:
+        geracao = cache_respostas.geracao(tabelas)
+        conteudo = consultar()
+        entrada = cache_respostas.guardar(
+            chave, geracao, serializar_json(conteudo),
+            total_itens=len(conteudo) if isinstance(conteudo, list) else None
+        )
+        request.state.cache_resposta = "MISS"
+    else:
+        request.state.cache_resposta = "HIT"
+
+    request.state.total_itens = entrada.total_itens
+    cabecalhos = {"ETag": entrada.etag, "Cache-Control": "no-cache", "X-Cache": request.state.cache_resposta}
+    if etag_corresponde(request.headers.get("if-none-match"), entrada.etag):
+        return Response(status_code=304, headers=cabecalhos)
+    return Response(entrada.corpo, media_type="application/json", headers=cabecalhos)
+
+@app.get("/api/v1/cache/respostas")
+async def estatisticas_cache_respostas():
+    """Acertos e faltas do cache das consultas de referência"""
+    return cache_respostas.estatisticas()
+
 # ==================
 # ENDPOINTS KNOWLEDGE BASE
 # ==================
 
 @app.get("/api/v1/ncm/buscar", response_model=List[NCMResponse])
-async def buscar_ncms(
+def buscar_ncms(
+    request: Request,
+    background_tasks: BackgroundTasks,
     padrao: Optional[str] = Query(None, description="Padrão para busca na descrição"),
     nivel: Optional[int] = Query(None, description="Nível hierárquico (2, 4, 6, 8)"),
     codigo_ncm: Optional[str] = Query(None, description="Código NCM específico"),
     limite: int = Query(20, description="Limite de resultados")
 ):
-    """Busca NCMs por diferentes critérios"""
+    """Busca NCMs por diferentes critérios (cache com ETag)"""
     try:
         start_time = time.time()
         
-        if codigo_ncm:
-            # Busca específica
-            ncm = unified_service.buscar_ncm(codigo_ncm)
-            resultados = [ncm] if ncm else []
-        elif nivel:
-            # Busca por nível
-            resultados = unified_service.buscar_ncms_por_nivel(nivel, limite)
-        elif padrao:
-            # Busca por padrão
-            resultados = unified_service.buscar_ncms_por_padrao(padrao, limite)
-        else:
-            # Busca geral (nível 2)
-            resultados = unified_service.buscar_ncms_por_nivel(2, limite)
+        def consultar():
+            if codigo_ncm:
+                # Busca específica
+                ncm = unified_service.buscar_ncm(codigo_ncm)
+                resultados = [ncm] if ncm else []
+            elif nivel:
+                # Busca por nível
+                resultados = unified_service.buscar_ncms_por_nivel(nivel, limite)
+            elif padrao:
+                # Busca por padrão
+                resultados = unified_service.buscar_ncms_por_padrao(padrao, limite)
+            else:
+                # Busca geral (nível 2)
+                resultados = unified_service.buscar_ncms_por_nivel(2, limite)
+            return [NCMResponse(**ncm) for ncm in resultados]
+        
+        resposta = _responder_cacheado(
+            request, ("ncm/buscar", padrao, nivel, codigo_ncm, limite), TABELAS_NCM, consultar
+        )
         
-        # Registrar interação web
+        # Registrar interação web depois da resposta
         tempo_ms = int((time.time() - start_time) * 1000)
-        unified_service.registrar_interacao_web({
+        background_tasks.add_task(unified_service.registrar_interacao_web, {
             'sessao_usuario': str(uuid.uuid4()),
             'tipo_interacao': 'CONSULTA_NCM',
             'endpoint_acessado': '/api/v1/ncm/buscar',
             'metodo_http': 'GET',
             'dados_entrada': {'padrao': padrao, 'nivel': nivel, 'codigo_ncm': codigo_ncm},
-            'dados_saida': {'total_resultados': len(resultados)},
+            'dados_saida': {'total_resultados': request.state.total_itens, 'cache': request.state.cache_resposta},
             'tempo_processamento_ms': tempo_ms,
             'sucesso': True,
-            'codigo_resposta': 200
+            'codigo_resposta': resposta.status_code
         })
         
-        return resultados
+        return resposta
         
     except Exception as e:
         logger.error(f"Erro ao buscar NCMs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/cest/para-ncm/{codigo_ncm}", response_model=List[CESTResponse])
-async def buscar_cests_para_ncm(codigo_ncm: str):
-    """Busca CESTs relacionados a um NCM"""
+def buscar_cests_para_ncm(codigo_ncm: str, request: Request, background_tasks: BackgroundTasks):
+    """Busca CESTs relacionados a um NCM (cache com ETag)"""
     try:
         start_time = time.time()
         
-        resultados = unified_service.buscar_cests_para_ncm(codigo_ncm)
+        resposta = _responder_cacheado(
+            request, ("cest/para-ncm", codigo_ncm), TABELAS_CEST,
+            lambda: [CESTResponse(**cest) for cest in unified_service.buscar_cests_para_ncm(codigo_ncm)]
+        )
         
-        # Registrar interação
+        # Registrar interação depois da resposta
         tempo_ms = int((time.time() - start_time) * 1000)
-        unified_service.registrar_interacao_web({
+        background_tasks.add_task(unified_service.registrar_interacao_web, {
             'sessao_usuario': str(uuid.uuid4()),
             'tipo_interacao': 'CONSULTA_CEST',
             'endpoint_acessado': f'/api/v1/cest/para-ncm/{codigo_ncm}',
             'metodo_http': 'GET',
             'dados_entrada': {'codigo_ncm': codigo_ncm},
-            'dados_saida': {'total_resultados': len(resultados)},
+            'dados_saida': {'total_resultados': request.state.total_itens, 'cache': request.state.cache_resposta},
             'tempo_processamento_ms': tempo_ms,
             'sucesso': True,
-            'codigo_resposta': 200
+            'codigo_resposta': resposta.status_code
         })
         
-        return resultados
+        return resposta
         
     except Exception as e:
         logger.error(f"Erro ao buscar CESTs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/ncm/{codigo_ncm}/exemplos")
-async def buscar_exemplos_ncm(codigo_ncm: str, limite: int = Query(10, description="Limite de exemplos")):
-    """Busca exemplos de produtos para um NCM"""
+def buscar_exemplos_ncm(codigo_ncm: str, request: Request,
+                              limite: int = Query(10, description="Limite de exemplos")):
+    """Busca exemplos de produtos para um NCM (cache com ETag)"""
     try:
-        resultados = unified_service.buscar_exemplos_ncm(codigo_ncm, limite)
-        return {"codigo_ncm": codigo_ncm, "exemplos": resultados}
+        return _responder_cacheado(
+            request, ("ncm/exemplos", codigo_ncm, limite), TABELAS_EXEMPLOS,
+            lambda: {"codigo_ncm": codigo_ncm, "exemplos": unified_service.buscar_exemplos_ncm(codigo_ncm, limite)}
+        )
         
     except Exception as e:
         logger.error(f"Erro ao buscar exemplos: {e}")
@@ -283,7 +393,7 @@ async def buscar_exemplos_ncm(codigo_ncm: str, limite: int = Query(10, descripti
 # ==================
 
 @app.post("/api/v1/classificar", response_model=ClassificacaoResponse)
-async def classificar_produto(request: ProdutoClassificacaoRequest, background_tasks: BackgroundTasks):
+def classificar_produto(request: ProdutoClassificacaoRequest, background_tasks: BackgroundTasks):
     """Classifica um produto (endpoint principal)"""
     try:
         start_time = time.time()
@@ -345,18 +455,31 @@ async def classificar_produto(request: ProdutoClassificacaoRequest, background_t
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/classificacoes/pendentes", response_model=List[ClassificacaoResponse])
-async def listar_classificacoes_pendentes(limite: int = Query(50, description="Limite de resultados")):
+def listar_classificacoes_pendentes(
+    limite: int = Query(50, description="Limite de resultados"),
+    cursor: Optional[str] = Query(None, description="Cursor da página anterior (cabeçalho X-Proximo-Cursor)"),
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula")
+):
     """Lista classificações pendentes de revisão"""
     try:
-        resultados = unified_service.buscar_classificacoes_pendentes(limite)
-        return resultados
-        
+        pagina = unified_service.pagina_classificacoes("PENDENTE_REVISAO", limite, cursor=cursor)
+        cabecalhos = {"X-Total-Count": str(pagina['total'])}
+        if pagina['proximo_cursor']:
+            cabecalhos["X-Proximo-Cursor"] = pagina['proximo_cursor']
+        
+        # Itens já são dicts serializáveis: resposta direta, sem revalidar pelo response_model
+        campos, _ = opcoes_campos(fields)
+        itens = enxugar_lista(pagina['itens'], campos, permitidos=campos_modelo(ClassificacaoResponse))
+        return RespostaJSONRapida(itens, headers=cabecalhos)
+        
+    except CursorInvalidoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Erro ao buscar pendentes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/api/v1/classificacoes/{classificacao_id}/revisar")
-async def revisar_classificacao(classificacao_id: int, request: RevisaoRequest):
+def revisar_classificacao(classificacao_id: int, request: RevisaoRequest):
     """Aplica revisão humana a uma classificação"""
     try:
         start_time = time.time()
@@ -399,7 +522,7 @@ async def revisar_classificacao(classificacao_id: int, request: RevisaoRequest):
 # ==================
 
 @app.post("/api/v1/golden-set")
-async def adicionar_golden_set(request: GoldenSetRequest):
+def adicionar_golden_set(request: GoldenSetRequest):
     """Adiciona entrada ao Golden Set"""
     try:
         golden_id = unified_service.adicionar_ao_golden_set(request.dict())
@@ -410,14 +533,18 @@ async def adicionar_golden_set(request: GoldenSetRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/golden-set")
-async def listar_golden_set(
+def listar_golden_set(
+    request: Request,
     ncm: Optional[str] = Query(None, description="Filtrar por NCM"),
     limite: int = Query(50, description="Limite de resultados")
 ):
-    """Lista entradas do Golden Set"""
+    """Lista entradas do Golden Set (cache com ETag)"""
     try:
-        resultados = unified_service.buscar_golden_set(ncm=ncm, limite=limite)
-        return {"total": len(resultados), "entradas": resultados}
+        def consultar():
+            resultados = unified_service.buscar_golden_set(ncm=ncm, limite=limite)
+            return {"total": len(resultados), "entradas": resultados}
+        
+        return _responder_cacheado(request, ("golden-set", ncm, limite), TABELAS_GOLDEN_SET, consultar)
         
     except Exception as e:
         logger.error(f"Erro ao buscar Golden Set: {e}")
@@ -428,7 +555,7 @@ async def listar_golden_set(
 # ==================
 
 @app.post("/api/v1/explicacoes")
-async def salvar_explicacao_agente(request: ExplicacaoAgenteRequest):
+def salvar_explicacao_agente(request: ExplicacaoAgenteRequest):
     """Salva explicação de um agente"""
     try:
         explicacao_id = unified_service.salvar_explicacao_agente(request.dict())
@@ -439,11 +566,13 @@ async def salvar_explicacao_agente(request: ExplicacaoAgenteRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/v1/produtos/{produto_id}/explicacoes")
-async def buscar_explicacoes_produto(produto_id: int):
-    """Busca todas as explicações de um produto"""
+def buscar_explicacoes_produto(produto_id: int, request: Request):
+    """Busca todas as explicações de um produto (cache com ETag)"""
     try:
-        explicacoes = unified_service.buscar_explicacoes_produto(produto_id)
-        return {"produto_id": produto_id, "explicacoes": explicacoes}
+        return _responder_cacheado(
+            request, ("produtos/explicacoes", produto_id), TABELAS_EXPLICACOES,
+            lambda: {"produto_id": produto_id, "explicacoes": unified_service.buscar_explicacoes_produto(produto_id)}
+        )
         
     except Exception as e:
         logger.error(f"Erro ao buscar explicações: {e}")
@@ -454,7 +583,7 @@ async def buscar_explicacoes_produto(produto_id: int):
 # ==================
 
 @app.post("/api/v1/consultas")
-async def registrar_consulta_agente(request: ConsultaAgenteRequest):
+def registrar_consulta_agente(request: ConsultaAgenteRequest):
     """Registra consulta realizada por um agente"""
     try:
         consulta_id = unified_service.registrar_consulta_agente(request.dict())
@@ -469,7 +598,7 @@ async def registrar_consulta_agente(request: ConsultaAgenteRequest):
 # ==================
 
 @app.get("/api/v1/dashboard/stats")
-async def dashboard_stats():
+def dashboard_stats():
     """Obtém estatísticas para o dashboard"""
     try:
         start_time = time.time()
@@ -500,8 +629,17 @@ async def dashboard_stats():
         logger.error(f"Erro no dashboard: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/dashboard/stats/reconciliar")
+async def dashboard_reconciliar(corrigir: bool = Query(True, description="Recalcular contadores divergentes")):
+    """Confere os contadores do dashboard com a varredura completa das tabelas"""
+    try:
+        return await asyncio.to_thread(unified_service.reconciliar_estatisticas, corrigir)
+    except Exception as e:
+        logger.error(f"Erro na reconciliação das estatísticas: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/v1/dashboard/metricas")
-async def dashboard_metricas():
+def dashboard_metricas():
     """Obtém métricas de qualidade"""
     try:
         from datetime import timedelta
@@ -529,7 +667,7 @@ async def dashboard_metricas():
 # ==================
 
 @app.get("/api/v1/sistema/status")
-async def sistema_status():
+def sistema_status():
     """Verifica status do sistema"""
     try:
         # Verificar conectividade do banco
@@ -562,7 +700,7 @@ async def health_check():
 # FUNÇÕES AUXILIARES
 # ==================
 
-async def registrar_consultas_agentes(produto_id: int, sessao_id: str):
+def registrar_consultas_agentes(produto_id: int, sessao_id: str):
     """Registra consultas simuladas dos agentes (background task)"""
     try:
         agentes_consultas = [
@@ -605,7 +743,7 @@ async def registrar_consultas_agentes(produto_id: int, sessao_id: str):
 # ==================
 
 @app.post("/api/v1/empresa/configurar", response_model=InformacaoEmpresaResponse)
-async def configurar_empresa(request: InformacaoEmpresaRequest):
+def configurar_empresa(request: InformacaoEmpresaRequest):
     """
     Configura ou atualiza as informações da empresa para contexto de classificação
     """
@@ -658,7 +796,7 @@ async def configurar_empresa(request: InformacaoEmpresaRequest):
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.get("/api/v1/empresa", response_model=Optional[InformacaoEmpresaResponse])
-async def obter_empresa():
+def obter_empresa():
     """
     Obtém as informações atuais da empresa
     """
@@ -688,7 +826,7 @@ async def obter_empresa():
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.get("/api/v1/empresa/contexto", response_model=Optional[ContextoClassificacaoResponse])
-async def obter_contexto_empresa():
+def obter_contexto_empresa():
     """
     Obtém o contexto de classificação baseado na empresa configurada
     """
@@ -725,7 +863,7 @@ async def obter_contexto_empresa():
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.delete("/api/v1/empresa")
-async def remover_empresa():
+def remover_empresa():
     """
     Remove as informações da empresa (desativa)
     """
@@ -753,7 +891,7 @@ async def remover_empresa():
 # ==================
 
 @app.get("/api/v1/dashboard/stats")
-async def get_dashboard_stats():
+def get_dashboard_stats():
     """
     [Tarefa 1.1] GET /dashboard/stats: Retorna estatísticas para o dashboard
     """
@@ -839,146 +977,120 @@ async def get_dashboard_stats():
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.get("/api/v1/produtos")
-async def get_produtos_filtrados(
+def get_produtos_filtrados(
     status: Optional[str] = Query(None, description="Filtro por status: classificado, nao_classificado, pendente"),
-    page: int = Query(1, ge=1, description="Página (começa em 1)"),
+    page: int = Query(1, ge=1, description="Página (começa em 1; ignorada com cursor)"),
     limit: int = Query(50, ge=1, le=1000, description="Itens por página"),
-    search: Optional[str] = Query(None, description="Busca por descrição")
+    search: Optional[str] = Query(None, description="Busca por descrição"),
+    cursor: Optional[str] = Query(None, description="Cursor da página anterior (pagination.proximo_cursor)"),
+    fields: Optional[str] = Query(None, description="Campos de cada produto, separados por vírgula")
 ):
     """
     [Tarefa 1.2] GET /produtos: Adicionar filtro por status (classificado, nao_classificado)
+    
+    Produtos classificados ficam em classificacoes_revisao. Paginação por
+    cursor (data_criacao, id): a página N custa o mesmo que a primeira;
+    `page` sem cursor mantém o OFFSET. O total vem dos contadores
+    materializados ou de um COUNT(*) em cache.
     """
     try:
-        service = get_unified_service()
-        offset = (page - 1) * limit
+        filtros = {}
+        if status == "classificado":
+            filtros["classificado"] = True
+        elif status == "nao_classificado":
+            filtros["classificado"] = False
+        elif status == "pendente":
+            filtros["status"] = "PENDENTE_REVISAO"
+        
+        pagina = unified_service.pagina_classificacoes(
+            limite=limit,
+            cursor=cursor,
+            offset=(page - 1) * limit,
+            busca=search,
+            **filtros
+        )
         
-        with service.get_session() as session:
-            # Construir query base
-            where_conditions = []
-            params = {}
-            
-            # Filtro por status
-            if status:
-                if status == "classificado":
-                    where_conditions.append("ncm_sugerido IS NOT NULL AND ncm_sugerido != '' AND status_revisao != 'PENDENTE'")
-                elif status == "nao_classificado":
-                    where_conditions.append("(ncm_sugerido IS NULL OR ncm_sugerido = '' OR status_revisao = 'PENDENTE')")
-                elif status == "pendente":
-                    where_conditions.append("status_revisao = 'PENDENTE'")
-            
-            # Filtro por busca
-            if search:
-                where_conditions.append("descricao_produto LIKE :search")
-                params["search"] = f"%{search}%"
-            
-            # Montar WHERE clause
-            where_clause = ""
-            if where_conditions:
-                where_clause = "WHERE " + " AND ".join(where_conditions)
-            
-            # Query principal
-            query = f"""
-                SELECT 
-                    p.*,
-                    CASE 
-                        WHEN p.ncm_sugerido IS NOT NULL AND p.ncm_sugerido != '' AND p.status_revisao != 'PENDENTE' 
-                        THEN 'classificado'
-                        ELSE 'nao_classificado'
-                    END as status_classificacao
-                FROM produtos p
-                {where_clause}
-                ORDER BY p.data_criacao DESC
-                LIMIT :limit OFFSET :offset
-            """
-            
-            params.update({"limit": limit, "offset": offset})
-            
-            produtos = session.execute(query, params).fetchall()
-            
-            # Query para total
-            count_query = f"""
-                SELECT COUNT(*) as total 
-                FROM produtos p 
-                {where_clause}
-            """
-            
-            total = session.execute(count_query, {k: v for k, v in params.items() if k not in ['limit', 'offset']}).fetchone()[0]
-            
-            # Formatar resultados
-            produtos_list = []
-            for row in produtos:
-                produto = dict(row._mapping)
-                produto['status_classificacao'] = row.status_classificacao
-                produtos_list.append(produto)
-            
-            return {
-                "produtos": produtos_list,
-                "pagination": {
-                    "page": page,
-                    "limit": limit,
-                    "total": total,
-                    "pages": (total + limit - 1) // limit
-                },
-                "filtros_aplicados": {
-                    "status": status,
-                    "search": search
-                }
+        # Formatar resultados
+        produtos_list = []
+        for produto in pagina['itens']:
+            classificado = (
+                bool(produto.get('ncm_sugerido'))
+                and produto.get('status_revisao') != 'PENDENTE_REVISAO'
+            )
+            produto['status_classificacao'] = 'classificado' if classificado else 'nao_classificado'
+            produtos_list.append(produto)
+        campos, _ = opcoes_campos(fields)
+        if campos:
+            produtos_list = enxugar_lista(produtos_list, campos)
+        
+        # Páginas de até 1000 itens: resposta direta, sem jsonable_encoder
+        total = pagina['total']
+        return RespostaJSONRapida({
+            "produtos": produtos_list,
+            "pagination": {
+                "page": page,
+                "limit": limit,
+                "total": total,
+                "pages": (total + limit - 1) // limit,
+                "proximo_cursor": pagina['proximo_cursor']
+            },
+            "filtros_aplicados": {
+                "status": status,
+                "search": search
             }
-            
+        })
+    
+    except CursorInvalidoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Erro ao buscar produtos filtrados: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.post("/api/v1/produtos/{produto_id}/classificar")
-async def classificar_produto_individual(
+def classificar_produto_individual(
     produto_id: int,
-    background_tasks: BackgroundTasks,
-    force_reclassify: bool = Query(False, description="Forçar reclassificação mesmo se já classificado")
+    force_reclassify: bool = Query(False, description="Forçar reclassificação mesmo se já classificado"),
+    empresa_id: Optional[str] = Query(None, description="Empresa (fila justa do agendador LLM)")
 ):
     """
     [Tarefa 1.3] POST /produtos/{id}/classificar: Inicia a classificação para um produto
+    
+    Enfileira uma sessão de um bloco na fila de processamento; acompanhe em
+    /api/v1/processo/status/{sessao_id}.
     """
     try:
-        service = get_unified_service()
-        
-        with service.get_session() as session:
-            # Verificar se produto existe
-            produto = session.execute(
-                "SELECT * FROM produtos WHERE produto_id = ?", 
-                (produto_id,)
-            ).fetchone()
-            
-            if not produto:
-                raise HTTPException(status_code=404, detail="Produto não encontrado")
-            
-            # Verificar se já está classificado
-            if not force_reclassify and produto.ncm_sugerido and produto.status_revisao != 'PENDENTE':
-                return {
-                    "message": "Produto já classificado",
-                    "produto_id": produto_id,
-                    "status": "already_classified",
-                    "ncm_atual": produto.ncm_sugerido,
-                    "cest_atual": produto.cest_sugerido
-                }
-            
-            # Gerar ID da sessão
-            sessao_id = str(uuid.uuid4())
-            
-            # Adicionar tarefa de classificação em background
-            background_tasks.add_task(
-                processar_classificacao_individual,
-                produto_id=produto_id,
-                sessao_id=sessao_id,
-                force_reclassify=force_reclassify
-            )
-            
+        with unified_service.get_session() as session:
+            # Verificar se produto existe (classificação mais recente do produto)
+            produto = session.execute(text(
+                "SELECT id, ncm_sugerido, cest_sugerido, status_revisao FROM classificacoes_revisao "
+                "WHERE produto_id = :produto_id ORDER BY id DESC LIMIT 1"
+            ), {"produto_id": produto_id}).fetchone()
+        
+        if not produto:
+            raise HTTPException(status_code=404, detail="Produto não encontrado")
+        
+        # Verificar se já está classificado
+        if not force_reclassify and produto.ncm_sugerido and produto.status_revisao != 'PENDENTE_REVISAO':
             return {
-                "message": "Classificação iniciada",
+                "message": "Produto já classificado",
                 "produto_id": produto_id,
-                "sessao_id": sessao_id,
-                "status": "processing",
-                "estimated_time_seconds": 30
+                "status": "already_classified",
+                "ncm_atual": produto.ncm_sugerido,
+                "cest_atual": produto.cest_sugerido
             }
+        
+        sessao = motor_processamento.enfileirar_classificacao(
+            empresa_id=empresa_id, classificacao_ids=[produto.id]
+        )
+        
+        return {
+            "message": "Classificação iniciada",
+            "produto_id": produto_id,
+            "sessao_id": sessao['sessao_id'],
+            "status": "processing",
+            "status_url": f"/api/v1/processo/status/{sessao['sessao_id']}",
+            "eventos_url": f"/api/v1/processo/{sessao['sessao_id']}/eventos"
+        }
             
     except HTTPException:
         raise
@@ -988,7 +1100,7 @@ async def classificar_produto_individual(
 
 # Endpoints para Base Padrão (Golden Set)
 @app.get("/api/v1/base-padrao")
-async def get_base_padrao(
+def get_base_padrao(
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=1000),
     search: Optional[str] = Query(None, description="Busca por descrição")
@@ -1037,7 +1149,7 @@ async def get_base_padrao(
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.post("/api/v1/base-padrao")
-async def create_base_padrao_item(item: GoldenSetRequest):
+def create_base_padrao_item(item: GoldenSetRequest):
     """
     [Tarefa 1.4] Endpoints CRUD para a Base Padrão - Criar
     """
@@ -1079,6 +1191,7 @@ async def create_base_padrao_item(item: GoldenSetRequest):
             )
             
             session.commit()
+            cache_respostas.invalidar(*TABELAS_GOLDEN_SET)
             
             return {
                 "message": "Item adicionado à base padrão com sucesso",
@@ -1093,7 +1206,7 @@ async def create_base_padrao_item(item: GoldenSetRequest):
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.put("/api/v1/base-padrao/{golden_set_id}")
-async def update_base_padrao_item(golden_set_id: str, item: GoldenSetRequest):
+def update_base_padrao_item(golden_set_id: str, item: GoldenSetRequest):
     """
     [Tarefa 1.4] Endpoints CRUD para a Base Padrão - Atualizar
     """
@@ -1133,6 +1246,7 @@ async def update_base_padrao_item(golden_set_id: str, item: GoldenSetRequest):
             )
             
             session.commit()
+            cache_respostas.invalidar(*TABELAS_GOLDEN_SET)
             
             return {
                 "message": "Item atualizado com sucesso",
@@ -1147,7 +1261,7 @@ async def update_base_padrao_item(golden_set_id: str, item: GoldenSetRequest):
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.delete("/api/v1/base-padrao/{golden_set_id}")
-async def delete_base_padrao_item(golden_set_id: str):
+def delete_base_padrao_item(golden_set_id: str):
     """
     [Tarefa 1.4] Endpoints CRUD para a Base Padrão - Excluir
     """
@@ -1171,6 +1285,7 @@ async def delete_base_padrao_item(golden_set_id: str):
             )
             
             session.commit()
+            cache_respostas.invalidar(*TABELAS_GOLDEN_SET)
             
             return {
                 "message": "Item removido da base padrão com sucesso",
@@ -1186,23 +1301,24 @@ async def delete_base_padrao_item(golden_set_id: str):
 
 # Endpoints para o Wizard de Processo
 @app.post("/api/v1/processo/sincronizar")
-async def sincronizar_produtos(background_tasks: BackgroundTasks):
+def sincronizar_produtos(
+    limite: Optional[int] = Query(None, description="Limite de produtos a carregar")
+):
     """
     [Tarefa 1.5] Endpoints para o Wizard - Sincronizar produtos do PostgreSQL
+    
+    Produtos ainda sem classificação entram em classificacoes_revisao como
+    pendentes; a sessão roda em um worker da fila de processamento.
     """
     try:
-        sessao_id = str(uuid.uuid4())
-        
-        background_tasks.add_task(
-            executar_sincronizacao_produtos,
-            sessao_id=sessao_id
-        )
+        sessao = motor_processamento.enfileirar_sincronizacao(limite)
         
         return {
             "message": "Sincronização de produtos iniciada",
-            "sessao_id": sessao_id,
+            "sessao_id": sessao['sessao_id'],
             "status": "processing",
-            "estimated_time_minutes": 5
+            "status_url": f"/api/v1/processo/status/{sessao['sessao_id']}",
+            "eventos_url": f"/api/v1/processo/{sessao['sessao_id']}/eventos"
         }
         
     except Exception as e:
@@ -1210,33 +1326,37 @@ async def sincronizar_produtos(background_tasks: BackgroundTasks):
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.post("/api/v1/processo/classificar-lote")
-async def classificar_lote(
-    background_tasks: BackgroundTasks,
+def classificar_lote(
     limite_produtos: Optional[int] = Query(None, description="Limite de produtos para classificar"),
-    apenas_pendentes: bool = Query(True, description="Classificar apenas produtos pendentes")
+    apenas_pendentes: bool = Query(True, description="Classificar apenas produtos pendentes"),
+    empresa_id: Optional[str] = Query(None, description="Empresa (limite de sessões simultâneas por empresa)")
 ):
     """
     [Tarefa 1.5] Endpoints para o Wizard - Classificar produtos em lote
+    
+    Os produtos são divididos em blocos de BATCH_JOB_CHUNK_SIZE; cada bloco
+    classificado é gravado com checkpoint, então a sessão sobrevive à queda
+    do worker e pode ser cancelada ou retomada.
     """
     try:
-        sessao_id = str(uuid.uuid4())
-        
-        background_tasks.add_task(
-            executar_classificacao_lote,
-            sessao_id=sessao_id,
+        sessao = motor_processamento.enfileirar_classificacao(
             limite_produtos=limite_produtos,
-            apenas_pendentes=apenas_pendentes
+            apenas_pendentes=apenas_pendentes,
+            empresa_id=empresa_id
         )
         
         return {
             "message": "Classificação em lote iniciada",
-            "sessao_id": sessao_id,
+            "sessao_id": sessao['sessao_id'],
             "status": "processing",
             "parametros": {
                 "limite_produtos": limite_produtos,
                 "apenas_pendentes": apenas_pendentes
             },
-            "estimated_time_minutes": 10
+            "total_produtos": sessao['total_itens'],
+            "total_blocos": sessao['total_blocos'],
+            "status_url": f"/api/v1/processo/status/{sessao['sessao_id']}",
+            "eventos_url": f"/api/v1/processo/{sessao['sessao_id']}/eventos"
         }
         
     except Exception as e:
@@ -1244,119 +1364,138 @@ async def classificar_lote(
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @app.get("/api/v1/processo/status/{sessao_id}")
-async def get_processo_status(sessao_id: str):
+def get_processo_status(sessao_id: str):
     """
-    Obter status de uma sessão de processamento
+    Obter status de uma sessão de processamento, com vazão e ETA
     """
     try:
-        service = get_unified_service()
+        status = motor_processamento.status(sessao_id)
         
-        with service.get_session() as session:
-            # Buscar status na tabela de logs ou sessões
-            status = session.execute(
-                """
-                SELECT status, progresso, mensagem, data_atualizacao
-                FROM sessoes_processamento 
-                WHERE sessao_id = ?
-                ORDER BY data_atualizacao DESC
-                LIMIT 1
-                """,
-                (sessao_id,)
-            ).fetchone()
-            
-            if not status:
-                return {
-                    "sessao_id": sessao_id,
-                    "status": "not_found",
-                    "message": "Sessão não encontrada"
-                }
-            
+        if not status:
             return {
                 "sessao_id": sessao_id,
-                "status": status[0],
-                "progresso": status[1],
-                "mensagem": status[2],
-                "data_atualizacao": status[3]
+                "status": "not_found",
+                "message": "Sessão não encontrada"
             }
+        
+        return {
+            "sessao_id": sessao_id,
+            "tipo": status['tipo'],
+            "status": status['status'],
+            "progresso": status['progresso'],
+            "mensagem": status['mensagem'],
+            "data_atualizacao": status['data_atualizacao'],
+            "total_itens": status['total_itens'],
+            "itens_processados": status['itens_processados'],
+            "itens_erro": status['itens_erro'],
+            "blocos": {"total": status['total_blocos'], "concluidos": status['blocos_concluidos']},
+            "itens_por_minuto": status['itens_por_minuto'],
+            "eta_segundos": status['eta_segundos'],
+            "cancelamento_solicitado": bool(status['cancelamento_solicitado']),
+            "data_inicio": status['data_inicio'],
+            "data_fim": status['data_fim']
+        }
             
     except Exception as e:
         logger.error(f"Erro ao buscar status da sessão {sessao_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+@app.get("/api/v1/processo/sessoes")
+def listar_sessoes_processo(
+    limite: int = Query(20, ge=1, le=200),
+    status: Optional[str] = Query(None, description="pendente, executando, concluido, erro, cancelado")
+):
+    """Sessões de processamento mais recentes"""
+    try:
+        return {"sessoes": motor_processamento.listar(limite, status)}
+    except Exception as e:
+        logger.error(f"Erro ao listar sessões de processamento: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+
+@app.post("/api/v1/processo/{sessao_id}/cancelar")
+def cancelar_processo(sessao_id: str):
+    """Cancela a sessão (em execução, encerra ao fim do bloco atual)"""
+    status = motor_processamento.cancelar(sessao_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    return {"sessao_id": sessao_id, "status": status}
+
+@app.post("/api/v1/processo/{sessao_id}/retomar")
+def retomar_processo(sessao_id: str):
+    """Devolve à fila uma sessão cancelada ou com erro, a partir do primeiro bloco pendente"""
+    if not motor_processamento.retomar(sessao_id):
+        raise HTTPException(status_code=409, detail="Sessão não encontrada ou sem blocos pendentes para retomar")
+    return {"sessao_id": sessao_id, "status": "pendente"}
+
 # ==================
-# FUNÇÕES DE BACKGROUND TASKS
+# PROGRESSO EM TEMPO REAL (SSE / WEBSOCKET)
 # ==================
 
-async def processar_classificacao_individual(produto_id: int, sessao_id: str, force_reclassify: bool = False):
-    """
-    Processar classificação individual em background
-    """
-    try:
-        # Aqui você integraria com o sistema de agentes existente
-        # Por enquanto, vamos simular o processamento
-        
-        logger.info(f"Iniciando classificação do produto {produto_id} na sessão {sessao_id}")
-        
-        service = get_unified_service()
-        
-        # Simular tempo de processamento
-        await asyncio.sleep(2)
-        
-        with service.get_session() as session:
-            # Atualizar status do produto (simulação)
-            session.execute(
-                """
-                UPDATE produtos SET
-                    ncm_sugerido = '12345678',
-                    cest_sugerido = '01.001.00',
-                    confianca_sugerida = 0.95,
-                    status_revisao = 'AGUARDANDO_REVISAO',
-                    data_atualizacao = ?
-                WHERE produto_id = ?
-                """,
-                (datetime.now().isoformat(), produto_id)
-            )
-            
-            session.commit()
-        
-        logger.info(f"Classificação do produto {produto_id} concluída")
-        
-    except Exception as e:
-        logger.error(f"Erro na classificação do produto {produto_id}: {str(e)}")
+def _evento_final(evento: Optional[Dict[str, Any]]) -> bool:
+    return bool(evento) and evento.get('tipo') != EVENTO_ETAPA and evento.get('status') in STATUS_FINAIS
 
-async def executar_sincronizacao_produtos(sessao_id: str):
+async def _eventos_sessao(sessao_id: str):
     """
-    Executar sincronização de produtos em background
+    Estado atual da sessão (uma leitura) seguido dos eventos do barramento até
+    o status final. None marca o intervalo de keepalive sem eventos
     """
+    intervalo = getattr(Config(), 'PROGRESS_KEEPALIVE_SECONDS', 15)
+    # Assinar antes da leitura: nenhum evento se perde entre as duas
+    assinatura = motor_processamento.barramento.assinar(sessao_id)
     try:
-        logger.info(f"Iniciando sincronização de produtos na sessão {sessao_id}")
-        
-        # Aqui você integraria com o PostgreSQL da empresa
-        # Por enquanto, vamos simular
-        
-        await asyncio.sleep(5)  # Simular tempo de processamento
-        
-        logger.info(f"Sincronização de produtos da sessão {sessao_id} concluída")
-        
-    except Exception as e:
-        logger.error(f"Erro na sincronização da sessão {sessao_id}: {str(e)}")
-
-async def executar_classificacao_lote(sessao_id: str, limite_produtos: Optional[int], apenas_pendentes: bool):
+        status = await asyncio.to_thread(motor_processamento.status, sessao_id)
+        if status is None:
+            yield {"tipo": "erro", "mensagem": "Sessão não encontrada"}
+            return
+
+        evento = evento_progresso(status)
+        yield evento
+        while not _evento_final(evento):
+            evento = await assinatura.proximo(intervalo)
+            if evento is None and not motor_processamento.eventos_locais:
+                # Workers externos não publicam neste processo: leitura esparsa do banco
+                status = await asyncio.to_thread(motor_processamento.status, sessao_id)
+                evento = evento_progresso(status) if status else None
+            yield evento
+    finally:
+        assinatura.cancelar()
+
+@app.get("/api/v1/processo/{sessao_id}/eventos")
+async def eventos_processo_sse(sessao_id: str, request: Request):
     """
-    Executar classificação em lote em background
+    Progresso da sessão via Server-Sent Events: status, blocos concluídos e
+    etapas da classificação (expansão, agrupamento, representantes, propagação)
     """
+    async def gerar():
+        eventos = _eventos_sessao(sessao_id)
+        try:
+            async for evento in eventos:
+                if await request.is_disconnected():
+                    break
+                if evento is None:
+                    yield ": keepalive\n\n"
+                    continue
+                cabecalho = f"id: {evento['sequencia']}\n" if 'sequencia' in evento else ""
+                yield f"{cabecalho}event: {evento['tipo']}\ndata: {json.dumps(evento, default=str)}\n\n"
+        finally:
+            await eventos.aclose()
+
+    return StreamingResponse(gerar(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/api/v1/processo/{sessao_id}/ws")
+async def eventos_processo_ws(websocket: WebSocket, sessao_id: str):
+    """Mesmos eventos de /eventos via WebSocket; fecha após o status final"""
+    await websocket.accept()
+    eventos = _eventos_sessao(sessao_id)
     try:
-        logger.info(f"Iniciando classificação em lote na sessão {sessao_id}")
-        
-        # Aqui você integraria com o sistema de agentes para classificação em lote
-        # Por enquanto, vamos simular
-        
-        await asyncio.sleep(10)  # Simular tempo de processamento
-        
-        logger.info(f"Classificação em lote da sessão {sessao_id} concluída")
-        
-    except Exception as e:
-        logger.error(f"Erro na classificação em lote da sessão {sessao_id}: {str(e)}")
+        async for evento in eventos:
+            await websocket.send_text(json.dumps(evento or {"tipo": "keepalive"}, default=str))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await eventos.aclose()
 
 # ==================
 
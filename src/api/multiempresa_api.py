@@ -13,6 +13,13 @@ import jwt
 from datetime import datetime, timedelta
 from enum import Enum
 import logging
+import sys
+from pathlib import Path
+
+# Adicionar src ao path para imports absolutos
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from api.respostas_json import RespostaJSONRapida
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -153,7 +160,8 @@ app = FastAPI(
     description="API para classificação automatizada de produtos com IA",
     version="2.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=RespostaJSONRapida
 )
 
 # Middlewares de segurança
@@ -197,7 +205,7 @@ async def login(email: str, password: str):
     raise HTTPException(status_code=401, detail="Credenciais inválidas")
 
 @app.post("/api/empresas", response_model=EmpresaResponse)
-async def criar_empresa(
+def criar_empresa(
     empresa_data: EmpresaCreateRequest,
     current_user: UserTokenData = Depends(get_current_user)
 ) -> EmpresaResponse:
@@ -238,7 +246,7 @@ async def criar_empresa(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/empresas", response_model=List[EmpresaResponse])
-async def listar_empresas(
+def listar_empresas(
     current_user: UserTokenData = Depends(get_current_user)
 ) -> List[EmpresaResponse]:
     """
@@ -277,7 +285,7 @@ async def listar_empresas(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.post("/api/empresas/{empresa_id}/ingestao")
-async def iniciar_ingestao_dados(
+def iniciar_ingestao_dados(
     empresa_id: int,
     ingestao_data: IngestaoRequest,
     current_user: UserTokenData = Depends(
@@ -316,7 +324,7 @@ async def iniciar_ingestao_dados(
         raise HTTPException(status_code=500, detail="Erro ao iniciar ingestão")
 
 @app.post("/api/empresas/{empresa_id}/classificacao")
-async def iniciar_classificacao(
+def iniciar_classificacao(
     empresa_id: int,
     classificacao_data: ClassificacaoRequest,
     current_user: UserTokenData = Depends(
@@ -353,7 +361,7 @@ async def iniciar_classificacao(
         raise HTTPException(status_code=500, detail="Erro ao iniciar classificação")
 
 @app.get("/api/empresas/{empresa_id}/revisao")
-async def obter_dados_revisao(
+def obter_dados_revisao(
     empresa_id: int,
     status: Optional[str] = "pendente",
     limit: int = 50,
@@ -0,0 +1,114 @@
+"""
+Serialização Rápida das Respostas da API
+Classe de resposta JSON baseada em orjson (com fallback para o json da
+biblioteca padrão) e projeção enxuta dos itens: campos pesados de trace
+(dados_trace_json, etapas_processamento, entrada/saída dos agentes) só vão na
+resposta quando pedidos em `include=`, e `fields=` escolhe os campos
+"""
+
+import json
+from dataclasses import asdict, is_dataclass
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Campos de trace que só entram na resposta quando pedidos em include=
+CAMPOS_TRACE = ("dados_trace_json", "etapas_processamento", "input", "output", "resultado_agente")
+
+
+def _converter(valor: Any) -> Any:
+    """Tipos que o serializador não conhece, como o jsonable_encoder do FastAPI os trataria."""
+    if isinstance(valor, BaseModel):
+        return valor.model_dump()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (set, frozenset, tuple)):
+        return list(valor)
+    if isinstance(valor, Enum):
+        return valor.value
+    if isinstance(valor, (datetime, date, time)):
+        return valor.isoformat()
+    if isinstance(valor, UUID):
+        return str(valor)
+    if isinstance(valor, bytes):
+        return valor.decode("utf-8", errors="replace")
+    if is_dataclass(valor):
+        return asdict(valor)
+    raise TypeError(f"Tipo não serializável em JSON: {type(valor).__name__}")
+
+
+def serializar_json(conteudo: Any) -> bytes:
+    """Corpo JSON em UTF-8 (orjson quando disponível)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(conteudo, default=_converter,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(conteudo, default=_converter, ensure_ascii=False,
+                      allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class RespostaJSONRapida(JSONResponse):
+    """
+    JSONResponse serializada por serializar_json. Como default_response_class
+    acelera só a etapa final; devolvida diretamente pelo endpoint também pula
+    a validação do response_model e o jsonable_encoder
+    """
+
+    def render(self, content: Any) -> bytes:
+        return serializar_json(content)
+
+
+# =====================
+# PROJEÇÃO DE CAMPOS
+# =====================
+
+def _lista_parametro(valor: Optional[str]) -> Set[str]:
+    return {parte.strip() for parte in (valor or "").split(",") if parte.strip()}
+
+
+def opcoes_campos(fields: Optional[str] = None, include: Optional[str] = None) -> Tuple[Optional[Set[str]], Set[str]]:
+    """(campos pedidos em fields= ou None, campos pesados pedidos em include=)."""
+    campos = _lista_parametro(fields)
+    return (campos or None), _lista_parametro(include)
+
+
+def campos_modelo(modelo: type) -> Set[str]:
+    """Campos declarados de um modelo Pydantic (a forma documentada da resposta)."""
+    return set(modelo.model_fields)
+
+
+def enxugar(item: Dict[str, Any], campos: Optional[Set[str]] = None, incluir: Iterable[str] = (),
+            pesados: Sequence[str] = CAMPOS_TRACE, permitidos: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """
+    Projeção de `item`: só `permitidos` (campos do modelo de resposta), só os
+    `campos` pedidos e, sem pedido explícito, sem os `pesados` fora de `incluir`.
+    """
+    incluir = set(incluir)
+    resultado = {}
+    for chave, valor in item.items():
+        if permitidos is not None and chave not in permitidos:
+            continue
+        if campos is not None:
+            if chave not in campos:
+                continue
+        elif chave in pesados and chave not in incluir:
+            continue
+        resultado[chave] = valor
+    return resultado
+
+
+def enxugar_lista(itens: Iterable[Dict[str, Any]], campos: Optional[Set[str]] = None,
+                  incluir: Iterable[str] = (), pesados: Sequence[str] = CAMPOS_TRACE,
+                  permitidos: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+    incluir = set(incluir)
+    return [enxugar(item, campos, incluir, pesados, permitidos) for item in itens]
@@ -4,7 +4,7 @@ Implementa endpoints para revisão, aprovação e correção de classificações
 Com gestão completa de GTIN e Golden Set
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -23,6 +23,8 @@ sys.path.insert(0, str(src_path))
 
 from database.models import ClassificacaoRevisao
 from database.connection import get_db
+from database.paginacao_cursor import CursorInvalidoError
+from api.respostas_json import RespostaJSONRapida, opcoes_campos, campos_modelo, enxugar, enxugar_lista
 from feedback.review_service import ReviewService
 from feedback.metrics_service import MetricsService
 
@@ -44,7 +46,8 @@ app = FastAPI(
     description="API para revisão humana de classificações fiscais NCM/CEST com gestão de GTIN e Golden Set",
     version="2.1.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=RespostaJSONRapida
 )
 
 # Configurar CORS para permitir acesso do frontend
@@ -152,30 +155,45 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
 @app.get("/api/v1/classificacoes", response_model=List[ClassificacaoResponse])
-async def listar_classificacoes(
+def listar_classificacoes(
     status: Optional[str] = Query(None, description="Filtrar por status: PENDENTE_REVISAO, APROVADO, CORRIGIDO"),
     confianca_min: Optional[float] = Query(None, description="Confiança mínima"),
-    page: int = Query(1, description="Número da página"),
+    page: int = Query(1, description="Número da página (sem cursor)"),
     limit: int = Query(50, description="Itens por página"),
+    cursor: Optional[str] = Query(None, description="Cursor da página anterior (cabeçalho X-Proximo-Cursor)"),
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula"),
     db: Session = Depends(get_db)
 ):
     """Lista classificações para revisão com filtros opcionais"""
     try:
-        classificacoes = review_service.listar_classificacoes(
+        pagina = review_service.pagina_classificacoes(
             db=db,
             status=status,
             confianca_min=confianca_min,
             page=page,
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
-        return classificacoes
+        # Próxima página por cursor: custo constante, sem OFFSET
+        cabecalhos = {"X-Total-Count": str(pagina["total"])}
+        if pagina["proximo_cursor"]:
+            cabecalhos["X-Proximo-Cursor"] = pagina["proximo_cursor"]
+        
+        # Resposta direta (orjson), sem revalidar cada item pelo response_model
+        campos, _ = opcoes_campos(fields)
+        itens = enxugar_lista(pagina["itens"], campos, permitidos=campos_modelo(ClassificacaoResponse))
+        return RespostaJSONRapida(itens, headers=cabecalhos)
+    except CursorInvalidoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Erro ao listar classificações: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/classificacoes/proximo-pendente", response_model=ClassificacaoDetalhe)
-async def obter_proximo_produto_pendente(
+def obter_proximo_produto_pendente(
     produto_id_atual: Optional[int] = Query(None, description="ID do produto atual para evitar repetição"),
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula"),
+    include: Optional[str] = Query(None, description="Campos de trace a incluir (dados_trace_json)"),
     db: Session = Depends(get_db)
 ):
     """Retorna o próximo produto pendente de revisão"""
@@ -186,7 +204,10 @@ async def obter_proximo_produto_pendente(
         )
         if not proximo_produto:
             raise HTTPException(status_code=404, detail="Não há produtos pendentes de revisão")
-        return proximo_produto
+        # Trace da classificação só quando pedido em include=
+        campos, incluir = opcoes_campos(fields, include)
+        return RespostaJSONRapida(enxugar(proximo_produto, campos, incluir,
+                                          permitidos=campos_modelo(ClassificacaoDetalhe)))
     except HTTPException:
         raise
     except Exception as e:
@@ -194,8 +215,10 @@ async def obter_proximo_produto_pendente(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/classificacoes/{produto_id}", response_model=ClassificacaoDetalhe)
-async def obter_classificacao_detalhe(
+def obter_classificacao_detalhe(
     produto_id: int,
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula"),
+    include: Optional[str] = Query(None, description="Campos de trace a incluir (dados_trace_json)"),
     db: Session = Depends(get_db)
 ):
     """Retorna todos os detalhes de uma classificação específica"""
@@ -203,7 +226,10 @@ async def obter_classificacao_detalhe(
         classificacao = review_service.obter_classificacao_detalhe(db=db, produto_id=produto_id)
         if not classificacao:
             raise HTTPException(status_code=404, detail="Classificação não encontrada")
-        return classificacao
+        # Trace da classificação só quando pedido em include=
+        campos, incluir = opcoes_campos(fields, include)
+        return RespostaJSONRapida(enxugar(classificacao, campos, incluir,
+                                          permitidos=campos_modelo(ClassificacaoDetalhe)))
     except HTTPException:
         raise
     except Exception as e:
@@ -211,7 +237,7 @@ async def obter_classificacao_detalhe(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.put("/api/v1/classificacoes/{produto_id}/revisar")
-async def revisar_classificacao(
+def revisar_classificacao(
     produto_id: int,
     revisao: RevisaoRequest,
     db: Session = Depends(get_db)
@@ -252,7 +278,7 @@ async def revisar_classificacao(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/dashboard/stats", response_model=DashboardStats)
-async def obter_estatisticas_dashboard(
+def obter_estatisticas_dashboard(
     periodo_dias: int = Query(30, description="Período em dias para calcular estatísticas"),
     db: Session = Depends(get_db)
 ):
@@ -265,7 +291,7 @@ async def obter_estatisticas_dashboard(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.post("/api/v1/golden-set/adicionar")
-async def adicionar_ao_golden_set(
+def adicionar_ao_golden_set(
     request: GoldenSetRequest,
     db: Session = Depends(get_db)
 ):
@@ -286,7 +312,7 @@ async def adicionar_ao_golden_set(
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
 
 @app.get("/api/v1/golden-set/estatisticas")
-async def estatisticas_golden_set(db: Session = Depends(get_db)):
+def estatisticas_golden_set(db: Session = Depends(get_db)):
     """Retorna estatísticas do Golden Set"""
     try:
         stats = review_service.obter_estatisticas_golden_set(db=db)
@@ -296,7 +322,7 @@ async def estatisticas_golden_set(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/golden-set/listar")
-async def listar_golden_set(
+def listar_golden_set(
     page: int = Query(1, description="Número da página"),
     limit: int = Query(50, description="Itens por página"),
     db: Session = Depends(get_db)
@@ -310,7 +336,7 @@ async def listar_golden_set(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.delete("/api/v1/golden-set/{entrada_id}")
-async def remover_entrada_golden_set(
+def remover_entrada_golden_set(
     entrada_id: int,
     db: Session = Depends(get_db)
 ):
@@ -326,7 +352,7 @@ async def remover_entrada_golden_set(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.delete("/api/v1/golden-set/limpar")
-async def limpar_golden_set(
+def limpar_golden_set(
     confirmar: bool = Query(False, description="Confirmação obrigatória para limpar todo o Golden Set"),
     db: Session = Depends(get_db)
 ):
@@ -347,7 +373,7 @@ async def limpar_golden_set(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.post("/api/v1/golden-set/restaurar")
-async def restaurar_golden_set(
+def restaurar_golden_set(
     db: Session = Depends(get_db)
 ):
     """Restaura todas as entradas inativas do Golden Set"""
@@ -363,15 +389,20 @@ async def restaurar_golden_set(
 # =============================================================================
 
 @app.get("/api/v1/explicacoes/{produto_id}")
-async def obter_explicacoes_produto(
+def obter_explicacoes_produto(
     produto_id: int,
-    agente: Optional[str] = Query(None, description="Nome do agente específico (expansion, ncm, cest, reconciler)")
+    agente: Optional[str] = Query(None, description="Nome do agente específico (expansion, ncm, cest, reconciler)"),
+    include: Optional[str] = Query(None, description="Campos pesados a incluir: input, output")
 ):
-    """Obtém explicações detalhadas dos agentes para um produto específico"""
+    """
+    Obtém explicações detalhadas dos agentes para um produto específico.
+    Entrada e saída completas dos agentes (input/output) só vão com include=
+    """
     try:
         if not EXPLICACAO_SERVICE_AVAILABLE:
             raise HTTPException(status_code=503, detail="Serviço de explicações não disponível")
         
+        _, incluir = opcoes_campos(include=include)
         if agente:
             # Explicação de um agente específico
             explicacao = explicacao_service.obter_explicacao_por_agente(produto_id, agente)
@@ -380,7 +411,7 @@ async def obter_explicacoes_produto(
                     status_code=404, 
                     detail=f"Explicação do agente '{agente}' não encontrada para produto {produto_id}"
                 )
-            return explicacao
+            return RespostaJSONRapida(enxugar(explicacao, incluir=incluir))
         else:
             # Todas as explicações do produto
             explicacoes = explicacao_service.obter_explicacoes_produto(produto_id)
@@ -389,7 +420,12 @@ async def obter_explicacoes_produto(
                     status_code=404,
                     detail=f"Nenhuma explicação encontrada para produto {produto_id}"
                 )
-            return {"produto_id": produto_id, "explicacoes": explicacoes}
+            por_agente = explicacoes.get("explicacoes_por_agente")
+            if isinstance(por_agente, dict):
+                explicacoes["explicacoes_por_agente"] = {
+                    nome: enxugar_lista(lista, incluir=incluir) for nome, lista in por_agente.items()
+                }
+            return RespostaJSONRapida({"produto_id": produto_id, "explicacoes": explicacoes})
             
     except HTTPException:
         raise
@@ -404,7 +440,7 @@ class ClassificarComExplicacaoRequest(BaseModel):
     salvar_explicacoes: bool = True
 
 @app.post("/api/v1/classificar-com-explicacao")
-async def classificar_produto_com_explicacao(
+def classificar_produto_com_explicacao(
     request: ClassificarComExplicacaoRequest
 ):
     """Classifica um produto com explicações detalhadas de cada agente"""
@@ -426,11 +462,12 @@ async def classificar_produto_com_explicacao(
             "codigo_produto": request.codigo_produto
         }
         
-        # Classificar com explicações
-        resultado = router.classify_product_with_explanations(
-            produto_data, 
-            salvar_explicacoes=request.salvar_explicacoes
-        )
+        # Classificar com explicações (fila interativa: o revisor passa à frente dos lotes)
+        with router.contexto_requisicao_llm():
+            resultado = router.classify_product_with_explanations(
+                produto_data, 
+                salvar_explicacoes=request.salvar_explicacoes
+            )
         
         return resultado
         
@@ -440,8 +477,16 @@ async def classificar_produto_com_explicacao(
         logger.error(f"Erro ao classificar produto com explicações: {e}")
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
 
+@app.get("/api/v1/llm/fila")
+async def obter_metricas_fila_llm():
+    """Profundidade das filas do agendador LLM por prioridade e empresa"""
+    from llm.request_scheduler import get_llm_scheduler
+    from config import Config
+    
+    return get_llm_scheduler(Config()).obter_metricas()
+
 @app.get("/api/v1/relatorio-agente/{agente_nome}")
-async def obter_relatorio_agente(
+def obter_relatorio_agente(
     agente_nome: str,
     periodo_dias: int = Query(30, description="Período em dias para análise")
 ):
@@ -471,7 +516,7 @@ async def obter_relatorio_agente(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.delete("/api/v1/explicacoes/limpar-antigas")
-async def limpar_explicacoes_antigas(
+def limpar_explicacoes_antigas(
     dias_manter: int = Query(90, description="Número de dias de explicações para manter"),
     confirmar: bool = Query(False, description="Confirmação obrigatória para limpar explicações")
 ):
@@ -508,7 +553,7 @@ async def limpar_explicacoes_antigas(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/consultas-metadados/{produto_id}")
-async def obter_consultas_produto(produto_id: int):
+def obter_consultas_produto(produto_id: int):
     """
     Obtém todas as consultas realizadas pelos agentes para um produto específico
     """
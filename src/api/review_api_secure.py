@@ -4,7 +4,7 @@ Implementa endpoints para revisão, aprovação e correção de classificações
 Com gestão completa de GTIN, Golden Set e segurança aprimorada
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Query, Header
+from fastapi import FastAPI, HTTPException, Depends, Query, Response, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -29,6 +29,8 @@ sys.path.insert(0, str(src_path))
 
 from database.models import ClassificacaoRevisao
 from database.connection import get_db
+from database.paginacao_cursor import CursorInvalidoError
+from api.respostas_json import RespostaJSONRapida, opcoes_campos, campos_modelo, enxugar, enxugar_lista
 from feedback.review_service import ReviewService
 from feedback.metrics_service import MetricsService
 
@@ -65,7 +67,8 @@ app = FastAPI(
     description="API para revisão humana de classificações fiscais NCM/CEST com gestão de GTIN, Golden Set e segurança aprimorada",
     version="2.1.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=RespostaJSONRapida
 )
 
 # Configurar CORS para permitir acesso do frontend
@@ -284,11 +287,13 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.now()}
 
 @app.get("/api/v1/classificacoes", response_model=List[ClassificacaoResponse])
-async def listar_classificacoes(
+def listar_classificacoes(
     status: Optional[str] = Query(None, description="Filtrar por status: PENDENTE_REVISAO, APROVADO, CORRIGIDO"),
     confianca_min: Optional[float] = Query(None, description="Confiança mínima"),
-    page: int = Query(1, description="Número da página"),
+    page: int = Query(1, description="Número da página (sem cursor)"),
     limit: int = Query(50, description="Itens por página"),
+    cursor: Optional[str] = Query(None, description="Cursor da página anterior (cabeçalho X-Proximo-Cursor)"),
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(verify_token)
 ):
@@ -300,21 +305,34 @@ async def listar_classificacoes(
         if status:
             status = sanitize_input(status)
         
-        classificacoes = review_service.listar_classificacoes(
+        pagina = review_service.pagina_classificacoes(
             db=db,
             status=status,
             confianca_min=confianca_min,
             page=page,
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
-        return classificacoes
+        # Próxima página por cursor: custo constante, sem OFFSET
+        cabecalhos = {"X-Total-Count": str(pagina["total"])}
+        if pagina["proximo_cursor"]:
+            cabecalhos["X-Proximo-Cursor"] = pagina["proximo_cursor"]
+        
+        # Resposta direta (orjson), sem revalidar cada item pelo response_model
+        campos, _ = opcoes_campos(fields)
+        itens = enxugar_lista(pagina["itens"], campos, permitidos=campos_modelo(ClassificacaoResponse))
+        return RespostaJSONRapida(itens, headers=cabecalhos)
+    except CursorInvalidoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Erro ao listar classificações: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/classificacoes/proximo-pendente", response_model=ClassificacaoDetalhe)
-async def obter_proximo_produto_pendente(
+def obter_proximo_produto_pendente(
     produto_id_atual: Optional[int] = Query(None, description="ID do produto atual para evitar repetição"),
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula"),
+    include: Optional[str] = Query(None, description="Campos de trace a incluir (dados_trace_json)"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(verify_token)
 ):
@@ -328,7 +346,10 @@ async def obter_proximo_produto_pendente(
         )
         if not proximo_produto:
             raise HTTPException(status_code=404, detail="Não há produtos pendentes de revisão")
-        return proximo_produto
+        # Trace da classificação só quando pedido em include=
+        campos, incluir = opcoes_campos(fields, include)
+        return RespostaJSONRapida(enxugar(proximo_produto, campos, incluir,
+                                          permitidos=campos_modelo(ClassificacaoDetalhe)))
     except HTTPException:
         raise
     except Exception as e:
@@ -336,8 +357,10 @@ async def obter_proximo_produto_pendente(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/classificacoes/{produto_id}", response_model=ClassificacaoDetalhe)
-async def obter_classificacao_detalhe(
+def obter_classificacao_detalhe(
     produto_id: int,
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula"),
+    include: Optional[str] = Query(None, description="Campos de trace a incluir (dados_trace_json)"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(verify_token)
 ):
@@ -348,7 +371,10 @@ async def obter_classificacao_detalhe(
         classificacao = review_service.obter_classificacao_detalhe(db=db, produto_id=produto_id)
         if not classificacao:
             raise HTTPException(status_code=404, detail="Classificação não encontrada")
-        return classificacao
+        # Trace da classificação só quando pedido em include=
+        campos, incluir = opcoes_campos(fields, include)
+        return RespostaJSONRapida(enxugar(classificacao, campos, incluir,
+                                          permitidos=campos_modelo(ClassificacaoDetalhe)))
     except HTTPException:
         raise
     except Exception as e:
@@ -356,7 +382,7 @@ async def obter_classificacao_detalhe(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.put("/api/v1/classificacoes/{produto_id}/revisar")
-async def revisar_classificacao(
+def revisar_classificacao(
     produto_id: int,
     revisao: RevisaoRequest,
     db: Session = Depends(get_db),
@@ -411,7 +437,7 @@ async def revisar_classificacao(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/dashboard/stats", response_model=DashboardStats)
-async def obter_estatisticas_dashboard(
+def obter_estatisticas_dashboard(
     periodo_dias: int = Query(30, description="Período em dias para calcular estatísticas"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(verify_token)
@@ -446,7 +472,7 @@ async def validar_codigo_barra(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.post("/api/v1/golden-set/adicionar")
-async def adicionar_ao_golden_set(
+def adicionar_ao_golden_set(
     produto_id: int,
     justificativa: str,
     db: Session = Depends(get_db),
@@ -471,7 +497,7 @@ async def adicionar_ao_golden_set(
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 @app.get("/api/v1/golden-set/estatisticas")
-async def estatisticas_golden_set(
+def estatisticas_golden_set(
     db: Session = Depends(get_db),
     current_user: dict = Depends(verify_token)
 ):
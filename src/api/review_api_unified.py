@@ -3,10 +3,10 @@ API REST para Interface de Revisão Humana - Versão Integrada com SQLite Unific
 Atualiza endpoints para usar o sistema SQLite unificado
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel, validator
 from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
@@ -23,6 +23,12 @@ sys.path.insert(0, str(src_path))
 
 # Imports do sistema unificado
 from services.unified_sqlite_service import get_unified_service
+from services.exportacao_streaming import (
+    FORMATOS_EXPORTACAO, FormatoIndisponivelError, validar_formato,
+    gerar_json, gerar_ndjson, gerar_csv, gerar_parquet
+)
+from database.paginacao_cursor import CursorInvalidoError
+from api.respostas_json import RespostaJSONRapida, opcoes_campos, campos_modelo, enxugar_lista
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -33,7 +39,8 @@ app = FastAPI(
     description="API integrada com SQLite unificado para revisão humana de classificações fiscais NCM/CEST",
     version="3.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    default_response_class=RespostaJSONRapida
 )
 
 # Configurar CORS
@@ -116,7 +123,7 @@ class CodigoBarraCorrecaoRequest(BaseModel):
 
 class ExportacaoRequest(BaseModel):
     """Request para exportação de dados"""
-    formato: str = "json"  # json, csv, excel
+    formato: str = "json"  # json, ndjson, csv, parquet
     filtros: Optional[Dict[str, Any]] = None
     incluir_explicacoes: bool = True
     incluir_consultas: bool = True
@@ -144,17 +151,25 @@ async def serve_index():
         return JSONResponse({"erro": str(e)}, status_code=500)
 
 @app.get("/api/classificacoes/pendentes", response_model=List[ClassificacaoResponse])
-async def listar_classificacoes_pendentes(
+def listar_classificacoes_pendentes(
     limite: int = Query(50, description="Número máximo de registros"),
-    offset: int = Query(0, description="Deslocamento para paginação"),
-    filtro_status: Optional[str] = Query(None, description="Filtrar por status")
+    offset: int = Query(0, description="Deslocamento para paginação (sem cursor)"),
+    filtro_status: Optional[str] = Query(None, description="Filtrar por status"),
+    cursor: Optional[str] = Query(None, description="Cursor da página anterior (cabeçalho X-Proximo-Cursor)"),
+    fields: Optional[str] = Query(None, description="Campos da resposta, separados por vírgula")
 ):
     """Lista classificações pendentes de revisão"""
     try:
         start_time = time.time()
         
-        # Buscar classificações pendentes
-        resultados = unified_service.buscar_classificacoes_pendentes(limite, offset)
+        # Buscar classificações pendentes (por cursor, custo constante por página)
+        pagina = unified_service.pagina_classificacoes(
+            "PENDENTE_REVISAO", limite, cursor=cursor, offset=offset
+        )
+        resultados = pagina['itens']
+        cabecalhos = {"X-Total-Count": str(pagina['total'])}
+        if pagina['proximo_cursor']:
+            cabecalhos["X-Proximo-Cursor"] = pagina['proximo_cursor']
         
         # Aplicar filtro de status se especificado
         if filtro_status:
@@ -167,21 +182,27 @@ async def listar_classificacoes_pendentes(
             'tipo_interacao': 'LISTA_PENDENTES',
             'endpoint_acessado': '/api/classificacoes/pendentes',
             'metodo_http': 'GET',
-            'dados_entrada': {'limite': limite, 'offset': offset, 'filtro_status': filtro_status},
+            'dados_entrada': {'limite': limite, 'offset': offset, 'filtro_status': filtro_status,
+                              'cursor': cursor},
             'dados_saida': {'total_resultados': len(resultados)},
             'tempo_processamento_ms': tempo_ms,
             'sucesso': True,
             'codigo_resposta': 200
         })
         
-        return resultados
+        # Resposta direta (orjson), sem revalidar cada item pelo response_model
+        campos, _ = opcoes_campos(fields)
+        itens = enxugar_lista(resultados, campos, permitidos=campos_modelo(ClassificacaoResponse))
+        return RespostaJSONRapida(itens, headers=cabecalhos)
         
+    except CursorInvalidoError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Erro ao listar pendentes: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/classificacoes/{classificacao_id}", response_model=ClassificacaoDetalhe)
-async def obter_classificacao_detalhe(classificacao_id: int):
+def obter_classificacao_detalhe(classificacao_id: int):
     """Obtém detalhes completos de uma classificação"""
     try:
         start_time = time.time()
@@ -226,7 +247,7 @@ async def obter_classificacao_detalhe(classificacao_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/classificacoes/{classificacao_id}/revisar")
-async def revisar_classificacao(classificacao_id: int, request: RevisaoRequest):
+def revisar_classificacao(classificacao_id: int, request: RevisaoRequest):
     """Aplica revisão humana a uma classificação"""
     try:
         start_time = time.time()
@@ -307,7 +328,7 @@ async def revisar_classificacao(classificacao_id: int, request: RevisaoRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/classificacoes/{classificacao_id}/corrigir-codigo-barra")
-async def corrigir_codigo_barra(classificacao_id: int, request: CodigoBarraCorrecaoRequest):
+def corrigir_codigo_barra(classificacao_id: int, request: CodigoBarraCorrecaoRequest):
     """Corrige código de barras de uma classificação"""
     try:
         # Buscar classificação atual
@@ -347,7 +368,7 @@ async def corrigir_codigo_barra(classificacao_id: int, request: CodigoBarraCorre
 # ==================
 
 @app.get("/api/estatisticas/dashboard")
-async def estatisticas_dashboard():
+def estatisticas_dashboard():
     """Obtém estatísticas para o dashboard de revisão"""
     try:
         start_time = time.time()
@@ -381,7 +402,7 @@ async def estatisticas_dashboard():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/estatisticas/revisao")
-async def estatisticas_revisao():
+def estatisticas_revisao():
     """Obtém estatísticas específicas do processo de revisão"""
     try:
         # Buscar métricas de revisão
@@ -401,7 +422,7 @@ async def estatisticas_revisao():
 # ==================
 
 @app.get("/api/buscar/produtos")
-async def buscar_produtos(
+def buscar_produtos(
     termo: str = Query(..., description="Termo de busca"),
     campo: str = Query("descricao", description="Campo de busca: descricao, codigo, codigo_barra"),
     limite: int = Query(20, description="Limite de resultados")
@@ -435,39 +456,65 @@ async def buscar_produtos(
 # ENDPOINTS EXPORTAÇÃO
 # ==================
 
+# Colunas da classificação na exportação tabular (CSV/Parquet)
+COLUNAS_EXPORTACAO = [
+    'id', 'produto_id', 'descricao_produto', 'descricao_completa', 'codigo_produto', 'codigo_barra',
+    'gtin_original', 'ncm_original', 'cest_original', 'ncm_sugerido', 'cest_sugerido',
+    'confianca_sugerida', 'status_revisao', 'ncm_corrigido', 'cest_corrigido',
+    'justificativa_correcao', 'revisado_por', 'data_revisao', 'data_criacao'
+]
+
+# Tipos Arrow da exportação Parquet (demais colunas são texto; datas vão em ISO 8601)
+TIPOS_EXPORTACAO = {'id': 'int64', 'produto_id': 'int64', 'confianca_sugerida': 'float64'}
+
 @app.post("/api/exportar/classificacoes")
-async def exportar_classificacoes(request: ExportacaoRequest):
-    """Exporta classificações em diferentes formatos"""
+def exportar_classificacoes(request: ExportacaoRequest):
+    """
+    Exporta classificações em streaming (json, ndjson, csv ou parquet)
+    
+    Os registros são lidos em lotes e enviados à medida que são gerados;
+    explicações e consultas vão aninhadas (em CSV/Parquet, como texto JSON).
+    """
     try:
-        # Buscar classificações para exportação
-        classificacoes = unified_service.buscar_classificacoes_para_exportacao(
-            filtros=request.filtros,
-            incluir_explicacoes=request.incluir_explicacoes,
-            incluir_consultas=request.incluir_consultas
-        )
-        
-        if request.formato == "json":
-            return JSONResponse({
-                'dados': classificacoes,
-                'total_registros': len(classificacoes),
-                'data_exportacao': datetime.now().isoformat()
-            })
-        else:
-            # Para CSV/Excel, implementar lógica específica
-            raise HTTPException(status_code=501, detail=f"Formato {request.formato} não implementado ainda")
-            
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Erro na exportação: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        validar_formato(request.formato)
+    except FormatoIndisponivelError as e:
+        raise HTTPException(status_code=400 if request.formato not in FORMATOS_EXPORTACAO else 501, detail=str(e))
+    
+    lotes = unified_service.iterar_classificacoes_para_exportacao(
+        filtros=request.filtros,
+        incluir_explicacoes=request.incluir_explicacoes,
+        incluir_consultas=request.incluir_consultas
+    )
+    
+    aninhadas = [c for c, incluir in (('explicacoes', request.incluir_explicacoes),
+                                      ('consultas', request.incluir_consultas)) if incluir]
+    colunas = COLUNAS_EXPORTACAO + aninhadas
+    
+    if request.formato == "json":
+        conteudo = gerar_json(lotes, {'data_exportacao': datetime.now().isoformat()})
+    elif request.formato == "ndjson":
+        conteudo = gerar_ndjson(lotes)
+    elif request.formato == "csv":
+        conteudo = gerar_csv(lotes, colunas)
+    else:
+        conteudo = gerar_parquet(lotes, colunas, colunas_json=aninhadas, tipos=TIPOS_EXPORTACAO)
+    
+    media_type, extensao = FORMATOS_EXPORTACAO[request.formato]
+    nome_arquivo = f"classificacoes_{datetime.now():%Y%m%d_%H%M%S}.{extensao}"
+    
+    # Iterador síncrono: o Starlette consome no threadpool, fora do event loop
+    return StreamingResponse(
+        conteudo,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}"'}
+    )
 
 # ==================
 # ENDPOINTS SISTEMA
 # ==================
 
 @app.get("/api/sistema/status")
-async def status_sistema():
+def status_sistema():
     """Verifica status do sistema de revisão"""
     try:
         # Verificar conectividade
@@ -27,7 +27,85 @@ class Config:
     # Ollama
     OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434')
     OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3')
+    # Mantém o modelo carregado para reaproveitar o cache KV dos prefixos dos agentes.
+    # Com OLLAMA_NUM_PARALLEL >= 4 no servidor, cada agente mantém seu prefixo em um slot.
+    OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+    OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', '0'))  # 0 = padrão do modelo
     
+    # Orçamento de tokens do prompt (system + user) por agente
+    PROMPT_TOKEN_BUDGETS = {
+        'ncm': int(os.getenv('PROMPT_TOKEN_BUDGET_NCM', '2000')),
+        'cest': int(os.getenv('PROMPT_TOKEN_BUDGET_CEST', '1500')),
+        'reconciler': int(os.getenv('PROMPT_TOKEN_BUDGET_RECONCILER', '1800')),
+    }
+    
+    # Produtos por chamada LLM nos agentes NCM e CEST (1 = modo individual)
+    LLM_BATCH_SIZE = int(os.getenv('LLM_BATCH_SIZE', '1'))
+
+    # Agendador de requisições ao LLM: slots simultâneos no total (alinhar com
+    # OLLAMA_NUM_PARALLEL) e por classe; o lote deve deixar slot para a revisão
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '2'))
+    LLM_CONCURRENCY_BY_PRIORITY = {
+        'interativa': int(os.getenv('LLM_CONCURRENCY_INTERACTIVE', '2')),
+        'lote': int(os.getenv('LLM_CONCURRENCY_BATCH', '1')),
+    }
+    LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', '0')) or None  # 0 = sem limite
+    # Os limites acima valem somados entre a API e os workers de lote (um agendador
+    # por processo) via leases na tabela llm_slots deste banco; vazio = só por processo.
+    # Lease de processo que caiu em outro host expira após LLM_SLOT_LEASE_SECONDS
+    LLM_SHARED_SLOTS_DB = os.getenv('LLM_SHARED_SLOTS_DB', str(DATA_DIR / "unified_rag_system.db"))
+    LLM_SLOT_LEASE_SECONDS = float(os.getenv('LLM_SLOT_LEASE_SECONDS', '900'))
+
+    # Gravação assíncrona (write-behind) do rastreamento de agentes e da auditoria:
+    # lote gravado a cada WRITE_BEHIND_INTERVAL_MS ou WRITE_BEHIND_BATCH_ROWS linhas.
+    # Overflow: bloquear | descartar_novos | descartar_antigos
+    WRITE_BEHIND_CAPACITY = int(os.getenv('WRITE_BEHIND_CAPACITY', '10000'))
+    WRITE_BEHIND_BATCH_ROWS = int(os.getenv('WRITE_BEHIND_BATCH_ROWS', '500'))
+    WRITE_BEHIND_INTERVAL_MS = int(os.getenv('WRITE_BEHIND_INTERVAL_MS', '200'))
+    TRACKING_OVERFLOW_POLICY = os.getenv('TRACKING_OVERFLOW_POLICY', 'descartar_antigos')
+    AUDIT_OVERFLOW_POLICY = os.getenv('AUDIT_OVERFLOW_POLICY', 'bloquear')
+
+    # Retenção: eventos de auditoria ficam em partições mensais; meses além de
+    # AUDIT_RETENTION_MONTHS (e explicações além de EXPLICACOES_RETENTION_DAYS)
+    # vão para ARCHIVE_DIR em Parquet (ou NDJSON gzip sem pyarrow)
+    ARCHIVE_DIR = Path(os.getenv('ARCHIVE_DIR', str(DATA_DIR / "archive")))
+    AUDIT_RETENTION_MONTHS = int(os.getenv('AUDIT_RETENTION_MONTHS', '12'))
+    EXPLICACOES_RETENTION_DAYS = int(os.getenv('EXPLICACOES_RETENTION_DAYS', '90'))
+
+    # Estatísticas do dashboard: contadores mantidos por triggers SQLite e
+    # conferidos com varredura completa a cada intervalo (0 = desligado)
+    STATS_RECONCILE_INTERVAL_MINUTES = int(os.getenv('STATS_RECONCILE_INTERVAL_MINUTES', '60'))
+    # Agregação das métricas de qualidade: em cache até o próximo commit que
+    # altere classificações neste processo (TTL cobre escritas de outros processos)
+    METRICS_CACHE_TTL_SECONDS = int(os.getenv('METRICS_CACHE_TTL_SECONDS', '300'))
+    # Totais das listagens paginadas por cursor com filtros sem contador
+    # materializado (busca, confiança mínima): COUNT(*) em cache pela mesma regra
+    PAGINATION_TOTALS_TTL_SECONDS = int(os.getenv('PAGINATION_TOTALS_TTL_SECONDS', '300'))
+
+    # Processamento em lote: sessões em sessoes_processamento executadas por
+    # processos worker em blocos de BATCH_JOB_CHUNK_SIZE produtos (checkpoint
+    # por bloco). Sem heartbeat por BATCH_JOB_STALE_SECONDS a sessão volta à
+    # fila; após BATCH_JOB_MAX_ATTEMPTS quedas vai para erro. WORKERS=0 deixa
+    # a execução para `python src/services/processamento_lote.py`
+    BATCH_JOB_WORKERS = int(os.getenv('BATCH_JOB_WORKERS', '1'))
+    BATCH_JOB_CHUNK_SIZE = int(os.getenv('BATCH_JOB_CHUNK_SIZE', '25'))
+    BATCH_JOB_MAX_PER_EMPRESA = int(os.getenv('BATCH_JOB_MAX_PER_EMPRESA', '1'))
+    BATCH_JOB_STALE_SECONDS = int(os.getenv('BATCH_JOB_STALE_SECONDS', '300'))
+    BATCH_JOB_MAX_ATTEMPTS = int(os.getenv('BATCH_JOB_MAX_ATTEMPTS', '3'))
+    BATCH_JOB_POLL_SECONDS = float(os.getenv('BATCH_JOB_POLL_SECONDS', '2'))
+    # Canais de progresso (SSE/WebSocket): keepalive sem eventos; com workers
+    # externos é também o intervalo de leitura do status no banco
+    PROGRESS_KEEPALIVE_SECONDS = float(os.getenv('PROGRESS_KEEPALIVE_SECONDS', '15'))
+
+    # Cache das consultas de referência (NCM, CEST, exemplos, golden set):
+    # invalidado pelos commits ORM deste processo; o TTL cobre outros processos
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '512'))
+    RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '300'))
+
+    # Rotas síncronas da API (banco e LLM bloqueantes) rodam no threadpool do
+    # AnyIO: máximo de requisições bloqueantes atendidas ao mesmo tempo
+    API_THREADPOOL_SIZE = int(os.getenv('API_THREADPOOL_SIZE', '40'))
+
     # Vector Store
     VECTOR_DIMENSION = int(os.getenv('VECTOR_DIMENSION', '384'))
     FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'IndexFlatIP')
@@ -0,0 +1,206 @@
+"""
+Arquivamento de Linhas Antigas
+Grava lotes de linhas em Parquet comprimido (pyarrow) ou, sem pyarrow,
+em NDJSON compactado com gzip
+"""
+
+import base64
+import gzip
+import json
+import logging
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+
+from sqlalchemy.types import Boolean, Float, Integer, LargeBinary, TypeDecorator
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def _valor_json(valor):
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return {"$base64": base64.b64encode(bytes(valor)).decode("ascii")}
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def tipos_arrow_sqlite(tipos_declarados: Dict[str, str]) -> Dict[str, str]:
+    """
+    Alias de tipo Arrow por coluna a partir do tipo declarado no SQLite
+    (PRAGMA table_info), pelas regras de afinidade: INT → int64,
+    REAL/FLOA/DOUB → float64, BLOB → binary, BOOL → bool. As demais colunas
+    (TEXT, JSON, TIMESTAMP, sem tipo...) ficam fora do dicionário, isto é, texto.
+    """
+    tipos = {}
+    for coluna, declarado in tipos_declarados.items():
+        declarado = (declarado or "").upper()
+        if "INT" in declarado:
+            tipos[coluna] = "int64"
+        elif any(chave in declarado for chave in ("CHAR", "CLOB", "TEXT")):
+            continue
+        elif "BLOB" in declarado:
+            tipos[coluna] = "binary"
+        elif any(chave in declarado for chave in ("REAL", "FLOA", "DOUB")):
+            tipos[coluna] = "float64"
+        elif "BOOL" in declarado:
+            tipos[coluna] = "bool"
+    return tipos
+
+
+def tipos_arrow_sqlalchemy(colunas: Iterable) -> Dict[str, str]:
+    """
+    Alias de tipo Arrow por coluna de uma tabela SQLAlchemy. Tipos
+    customizados (TypeDecorator), JSON, datas e textos ficam como texto:
+    o valor já convertido pelo tipo é serializado em _valor_texto.
+    """
+    tipos = {}
+    for coluna in colunas:
+        tipo = coluna.type
+        if isinstance(tipo, TypeDecorator):
+            continue
+        if isinstance(tipo, Boolean):
+            tipos[coluna.name] = "bool"
+        elif isinstance(tipo, Integer):
+            tipos[coluna.name] = "int64"
+        elif isinstance(tipo, Float):
+            tipos[coluna.name] = "float64"
+        elif isinstance(tipo, LargeBinary):
+            tipos[coluna.name] = "binary"
+    return tipos
+
+
+def _valor_texto(valor):
+    if valor is None or isinstance(valor, (str, bytes)):
+        return valor
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False, default=str)
+    return str(valor)
+
+
+def _conversor(alias: Optional[str]):
+    if alias is None:
+        return _valor_texto
+    if alias == "bool":
+        return lambda valor: None if valor is None else bool(valor)
+    return lambda valor: valor
+
+
+class ArquivadorLinhas:
+    """
+    Escritor incremental de um arquivo morto.
+
+    Uso:
+        with ArquivadorLinhas(destino / "auditoria_2024_01", colunas) as arquivo:
+            arquivo.escrever(linhas)
+        arquivo.caminho  # .parquet ou .ndjson.gz
+    """
+
+    def __init__(self, caminho_base: Union[str, Path], colunas: Sequence[str],
+                 compressao: str = "zstd", tipos: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            caminho_base: Caminho sem extensão; a extensão depende do formato
+            colunas: Nomes das colunas, na ordem das tuplas escritas
+            compressao: Codec Parquet (zstd, snappy, gzip...)
+            tipos: coluna -> alias de tipo Arrow ("int64", "float64", "bool",
+                "binary"); colunas ausentes são texto. O schema Parquet é
+                declarado antes do primeiro lote: uma coluna só com nulos no
+                início mantém o tipo nos lotes seguintes
+        """
+        self.colunas = list(colunas)
+        self.compressao = compressao
+        self.total_linhas = 0
+        tipos = tipos or {}
+        self._conversores = [_conversor(tipos.get(coluna)) for coluna in self.colunas]
+        self._schema = pa.schema([
+            pa.field(coluna, pa.type_for_alias(tipos.get(coluna, "string"))) for coluna in self.colunas
+        ]) if PYARROW_AVAILABLE else None
+
+        caminho_base = Path(caminho_base)
+        caminho_base.parent.mkdir(parents=True, exist_ok=True)
+        self.formato = "parquet" if PYARROW_AVAILABLE else "ndjson.gz"
+        self.caminho = caminho_base.with_name(f"{caminho_base.name}.{self.formato}")
+        self._temporario = self.caminho.with_name(self.caminho.name + ".tmp")
+
+        self._writer = None
+        self._arquivo = None if PYARROW_AVAILABLE else gzip.open(self._temporario, "wt", encoding="utf-8")
+
+    def escrever(self, linhas: List[Sequence[Any]]):
+        """Acrescenta um lote de linhas (tuplas na ordem de colunas)."""
+        if not linhas:
+            return
+
+        if PYARROW_AVAILABLE:
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(str(self._temporario), self._schema, compression=self.compressao)
+            dados = {
+                coluna: [converter(linha[i]) for linha in linhas]
+                for i, (coluna, converter) in enumerate(zip(self.colunas, self._conversores))
+            }
+            self._writer.write_batch(pa.RecordBatch.from_pydict(dados, schema=self._schema))
+        else:
+            for linha in linhas:
+                registro = {coluna: _valor_json(valor) for coluna, valor in zip(self.colunas, linha)}
+                self._arquivo.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+
+        self.total_linhas += len(linhas)
+
+    def fechar(self) -> Optional[Path]:
+        """Finaliza o arquivo; retorna o caminho (None se nenhuma linha foi escrita)."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+        if not self.total_linhas:
+            self._temporario.unlink(missing_ok=True)
+            return None
+
+        self._temporario.replace(self.caminho)
+        return self.caminho
+
+    def descartar(self):
+        """Abandona o arquivo parcial (erro durante o arquivamento)."""
+        self.total_linhas = 0
+        self.fechar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.descartar()
+        else:
+            self.fechar()
+        return False
+
+
+def ler_arquivo_morto(caminho: Union[str, Path]) -> List[Dict[str, Any]]:
+    """Lê um arquivo gerado por ArquivadorLinhas (consulta/restauração eventual)."""
+    caminho = Path(caminho)
+    if caminho.suffix == ".parquet":
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("pyarrow é necessário para ler arquivos Parquet")
+        return pq.read_table(str(caminho)).to_pylist()
+
+    registros = []
+    with gzip.open(caminho, "rt", encoding="utf-8") as f:
+        for linha in f:
+            registro = json.loads(linha)
+            registros.append({
+                coluna: base64.b64decode(valor["$base64"]) if isinstance(valor, dict) and "$base64" in valor else valor
+                for coluna, valor in registro.items()
+            })
+    return registros
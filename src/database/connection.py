@@ -3,8 +3,8 @@ Conexão com banco de dados - PostgreSQL com fallback para SQLite
 """
 
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
 from sqlalchemy.exc import SQLAlchemyError
 import os
 from pathlib import Path
@@ -12,6 +12,10 @@ from dotenv import load_dotenv
 import logging
 
 from .models import Base
+from .sqlite_connection import criar_engine_sqlite, PERFIL_OLTP
+from .ordenacao_revisao import garantir_ordenacao_revisao
+from .estatisticas_materializadas import garantir_estatisticas_materializadas
+from .paginacao_cursor import garantir_indices_paginacao
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -19,6 +23,9 @@ logger = logging.getLogger(__name__)
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# Banco unificado (desenvolvimento/testes ou PostgreSQL não configurado)
+SQLITE_DB_PATH = Path(__file__).parent.parent.parent / "data" / "unified_rag_system.db"
+
 def get_database_url():
     """
     Constrói a URL de conexão do banco baseada nas variáveis de ambiente.
@@ -28,9 +35,8 @@ def get_database_url():
     
     if db_type == 'sqlite':
         # SQLite para desenvolvimento/testes - usar o banco unificado
-        db_path = Path(__file__).parent.parent.parent / "data" / "unified_rag_system.db"
-        db_path.parent.mkdir(exist_ok=True)
-        return f"sqlite:///{db_path}"
+        SQLITE_DB_PATH.parent.mkdir(exist_ok=True)
+        return f"sqlite:///{SQLITE_DB_PATH}"
     
     # PostgreSQL para produção
     user = os.getenv('DB_USER')
@@ -42,30 +48,32 @@ def get_database_url():
     if not all([user, password, database]):
         # Fallback para SQLite se PostgreSQL não estiver configurado
         logger.warning("PostgreSQL não configurado completamente, usando SQLite")
-        db_path = Path(__file__).parent.parent.parent / "data" / "unified_rag_system.db"
-        db_path.parent.mkdir(exist_ok=True)
-        return f"sqlite:///{db_path}"
+        SQLITE_DB_PATH.parent.mkdir(exist_ok=True)
+        return f"sqlite:///{SQLITE_DB_PATH}"
     
     return f"postgresql://{user}:{password}@{host}:{port}/{database}"
 
 # String de conexão
 DATABASE_URL = get_database_url()
 
+def criar_engine(database_url: str):
+    """
+    Engine com pool de conexões (QueuePool): cada sessão das rotas síncronas,
+    executadas em threads do threadpool, tem conexão e transação próprias.
+    SQLite recebe o perfil OLTP a cada conexão, como o banco unificado do
+    UnifiedSQLiteService.
+    """
+    if database_url.startswith("sqlite"):
+        return criar_engine_sqlite(
+            make_url(database_url).database,
+            PERFIL_OLTP,
+            connect_args={"check_same_thread": False},
+            echo=False
+        )
+    return create_engine(database_url, pool_pre_ping=True, echo=False)
+
 # Criar engine
-if "sqlite" in DATABASE_URL:
-    engine = create_engine(
-        DATABASE_URL,
-        poolclass=StaticPool,
-        connect_args={"check_same_thread": False},
-        echo=False
-    )
-else:
-    engine = create_engine(
-        DATABASE_URL,
-        poolclass=StaticPool,
-        pool_pre_ping=True,
-        echo=False
-    )
+engine = criar_engine(DATABASE_URL)
 
 # Criar sessão
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -76,6 +84,12 @@ def create_tables():
     """
     try:
         Base.metadata.create_all(bind=engine)
+        # Bancos anteriores às colunas de ordenação da fila de revisão, aos
+        # índices das listagens e aos contadores do dashboard (só SQLite)
+        with engine.begin() as conn:
+            garantir_ordenacao_revisao(conn)
+            garantir_indices_paginacao(conn)
+            garantir_estatisticas_materializadas(conn)
         logger.info("✅ Tabelas criadas com sucesso!")
         return True
     except Exception as e:
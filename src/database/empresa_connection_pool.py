@@ -0,0 +1,167 @@
+"""
+Pool de Conexões SQLite por Empresa
+Reaproveita conexões (e suas instruções preparadas) entre chamadas,
+com limite global, afinidade por thread e fechamento LRU de bancos ociosos
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Union
+
+from .sqlite_connection import conectar_sqlite, PERFIL_OLTP
+
+logger = logging.getLogger(__name__)
+
+
+class _EntradaPool:
+    """Conexão aberta para um par (banco, thread)."""
+
+    __slots__ = ("conn", "em_uso", "ultimo_uso")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.em_uso = 0
+        self.ultimo_uso = time.monotonic()
+
+
+class EmpresaConnectionPool:
+    """
+    Pool limitado de conexões sqlite3 para os bancos segregados por empresa.
+
+    - Cada conexão pertence a um par (banco, thread): uma thread nunca usa a
+      conexão de outra, e o mesmo par reaproveita a conexão já aberta.
+    - O cache de instruções do sqlite3 (cached_statements) é por conexão; ao
+      manter a conexão aberta, o mesmo SQL não é recompilado a cada linha.
+    - Acima de max_conexoes, as conexões menos usadas recentemente e livres
+      são fechadas; conexões ociosas há mais de max_ocioso segundos também.
+    """
+
+    def __init__(self, max_conexoes: int = 32, max_ocioso: Optional[float] = 300.0,
+                 perfil: str = PERFIL_OLTP, cached_statements: int = 256):
+        self.max_conexoes = max_conexoes
+        self.max_ocioso = max_ocioso
+        self.perfil = perfil
+        self.cached_statements = cached_statements
+
+        self._lock = threading.Lock()
+        self._conexoes: "OrderedDict[Tuple[str, int], _EntradaPool]" = OrderedDict()
+        self._ultima_limpeza = time.monotonic()
+        self._metricas = {"aberturas": 0, "reutilizacoes": 0, "fechamentos_lru": 0, "fechamentos_ociosas": 0}
+
+    @contextmanager
+    def conexao(self, db_path: Union[str, Path]):
+        """
+        Empresta a conexão da thread atual para o banco.
+
+        Mesma semântica de `with sqlite3.connect(...) as conn`: commit ao sair
+        sem erro, rollback em exceção. Chamadas aninhadas na mesma thread
+        compartilham a conexão e só o bloco mais externo finaliza a transação.
+        """
+        chave = (str(db_path), threading.get_ident())
+        with self._lock:
+            entrada = self._conexoes.get(chave)
+            if entrada is not None:
+                self._conexoes.move_to_end(chave)
+                self._metricas["reutilizacoes"] += 1
+                entrada.em_uso += 1
+
+        if entrada is None:
+            conn = conectar_sqlite(
+                db_path, self.perfil,
+                # Fechamento LRU pode ocorrer em outra thread; o uso continua restrito à dona
+                check_same_thread=False,
+                cached_statements=self.cached_statements
+            )
+            entrada = _EntradaPool(conn)
+            entrada.em_uso = 1
+            with self._lock:
+                self._conexoes[chave] = entrada
+                self._metricas["aberturas"] += 1
+                self._fechar_excedentes()
+
+        try:
+            yield entrada.conn
+            if entrada.em_uso == 1:
+                entrada.conn.commit()
+        except BaseException:
+            if entrada.em_uso == 1:
+                entrada.conn.rollback()
+            raise
+        finally:
+            with self._lock:
+                entrada.em_uso -= 1
+                entrada.ultimo_uso = time.monotonic()
+                self._limpeza_periodica()
+
+    def _fechar_excedentes(self):
+        """Fecha as conexões livres menos usadas recentemente acima do limite (com lock)."""
+        excedente = len(self._conexoes) - self.max_conexoes
+        if excedente <= 0:
+            return
+        for chave in [c for c, e in self._conexoes.items() if e.em_uso == 0][:excedente]:
+            self._conexoes.pop(chave).conn.close()
+            self._metricas["fechamentos_lru"] += 1
+
+    def _limpeza_periodica(self):
+        agora = time.monotonic()
+        if self.max_ocioso is None or agora - self._ultima_limpeza < min(self.max_ocioso, 30.0):
+            return
+        self._ultima_limpeza = agora
+        self._fechar_ociosas(agora - self.max_ocioso)
+
+    def _fechar_ociosas(self, limite: float) -> int:
+        ociosas = [c for c, e in self._conexoes.items() if e.em_uso == 0 and e.ultimo_uso <= limite]
+        for chave in ociosas:
+            self._conexoes.pop(chave).conn.close()
+        self._metricas["fechamentos_ociosas"] += len(ociosas)
+        return len(ociosas)
+
+    def fechar_ociosas(self, max_ocioso: Optional[float] = None) -> int:
+        """Fecha conexões livres ociosas há mais de max_ocioso segundos."""
+        limite = max_ocioso if max_ocioso is not None else (self.max_ocioso or 0.0)
+        with self._lock:
+            return self._fechar_ociosas(time.monotonic() - limite)
+
+    def fechar_banco(self, db_path: Union[str, Path]):
+        """Fecha as conexões livres de um banco (ex.: antes de removê-lo ou substituí-lo)."""
+        with self._lock:
+            for chave in [c for c, e in self._conexoes.items() if c[0] == str(db_path) and e.em_uso == 0]:
+                self._conexoes.pop(chave).conn.close()
+
+    def fechar_todas(self):
+        """Fecha todas as conexões livres (encerramento do processo)."""
+        with self._lock:
+            for chave in [c for c, e in self._conexoes.items() if e.em_uso == 0]:
+                self._conexoes.pop(chave).conn.close()
+
+    def obter_metricas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "conexoes_abertas": len(self._conexoes),
+                "bancos_abertos": len({banco for banco, _ in self._conexoes}),
+                "max_conexoes": self.max_conexoes,
+                **self._metricas,
+            }
+
+
+_pool_empresas: Optional[EmpresaConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_empresa_pool(max_conexoes: int = 32, max_ocioso: Optional[float] = 300.0) -> EmpresaConnectionPool:
+    """
+    Pool único do processo para os bancos por empresa: managers e serviços
+    criados por requisição reaproveitam as mesmas conexões. Os parâmetros
+    valem na primeira chamada.
+    """
+    global _pool_empresas
+    with _pool_lock:
+        if _pool_empresas is None:
+            _pool_empresas = EmpresaConnectionPool(max_conexoes=max_conexoes, max_ocioso=max_ocioso)
+            atexit.register(_pool_empresas.fechar_todas)
+        return _pool_empresas
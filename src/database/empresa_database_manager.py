@@ -7,27 +7,158 @@ Mantém o Golden Set como referência compartilhada
 import sqlite3
 import os
 import json
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 
+from .empresa_connection_pool import EmpresaConnectionPool, get_empresa_pool
+from .payload_codec import compactar_json, expandir_json
+
+# classificacao_id fica nulo nas ações registradas antes de a classificação
+# ser gravada (o rastreamento é feito durante a classificação)
+SQL_TABELA_AGENTE_ACOES = """
+    CREATE TABLE IF NOT EXISTS agente_acoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produto_id INTEGER NOT NULL,
+        classificacao_id INTEGER,
+        agente_nome TEXT NOT NULL, -- expansion, ncm, cest, aggregation, reconciler
+        acao_tipo TEXT NOT NULL, -- busca, classificacao, validacao, correcao
+        input_dados TEXT, -- JSON ou payload compactado (payload_codec)
+        output_resultado TEXT, -- JSON ou payload compactado (payload_codec)
+        justificativa TEXT,
+        confianca REAL,
+        tempo_execucao REAL, -- em segundos
+        data_execucao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        sucesso BOOLEAN DEFAULT 1,
+        erro_detalhes TEXT,
+        FOREIGN KEY (produto_id) REFERENCES produtos_empresa (id),
+        FOREIGN KEY (classificacao_id) REFERENCES classificacoes (id)
+    )
+"""
+
+SQL_INDICES_AGENTE_ACOES = [
+    "CREATE INDEX IF NOT EXISTS idx_agente_acoes_produto ON agente_acoes(produto_id)",
+    "CREATE INDEX IF NOT EXISTS idx_agente_acoes_agente ON agente_acoes(agente_nome)",
+]
+
+SQL_INSERT_AGENTE_ACAO = """
+    INSERT INTO agente_acoes 
+    (produto_id, classificacao_id, agente_nome, acao_tipo, 
+     input_dados, output_resultado, justificativa, confianca,
+     tempo_execucao, sucesso, erro_detalhes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_INSERT_AGENTE_CONSULTA = """
+    INSERT INTO agente_consultas 
+    (produto_id, agente_nome, tipo_consulta, query_original,
+     query_processada, resultados_encontrados, resultado_detalhes,
+     relevancia_score, tempo_resposta, sucesso)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def parametros_agente_acao(acao_data: Dict[str, Any]) -> tuple:
+    """Converte os dados de uma ação de agente nos parâmetros de SQL_INSERT_AGENTE_ACAO"""
+    return (
+        acao_data.get('produto_id'),
+        acao_data.get('classificacao_id'),
+        acao_data.get('agente_nome'),
+        acao_data.get('acao_tipo'),
+        compactar_json(acao_data.get('input_dados', {})),
+        compactar_json(acao_data.get('output_resultado', {})),
+        acao_data.get('justificativa'),
+        acao_data.get('confianca'),
+        acao_data.get('tempo_execucao'),
+        acao_data.get('sucesso', True),
+        acao_data.get('erro_detalhes')
+    )
+
+
+def parametros_agente_consulta(consulta_data: Dict[str, Any]) -> tuple:
+    """Converte os dados de uma consulta de agente nos parâmetros de SQL_INSERT_AGENTE_CONSULTA"""
+    return (
+        consulta_data.get('produto_id'),
+        consulta_data.get('agente_nome'),
+        consulta_data.get('tipo_consulta'),
+        consulta_data.get('query_original'),
+        consulta_data.get('query_processada'),
+        consulta_data.get('resultados_encontrados', 0),
+        json.dumps(consulta_data.get('resultado_detalhes', {}), ensure_ascii=False),
+        consulta_data.get('relevancia_score'),
+        consulta_data.get('tempo_resposta'),
+        consulta_data.get('sucesso', True)
+    )
+
+
+# Bancos de empresa já conferidos por garantir_classificacao_opcional neste processo
+_bancos_verificados: set = set()
+_bancos_verificados_lock = threading.Lock()
+
+
+def garantir_classificacao_opcional(conn) -> bool:
+    """
+    Bancos anteriores criaram agente_acoes.classificacao_id como NOT NULL, o que
+    rejeita as ações rastreadas antes de a classificação existir. O SQLite não
+    altera restrições de coluna: a tabela é recriada com o layout atual.
+
+    Returns:
+        True se a tabela foi convertida
+    """
+    colunas = conn.execute("PRAGMA table_info(agente_acoes)").fetchall()
+    if not any(coluna[1] == "classificacao_id" and coluna[3] for coluna in colunas):
+        return False
+
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute("ALTER TABLE agente_acoes RENAME TO agente_acoes_anterior")
+    conn.execute(SQL_TABELA_AGENTE_ACOES)
+    nomes = ", ".join(coluna[1] for coluna in colunas)
+    conn.execute(f"INSERT INTO agente_acoes ({nomes}) SELECT {nomes} FROM agente_acoes_anterior")
+    conn.execute("DROP TABLE agente_acoes_anterior")
+    for indice_sql in SQL_INDICES_AGENTE_ACOES:
+        conn.execute(indice_sql)
+    return True
+
+
 class EmpresaDatabaseManager:
     """Gerencia bancos de dados segregados por empresa"""
     
-    def __init__(self, base_path: str = "data/empresas"):
+    def __init__(self, base_path: str = "data/empresas", pool: Optional[EmpresaConnectionPool] = None):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
         self.golden_set_db = "data/golden_set_shared.db"
         
+        # Conexões reaproveitadas entre chamadas e instâncias (uma por banco e
+        # thread): o pool é do processo, não do manager
+        self._pool = pool if pool is not None else get_empresa_pool()
+        
     def get_empresa_db_path(self, empresa_id: int) -> str:
         """Retorna o caminho do banco de dados da empresa"""
         return str(self.base_path / f"empresa_{empresa_id}.db")
     
+    def conexao_empresa(self, empresa_id: int):
+        """Context manager com a conexão do pool para o banco da empresa"""
+        return self._pool.conexao(self.get_empresa_db_path(empresa_id))
+    
+    def conexao_golden_set(self):
+        """Context manager com a conexão do pool para o Golden Set compartilhado"""
+        return self._pool.conexao(self.golden_set_db)
+    
+    def obter_metricas_pool(self) -> Dict[str, Any]:
+        """Métricas do pool de conexões (abertas, reutilizações, fechamentos)"""
+        return self._pool.obter_metricas()
+    
+    def fechar_conexoes(self):
+        """Fecha as conexões livres do pool (compartilhado por todos os managers do processo)"""
+        self._pool.fechar_todas()
+    
     def create_empresa_database(self, empresa_id: int, empresa_info: Dict[str, Any]) -> str:
         """Cria um novo banco de dados para a empresa"""
         db_path = self.get_empresa_db_path(empresa_id)
         
-        with sqlite3.connect(db_path) as conn:
+        with self._pool.conexao(db_path) as conn:
             cursor = conn.cursor()
             
             # Tabela de informações da empresa
@@ -87,25 +218,8 @@ class EmpresaDatabaseManager:
             """)
             
             # Tabela de ações dos agentes por produto
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS agente_acoes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    produto_id INTEGER NOT NULL,
-                    classificacao_id INTEGER NOT NULL,
-                    agente_nome TEXT NOT NULL, -- expansion, ncm, cest, aggregation, reconciler
-                    acao_tipo TEXT NOT NULL, -- busca, classificacao, validacao, correcao
-                    input_dados TEXT, -- JSON com dados de entrada
-                    output_resultado TEXT, -- JSON com resultado da ação
-                    justificativa TEXT,
-                    confianca REAL,
-                    tempo_execucao REAL, -- em segundos
-                    data_execucao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    sucesso BOOLEAN DEFAULT 1,
-                    erro_detalhes TEXT,
-                    FOREIGN KEY (produto_id) REFERENCES produtos_empresa (id),
-                    FOREIGN KEY (classificacao_id) REFERENCES classificacoes (id)
-                )
-            """)
+            cursor.execute(SQL_TABELA_AGENTE_ACOES)
+            garantir_classificacao_opcional(conn)
             
             # Tabela de consultas realizadas pelos agentes
             cursor.execute("""
@@ -184,8 +298,6 @@ class EmpresaDatabaseManager:
             # Criar índices para performance
             self._create_indexes(cursor)
             
-            conn.commit()
-            
         print(f"✅ Banco de dados criado para empresa {empresa_id}: {db_path}")
         return db_path
     
@@ -197,8 +309,7 @@ class EmpresaDatabaseManager:
             "CREATE INDEX IF NOT EXISTS idx_classificacoes_produto ON classificacoes(produto_id)",
             "CREATE INDEX IF NOT EXISTS idx_classificacoes_ncm ON classificacoes(ncm_codigo)",
             "CREATE INDEX IF NOT EXISTS idx_classificacoes_cest ON classificacoes(cest_codigo)",
-            "CREATE INDEX IF NOT EXISTS idx_agente_acoes_produto ON agente_acoes(produto_id)",
-            "CREATE INDEX IF NOT EXISTS idx_agente_acoes_agente ON agente_acoes(agente_nome)",
+            *SQL_INDICES_AGENTE_ACOES,
             "CREATE INDEX IF NOT EXISTS idx_agente_consultas_produto ON agente_consultas(produto_id)",
             "CREATE INDEX IF NOT EXISTS idx_agente_consultas_agente ON agente_consultas(agente_nome)",
             "CREATE INDEX IF NOT EXISTS idx_historico_produto ON historico_mudancas(produto_id)",
@@ -212,7 +323,7 @@ class EmpresaDatabaseManager:
         """Insere um novo produto no banco da empresa"""
         db_path = self.get_empresa_db_path(empresa_id)
         
-        with sqlite3.connect(db_path) as conn:
+        with self._pool.conexao(db_path) as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -241,8 +352,6 @@ class EmpresaDatabaseManager:
                 VALUES (?, 'criacao', ?, ?)
             """, (produto_id, produto_data.get('usuario', 'sistema'), 'Produto criado'))
             
-            conn.commit()
-            
         return produto_id
     
     def insert_classificacao(self, empresa_id: int, produto_id: int, 
@@ -250,7 +359,7 @@ class EmpresaDatabaseManager:
         """Insere uma nova classificação para um produto"""
         db_path = self.get_empresa_db_path(empresa_id)
         
-        with sqlite3.connect(db_path) as conn:
+        with self._pool.conexao(db_path) as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -281,39 +390,30 @@ class EmpresaDatabaseManager:
                   classificacao_data.get('usuario', 'sistema'), 
                   'Classificação criada'))
             
-            conn.commit()
-            
         return classificacao_id
     
+    def _garantir_esquema_rastreamento(self, db_path: str):
+        """Converte agente_acoes de bancos antigos na primeira gravação do processo"""
+        chave = os.path.abspath(db_path)
+        if chave in _bancos_verificados:
+            return
+        with _bancos_verificados_lock:
+            if chave in _bancos_verificados:
+                return
+            with self._pool.conexao(db_path) as conn:
+                if garantir_classificacao_opcional(conn):
+                    print(f"✅ agente_acoes convertida (classificacao_id opcional): {db_path}")
+            _bancos_verificados.add(chave)
+    
     def insert_agente_acao(self, empresa_id: int, acao_data: Dict[str, Any]) -> int:
         """Registra uma ação de agente"""
         db_path = self.get_empresa_db_path(empresa_id)
+        self._garantir_esquema_rastreamento(db_path)
         
-        with sqlite3.connect(db_path) as conn:
+        with self._pool.conexao(db_path) as conn:
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO agente_acoes 
-                (produto_id, classificacao_id, agente_nome, acao_tipo, 
-                 input_dados, output_resultado, justificativa, confianca,
-                 tempo_execucao, sucesso, erro_detalhes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                acao_data.get('produto_id'),
-                acao_data.get('classificacao_id'),
-                acao_data.get('agente_nome'),
-                acao_data.get('acao_tipo'),
-                json.dumps(acao_data.get('input_dados', {}), ensure_ascii=False),
-                json.dumps(acao_data.get('output_resultado', {}), ensure_ascii=False),
-                acao_data.get('justificativa'),
-                acao_data.get('confianca'),
-                acao_data.get('tempo_execucao'),
-                acao_data.get('sucesso', True),
-                acao_data.get('erro_detalhes')
-            ))
-            
+            cursor.execute(SQL_INSERT_AGENTE_ACAO, parametros_agente_acao(acao_data))
             acao_id = cursor.lastrowid
-            conn.commit()
             
         return acao_id
     
@@ -321,33 +421,47 @@ class EmpresaDatabaseManager:
         """Registra uma consulta de agente"""
         db_path = self.get_empresa_db_path(empresa_id)
         
-        with sqlite3.connect(db_path) as conn:
+        with self._pool.conexao(db_path) as conn:
             cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO agente_consultas 
-                (produto_id, agente_nome, tipo_consulta, query_original,
-                 query_processada, resultados_encontrados, resultado_detalhes,
-                 relevancia_score, tempo_resposta, sucesso)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                consulta_data.get('produto_id'),
-                consulta_data.get('agente_nome'),
-                consulta_data.get('tipo_consulta'),
-                consulta_data.get('query_original'),
-                consulta_data.get('query_processada'),
-                consulta_data.get('resultados_encontrados', 0),
-                json.dumps(consulta_data.get('resultado_detalhes', {}), ensure_ascii=False),
-                consulta_data.get('relevancia_score'),
-                consulta_data.get('tempo_resposta'),
-                consulta_data.get('sucesso', True)
-            ))
-            
+            cursor.execute(SQL_INSERT_AGENTE_CONSULTA, parametros_agente_consulta(consulta_data))
             consulta_id = cursor.lastrowid
-            conn.commit()
             
         return consulta_id
     
+    def insert_rastreamento_lote(self, empresa_id: int, acoes: List[tuple],
+                                 consultas: List[tuple]) -> int:
+        """
+        Grava ações e consultas de agentes já convertidas em parâmetros
+        (parametros_agente_acao / parametros_agente_consulta) em uma transação.
+        
+        Se o lote falhar, as linhas são gravadas uma a uma para que uma linha
+        inválida não descarte as demais.
+        
+        Returns:
+            Número de linhas que não puderam ser gravadas
+        """
+        db_path = self.get_empresa_db_path(empresa_id)
+        try:
+            self._garantir_esquema_rastreamento(db_path)
+            with self._pool.conexao(db_path) as conn:
+                if acoes:
+                    conn.executemany(SQL_INSERT_AGENTE_ACAO, acoes)
+                if consultas:
+                    conn.executemany(SQL_INSERT_AGENTE_CONSULTA, consultas)
+            return 0
+        except sqlite3.Error as e:
+            print(f"⚠️ Lote de rastreamento da empresa {empresa_id} falhou ({e}); gravando linha a linha")
+        
+        nao_gravadas = 0
+        for sql, linhas in ((SQL_INSERT_AGENTE_ACAO, acoes), (SQL_INSERT_AGENTE_CONSULTA, consultas)):
+            for parametros in linhas:
+                try:
+                    with self._pool.conexao(db_path) as conn:
+                        conn.execute(sql, parametros)
+                except sqlite3.Error:
+                    nao_gravadas += 1
+        return nao_gravadas
+    
     def get_empresa_stats(self, empresa_id: int) -> Dict[str, Any]:
         """Obtém estatísticas da empresa"""
         db_path = self.get_empresa_db_path(empresa_id)
@@ -355,7 +469,7 @@ class EmpresaDatabaseManager:
         if not os.path.exists(db_path):
             return {"erro": "Banco da empresa não encontrado"}
         
-        with sqlite3.connect(db_path) as conn:
+        with self._pool.conexao(db_path) as conn:
             cursor = conn.cursor()
             
             # Estatísticas básicas
@@ -402,9 +516,9 @@ class EmpresaDatabaseManager:
         """Obtém detalhes completos de um produto incluindo histórico de agentes"""
         db_path = self.get_empresa_db_path(empresa_id)
         
-        with sqlite3.connect(db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._pool.conexao(db_path) as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             
             # Dados do produto
             cursor.execute("SELECT * FROM produtos_empresa WHERE id = ?", (produto_id,))
@@ -426,11 +540,11 @@ class EmpresaDatabaseManager:
             acoes = []
             for row in cursor.fetchall():
                 acao = dict(row)
-                # Parse JSON fields
+                # Payload compactado ou JSON legado
                 try:
-                    acao['input_dados'] = json.loads(acao['input_dados'] or '{}')
-                    acao['output_resultado'] = json.loads(acao['output_resultado'] or '{}')
-                except:
+                    acao['input_dados'] = expandir_json(acao['input_dados'], {})
+                    acao['output_resultado'] = expandir_json(acao['output_resultado'], {})
+                except Exception:
                     pass
                 acoes.append(acao)
             
@@ -474,9 +588,9 @@ class EmpresaDatabaseManager:
             empresa_id = int(db_file.stem.split('_')[1])
             
             try:
-                with sqlite3.connect(str(db_file)) as conn:
-                    conn.row_factory = sqlite3.Row
+                with self._pool.conexao(str(db_file)) as conn:
                     cursor = conn.cursor()
+                    cursor.row_factory = sqlite3.Row
                     
                     cursor.execute("SELECT * FROM empresa_info WHERE id = ?", (empresa_id,))
                     info = dict(cursor.fetchone() or {})
@@ -496,7 +610,7 @@ class EmpresaDatabaseManager:
 
     def create_golden_set_shared(self):
         """Cria o banco do Golden Set compartilhado entre todas as empresas"""
-        with sqlite3.connect(self.golden_set_db) as conn:
+        with self._pool.conexao(self.golden_set_db) as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -540,6 +654,4 @@ class EmpresaDatabaseManager:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_golden_ncm ON golden_set_produtos(ncm_codigo)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_golden_cest ON golden_set_produtos(cest_codigo)")
             
-            conn.commit()
-            
         print(f"✅ Golden Set compartilhado criado: {self.golden_set_db}")
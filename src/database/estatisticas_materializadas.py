@@ -0,0 +1,499 @@
+"""
+Estatísticas Materializadas do Dashboard
+Contadores (totais, por status, por dia e por agente) mantidos por triggers
+SQLite a cada INSERT/UPDATE/DELETE, para que o dashboard leia poucas linhas
+em vez de fazer COUNT(*)/AVG nas tabelas inteiras. Uma reconciliação
+periódica compara os contadores com a varredura completa e os corrige
+"""
+
+import itertools
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Prefixo dos triggers; trocar a versão quando as definições mudarem força
+# a recriação dos triggers e o recálculo dos contadores
+PREFIXO_TRIGGER = "estat_v1_"
+
+SQL_TABELAS_ESTATISTICAS = [
+    """
+    CREATE TABLE IF NOT EXISTS estatisticas_contadores (
+        chave TEXT PRIMARY KEY,
+        valor INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estatisticas_diarias (
+        serie TEXT NOT NULL,
+        dia TEXT NOT NULL,
+        valor INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (serie, dia)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estatisticas_classificacoes_diarias (
+        dia TEXT NOT NULL,
+        status_revisao TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        soma_confianca REAL NOT NULL DEFAULT 0,
+        qtd_confianca INTEGER NOT NULL DEFAULT 0,
+        soma_tempo_revisao REAL NOT NULL DEFAULT 0,
+        qtd_tempo_revisao INTEGER NOT NULL DEFAULT 0,
+        faixa_0_50 INTEGER NOT NULL DEFAULT 0,
+        faixa_50_70 INTEGER NOT NULL DEFAULT 0,
+        faixa_70_80 INTEGER NOT NULL DEFAULT 0,
+        faixa_80_90 INTEGER NOT NULL DEFAULT 0,
+        faixa_90_100 INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, status_revisao)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estatisticas_agentes_diarias (
+        dia TEXT NOT NULL,
+        agente_nome TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        soma_confianca REAL NOT NULL DEFAULT 0,
+        qtd_confianca INTEGER NOT NULL DEFAULT 0,
+        soma_tempo_ms REAL NOT NULL DEFAULT 0,
+        qtd_tempo_ms INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, agente_nome)
+    )
+    """,
+]
+
+TABELAS_ESTATISTICAS = [
+    "estatisticas_contadores", "estatisticas_diarias",
+    "estatisticas_classificacoes_diarias", "estatisticas_agentes_diarias",
+]
+
+# Faixas de confiança do dashboard (mesmos limites de MetricsService)
+FAIXAS_CONFIANCA = {
+    "0.0-0.5": "faixa_0_50",
+    "0.5-0.7": "faixa_50_70",
+    "0.7-0.8": "faixa_70_80",
+    "0.8-0.9": "faixa_80_90",
+    "0.9-1.0": "faixa_90_100",
+}
+
+
+class Agregado(NamedTuple):
+    """
+    Contribuição de cada linha de `origem` para uma tabela de estatísticas.
+
+    As expressões usam {r} como a linha (NEW/OLD nos triggers, a tabela de
+    origem no recálculo); `valores` são somados, `chaves` formam a PK.
+    """
+    origem: str
+    destino: str
+    chaves: Sequence[Tuple[str, str]]
+    valores: Sequence[Tuple[str, str]]
+    condicao: str = "1"
+    colunas: Sequence[str] = ()  # Colunas que, ao mudar, alteram a contribuição
+
+
+def _contador(origem: str, chave: str, condicao: str = "1", colunas: Sequence[str] = ()) -> Agregado:
+    return Agregado(origem, "estatisticas_contadores", [("chave", chave)], [("valor", "1")], condicao, colunas)
+
+
+def _dia(coluna: str) -> str:
+    # Datas nulas ficam no dia '' (fora de qualquer período, como no filtro por data)
+    return f"COALESCE(date({{r}}.{coluna}), '')"
+
+
+_CONFIANCA = "COALESCE({r}.confianca_sugerida, 0)"
+
+AGREGADOS = [
+    # Totais
+    _contador("classificacoes_revisao", "'classificacoes_revisao'"),
+    _contador("classificacoes_revisao", "'classificacoes_revisao:' || COALESCE({r}.status_revisao, '')",
+              colunas=["status_revisao"]),
+    _contador("golden_set", "'golden_set:ativos'", "{r}.ativo", ["ativo"]),
+    _contador("explicacoes_agentes", "'explicacoes_agentes'"),
+    _contador("consultas_agentes", "'consultas_agentes'"),
+    _contador("ncm_hierarchy", "'ncm_hierarchy:ativos'", "{r}.ativo", ["ativo"]),
+    _contador("cest_categories", "'cest_categories:ativos'", "{r}.ativo", ["ativo"]),
+    _contador("ncm_cest_mapping", "'ncm_cest_mapping:ativos'", "{r}.ativo", ["ativo"]),
+    _contador("produtos_exemplos", "'produtos_exemplos:ativos'", "{r}.ativo", ["ativo"]),
+
+    # Séries diárias simples
+    Agregado("classificacoes_revisao", "estatisticas_diarias",
+             [("serie", "'classificacoes_revisao:criadas'"), ("dia", _dia("data_criacao"))],
+             [("valor", "1")], colunas=["data_criacao"]),
+    Agregado("golden_set", "estatisticas_diarias",
+             [("serie", "'golden_set:ativos'"), ("dia", _dia("data_adicao"))],
+             [("valor", "1")], "{r}.ativo", ["ativo", "data_adicao"]),
+
+    # Classificações por dia de classificação e status
+    Agregado("classificacoes_revisao", "estatisticas_classificacoes_diarias",
+             [("dia", _dia("data_classificacao")), ("status_revisao", "COALESCE({r}.status_revisao, '')")],
+             [
+                 ("total", "1"),
+                 ("soma_confianca", _CONFIANCA),
+                 ("qtd_confianca", "{r}.confianca_sugerida IS NOT NULL"),
+                 ("soma_tempo_revisao", "COALESCE({r}.tempo_revisao_segundos, 0)"),
+                 ("qtd_tempo_revisao", "{r}.tempo_revisao_segundos IS NOT NULL"),
+                 ("faixa_0_50", f"{_CONFIANCA} < 0.5"),
+                 ("faixa_50_70", f"{_CONFIANCA} >= 0.5 AND {_CONFIANCA} < 0.7"),
+                 ("faixa_70_80", f"{_CONFIANCA} >= 0.7 AND {_CONFIANCA} < 0.8"),
+                 ("faixa_80_90", f"{_CONFIANCA} >= 0.8 AND {_CONFIANCA} < 0.9"),
+                 ("faixa_90_100", f"{_CONFIANCA} >= 0.9"),
+             ],
+             colunas=["data_classificacao", "status_revisao", "confianca_sugerida", "tempo_revisao_segundos"]),
+
+    # Explicações por dia de execução e agente
+    Agregado("explicacoes_agentes", "estatisticas_agentes_diarias",
+             [("dia", _dia("data_execucao")), ("agente_nome", "COALESCE({r}.agente_nome, '')")],
+             [
+                 ("total", "1"),
+                 ("soma_confianca", "COALESCE({r}.nivel_confianca, 0)"),
+                 ("qtd_confianca", "{r}.nivel_confianca IS NOT NULL"),
+                 ("soma_tempo_ms", "COALESCE({r}.tempo_processamento_ms, 0)"),
+                 ("qtd_tempo_ms", "{r}.tempo_processamento_ms IS NOT NULL"),
+             ],
+             colunas=["data_execucao", "agente_nome", "nivel_confianca", "tempo_processamento_ms"]),
+]
+
+
+# =====================
+# GERAÇÃO DE SQL
+# =====================
+
+def _sql_upsert(agregado: Agregado, linha: str, sinal: int) -> str:
+    """INSERT ... ON CONFLICT que soma a contribuição de NEW (+1) ou OLD (-1)."""
+    chaves = [nome for nome, _ in agregado.chaves]
+    valores = [nome for nome, _ in agregado.valores]
+    expressoes = [expr.format(r=linha) for _, expr in agregado.chaves]
+    expressoes += [f"({expr.format(r=linha)}) * {sinal}" for _, expr in agregado.valores]
+    return (
+        f"INSERT INTO {agregado.destino} ({', '.join(chaves + valores)}) "
+        f"SELECT {', '.join(expressoes)} WHERE {agregado.condicao.format(r=linha)} "
+        f"ON CONFLICT({', '.join(chaves)}) DO UPDATE SET "
+        + ", ".join(f"{v} = {v} + excluded.{v}" for v in valores)
+    )
+
+
+def _sql_selecao(agregado: Agregado) -> str:
+    """SELECT ... GROUP BY com a varredura completa da origem."""
+    expressoes_chave = [expr.format(r="t") for _, expr in agregado.chaves]
+    return (
+        f"SELECT {', '.join(expressoes_chave)}, "
+        + ", ".join(f"SUM({expr.format(r='t')})" for _, expr in agregado.valores)
+        + f" FROM {agregado.origem} t WHERE {agregado.condicao.format(r='t')} "
+        f"GROUP BY {', '.join(expressoes_chave)}"
+    )
+
+
+def _sql_recalculo(agregado: Agregado) -> str:
+    """Grava o resultado de _sql_selecao na tabela de estatísticas."""
+    chaves = [nome for nome, _ in agregado.chaves]
+    valores = [nome for nome, _ in agregado.valores]
+    return (
+        f"INSERT INTO {agregado.destino} ({', '.join(chaves + valores)}) {_sql_selecao(agregado)} "
+        f"ON CONFLICT({', '.join(chaves)}) DO UPDATE SET "
+        + ", ".join(f"{v} = {v} + excluded.{v}" for v in valores)
+    )
+
+
+def _sql_triggers(origem: str) -> Dict[str, str]:
+    """Triggers AFTER INSERT/DELETE/UPDATE de uma tabela de origem."""
+    agregados = [a for a in AGREGADOS if a.origem == origem]
+    colunas = sorted({coluna for a in agregados for coluna in a.colunas})
+
+    def corpo(comandos):
+        return "BEGIN\n    " + ";\n    ".join(comandos) + ";\nEND"
+
+    triggers = {
+        f"{PREFIXO_TRIGGER}{origem}_ins": (
+            f"CREATE TRIGGER {PREFIXO_TRIGGER}{origem}_ins AFTER INSERT ON {origem} "
+            + corpo([_sql_upsert(a, "NEW", 1) for a in agregados])
+        ),
+        f"{PREFIXO_TRIGGER}{origem}_del": (
+            f"CREATE TRIGGER {PREFIXO_TRIGGER}{origem}_del AFTER DELETE ON {origem} "
+            + corpo([_sql_upsert(a, "OLD", -1) for a in agregados])
+        ),
+    }
+    if colunas:
+        triggers[f"{PREFIXO_TRIGGER}{origem}_upd"] = (
+            f"CREATE TRIGGER {PREFIXO_TRIGGER}{origem}_upd AFTER UPDATE OF {', '.join(colunas)} ON {origem} "
+            + corpo([_sql_upsert(a, "OLD", -1) for a in agregados if a.colunas]
+                    + [_sql_upsert(a, "NEW", 1) for a in agregados if a.colunas])
+        )
+    return triggers
+
+
+# =====================
+# INSTALAÇÃO E RECÁLCULO
+# =====================
+
+def _eh_sqlite(conn) -> bool:
+    return conn.dialect.name == "sqlite"
+
+
+def _tabelas_existentes(conn) -> set:
+    return {linha[0] for linha in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table'"
+    )).fetchall()}
+
+
+def garantir_estatisticas_materializadas(conn) -> bool:
+    """
+    Cria as tabelas de estatísticas e os triggers das tabelas de origem
+    existentes. Se algum trigger faltava (banco novo, tabela criada depois,
+    versão nova), recalcula todos os contadores na mesma transação.
+
+    Args:
+        conn: Connection SQLAlchemy dentro de uma transação
+
+    Returns:
+        True se os contadores foram recalculados
+    """
+    if not _eh_sqlite(conn):
+        return False
+
+    for sql in SQL_TABELAS_ESTATISTICAS:
+        conn.execute(text(sql))
+
+    tabelas = _tabelas_existentes(conn)
+    desejados = {}
+    for origem in dict.fromkeys(a.origem for a in AGREGADOS):
+        if origem in tabelas:
+            desejados.update(_sql_triggers(origem))
+
+    existentes = {linha[0] for linha in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'estat\\_%' ESCAPE '\\'"
+    )).fetchall()}
+    if existentes == set(desejados):
+        return False
+
+    for nome in existentes:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {nome}"))
+    for sql in desejados.values():
+        conn.execute(text(sql))
+
+    recalcular_estatisticas(conn, tabelas)
+    logger.info(f"✅ Estatísticas materializadas instaladas ({len(desejados)} triggers)")
+    return True
+
+
+def recalcular_estatisticas(conn, tabelas: Optional[set] = None):
+    """Refaz todas as tabelas de estatísticas a partir das tabelas de origem."""
+    tabelas = tabelas if tabelas is not None else _tabelas_existentes(conn)
+    for destino in TABELAS_ESTATISTICAS:
+        conn.execute(text(f"DELETE FROM {destino}"))
+    for agregado in AGREGADOS:
+        if agregado.origem in tabelas:
+            conn.execute(text(_sql_recalculo(agregado)))
+
+
+def materializacao_ativa(conn) -> bool:
+    """True se o banco da conexão tem os triggers instalados (SQLite)."""
+    if not _eh_sqlite(conn):
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name LIKE :prefixo LIMIT 1"
+    ), {"prefixo": f"{PREFIXO_TRIGGER}%"}).first() is not None
+
+
+# =====================
+# RECONCILIAÇÃO
+# =====================
+
+def _chaves_destino(destino: str) -> List[str]:
+    return [nome for nome, _ in next(a for a in AGREGADOS if a.destino == destino).chaves]
+
+
+def _ler_materializado(conn, destino: str) -> Dict[Tuple, Dict[str, Any]]:
+    chaves = _chaves_destino(destino)
+    resultado = conn.execute(text(f"SELECT * FROM {destino}"))
+    nomes = list(resultado.keys())
+    linhas = {}
+    for linha in resultado.fetchall():
+        registro = {nome: valor for nome, valor in zip(nomes, linha) if nome not in chaves}
+        linhas[tuple(linha[nomes.index(c)] for c in chaves)] = registro
+    return linhas
+
+
+def _ler_recalculado(conn, tabelas: set) -> Dict[str, Dict[Tuple, Dict[str, Any]]]:
+    esperados = {destino: {} for destino in TABELAS_ESTATISTICAS}
+    for agregado in AGREGADOS:
+        if agregado.origem not in tabelas:
+            continue
+        n = len(agregado.chaves)
+        for linha in conn.execute(text(_sql_selecao(agregado))).fetchall():
+            registro = esperados[agregado.destino].setdefault(tuple(linha[:n]), {})
+            for (nome, _), valor in zip(agregado.valores, linha[n:]):
+                registro[nome] = registro.get(nome, 0) + (valor or 0)
+    return esperados
+
+
+def _divergem(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    # Linhas zeradas equivalem a linhas ausentes; somas REAL com tolerância
+    for coluna in set(a) | set(b):
+        x, y = a.get(coluna) or 0, b.get(coluna) or 0
+        if abs(x - y) > 1e-6 * max(1.0, abs(x), abs(y)):
+            return True
+    return False
+
+
+def reconciliar_estatisticas(conn, corrigir: bool = True, max_divergencias: int = 20) -> Dict[str, Any]:
+    """
+    Compara os contadores materializados com a varredura completa das
+    tabelas de origem e, se `corrigir`, recalcula os divergentes.
+
+    Args:
+        conn: Connection SQLAlchemy dentro de uma transação (leitura e
+            correção veem o mesmo estado das tabelas)
+
+    Returns:
+        Quantidade e amostra das divergências por tabela de estatísticas
+    """
+    if not _eh_sqlite(conn):
+        return {"disponivel": False}
+
+    esperados = _ler_recalculado(conn, _tabelas_existentes(conn))
+    divergencias = {}
+    for destino in TABELAS_ESTATISTICAS:
+        atuais = _ler_materializado(conn, destino)
+        diferentes = sorted(
+            (chave for chave in set(atuais) | set(esperados[destino])
+             if _divergem(atuais.get(chave, {}), esperados[destino].get(chave, {}))),
+            key=str
+        )
+        if diferentes:
+            divergencias[destino] = {
+                "total": len(diferentes),
+                "amostra": [
+                    {"chave": list(chave), "materializado": atuais.get(chave),
+                     "recalculado": esperados[destino].get(chave)}
+                    for chave in diferentes[:max_divergencias]
+                ],
+            }
+
+    if divergencias:
+        logger.warning(
+            "⚠️ Estatísticas materializadas divergentes: "
+            + ", ".join(f"{destino}={d['total']}" for destino, d in divergencias.items())
+            + (" (recalculadas)" if corrigir else "")
+        )
+        if corrigir:
+            recalcular_estatisticas(conn)
+
+    return {
+        "disponivel": True,
+        "consistente": not divergencias,
+        "corrigido": bool(divergencias) and corrigir,
+        "divergencias": divergencias,
+        "data_verificacao": datetime.now().isoformat(),
+    }
+
+
+# =====================
+# LEITURA
+# =====================
+
+def _dia_iso(valor: Union[date, datetime, str]) -> str:
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return str(valor)[:10]
+
+
+def ler_contadores(conn) -> Dict[str, int]:
+    """Todos os contadores totais (dezenas de linhas)."""
+    return {chave: valor for chave, valor in conn.execute(text(
+        "SELECT chave, valor FROM estatisticas_contadores"
+    )).fetchall()}
+
+
+def somar_serie(conn, serie: str, inicio: Union[date, datetime, str],
+                fim: Optional[Union[date, datetime, str]] = None) -> int:
+    """Soma de uma série diária entre os dias `inicio` e `fim` (inclusive)."""
+    sql = "SELECT COALESCE(SUM(valor), 0) FROM estatisticas_diarias WHERE serie = :serie AND dia >= :inicio"
+    parametros = {"serie": serie, "inicio": _dia_iso(inicio)}
+    if fim is not None:
+        sql += " AND dia <= :fim"
+        parametros["fim"] = _dia_iso(fim)
+    return int(conn.execute(text(sql), parametros).scalar() or 0)
+
+
+def ler_classificacoes_diarias(conn, inicio: Union[date, datetime, str],
+                               fim: Optional[Union[date, datetime, str]] = None) -> List[Dict[str, Any]]:
+    """Linhas (dia, status) de estatisticas_classificacoes_diarias no intervalo de dias."""
+    sql = "SELECT * FROM estatisticas_classificacoes_diarias WHERE dia >= :inicio"
+    parametros = {"inicio": _dia_iso(inicio)}
+    if fim is not None:
+        sql += " AND dia <= :fim"
+        parametros["fim"] = _dia_iso(fim)
+    resultado = conn.execute(text(sql + " ORDER BY dia, status_revisao"), parametros)
+    nomes = list(resultado.keys())
+    return [dict(zip(nomes, linha)) for linha in resultado.fetchall()]
+
+
+def ler_desempenho_agentes(conn, inicio: Union[date, datetime, str]) -> List[Dict[str, Any]]:
+    """Execuções, confiança média e tempo médio por agente desde o dia `inicio`."""
+    resultado = conn.execute(text("""
+        SELECT agente_nome, SUM(total), SUM(soma_confianca), SUM(qtd_confianca),
+               SUM(soma_tempo_ms), SUM(qtd_tempo_ms)
+        FROM estatisticas_agentes_diarias
+        WHERE dia >= :inicio
+        GROUP BY agente_nome
+        HAVING SUM(total) > 0
+        ORDER BY SUM(total) DESC
+    """), {"inicio": _dia_iso(inicio)})
+    return [
+        {
+            "nome": nome,
+            "total_execucoes": int(total),
+            "confianca_media": round(soma_conf / qtd_conf, 2) if qtd_conf else 0,
+            "tempo_medio_ms": round(soma_tempo / qtd_tempo, 2) if qtd_tempo else 0,
+        }
+        for nome, total, soma_conf, qtd_conf, soma_tempo, qtd_tempo in resultado.fetchall()
+    ]
+
+
+# =====================
+# GERAÇÃO DE ESCRITAS
+# =====================
+# Número de commits ORM deste processo que alteraram cada tabela; caches de
+# métricas guardam a geração lida e deixam de valer quando ela muda
+
+_geracoes: Dict[str, int] = {}
+_lock_geracoes = threading.Lock()
+
+
+def geracao_escritas(tabela: str) -> int:
+    """Geração atual de `tabela` (muda a cada commit que a altera)."""
+    return _geracoes.get(tabela, 0)
+
+
+def avancar_geracao(tabela: str):
+    """Invalida os caches de `tabela` (escritas fora do ORM)."""
+    with _lock_geracoes:
+        _geracoes[tabela] = _geracoes.get(tabela, 0) + 1
+
+
+@event.listens_for(Session, "after_flush")
+def _anotar_tabelas_escritas(session, flush_context):
+    tabelas = session.info.setdefault("tabelas_escritas", set())
+    for objeto in itertools.chain(session.new, session.dirty, session.deleted):
+        tabela = getattr(objeto, "__tablename__", None)
+        if tabela:
+            tabelas.add(tabela)
+
+
+@event.listens_for(Session, "after_commit")
+def _avancar_geracoes(session):
+    for tabela in session.info.pop("tabelas_escritas", ()):
+        avancar_geracao(tabela)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_tabelas_escritas(session):
+    session.info.pop("tabelas_escritas", None)
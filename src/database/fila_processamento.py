@@ -0,0 +1,412 @@
+"""
+Fila Durável de Processamento em Lote
+Sessões de processamento (jobs) e seus blocos gravados no SQLite. Cada bloco
+concluído é um checkpoint gravado na mesma transação dos resultados: um
+worker que cai no meio da sessão é retomado a partir do primeiro bloco
+pendente, sem repetir nem perder itens
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Estados da sessão
+STATUS_PENDENTE = "pendente"
+STATUS_EXECUTANDO = "executando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+STATUS_CANCELADO = "cancelado"
+STATUS_FINAIS = (STATUS_CONCLUIDO, STATUS_ERRO, STATUS_CANCELADO)
+
+SQL_TABELAS_PROCESSAMENTO = [
+    """
+    CREATE TABLE IF NOT EXISTS sessoes_processamento (
+        sessao_id TEXT PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pendente',
+        empresa_id TEXT,
+        parametros_json TEXT,
+        total_itens INTEGER NOT NULL DEFAULT 0,
+        itens_processados INTEGER NOT NULL DEFAULT 0,
+        itens_erro INTEGER NOT NULL DEFAULT 0,
+        total_blocos INTEGER NOT NULL DEFAULT 0,
+        blocos_concluidos INTEGER NOT NULL DEFAULT 0,
+        tempo_execucao_ms INTEGER NOT NULL DEFAULT 0,
+        progresso REAL NOT NULL DEFAULT 0,
+        mensagem TEXT,
+        cancelamento_solicitado INTEGER NOT NULL DEFAULT 0,
+        tentativas INTEGER NOT NULL DEFAULT 0,
+        worker_id TEXT,
+        heartbeat TEXT,
+        data_criacao TEXT NOT NULL,
+        data_inicio TEXT,
+        data_fim TEXT,
+        data_atualizacao TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_sessoes_processamento_fila
+    ON sessoes_processamento(status, data_criacao)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sessoes_processamento_blocos (
+        sessao_id TEXT NOT NULL,
+        indice INTEGER NOT NULL,
+        itens_json TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pendente',
+        itens_processados INTEGER NOT NULL DEFAULT 0,
+        itens_erro INTEGER NOT NULL DEFAULT 0,
+        tempo_ms INTEGER,
+        data_conclusao TEXT,
+        PRIMARY KEY (sessao_id, indice)
+    )
+    """,
+]
+
+
+class SessaoPerdidaError(RuntimeError):
+    """O worker não é mais dono da sessão (recuperada por outro ou cancelada)"""
+
+
+def _agora() -> str:
+    return datetime.now().isoformat(sep=" ", timespec="seconds")
+
+
+# Estados do layout anterior (scripts/create_sessoes_table.py) mantidos na migração;
+# os demais eram tarefas em memória do processo da API e não serão retomados
+_STATUS_LEGADOS_FINAIS = {"concluido": STATUS_CONCLUIDO, "erro": STATUS_ERRO, "cancelado": STATUS_CANCELADO}
+
+
+def _colunas(conn, tabela: str) -> set:
+    return {linha[1] for linha in conn.execute(text(f"PRAGMA table_info({tabela})")).fetchall()}
+
+
+def _migrar_sessoes_legadas(conn) -> int:
+    """
+    Converte sessoes_processamento do layout anterior (id, tipo_processo,
+    total_items, items_processados, parametros, data_conclusao...) para o da
+    fila. Sessões não finalizadas viram erro: não há blocos para retomá-las.
+
+    Returns:
+        Número de sessões migradas (0 se a tabela já está no layout atual)
+    """
+    colunas = _colunas(conn, "sessoes_processamento")
+    if "tipo_processo" not in colunas or "data_criacao" in colunas:
+        return 0
+
+    conn.execute(text("ALTER TABLE sessoes_processamento RENAME TO sessoes_processamento_legado"))
+    conn.execute(text(SQL_TABELAS_PROCESSAMENTO[0]))
+
+    linhas = conn.execute(text("""
+        SELECT sessao_id, tipo_processo, status, progresso, total_items, items_processados, mensagem,
+               parametros, data_inicio, data_atualizacao, data_conclusao, erro_detalhes
+        FROM sessoes_processamento_legado
+    """)).mappings().all()
+    agora = _agora()
+    if linhas:
+        conn.execute(text("""
+            INSERT INTO sessoes_processamento (
+                sessao_id, tipo, status, parametros_json, total_itens, itens_processados, progresso,
+                mensagem, data_criacao, data_inicio, data_fim, data_atualizacao
+            ) VALUES (:sessao_id, :tipo, :status, :parametros, :total_itens, :itens_processados, :progresso,
+                      :mensagem, :data_criacao, :data_inicio, :data_fim, :data_atualizacao)
+        """), [
+            {
+                "sessao_id": linha["sessao_id"],
+                "tipo": linha["tipo_processo"],
+                "status": _STATUS_LEGADOS_FINAIS.get(linha["status"], STATUS_ERRO),
+                "parametros": linha["parametros"],
+                "total_itens": linha["total_items"] or 0,
+                "itens_processados": linha["items_processados"] or 0,
+                "progresso": linha["progresso"] or 0,
+                "mensagem": (linha["mensagem"] if linha["status"] in _STATUS_LEGADOS_FINAIS
+                             else linha["erro_detalhes"] or "Sessão anterior à fila durável interrompida"),
+                "data_criacao": linha["data_inicio"] or agora,
+                "data_inicio": linha["data_inicio"],
+                "data_fim": linha["data_conclusao"] or (None if linha["status"] in _STATUS_LEGADOS_FINAIS else agora),
+                "data_atualizacao": linha["data_atualizacao"] or agora,
+            }
+            for linha in linhas
+        ])
+
+    # Os índices do layout anterior (idx_sessao_id, idx_status...) saem com a tabela
+    conn.execute(text("DROP TABLE sessoes_processamento_legado"))
+    logger.info(f"✅ sessoes_processamento migrada para a fila durável ({len(linhas)} sessões)")
+    return len(linhas)
+
+
+def garantir_fila_processamento(conn):
+    """
+    Cria as tabelas da fila em bancos anteriores a ela, convertendo a
+    sessoes_processamento do layout anterior quando existir.
+
+    Args:
+        conn: Connection SQLAlchemy dentro de uma transação
+    """
+    _migrar_sessoes_legadas(conn)
+    for sql in SQL_TABELAS_PROCESSAMENTO:
+        conn.execute(text(sql))
+
+
+# =====================
+# CRIAÇÃO E CONTROLE
+# =====================
+
+def criar_sessao(conn, sessao_id: str, tipo: str, blocos: Sequence[Sequence[Any]],
+                 parametros: Optional[Dict[str, Any]] = None, empresa_id: Any = None,
+                 total_itens: Optional[int] = None):
+    """Grava a sessão pendente e seus blocos de itens (ids) já planejados."""
+    agora = _agora()
+    conn.execute(text("""
+        INSERT INTO sessoes_processamento (
+            sessao_id, tipo, status, empresa_id, parametros_json, total_itens, total_blocos,
+            mensagem, data_criacao, data_atualizacao
+        ) VALUES (:sessao_id, :tipo, :status, :empresa_id, :parametros, :total_itens, :total_blocos,
+                  'Aguardando worker', :agora, :agora)
+    """), {
+        "sessao_id": sessao_id, "tipo": tipo, "status": STATUS_PENDENTE,
+        "empresa_id": None if empresa_id is None else str(empresa_id),
+        "parametros": json.dumps(parametros or {}, default=str),
+        "total_itens": sum(len(bloco) for bloco in blocos) if total_itens is None else total_itens,
+        "total_blocos": len(blocos), "agora": agora
+    })
+    if blocos:
+        conn.execute(text("""
+            INSERT INTO sessoes_processamento_blocos (sessao_id, indice, itens_json)
+            VALUES (:sessao_id, :indice, :itens)
+        """), [{"sessao_id": sessao_id, "indice": indice, "itens": json.dumps(list(bloco))}
+               for indice, bloco in enumerate(blocos)])
+
+
+def reivindicar_sessao(conn, worker_id: str, max_por_empresa: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    Passa a sessão pendente mais antiga para `worker_id` num único UPDATE
+    (atômico entre processos). Com max_por_empresa > 0, empresas com esse
+    número de sessões em execução ficam de fora.
+    """
+    agora = _agora()
+    resultado = conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET status = :executando, worker_id = :worker_id, heartbeat = :agora,
+            tentativas = tentativas + 1, data_inicio = COALESCE(data_inicio, :agora),
+            data_atualizacao = :agora, mensagem = 'Em execução'
+        WHERE status = :pendente AND sessao_id = (
+            SELECT s.sessao_id FROM sessoes_processamento s
+            WHERE s.status = :pendente AND s.cancelamento_solicitado = 0
+              AND (:max_por_empresa <= 0 OR (
+                  SELECT COUNT(*) FROM sessoes_processamento e
+                  WHERE e.status = :executando AND e.empresa_id IS s.empresa_id
+              ) < :max_por_empresa)
+            ORDER BY s.data_criacao, s.rowid
+            LIMIT 1
+        )
+    """), {"executando": STATUS_EXECUTANDO, "pendente": STATUS_PENDENTE, "worker_id": worker_id,
+           "agora": agora, "max_por_empresa": max_por_empresa})
+    if resultado.rowcount == 0:
+        return None
+
+    linha = conn.execute(text("""
+        SELECT * FROM sessoes_processamento
+        WHERE worker_id = :worker_id AND status = :executando AND heartbeat = :agora
+        ORDER BY data_atualizacao DESC LIMIT 1
+    """), {"worker_id": worker_id, "executando": STATUS_EXECUTANDO, "agora": agora}).mappings().first()
+    return dict(linha) if linha else None
+
+
+def proximo_bloco(conn, sessao_id: str) -> Optional[Dict[str, Any]]:
+    """Primeiro bloco ainda não concluído da sessão ({'indice', 'itens'})."""
+    linha = conn.execute(text("""
+        SELECT indice, itens_json FROM sessoes_processamento_blocos
+        WHERE sessao_id = :sessao_id AND status = :pendente
+        ORDER BY indice LIMIT 1
+    """), {"sessao_id": sessao_id, "pendente": STATUS_PENDENTE}).first()
+    if linha is None:
+        return None
+    return {"indice": linha[0], "itens": json.loads(linha[1])}
+
+
+def concluir_bloco(conn, sessao_id: str, worker_id: str, indice: int,
+                   processados: int, erros: int, tempo_ms: int):
+    """
+    Checkpoint do bloco: chamar na transação que gravou os resultados.
+    SessaoPerdidaError (desfaz a transação) se o worker perdeu a sessão.
+    """
+    agora = _agora()
+    resultado = conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET itens_processados = itens_processados + :processados,
+            itens_erro = itens_erro + :erros,
+            blocos_concluidos = blocos_concluidos + 1,
+            tempo_execucao_ms = tempo_execucao_ms + :tempo_ms,
+            progresso = CASE WHEN total_blocos > 0
+                THEN ROUND(100.0 * (blocos_concluidos + 1) / total_blocos, 1) ELSE 100 END,
+            heartbeat = :agora, data_atualizacao = :agora,
+            mensagem = 'Bloco ' || (:indice + 1) || ' de ' || total_blocos || ' concluído'
+        WHERE sessao_id = :sessao_id AND worker_id = :worker_id AND status = :executando
+    """), {"processados": processados, "erros": erros, "tempo_ms": tempo_ms, "agora": agora,
+           "indice": indice, "sessao_id": sessao_id, "worker_id": worker_id,
+           "executando": STATUS_EXECUTANDO})
+    if resultado.rowcount == 0:
+        raise SessaoPerdidaError(f"Sessão {sessao_id} não pertence mais ao worker {worker_id}")
+
+    conn.execute(text("""
+        UPDATE sessoes_processamento_blocos
+        SET status = :concluido, itens_processados = :processados, itens_erro = :erros,
+            tempo_ms = :tempo_ms, data_conclusao = :agora
+        WHERE sessao_id = :sessao_id AND indice = :indice
+    """), {"concluido": STATUS_CONCLUIDO, "processados": processados, "erros": erros,
+           "tempo_ms": tempo_ms, "agora": agora, "sessao_id": sessao_id, "indice": indice})
+
+
+def atualizar_total_itens(conn, sessao_id: str, total_itens: int):
+    """Total conhecido só durante a execução (sincronização)."""
+    conn.execute(text(
+        "UPDATE sessoes_processamento SET total_itens = :total WHERE sessao_id = :sessao_id"
+    ), {"total": total_itens, "sessao_id": sessao_id})
+
+
+def registrar_heartbeat(conn, sessao_id: str, worker_id: str) -> bool:
+    """Renova a posse da sessão; False se ela foi perdida."""
+    agora = _agora()
+    return conn.execute(text("""
+        UPDATE sessoes_processamento SET heartbeat = :agora
+        WHERE sessao_id = :sessao_id AND worker_id = :worker_id AND status = :executando
+    """), {"agora": agora, "sessao_id": sessao_id, "worker_id": worker_id,
+           "executando": STATUS_EXECUTANDO}).rowcount > 0
+
+
+def cancelamento_solicitado(conn, sessao_id: str) -> bool:
+    return bool(conn.execute(text(
+        "SELECT cancelamento_solicitado FROM sessoes_processamento WHERE sessao_id = :sessao_id"
+    ), {"sessao_id": sessao_id}).scalar())
+
+
+def finalizar_sessao(conn, sessao_id: str, worker_id: str, status: str, mensagem: str):
+    """Estado final gravado pelo worker dono da sessão."""
+    agora = _agora()
+    conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET status = :status, mensagem = :mensagem, data_fim = :agora, data_atualizacao = :agora,
+            progresso = CASE WHEN :status = :concluido THEN 100 ELSE progresso END
+        WHERE sessao_id = :sessao_id AND worker_id = :worker_id AND status = :executando
+    """), {"status": status, "mensagem": mensagem, "agora": agora, "concluido": STATUS_CONCLUIDO,
+           "sessao_id": sessao_id, "worker_id": worker_id, "executando": STATUS_EXECUTANDO})
+
+
+def devolver_sessao(conn, sessao_id: str, worker_id: str):
+    """Worker encerrado normalmente no meio da sessão: volta para a fila sem contar tentativa."""
+    conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET status = :pendente, worker_id = NULL, tentativas = MAX(tentativas - 1, 0),
+            data_atualizacao = :agora, mensagem = 'Worker encerrado; aguardando retomada'
+        WHERE sessao_id = :sessao_id AND worker_id = :worker_id AND status = :executando
+    """), {"pendente": STATUS_PENDENTE, "agora": _agora(), "sessao_id": sessao_id,
+           "worker_id": worker_id, "executando": STATUS_EXECUTANDO})
+
+
+def solicitar_cancelamento(conn, sessao_id: str) -> Optional[str]:
+    """
+    Sessão pendente é cancelada na hora; em execução, o worker encerra ao fim
+    do bloco atual. Retorna o status resultante (None se não existe).
+    """
+    agora = _agora()
+    conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET status = :cancelado, mensagem = 'Cancelada antes de iniciar', data_fim = :agora,
+            data_atualizacao = :agora
+        WHERE sessao_id = :sessao_id AND status = :pendente
+    """), {"cancelado": STATUS_CANCELADO, "agora": agora, "sessao_id": sessao_id,
+           "pendente": STATUS_PENDENTE})
+    conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET cancelamento_solicitado = 1, mensagem = 'Cancelamento solicitado', data_atualizacao = :agora
+        WHERE sessao_id = :sessao_id AND status = :executando
+    """), {"agora": agora, "sessao_id": sessao_id, "executando": STATUS_EXECUTANDO})
+    return conn.execute(text(
+        "SELECT status FROM sessoes_processamento WHERE sessao_id = :sessao_id"
+    ), {"sessao_id": sessao_id}).scalar()
+
+
+def retomar_sessao(conn, sessao_id: str) -> bool:
+    """Devolve à fila uma sessão cancelada ou com erro que ainda tem blocos pendentes."""
+    return conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET status = :pendente, cancelamento_solicitado = 0, worker_id = NULL, tentativas = 0,
+            data_fim = NULL, data_atualizacao = :agora, mensagem = 'Retomada; aguardando worker'
+        WHERE sessao_id = :sessao_id AND status IN (:erro, :cancelado)
+          AND EXISTS (SELECT 1 FROM sessoes_processamento_blocos b
+                      WHERE b.sessao_id = :sessao_id AND b.status = :pendente)
+    """), {"pendente": STATUS_PENDENTE, "agora": _agora(), "sessao_id": sessao_id,
+           "erro": STATUS_ERRO, "cancelado": STATUS_CANCELADO}).rowcount > 0
+
+
+def recuperar_sessoes_orfas(conn, heartbeat_limite: datetime, max_tentativas: int) -> int:
+    """
+    Sessões em execução sem heartbeat desde `heartbeat_limite` (worker caiu)
+    voltam para a fila, ou vão para erro após max_tentativas.
+    """
+    limite = heartbeat_limite.isoformat(sep=" ", timespec="seconds")
+    parametros = {"limite": limite, "agora": _agora(), "executando": STATUS_EXECUTANDO,
+                  "max_tentativas": max_tentativas}
+    falhas = conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET status = :erro, worker_id = NULL, data_fim = :agora, data_atualizacao = :agora,
+            mensagem = 'Worker interrompido ' || tentativas || ' vezes; use retomar'
+        WHERE status = :executando AND heartbeat < :limite AND tentativas >= :max_tentativas
+    """), {**parametros, "erro": STATUS_ERRO}).rowcount
+    devolvidas = conn.execute(text("""
+        UPDATE sessoes_processamento
+        SET status = CASE WHEN cancelamento_solicitado = 1 THEN :cancelado ELSE :pendente END,
+            worker_id = NULL, data_atualizacao = :agora,
+            mensagem = 'Worker interrompido; retomando do último bloco concluído'
+        WHERE status = :executando AND heartbeat < :limite
+    """), {**parametros, "pendente": STATUS_PENDENTE, "cancelado": STATUS_CANCELADO}).rowcount
+    if falhas or devolvidas:
+        logger.warning(f"⚠️ Sessões órfãs: {devolvidas} devolvidas à fila, {falhas} com erro")
+    return falhas + devolvidas
+
+
+# =====================
+# CONSULTA
+# =====================
+
+def obter_status_sessao(conn, sessao_id: str) -> Optional[Dict[str, Any]]:
+    """Estado da sessão com vazão (itens/minuto de execução) e ETA em segundos."""
+    linha = conn.execute(text(
+        "SELECT * FROM sessoes_processamento WHERE sessao_id = :sessao_id"
+    ), {"sessao_id": sessao_id}).mappings().first()
+    if linha is None:
+        return None
+
+    status = dict(linha)
+    status["parametros"] = json.loads(status.pop("parametros_json") or "{}")
+    concluidos = status["itens_processados"] + status["itens_erro"]
+    segundos = status["tempo_execucao_ms"] / 1000
+    itens_por_segundo = concluidos / segundos if segundos > 0 else 0.0
+    restantes = max(status["total_itens"] - concluidos, 0)
+
+    status["itens_por_minuto"] = round(itens_por_segundo * 60, 2)
+    status["eta_segundos"] = (
+        0 if status["status"] == STATUS_CONCLUIDO
+        else round(restantes / itens_por_segundo) if itens_por_segundo > 0 and status["status"] not in STATUS_FINAIS
+        else None
+    )
+    return status
+
+
+def listar_sessoes(conn, limite: int = 20, status: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Sessões mais recentes (sem os blocos)."""
+    sql = "SELECT sessao_id FROM sessoes_processamento"
+    parametros: Dict[str, Any] = {"limite": limite}
+    if status:
+        sql += " WHERE status = :status"
+        parametros["status"] = status
+    ids = [linha[0] for linha in conn.execute(
+        text(sql + " ORDER BY data_criacao DESC LIMIT :limite"), parametros
+    ).fetchall()]
+    return [obter_status_sessao(conn, sessao_id) for sessao_id in ids]
@@ -181,6 +181,9 @@ class KnowledgeBaseMetadata(KnowledgeBase):
     # Fontes de dados utilizadas
     fontes_utilizadas = Column(Text)  # JSON com lista de arquivos fonte
     
+    # Checksum do snapshot binário do grafo fiscal gerado nesta versão
+    checksum_snapshot = Column(String(64))
+    
     # Status
     ativo = Column(Boolean, default=True)
     
@@ -2,18 +2,25 @@
 Modelos de banco de dados para o sistema de revisão humana
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, LargeBinary, Index
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.types import JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
 
+from .ordenacao_revisao import registrar_manutencao_ordenacao, INDICE_FILA_REVISAO, COLUNAS_INDICE_FILA
+from .paginacao_cursor import INDICES_PAGINACAO_CLASSIFICACOES
+from .payload_codec import TraceCompactado
+
 Base = declarative_base()
 
 # Tipo JSON compatível com SQLite e PostgreSQL
 JsonType = JSON().with_variant(JSONB(), 'postgresql').with_variant(Text(), 'sqlite')
 
+# Traces: payload compactado no SQLite, JSONB (já comprimido via TOAST) no PostgreSQL
+TraceType = TraceCompactado().with_variant(JSONB(), 'postgresql')
+
 class ClassificacaoRevisao(Base):
     """
     Tabela para armazenar classificações e seu status de revisão
@@ -67,7 +74,7 @@ class ClassificacaoRevisao(Base):
     # Metadados
     data_classificacao = Column(DateTime, default=func.now())
     data_criacao = Column(DateTime, default=func.now())
-    dados_trace_json = Column(JsonType)  # Armazena traces completos dos agentes
+    dados_trace_json = Column(TraceType)  # Armazena traces completos dos agentes
     
     # Explicações detalhadas dos agentes
     explicacao_agente_expansao = Column(Text)  # Explicação do agente de expansão
@@ -79,10 +86,22 @@ class ClassificacaoRevisao(Base):
     tempo_revisao_segundos = Column(Integer)  # Tempo gasto na revisão
     complexidade_produto = Column(String(20))  # SIMPLES, MEDIO, COMPLEXO
     
+    # Ordem da fila de revisão (mantida pelo ORM a partir de descricao_produto)
+    chave_ordenacao = Column(Text)  # Descrição em maiúsculas e sem acentos
+    letra_ordenacao = Column(String(1))  # Primeira letra A-Z da chave
+    
+    __table_args__ = (
+        Index(INDICE_FILA_REVISAO, *COLUNAS_INDICE_FILA),
+        *(Index(nome, *colunas) for nome, colunas in INDICES_PAGINACAO_CLASSIFICACOES.items()),
+    )
+    
     def __repr__(self):
         return f"<ClassificacaoRevisao(produto_id={self.produto_id}, status={self.status_revisao})>"
 
 
+registrar_manutencao_ordenacao(ClassificacaoRevisao)
+
+
 class EstadoOrdenacao(Base):
     """
     Tabela para controlar o estado da ordenação alfabética
@@ -239,6 +258,9 @@ class ExplicacaoAgente(Base):
     memoria_utilizada_mb = Column(Float)  # Memória utilizada aproximada
     tokens_llm_utilizados = Column(Integer)  # Tokens utilizados do LLM
     
+    # Campos volumosos (contexto, etapas, resultado...) compactados; ver database.payload_codec
+    payload_compactado = Column(LargeBinary)
+    
     # Auditoria
     data_execucao = Column(DateTime, default=func.now())
     sessao_classificacao = Column(String(100))  # ID da sessão de classificação
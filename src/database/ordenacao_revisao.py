@@ -0,0 +1,107 @@
+"""
+Ordem da Fila de Revisão
+Chave de ordenação normalizada (maiúsculas, sem acentos) e primeira letra
+persistidas em classificacoes_revisao, para que o "próximo pendente" seja
+escolhido por consultas indexadas com LIMIT 1
+"""
+
+import logging
+import string
+import unicodedata
+from typing import Optional
+
+from sqlalchemy import event, inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Índice composto usado pela fila: status -> letra -> chave -> id
+INDICE_FILA_REVISAO = "idx_classificacao_fila_revisao"
+COLUNAS_INDICE_FILA = ("status_revisao", "letra_ordenacao", "chave_ordenacao", "id")
+
+# Produtos sem nenhuma letra A-Z na descrição vão para o fim da rotação
+LETRA_PADRAO = "Z"
+
+
+def chave_ordenacao(texto: Optional[str]) -> str:
+    """Descrição em maiúsculas e sem acentos (mesma ordem da antiga ordenação em memória)."""
+    if not texto:
+        return ""
+    texto_norm = unicodedata.normalize('NFD', texto.upper())
+    return ''.join(c for c in texto_norm if unicodedata.category(c) != 'Mn')
+
+
+def letra_ordenacao(texto: Optional[str]) -> str:
+    """Primeira letra A-Z da descrição normalizada; LETRA_PADRAO se não houver."""
+    for char in chave_ordenacao(texto):
+        if char in string.ascii_uppercase:
+            return char
+    return LETRA_PADRAO
+
+
+def _preencher_ordenacao(mapper, connection, target):
+    target.chave_ordenacao = chave_ordenacao(target.descricao_produto)
+    target.letra_ordenacao = letra_ordenacao(target.descricao_produto)
+
+
+def registrar_manutencao_ordenacao(modelo):
+    """Mantém chave_ordenacao/letra_ordenacao do modelo em todo INSERT e UPDATE via ORM."""
+    event.listen(modelo, "before_insert", _preencher_ordenacao)
+    event.listen(modelo, "before_update", _preencher_ordenacao)
+
+
+def preencher_chaves_pendentes(conn, lote: int = 1000) -> int:
+    """
+    Calcula as chaves das linhas gravadas sem elas (bancos anteriores às
+    colunas ou inserções fora do ORM), em lotes.
+
+    Args:
+        conn: Connection SQLAlchemy dentro de uma transação
+
+    Returns:
+        Quantidade de linhas atualizadas
+    """
+    total = 0
+    while True:
+        linhas = conn.execute(text(
+            "SELECT id, descricao_produto FROM classificacoes_revisao "
+            "WHERE chave_ordenacao IS NULL OR letra_ordenacao IS NULL ORDER BY id LIMIT :lote"
+        ), {"lote": lote}).fetchall()
+        if not linhas:
+            break
+        conn.execute(
+            text("UPDATE classificacoes_revisao SET chave_ordenacao = :chave, letra_ordenacao = :letra WHERE id = :id"),
+            [
+                {"id": linha[0], "chave": chave_ordenacao(linha[1]), "letra": letra_ordenacao(linha[1])}
+                for linha in linhas
+            ]
+        )
+        total += len(linhas)
+
+    if total:
+        logger.info(f"✅ Chaves de ordenação calculadas para {total} classificações")
+    return total
+
+
+def garantir_ordenacao_revisao(conn):
+    """
+    Adiciona as colunas e o índice da fila em bancos criados antes deles e
+    preenche as chaves que faltam.
+
+    Args:
+        conn: Connection SQLAlchemy dentro de uma transação
+    """
+    inspetor = inspect(conn)
+    if not inspetor.has_table("classificacoes_revisao"):
+        return
+
+    colunas = {coluna["name"] for coluna in inspetor.get_columns("classificacoes_revisao")}
+    if "chave_ordenacao" not in colunas:
+        conn.execute(text("ALTER TABLE classificacoes_revisao ADD COLUMN chave_ordenacao TEXT"))
+    if "letra_ordenacao" not in colunas:
+        conn.execute(text("ALTER TABLE classificacoes_revisao ADD COLUMN letra_ordenacao VARCHAR(1)"))
+
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {INDICE_FILA_REVISAO} "
+        f"ON classificacoes_revisao({', '.join(COLUNAS_INDICE_FILA)})"
+    ))
+    preencher_chaves_pendentes(conn)
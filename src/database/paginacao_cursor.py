@@ -0,0 +1,200 @@
+"""
+Paginação por Chave (keyset) com Cursores Opacos
+Listagens ordenadas por (data DESC, id DESC) continuam a partir da última
+linha entregue em vez de descartar OFFSET linhas: com um índice
+(filtros de igualdade..., data, id) a página N custa o mesmo que a primeira.
+Totais vêm dos contadores materializados ou de um COUNT(*) em cache
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import String, cast, inspect, literal, text, tuple_
+
+from .estatisticas_materializadas import geracao_escritas, ler_contadores, materializacao_ativa
+
+# Posição na listagem: (valor da data como gravado ou None, id)
+PosicaoCursor = Tuple[Optional[str], int]
+
+
+# Índices (filtro de igualdade..., data, id) das listagens de classificacoes_revisao:
+# revisão (por data_classificacao, com ou sem status) e pendentes (data_criacao).
+# No SQLite o id (rowid) já é a última coluna implícita de todo índice, por
+# isso idx_classificacao_status serve à listagem de pendentes como está
+INDICES_PAGINACAO_CLASSIFICACOES = {
+    "idx_classificacao_status": ("status_revisao", "data_criacao"),
+    "idx_classificacao_status_data_id": ("status_revisao", "data_classificacao", "id"),
+    "idx_classificacao_data_id": ("data_classificacao", "id"),
+    "idx_classificacao_criacao_id": ("data_criacao", "id"),
+}
+
+
+class CursorInvalidoError(ValueError):
+    """Cursor truncado, adulterado ou emitido para outros filtros"""
+
+
+# =====================
+# CURSOR OPACO
+# =====================
+
+def assinatura_filtros(**filtros) -> str:
+    """Impressão curta dos filtros; um cursor só vale para a listagem que o emitiu."""
+    bruto = json.dumps(filtros, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(bruto.encode("utf-8")).hexdigest()[:12]
+
+
+def codificar_cursor(posicao: PosicaoCursor, assinatura: str) -> str:
+    """Token base64url com a última (data, id) entregue e a assinatura dos filtros."""
+    data, ultimo_id = posicao
+    corpo = json.dumps({"d": data, "i": ultimo_id, "f": assinatura}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(corpo.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(token: str, assinatura: str) -> PosicaoCursor:
+    """Posição gravada em `token`; CursorInvalidoError se não for desta listagem."""
+    try:
+        bruto = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        corpo = json.loads(bruto)
+        data, ultimo_id, assinatura_token = corpo["d"], corpo["i"], corpo["f"]
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise CursorInvalidoError("Cursor de paginação inválido") from e
+
+    if (not isinstance(ultimo_id, int) or isinstance(ultimo_id, bool)
+            or not (data is None or isinstance(data, str))):
+        raise CursorInvalidoError("Cursor de paginação inválido")
+    if assinatura_token != assinatura:
+        raise CursorInvalidoError("Cursor emitido para outros filtros; recomece da primeira página")
+    return data, ultimo_id
+
+
+# =====================
+# CONSULTA POR CHAVE
+# =====================
+
+def _chave_data(coluna_data, sqlite: bool):
+    # No SQLite a data é comparada como o texto gravado: reconverter para
+    # datetime muda o formato (microssegundos) e quebra a igualdade
+    return cast(coluna_data, String) if sqlite else coluna_data
+
+
+def _valor_data(data: str, sqlite: bool):
+    if sqlite:
+        return literal(data, String())
+    try:
+        return literal(datetime.fromisoformat(data))
+    except ValueError as e:
+        raise CursorInvalidoError("Cursor de paginação inválido") from e
+
+
+def paginar_keyset(query, coluna_data, coluna_id, limite: int,
+                   posicao: Optional[PosicaoCursor] = None,
+                   offset: int = 0) -> Tuple[List[Any], Optional[PosicaoCursor]]:
+    """
+    Uma página de `query` (ORM, uma entidade) em ordem (data DESC, id DESC),
+    com datas nulas por último em ordem de id.
+
+    Retorna (entidades, posição para a próxima página ou None). Sem `posicao`,
+    `offset` mantém a paginação numérica antiga (custo proporcional ao offset)
+    e a resposta já traz o cursor para as páginas seguintes.
+    """
+    sqlite = query.session.get_bind().dialect.name == "sqlite"
+    consulta = query.add_columns(
+        _chave_data(coluna_data, sqlite).label("_chave_data"),
+        coluna_id.label("_chave_id")
+    )
+
+    if posicao is None and offset:
+        linhas = consulta.order_by(
+            coluna_data.desc().nullslast(), coluna_id.desc()
+        ).offset(offset).limit(limite + 1).all()
+    else:
+        data, ultimo_id = posicao if posicao else (None, None)
+        linhas = []
+
+        # Fase 1: datas preenchidas, seguindo o índice (..., data, id) de trás para frente
+        if posicao is None or data is not None:
+            fase_datas = consulta.filter(coluna_data.isnot(None))
+            if posicao is not None:
+                fase_datas = fase_datas.filter(
+                    tuple_(coluna_data, coluna_id) < tuple_(_valor_data(data, sqlite), literal(ultimo_id))
+                )
+            linhas = fase_datas.order_by(coluna_data.desc(), coluna_id.desc()).limit(limite + 1).all()
+
+        # Fase 2: datas nulas, por id; completa a página na transição
+        if len(linhas) <= limite:
+            fase_nulos = consulta.filter(coluna_data.is_(None))
+            if posicao is not None and data is None:
+                fase_nulos = fase_nulos.filter(coluna_id < ultimo_id)
+            linhas += fase_nulos.order_by(coluna_id.desc()).limit(limite + 1 - len(linhas)).all()
+
+    proxima = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        ultima_data, ultimo_id = linhas[-1][-2], linhas[-1][-1]
+        if isinstance(ultima_data, datetime):
+            ultima_data = ultima_data.isoformat()
+        proxima = (ultima_data, ultimo_id)
+    return [linha[0] for linha in linhas], proxima
+
+
+def garantir_indices_paginacao(conn):
+    """
+    Cria os índices das listagens em bancos anteriores a eles.
+
+    Args:
+        conn: Connection SQLAlchemy dentro de uma transação
+    """
+    if not inspect(conn).has_table("classificacoes_revisao"):
+        return
+    for nome, colunas in INDICES_PAGINACAO_CLASSIFICACOES.items():
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {nome} ON classificacoes_revisao({', '.join(colunas)})"
+        ))
+
+
+# =====================
+# TOTAIS
+# =====================
+
+def total_materializado(conn, tabela: str, status: Optional[str] = None) -> Optional[int]:
+    """Total de `tabela` (ou de um status) pelos contadores dos triggers; None sem materialização."""
+    if not materializacao_ativa(conn):
+        return None
+    chave = tabela if status is None else f"{tabela}:{status}"
+    return int(ler_contadores(conn).get(chave, 0))
+
+
+class CacheTotais:
+    """
+    COUNT(*) por listagem e filtros, reaproveitado enquanto a tabela não recebe
+    commits ORM deste processo (geracao_escritas) e dentro do TTL, que cobre
+    escritas de outros processos
+    """
+
+    def __init__(self, ttl_segundos: int = 300, max_entradas: int = 256):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self._totais: Dict[tuple, Tuple[int, float, int]] = {}
+        self._lock = threading.Lock()
+
+    def obter(self, session, tabela: str, assinatura: str, contar: Callable[[], int]) -> int:
+        chave = (str(session.get_bind().url), tabela, assinatura)
+        geracao = geracao_escritas(tabela)
+        with self._lock:
+            guardado = self._totais.get(chave)
+        if (guardado and guardado[0] == geracao
+                and time.monotonic() - guardado[1] < self.ttl_segundos):
+            return guardado[2]
+
+        total = int(contar())
+        with self._lock:
+            if len(self._totais) >= self.max_entradas:
+                self._totais.clear()
+            self._totais[chave] = (geracao, time.monotonic(), total)
+        return total
@@ -0,0 +1,165 @@
+"""
+Particionamento Mensal em Arquivos SQLite
+Uma tabela por mês, cada uma em seu próprio arquivo; consultas abrem só os
+meses do intervalo e meses antigos são arquivados e removidos por inteiro
+"""
+
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+from .arquivamento import ArquivadorLinhas, tipos_arrow_sqlite
+from .sqlite_connection import conectar_sqlite
+
+logger = logging.getLogger(__name__)
+
+
+def chave_mes(valor: Union[datetime, str]) -> str:
+    """'AAAA_MM' de um datetime ou de um timestamp ISO/SQLite ('2024-01-31 ...')."""
+    if isinstance(valor, datetime):
+        return f"{valor.year:04d}_{valor.month:02d}"
+    return f"{str(valor)[:4]}_{str(valor)[5:7]}"
+
+
+def _mes_anterior(chave: str, meses: int) -> str:
+    ano, mes = int(chave[:4]), int(chave[5:7])
+    total = ano * 12 + (mes - 1) - meses
+    return f"{total // 12:04d}_{total % 12 + 1:02d}"
+
+
+class ParticionamentoMensal:
+    """
+    Partições mensais de uma tabela: <diretorio>/<tabela>_AAAA_MM.db.
+
+    Todas as partições têm o mesmo esquema e o mesmo nome de tabela, então o
+    mesmo SQL roda em qualquer uma delas.
+    """
+
+    def __init__(self, diretorio: Union[str, Path], tabela: str, ddl: Sequence[str], perfil: str):
+        """
+        Args:
+            diretorio: Pasta das partições
+            tabela: Nome da tabela (e prefixo dos arquivos)
+            ddl: CREATE TABLE/INDEX IF NOT EXISTS executados em cada partição nova
+            perfil: Perfil SQLite das conexões
+        """
+        self.diretorio = Path(diretorio)
+        self.tabela = tabela
+        self.ddl = list(ddl)
+        self.perfil = perfil
+        self._padrao = re.compile(rf"^{re.escape(tabela)}_(\d{{4}}_\d{{2}})\.db$")
+        self._lock = threading.Lock()
+        self._criadas = set()
+
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+
+    def caminho(self, chave: str) -> Path:
+        return self.diretorio / f"{self.tabela}_{chave}.db"
+
+    def particoes(self) -> List[str]:
+        """Chaves 'AAAA_MM' das partições existentes, da mais antiga para a mais recente."""
+        chaves = []
+        for nome in os.listdir(self.diretorio):
+            encontrado = self._padrao.match(nome)
+            if encontrado:
+                chaves.append(encontrado.group(1))
+        return sorted(chaves)
+
+    def particoes_no_intervalo(self, inicio: Optional[datetime] = None,
+                               fim: Optional[datetime] = None) -> List[str]:
+        """Partições que podem conter linhas de [inicio, fim] (limites abertos se None)."""
+        primeira = chave_mes(inicio) if inicio else None
+        ultima = chave_mes(fim) if fim else None
+        return [
+            chave for chave in self.particoes()
+            if (primeira is None or chave >= primeira) and (ultima is None or chave <= ultima)
+        ]
+
+    def _garantir(self, chave: str):
+        if chave in self._criadas:
+            return
+        with self._lock:
+            if chave in self._criadas:
+                return
+            conn = conectar_sqlite(self.caminho(chave), self.perfil)
+            try:
+                with conn:
+                    for sql in self.ddl:
+                        conn.execute(sql)
+            finally:
+                conn.close()
+            self._criadas.add(chave)
+
+    @contextmanager
+    def conectar(self, chave: str, criar: bool = False):
+        """Conexão com a partição do mês (commit ao sair sem erro)."""
+        if criar:
+            self._garantir(chave)
+        conn = conectar_sqlite(self.caminho(chave), self.perfil)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def inserir(self, sql: str, linhas: Iterable[Tuple], indice_timestamp: int):
+        """
+        Distribui as linhas entre as partições pelo timestamp e grava cada
+        grupo com executemany em uma transação por partição.
+        """
+        grupos = {}
+        for linha in linhas:
+            grupos.setdefault(chave_mes(linha[indice_timestamp]), []).append(linha)
+
+        for chave, grupo in sorted(grupos.items()):
+            with self.conectar(chave, criar=True) as conn:
+                conn.executemany(sql, grupo)
+
+    def arquivar(self, destino: Union[str, Path], meses_manter: int,
+                 referencia: Optional[datetime] = None, lote: int = 5000) -> List[dict]:
+        """
+        Exporta as partições anteriores aos últimos `meses_manter` meses para
+        arquivos mortos e remove os arquivos SQLite (sem DELETE linha a linha).
+
+        Returns:
+            Lista com partição, arquivo gerado e linhas arquivadas
+        """
+        limite = _mes_anterior(chave_mes(referencia or datetime.utcnow()), meses_manter - 1)
+        arquivadas = []
+
+        for chave in [c for c in self.particoes() if c < limite]:
+            with self.conectar(chave) as conn:
+                cursor = conn.execute(f"SELECT * FROM {self.tabela} ORDER BY rowid")
+                colunas = [d[0] for d in cursor.description]
+                tipos = tipos_arrow_sqlite({
+                    coluna[1]: coluna[2] for coluna in conn.execute(f"PRAGMA table_info({self.tabela})")
+                })
+                with ArquivadorLinhas(Path(destino) / f"{self.tabela}_{chave}", colunas, tipos=tipos) as arquivo:
+                    while True:
+                        linhas = cursor.fetchmany(lote)
+                        if not linhas:
+                            break
+                        arquivo.escrever(linhas)
+
+            self.remover(chave)
+            arquivadas.append({
+                "particao": chave,
+                "arquivo": str(arquivo.caminho) if arquivo.total_linhas else None,
+                "linhas": arquivo.total_linhas,
+            })
+            logger.info(f"📦 Partição {self.tabela}_{chave} arquivada ({arquivo.total_linhas} linhas)")
+
+        return arquivadas
+
+    def remover(self, chave: str):
+        """Remove o arquivo da partição (e os arquivos -wal/-shm)."""
+        with self._lock:
+            self._criadas.discard(chave)
+            caminho = self.caminho(chave)
+            for sufixo in ("", "-wal", "-shm"):
+                Path(f"{caminho}{sufixo}").unlink(missing_ok=True)
@@ -0,0 +1,368 @@
+"""
+Codificação Compacta de Payloads (explicações, traces e ações dos agentes)
+msgpack + zstd com dicionário treinado em traces típicos, com fallback
+para JSON compacto + zlib quando as bibliotecas não estão instaladas
+"""
+
+import json
+import logging
+import struct
+import zlib
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Layout do payload (little-endian):
+#   magic, serialização, compressão, id do dicionário zstd (0 = sem dicionário)
+PAYLOAD_MAGIC = b"PZ"
+_CABECALHO = struct.Struct("<2sBBI")
+
+SERIALIZACAO_JSON = 1
+SERIALIZACAO_MSGPACK = 2
+
+COMPRESSAO_NENHUMA = 0
+COMPRESSAO_ZLIB = 1
+COMPRESSAO_ZSTD = 2
+
+# Campos volumosos de explicacoes_agentes que vão para o payload compactado;
+# os demais (agente_nome, nivel_confianca, tempo_processamento_ms...) seguem em colunas
+CAMPOS_PAYLOAD_EXPLICACAO = (
+    "contexto_utilizado",
+    "etapas_processamento",
+    "produtos_similares_encontrados",
+    "resultado_agente",
+    "exemplos_utilizados",
+)
+
+# Nome do dicionário usado para explicacoes_agentes em dicionarios_compressao
+DICIONARIO_EXPLICACOES = "explicacoes_agentes"
+
+# Colunas JSON de agente_acoes (bancos por empresa) gravadas com o codec
+CAMPOS_PAYLOAD_ACAO = ("input_dados", "output_resultado")
+
+# Abaixo deste tamanho o JSON é gravado como texto: cabeçalho + compressão
+# deixariam valores como "{}" maiores que o original
+LIMITE_COMPACTACAO = 128
+
+SQL_TABELA_DICIONARIOS = """
+    CREATE TABLE IF NOT EXISTS dicionarios_compressao (
+        id INTEGER PRIMARY KEY,
+        nome TEXT NOT NULL,
+        dict_id INTEGER NOT NULL,
+        dados BLOB NOT NULL,
+        total_amostras INTEGER,
+        data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class PayloadError(Exception):
+    """Payload corrompido ou codificado com biblioteca/dicionário indisponível."""
+
+
+def _para_primitivo(obj):
+    """Converte tipos não serializáveis (datetime, set, objetos) para primitivos."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def _serializar_json(obj) -> bytes:
+    return json.dumps(obj, default=_para_primitivo, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _serializar(obj, serializacao: int) -> bytes:
+    if serializacao == SERIALIZACAO_MSGPACK:
+        return msgpack.packb(obj, default=_para_primitivo, use_bin_type=True, strict_types=False)
+    return _serializar_json(obj)
+
+
+def treinar_dicionario(amostras: Iterable[Any], tamanho: int = 112640) -> Optional[bytes]:
+    """
+    Treina um dicionário zstd a partir de payloads típicos.
+
+    Args:
+        amostras: Objetos (dict/list) representativos dos payloads
+        tamanho: Tamanho máximo do dicionário em bytes
+
+    Returns:
+        Bytes do dicionário, ou None se zstandard não estiver disponível
+        ou não houver amostras suficientes
+    """
+    if not ZSTD_AVAILABLE:
+        logger.warning("⚠️ zstandard não instalado; payloads serão comprimidos sem dicionário (zlib)")
+        return None
+
+    serializacao = SERIALIZACAO_MSGPACK if MSGPACK_AVAILABLE else SERIALIZACAO_JSON
+    dados = [_serializar(amostra, serializacao) for amostra in amostras]
+    if len(dados) < 8:
+        logger.warning(f"⚠️ Apenas {len(dados)} amostras; dicionário não treinado")
+        return None
+
+    try:
+        return zstandard.train_dictionary(tamanho, dados).as_bytes()
+    except zstandard.ZstdError as e:
+        logger.warning(f"⚠️ Falha ao treinar dicionário zstd: {e}")
+        return None
+
+
+class PayloadCodec:
+    """
+    Codifica objetos em bytes compactos e decodifica qualquer payload já
+    gravado, inclusive os produzidos com outra combinação de bibliotecas.
+
+    O cabeçalho registra serialização, compressão e dicionário, então linhas
+    gravadas antes e depois de um novo dicionário convivem na mesma tabela.
+    """
+
+    def __init__(self, dicionarios: Optional[Dict[int, bytes]] = None,
+                 dicionario_ativo: Optional[int] = None, nivel: int = 3):
+        """
+        Args:
+            dicionarios: dict_id -> bytes de todos os dicionários conhecidos
+            dicionario_ativo: dict_id usado para codificar (None = sem dicionário)
+            nivel: Nível de compressão
+        """
+        self.nivel = nivel
+        self.serializacao = SERIALIZACAO_MSGPACK if MSGPACK_AVAILABLE else SERIALIZACAO_JSON
+        self.compressao = COMPRESSAO_ZSTD if ZSTD_AVAILABLE else COMPRESSAO_ZLIB
+
+        self._dicionarios = dict(dicionarios or {})
+        self._dicts_zstd: Dict[int, Any] = {}
+        self.dicionario_ativo = dicionario_ativo if self.compressao == COMPRESSAO_ZSTD else None
+        if self.dicionario_ativo is not None and self.dicionario_ativo not in self._dicionarios:
+            raise ValueError(f"Dicionário {self.dicionario_ativo} não fornecido")
+
+    def _zstd_dict(self, dict_id: int):
+        """Dicionário zstd pré-carregado (reaproveitado entre compressores)."""
+        if not dict_id:
+            return None
+        if dict_id not in self._dicts_zstd:
+            try:
+                self._dicts_zstd[dict_id] = zstandard.ZstdCompressionDict(self._dicionarios[dict_id])
+            except KeyError:
+                raise PayloadError(f"Dicionário zstd {dict_id} não carregado")
+        return self._dicts_zstd[dict_id]
+
+    def codificar(self, obj: Any) -> bytes:
+        """
+        Serializa e comprime um objeto.
+
+        Raises:
+            ValueError/TypeError: objeto com referências circulares ou não serializável
+        """
+        dados = _serializar(obj, self.serializacao)
+        dict_id = self.dicionario_ativo or 0
+
+        if self.compressao == COMPRESSAO_ZSTD:
+            # Compressores zstd não são thread-safe: um por chamada
+            dados = zstandard.ZstdCompressor(level=self.nivel, dict_data=self._zstd_dict(dict_id)).compress(dados)
+        else:
+            dados = zlib.compress(dados, min(self.nivel * 2, 9))
+
+        return _CABECALHO.pack(PAYLOAD_MAGIC, self.serializacao, self.compressao, dict_id) + dados
+
+    def decodificar(self, payload: Optional[bytes]) -> Any:
+        """Decodifica um payload produzido por codificar (None -> None)."""
+        if payload is None:
+            return None
+
+        payload = bytes(payload)
+        try:
+            magic, serializacao, compressao, dict_id = _CABECALHO.unpack_from(payload, 0)
+        except struct.error:
+            raise PayloadError("Payload truncado")
+        if magic != PAYLOAD_MAGIC:
+            raise PayloadError("Payload sem cabeçalho reconhecido")
+
+        dados = payload[_CABECALHO.size:]
+        if compressao == COMPRESSAO_ZSTD:
+            if not ZSTD_AVAILABLE:
+                raise PayloadError("Payload comprimido com zstd, mas zstandard não está instalado")
+            dados = zstandard.ZstdDecompressor(dict_data=self._zstd_dict(dict_id)).decompress(dados)
+        elif compressao == COMPRESSAO_ZLIB:
+            dados = zlib.decompress(dados)
+        elif compressao != COMPRESSAO_NENHUMA:
+            raise PayloadError(f"Compressão desconhecida: {compressao}")
+
+        if serializacao == SERIALIZACAO_MSGPACK:
+            if not MSGPACK_AVAILABLE:
+                raise PayloadError("Payload serializado com msgpack, mas msgpack não está instalado")
+            return msgpack.unpackb(dados, raw=False, strict_map_key=False)
+        if serializacao == SERIALIZACAO_JSON:
+            return json.loads(dados)
+        raise PayloadError(f"Serialização desconhecida: {serializacao}")
+
+
+# =====================
+# ESQUEMA E DICIONÁRIOS
+# =====================
+
+def garantir_esquema_payload(conn):
+    """
+    Cria a tabela de dicionários e a coluna payload_compactado em
+    explicacoes_agentes quando o banco foi criado antes delas.
+
+    Args:
+        conn: Conexão sqlite3 ou Connection SQLAlchemy (exec_driver_sql)
+    """
+    executar = conn.exec_driver_sql if hasattr(conn, "exec_driver_sql") else conn.execute
+    executar(SQL_TABELA_DICIONARIOS)
+
+    tabelas = {linha[0] for linha in executar("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+    if "explicacoes_agentes" in tabelas:
+        colunas = {linha[1] for linha in executar("PRAGMA table_info(explicacoes_agentes)").fetchall()}
+        if "payload_compactado" not in colunas:
+            executar("ALTER TABLE explicacoes_agentes ADD COLUMN payload_compactado BLOB")
+            logger.info("✅ Coluna payload_compactado adicionada em explicacoes_agentes")
+
+
+def carregar_codec(conn, nome: str = DICIONARIO_EXPLICACOES) -> PayloadCodec:
+    """
+    Monta o codec com todos os dicionários gravados para `nome`; o mais
+    recente é usado para codificar.
+    """
+    executar = conn.exec_driver_sql if hasattr(conn, "exec_driver_sql") else conn.execute
+    try:
+        linhas = executar(
+            "SELECT dict_id, dados FROM dicionarios_compressao WHERE nome = ? ORDER BY id",
+            (nome,)
+        ).fetchall()
+    except Exception as e:
+        logger.debug(f"Dicionários de compressão indisponíveis: {e}")
+        linhas = []
+
+    dicionarios = {dict_id: bytes(dados) for dict_id, dados in linhas}
+    ativo = linhas[-1][0] if linhas and ZSTD_AVAILABLE else None
+    return PayloadCodec(dicionarios, ativo)
+
+
+def salvar_dicionario(conn, dados: bytes, nome: str = DICIONARIO_EXPLICACOES,
+                      total_amostras: int = 0) -> int:
+    """Grava um dicionário treinado e retorna seu dict_id."""
+    dict_id = zstandard.ZstdCompressionDict(dados).dict_id()
+    executar = conn.exec_driver_sql if hasattr(conn, "exec_driver_sql") else conn.execute
+    executar(
+        "INSERT INTO dicionarios_compressao (nome, dict_id, dados, total_amostras) VALUES (?, ?, ?, ?)",
+        (nome, dict_id, dados, total_amostras)
+    )
+    return dict_id
+
+
+# =====================
+# EXPLICAÇÕES
+# =====================
+
+def _carregar_json(valor):
+    if isinstance(valor, (str, bytes)):
+        try:
+            return json.loads(valor)
+        except ValueError:
+            return valor
+    return valor
+
+
+def payload_explicacao(dados: Dict[str, Any]) -> Dict[str, Any]:
+    """Extrai os campos volumosos de uma explicação (dict ou colunas legadas)."""
+    return {campo: _carregar_json(dados.get(campo)) for campo in CAMPOS_PAYLOAD_EXPLICACAO
+            if dados.get(campo) is not None}
+
+
+def expandir_explicacao(explicacao, codec: PayloadCodec) -> Dict[str, Any]:
+    """
+    Campos volumosos de uma linha de explicacoes_agentes, lidos do payload
+    compactado ou, em linhas ainda não migradas, das colunas JSON.
+    """
+    payload = getattr(explicacao, "payload_compactado", None)
+    if payload is not None:
+        campos = codec.decodificar(payload)
+        return {campo: campos.get(campo) for campo in CAMPOS_PAYLOAD_EXPLICACAO}
+    return {campo: _carregar_json(getattr(explicacao, campo, None)) for campo in CAMPOS_PAYLOAD_EXPLICACAO}
+
+
+def tamanho_payload_legado(linhas: List[Dict[str, Any]]) -> int:
+    """Bytes ocupados pelos campos volumosos em JSON (para relatório de migração)."""
+    total = 0
+    for linha in linhas:
+        for campo in CAMPOS_PAYLOAD_EXPLICACAO:
+            valor = linha.get(campo)
+            if valor is not None:
+                total += len(valor if isinstance(valor, (str, bytes)) else _serializar_json(valor))
+    return total
+
+
+# =====================
+# TRACES E AÇÕES DOS AGENTES
+# =====================
+# dados_trace_json (classificacoes_revisao) e input_dados/output_resultado
+# (agente_acoes) guardam o payload na própria coluna: o SQLite aceita BLOB em
+# colunas TEXT, então linhas legadas (texto JSON) e novas (bytes com o
+# cabeçalho PZ) convivem sem ALTER TABLE. Sem dicionário: cada linha se
+# decodifica sem consultar dicionarios_compressao do banco de origem.
+
+_codec_colunas = PayloadCodec()
+
+
+def eh_payload(valor) -> bool:
+    """True se o valor é um payload do codec (e não texto JSON legado)."""
+    return isinstance(valor, (bytes, bytearray, memoryview)) and bytes(valor[:2]) == PAYLOAD_MAGIC
+
+
+def compactar_json(obj) -> Optional[Union[str, bytes]]:
+    """
+    Valor a gravar numa coluna JSON compactável: payload do codec, ou o
+    próprio JSON quando ele é menor que LIMITE_COMPACTACAO.
+    """
+    if obj is None:
+        return None
+    dados = _serializar_json(obj)
+    if len(dados) < LIMITE_COMPACTACAO:
+        return dados.decode("utf-8")
+    return _codec_colunas.codificar(obj)
+
+
+def expandir_json(valor, padrao=None):
+    """Lê uma coluna JSON compactável (payload, texto JSON legado ou vazio)."""
+    if valor is None or valor == "":
+        return padrao
+    if eh_payload(valor):
+        return _codec_colunas.decodificar(valor)
+    return _carregar_json(valor)
+
+
+class TraceCompactado(TypeDecorator):
+    """
+    Tipo SQLAlchemy para dados_trace_json: grava o payload do codec e lê
+    tanto payloads quanto o JSON das linhas anteriores à migração.
+    Strings recebidas (traces já serializados) são gravadas como o objeto JSON.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, str):
+            value = _carregar_json(value)
+        valor = compactar_json(value)
+        return valor.encode("utf-8") if isinstance(valor, str) else valor
+
+    def process_result_value(self, value, dialect):
+        return expandir_json(value)
+
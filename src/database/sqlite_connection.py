@@ -0,0 +1,196 @@
+"""
+Fábrica de conexões SQLite com perfis de desempenho nomeados
+Aplica os mesmos PRAGMAs a engines SQLAlchemy e a conexões sqlite3 diretas
+"""
+
+import logging
+import sqlite3
+import weakref
+from pathlib import Path
+from typing import Dict, Any, Optional, Union
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Perfis disponíveis
+PERFIL_LEITURA = "leitura"        # base de conhecimento, metadados FAISS: muitas leituras concorrentes
+PERFIL_AUDITORIA = "auditoria"    # trilha de auditoria: escrita intensa, leituras eventuais
+PERFIL_OLTP = "oltp"              # bancos por empresa e banco unificado: transações curtas mistas
+
+# WAL permite leitores concorrentes com um escritor; synchronous=NORMAL em WAL
+# só perde as últimas transações em queda de energia, nunca corrompe o banco.
+PERFIS_SQLITE: Dict[str, Dict[str, Any]] = {
+    PERFIL_LEITURA: {
+        "journal_mode": "wal",
+        "synchronous": "NORMAL",
+        "busy_timeout": 30000,
+        "cache_size": -65536,          # 64 MB
+        "mmap_size": 268435456,        # 256 MB
+        "temp_store": "MEMORY",
+    },
+    PERFIL_AUDITORIA: {
+        "journal_mode": "wal",
+        "synchronous": "NORMAL",
+        "busy_timeout": 30000,
+        "cache_size": -16384,          # 16 MB
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+        "wal_autocheckpoint": 4000,    # checkpoints menos frequentes sob escrita contínua
+    },
+    PERFIL_OLTP: {
+        "journal_mode": "wal",
+        "synchronous": "NORMAL",
+        "busy_timeout": 10000,
+        "cache_size": -8192,           # 8 MB por conexão (um banco por empresa)
+        "mmap_size": 67108864,         # 64 MB
+        "temp_store": "MEMORY",
+    },
+}
+
+# Perfil aplicado a cada engine criado pela fábrica
+_PERFIS_ENGINES: "weakref.WeakKeyDictionary[Engine, str]" = weakref.WeakKeyDictionary()
+
+# journal_mode é persistente no arquivo e exige escrita; os demais valem por conexão
+_PRAGMAS_PERSISTENTES = ("journal_mode",)
+
+# Valores devolvidos por PRAGMA temp_store / synchronous
+_TEMP_STORE = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+_SYNCHRONOUS = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+
+
+def _obter_perfil(perfil: str) -> Dict[str, Any]:
+    try:
+        return PERFIS_SQLITE[perfil]
+    except KeyError:
+        raise ValueError(f"Perfil SQLite desconhecido: {perfil} (disponíveis: {', '.join(PERFIS_SQLITE)})")
+
+
+def aplicar_perfil(conn, perfil: str, somente_leitura: bool = False):
+    """
+    Aplica os PRAGMAs do perfil a uma conexão DB-API sqlite3.
+
+    Args:
+        conn: Conexão sqlite3 (ou a conexão DB-API de um engine SQLAlchemy)
+        perfil: Nome do perfil em PERFIS_SQLITE
+        somente_leitura: Conexão aberta com mode=ro; não altera o journal do arquivo
+    """
+    cursor = conn.cursor()
+    try:
+        for pragma, valor in _obter_perfil(perfil).items():
+            if somente_leitura and pragma in _PRAGMAS_PERSISTENTES:
+                continue
+            try:
+                cursor.execute(f"PRAGMA {pragma}={valor}")
+            except sqlite3.OperationalError as e:
+                # Ex.: banco somente leitura no sistema de arquivos; segue com o padrão
+                logger.debug(f"PRAGMA {pragma}={valor} não aplicado: {e}")
+    finally:
+        cursor.close()
+
+
+def conectar_sqlite(db_path: Union[str, Path], perfil: str, somente_leitura: bool = False,
+                    **kwargs) -> sqlite3.Connection:
+    """
+    Abre uma conexão sqlite3 com o perfil aplicado.
+
+    Mantém a semântica de sqlite3.connect, inclusive como context manager
+    (commit/rollback ao sair do bloco).
+
+    Args:
+        db_path: Caminho do banco
+        perfil: Nome do perfil em PERFIS_SQLITE
+        somente_leitura: Abre com mode=ro (URI)
+        **kwargs: Repassados para sqlite3.connect
+    """
+    kwargs.setdefault("timeout", _obter_perfil(perfil)["busy_timeout"] / 1000)
+    if somente_leitura:
+        conn = sqlite3.connect(f"file:{Path(db_path).as_posix()}?mode=ro", uri=True, **kwargs)
+    else:
+        conn = sqlite3.connect(str(db_path), **kwargs)
+    aplicar_perfil(conn, perfil, somente_leitura=somente_leitura)
+    return conn
+
+
+def criar_engine_sqlite(db_path: Union[str, Path], perfil: str, **kwargs) -> Engine:
+    """
+    Cria um engine SQLAlchemy que aplica o perfil a cada nova conexão do pool.
+
+    Args:
+        db_path: Caminho do banco
+        perfil: Nome do perfil em PERFIS_SQLITE
+        **kwargs: Repassados para create_engine (poolclass, connect_args, echo...)
+    """
+    _obter_perfil(perfil)
+    engine = create_engine(f"sqlite:///{db_path}", **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def _aplicar_perfil(dbapi_connection, connection_record):
+        aplicar_perfil(dbapi_connection, perfil)
+
+    _PERFIS_ENGINES[engine] = perfil
+    return engine
+
+
+def pragmas_efetivos(conn) -> Dict[str, Any]:
+    """Lê os valores em vigor dos PRAGMAs controlados pelos perfis."""
+    pragmas = sorted({pragma for perfil in PERFIS_SQLITE.values() for pragma in perfil})
+    valores = {}
+    for pragma in pragmas:
+        valor = conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+        if pragma == "temp_store":
+            valor = _TEMP_STORE.get(valor, valor)
+        elif pragma == "synchronous":
+            valor = _SYNCHRONOUS.get(valor, valor)
+        valores[pragma] = valor
+    return valores
+
+
+def _divergencias(perfil: str, efetivos: Dict[str, Any]) -> Dict[str, Any]:
+    divergentes = {}
+    for pragma, esperado in _obter_perfil(perfil).items():
+        atual = efetivos.get(pragma)
+        if str(atual).lower() != str(esperado).lower():
+            divergentes[pragma] = {"esperado": esperado, "atual": atual}
+    return divergentes
+
+
+def verificar_perfil_sqlite(alvo: Union[Engine, str, Path], perfil: Optional[str] = None,
+                            nome: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Verificação de inicialização: registra no log os PRAGMAs efetivos de um
+    engine (ou caminho de banco) e avisa quando divergem do perfil.
+
+    Args:
+        alvo: Engine criado por criar_engine_sqlite ou caminho do banco
+        perfil: Perfil esperado (padrão: o registrado no engine)
+        nome: Rótulo usado no log
+
+    Returns:
+        Dict com perfil, pragmas efetivos e divergências
+    """
+    if isinstance(alvo, Engine):
+        perfil = perfil or _PERFIS_ENGINES.get(alvo)
+        nome = nome or str(alvo.url.database)
+        raw = alvo.raw_connection()
+        try:
+            efetivos = pragmas_efetivos(raw.driver_connection)
+        finally:
+            raw.close()
+    else:
+        nome = nome or str(alvo)
+        conn = conectar_sqlite(alvo, perfil)
+        try:
+            efetivos = pragmas_efetivos(conn)
+        finally:
+            conn.close()
+
+    divergencias = _divergencias(perfil, efetivos) if perfil else {}
+    resumo = ", ".join(f"{pragma}={valor}" for pragma, valor in efetivos.items())
+    if divergencias:
+        logger.warning(f"SQLite {nome} [{perfil}] com PRAGMAs divergentes do perfil: {divergencias}")
+    else:
+        logger.info(f"SQLite {nome} [{perfil}]: {resumo}")
+
+    return {"banco": nome, "perfil": perfil, "pragmas": efetivos, "divergencias": divergencias}
@@ -10,6 +10,10 @@ from sqlalchemy.sql import func
 from sqlalchemy.types import JSON
 import json
 
+from .ordenacao_revisao import registrar_manutencao_ordenacao, INDICE_FILA_REVISAO, COLUNAS_INDICE_FILA
+from .paginacao_cursor import INDICES_PAGINACAO_CLASSIFICACOES
+from .payload_codec import TraceCompactado
+
 # Base unificada para todos os modelos
 UnifiedBase = declarative_base()
 
@@ -245,7 +249,7 @@ class ClassificacaoRevisao(UnifiedBase):
     # Metadados
     data_classificacao = Column(DateTime, default=func.now())
     data_criacao = Column(DateTime, default=func.now())
-    dados_trace_json = Column(JsonType)
+    dados_trace_json = Column(TraceCompactado)  # payload compactado (linhas legadas em JSON)
     
     # Explicações dos agentes
     explicacao_agente_expansao = Column(Text)
@@ -257,15 +261,23 @@ class ClassificacaoRevisao(UnifiedBase):
     tempo_revisao_segundos = Column(Integer)
     complexidade_produto = Column(String(20))
     
+    # Ordem da fila de revisão (mantida pelo ORM)
+    chave_ordenacao = Column(Text)
+    letra_ordenacao = Column(String(1))
+    
     # Relacionamentos
     explicacoes = relationship("ExplicacaoAgente", back_populates="classificacao")
     
     __table_args__ = (
-        Index('idx_classificacao_status', 'status_revisao', 'data_criacao'),
+        Index('idx_classificacao_status_id', 'status_revisao', 'id'),
+        Index(INDICE_FILA_REVISAO, *COLUNAS_INDICE_FILA),
         Index('idx_classificacao_produto', 'produto_id'),
         Index('idx_classificacao_ncm', 'ncm_original', 'ncm_sugerido'),
+        *(Index(nome, *colunas) for nome, colunas in INDICES_PAGINACAO_CLASSIFICACOES.items()),
     )
 
+registrar_manutencao_ordenacao(ClassificacaoRevisao)
+
 # =======================
 # GOLDEN SET
 # =======================
@@ -365,6 +377,9 @@ class ExplicacaoAgente(UnifiedBase):
     data_execucao = Column(DateTime, default=func.now())
     sessao_classificacao = Column(String(100))
     
+    # Campos volumosos compactados (database.payload_codec)
+    payload_compactado = Column(LargeBinary)
+    
     # Qualidade e feedback
     qualidade_explicacao = Column(Float)
     feedback_humano = Column(Text)
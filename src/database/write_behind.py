@@ -0,0 +1,192 @@
+"""
+Gravação Assíncrona em Lote (write-behind)
+Buffer em memória drenado por uma thread que grava lotes em uma única transação
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Políticas quando o buffer está cheio
+POLITICA_BLOQUEAR = "bloquear"                # produtor espera espaço (até timeout_bloqueio)
+POLITICA_DESCARTAR_NOVOS = "descartar_novos"  # item recebido é descartado
+POLITICA_DESCARTAR_ANTIGOS = "descartar_antigos"  # item mais antigo dá lugar ao novo
+POLITICAS_OVERFLOW = (POLITICA_BLOQUEAR, POLITICA_DESCARTAR_NOVOS, POLITICA_DESCARTAR_ANTIGOS)
+
+
+class WriteBehindWriter:
+    """
+    Fila limitada de linhas a gravar, drenada em segundo plano.
+
+    A thread de escrita chama gravar_lote(itens) a cada intervalo_ms ou assim
+    que max_lote itens se acumulam; gravar_lote deve gravar todos os itens em
+    uma única transação. Na saída do processo (atexit) o buffer é drenado.
+
+    gravar_lote pode retornar o número de itens que não conseguiu gravar
+    (falha parcial); uma exceção conta o lote inteiro como não gravado. Itens
+    perdidos entram em obter_metricas() e fazem o próximo flush() retornar False.
+    """
+
+    def __init__(self, gravar_lote: Callable[[List[Any]], Optional[int]], nome: str = "write-behind",
+                 capacidade: int = 10000, max_lote: int = 500, intervalo_ms: int = 200,
+                 politica: str = POLITICA_BLOQUEAR, timeout_bloqueio: float = 1.0):
+        if politica not in POLITICAS_OVERFLOW:
+            raise ValueError(f"Política de overflow inválida: {politica} (use {', '.join(POLITICAS_OVERFLOW)})")
+
+        self.nome = nome
+        self.capacidade = capacidade
+        self.max_lote = max_lote
+        self.intervalo = intervalo_ms / 1000
+        self.politica = politica
+        self.timeout_bloqueio = timeout_bloqueio
+        self._gravar_lote = gravar_lote
+
+        self._buffer: deque = deque()
+        self._cond = threading.Condition()
+        self._em_gravacao = 0
+        self._flush_pendentes = 0
+        self._encerrado = False
+        self._nao_gravados_desde_flush = 0
+        self._metricas = {"enfileirados": 0, "gravados": 0, "lotes": 0, "descartados": 0,
+                          "erros": 0, "nao_gravados": 0}
+
+        self._thread = threading.Thread(target=self._executar, name=nome, daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    @classmethod
+    def from_config(cls, gravar_lote: Callable[[List[Any]], Optional[int]], nome: str, config,
+                    politica: str = POLITICA_BLOQUEAR) -> "WriteBehindWriter":
+        """Cria o writer com capacidade, lote e intervalo definidos em Config."""
+        return cls(
+            gravar_lote,
+            nome=nome,
+            capacidade=getattr(config, 'WRITE_BEHIND_CAPACITY', 10000),
+            max_lote=getattr(config, 'WRITE_BEHIND_BATCH_ROWS', 500),
+            intervalo_ms=getattr(config, 'WRITE_BEHIND_INTERVAL_MS', 200),
+            politica=politica,
+        )
+
+    def enfileirar(self, item: Any) -> bool:
+        """
+        Coloca um item no buffer sem esperar pela gravação.
+
+        Returns:
+            False quando o item foi descartado (buffer cheio ou writer encerrado)
+        """
+        with self._cond:
+            if self._encerrado:
+                self._metricas["descartados"] += 1
+                return False
+
+            if len(self._buffer) >= self.capacidade:
+                if self.politica == POLITICA_DESCARTAR_NOVOS:
+                    self._metricas["descartados"] += 1
+                    return False
+                if self.politica == POLITICA_DESCARTAR_ANTIGOS:
+                    self._buffer.popleft()
+                    self._metricas["descartados"] += 1
+                elif not self._cond.wait_for(
+                    lambda: len(self._buffer) < self.capacidade or self._encerrado, self.timeout_bloqueio
+                ) or self._encerrado:
+                    self._metricas["descartados"] += 1
+                    logger.warning(f"{self.nome}: buffer cheio por {self.timeout_bloqueio}s; item descartado")
+                    return False
+
+            self._buffer.append(item)
+            self._metricas["enfileirados"] += 1
+            if len(self._buffer) >= self.max_lote:
+                self._cond.notify_all()
+            return True
+
+    def _proximo_lote(self) -> Optional[List[Any]]:
+        with self._cond:
+            limite = time.monotonic() + self.intervalo
+            while len(self._buffer) < self.max_lote and not (self._encerrado or self._flush_pendentes):
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+
+            if not self._buffer:
+                return None if self._encerrado else []
+
+            lote = [self._buffer.popleft() for _ in range(min(self.max_lote, len(self._buffer)))]
+            self._em_gravacao = len(lote)
+            # Libera produtores bloqueados pela política "bloquear"
+            self._cond.notify_all()
+            return lote
+
+    def _executar(self):
+        while True:
+            lote = self._proximo_lote()
+            if lote is None:
+                return
+            if not lote:
+                continue
+
+            try:
+                nao_gravados = min(self._gravar_lote(lote) or 0, len(lote))
+                if nao_gravados:
+                    logger.error(f"{self.nome}: {nao_gravados} de {len(lote)} itens do lote não foram gravados")
+            except Exception as e:
+                nao_gravados = len(lote)
+                logger.error(f"{self.nome}: falha ao gravar lote de {len(lote)} itens: {e}")
+
+            with self._cond:
+                self._metricas["gravados"] += len(lote) - nao_gravados
+                if nao_gravados < len(lote):
+                    self._metricas["lotes"] += 1
+                if nao_gravados:
+                    self._metricas["erros"] += 1
+                    self._metricas["nao_gravados"] += nao_gravados
+                    self._nao_gravados_desde_flush += nao_gravados
+                self._em_gravacao = 0
+                self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Aguarda até que tudo o que foi enfileirado esteja gravado.
+
+        Returns:
+            False se o timeout expirou antes ou se algum item deixou de ser
+            gravado por erro desde o flush anterior
+        """
+        with self._cond:
+            # Grava o que houver sem esperar o intervalo do lote
+            self._flush_pendentes += 1
+            self._cond.notify_all()
+            try:
+                concluido = self._cond.wait_for(lambda: not self._buffer and not self._em_gravacao, timeout)
+            finally:
+                self._flush_pendentes -= 1
+            nao_gravados, self._nao_gravados_desde_flush = self._nao_gravados_desde_flush, 0
+            if nao_gravados:
+                logger.warning(f"{self.nome}: {nao_gravados} itens não gravados por erro desde o último flush")
+            return concluido and not nao_gravados
+
+    def fechar(self, timeout: float = 10.0):
+        """Drena o buffer e encerra a thread de escrita (idempotente)."""
+        with self._cond:
+            if self._encerrado:
+                return
+            self._encerrado = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        atexit.unregister(self.fechar)
+        if self._thread.is_alive():
+            logger.warning(f"{self.nome}: encerramento excedeu {timeout}s com {len(self._buffer)} itens pendentes")
+
+    def obter_metricas(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._metricas,
+                "pendentes": len(self._buffer) + self._em_gravacao,
+                "capacidade": self.capacidade,
+                "politica": self.politica,
+            }
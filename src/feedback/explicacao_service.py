@@ -7,11 +7,18 @@ from typing import Dict, List, Optional, Any
 import json
 import logging
 from datetime import datetime, timedelta
+from pathlib import Path
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
+from sqlalchemy import func, and_, select
 
+from config import Config
 from database.models import ExplicacaoAgente, ClassificacaoRevisao, GoldenSetEntry
 from database.connection import get_db
+from database.arquivamento import ArquivadorLinhas, tipos_arrow_sqlalchemy
+from database.payload_codec import (
+    PayloadCodec, PayloadError, carregar_codec, garantir_esquema_payload,
+    payload_explicacao, expandir_explicacao
+)
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +65,35 @@ def clean_circular_references(obj, max_depth=5, current_depth=0):
 class ExplicacaoService:
     """Serviço para gerenciar explicações dos agentes"""
     
+    def __init__(self):
+        self._codec: Optional[PayloadCodec] = None
+    
+    def _obter_codec(self, db: Session, recarregar: bool = False) -> PayloadCodec:
+        """Codec dos payloads compactados (garante a coluna em bancos SQLite antigos)"""
+        if self._codec is None or recarregar:
+            conn = db.connection()
+            if conn.dialect.name == "sqlite":
+                garantir_esquema_payload(conn)
+                db.commit()
+            self._codec = carregar_codec(db.connection())
+        return self._codec
+    
+    def _compactar(self, db: Session, explicacao_data: Dict[str, Any]) -> bytes:
+        codec = self._obter_codec(db)
+        campos = payload_explicacao(explicacao_data)
+        try:
+            return codec.codificar(campos)
+        except (ValueError, TypeError, RecursionError):
+            # Só objetos com referências circulares pagam a limpeza recursiva
+            return codec.codificar({k: clean_circular_references(v) for k, v in campos.items()})
+    
+    def _expandir(self, db: Session, explicacao: ExplicacaoAgente) -> Dict[str, Any]:
+        try:
+            return expandir_explicacao(explicacao, self._obter_codec(db))
+        except PayloadError:
+            # Dicionário treinado depois que o codec foi carregado
+            return expandir_explicacao(explicacao, self._obter_codec(db, recarregar=True))
+    
     def salvar_explicacao_agente(self, produto_id: int, explicacao_data: Dict[str, Any], 
                                  classificacao_id: Optional[int] = None, 
                                  sessao_classificacao: Optional[str] = None) -> bool:
@@ -84,10 +120,8 @@ class ExplicacaoService:
         try:
             db = next(get_db())
             
-            # Limpar referências circulares dos campos JSON
-            contexto_utilizado = clean_circular_references(explicacao_data.get("contexto_utilizado"))
-            etapas_processamento = clean_circular_references(explicacao_data.get("etapas_processamento"))
-            resultado_agente = clean_circular_references(explicacao_data.get("resultado_agente"))
+            # Contexto, etapas e resultado vão compactados em payload_compactado
+            payload = self._compactar(db, explicacao_data)
             
             explicacao = ExplicacaoAgente(
                 produto_id=produto_id,
@@ -95,14 +129,12 @@ class ExplicacaoService:
                 agente_nome=explicacao_data.get("agente_nome"),
                 agente_versao=explicacao_data.get("agente_versao", "1.0"),
                 input_original=str(explicacao_data.get("input_original", ""))[:1000],  # Limitar tamanho
-                contexto_utilizado=contexto_utilizado,
-                etapas_processamento=etapas_processamento,
-                resultado_agente=resultado_agente,
+                payload_compactado=payload,
                 explicacao_detalhada=str(explicacao_data.get("explicacao_detalhada", ""))[:5000],  # Limitar tamanho
                 justificativa_tecnica=str(explicacao_data.get("justificativa_tecnica", ""))[:2000],
                 nivel_confianca=explicacao_data.get("nivel_confianca"),
                 tempo_processamento_ms=explicacao_data.get("tempo_processamento_ms"),
-                tokens_llm_utilizados=explicacao_data.get("tokens_utilizados"),
+                tokens_llm_utilizados=explicacao_data.get("tokens_llm_utilizados", explicacao_data.get("tokens_utilizados")),
                 memoria_utilizada_mb=explicacao_data.get("memoria_utilizada_mb"),
                 rag_consultado=explicacao_data.get("rag_consultado", False),
                 golden_set_utilizado=explicacao_data.get("golden_set_utilizado", False),
@@ -133,6 +165,7 @@ class ExplicacaoService:
         """
         try:
             db = next(get_db())
+            self._obter_codec(db)
             
             explicacoes = db.query(ExplicacaoAgente).filter(
                 ExplicacaoAgente.produto_id == produto_id
@@ -153,7 +186,7 @@ class ExplicacaoService:
                     "id": exp.id,
                     "versao": exp.agente_versao,
                     "input": exp.input_original,
-                    "output": exp.resultado_agente,
+                    "output": self._expandir(db, exp)["resultado_agente"],
                     "explicacao": exp.explicacao_detalhada,
                     "confianca": exp.nivel_confianca,
                     "tempo_ms": exp.tempo_processamento_ms,
@@ -182,6 +215,7 @@ class ExplicacaoService:
         """
         try:
             db = next(get_db())
+            self._obter_codec(db)
             
             data_inicio = datetime.now() - timedelta(days=periodo_dias)
             
@@ -231,6 +265,69 @@ class ExplicacaoService:
             logger.error(f"❌ Erro ao gerar relatório: {e}")
             return {"erro": str(e)}
     
+    def limpar_explicacoes_antigas(self, dias_manter: int = None, lote: int = 1000) -> int:
+        """
+        Arquiva e remove explicações antigas (mantém as marcadas para melhoria)
+        
+        As linhas são primeiro copiadas para o arquivo morto (Parquet ou NDJSON
+        gzip em ARCHIVE_DIR) e só então removidas, em lotes por id: cada lote é
+        uma transação curta, sem travar o banco durante toda a limpeza.
+        
+        Args:
+            dias_manter: Dias de explicações a manter (padrão EXPLICACOES_RETENTION_DAYS)
+            lote: Linhas por transação
+            
+        Returns:
+            int: Número de registros removidos
+        """
+        try:
+            db = next(get_db())
+            self._obter_codec(db)
+            
+            dias_manter = dias_manter or getattr(Config, 'EXPLICACOES_RETENTION_DAYS', 90)
+            data_limite = datetime.now() - timedelta(days=dias_manter)
+            tabela = ExplicacaoAgente.__table__
+            filtro = and_(
+                tabela.c.data_execucao < data_limite,
+                tabela.c.marcado_para_melhoria == False  # Manter marcadas para melhoria
+            )
+            
+            destino = Path(getattr(Config, 'ARCHIVE_DIR', 'data/archive')) / "explicacoes" / \
+                f"explicacoes_agentes_ate_{data_limite:%Y%m%d}_{datetime.now():%Y%m%d%H%M%S}"
+            
+            # 1. Arquivar (somente leitura)
+            ids = []
+            with ArquivadorLinhas(destino, [c.name for c in tabela.columns],
+                                  tipos=tipos_arrow_sqlalchemy(tabela.columns)) as arquivo:
+                ultimo_id = 0
+                while True:
+                    linhas = db.execute(
+                        select(tabela).where(filtro, tabela.c.id > ultimo_id).order_by(tabela.c.id).limit(lote)
+                    ).fetchall()
+                    if not linhas:
+                        break
+                    arquivo.escrever([tuple(linha) for linha in linhas])
+                    ids.extend(linha.id for linha in linhas)
+                    ultimo_id = ids[-1]
+                db.rollback()
+            
+            # 2. Remover em lotes curtos
+            removidas = 0
+            for inicio in range(0, len(ids), lote):
+                resultado = db.execute(tabela.delete().where(filtro, tabela.c.id.in_(ids[inicio:inicio + lote])))
+                db.commit()
+                removidas += resultado.rowcount
+            
+            if removidas:
+                logger.info(f"🧹 Removidas {removidas} explicações anteriores a {data_limite} (arquivo: {arquivo.caminho})")
+            return removidas
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao limpar explicações antigas: {e}")
+            if 'db' in locals():
+                db.rollback()
+            return 0
+    
     def atualizar_golden_set_com_explicacoes(self, golden_set_id: int, explicacoes: Dict[str, str]) -> bool:
         """
         Atualiza entrada do Golden Set com explicações dos agentes
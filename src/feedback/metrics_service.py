@@ -3,10 +3,11 @@ Serviço para cálculo de métricas e análise de qualidade
 """
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, desc
+from sqlalchemy import func, and_, desc, case
 from typing import Dict, List, Any, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import logging
+import time
 import sys
 import os
 from pathlib import Path
@@ -16,161 +17,203 @@ src_path = Path(__file__).parent.parent
 sys.path.insert(0, str(src_path))
 
 from database.models import ClassificacaoRevisao, MetricasQualidade, GoldenSetEntry
+from database.estatisticas_materializadas import (
+    FAIXAS_CONFIANCA, materializacao_ativa, ler_classificacoes_diarias, somar_serie, geracao_escritas
+)
+from config import Config
 
 logger = logging.getLogger(__name__)
 
 class MetricsService:
     """
     Serviço responsável por calcular métricas de qualidade e detectar drift
+    
+    Todas as métricas de classificações saem de uma única agregação por
+    (dia, status) com somas de confiança, tempo de revisão e faixas de
+    confiança calculadas no banco; o resultado fica em cache até o próximo
+    commit que altere classificacoes_revisao (ou METRICS_CACHE_TTL_SECONDS,
+    para escritas de outros processos).
     """
     
-    def calcular_estatisticas(self, db: Session, periodo_dias: int = 30) -> Dict[str, Any]:
+    def __init__(self):
+        self.cache_ttl = getattr(Config(), 'METRICS_CACHE_TTL_SECONDS', 300)
+        self._cache_agregados: Dict[tuple, tuple] = {}
+    
+    # =====================
+    # AGREGAÇÃO POR DIA E STATUS
+    # =====================
+    
+    def _agregar_por_dia(self, db: Session, data_inicio: datetime) -> List[Dict[str, Any]]:
         """
-        Calcula estatísticas gerais para o dashboard
+        Linhas (dia, status) desde o dia de data_inicio, com as mesmas colunas
+        de estatisticas_classificacoes_diarias
         """
-        data_inicio = datetime.now() - timedelta(days=periodo_dias)
+        dia_inicio = data_inicio.date()
+        url = str(db.get_bind().url)
+        geracao = geracao_escritas(ClassificacaoRevisao.__tablename__)
         
-        # Consultas base
-        total_query = db.query(ClassificacaoRevisao).filter(
-            ClassificacaoRevisao.data_classificacao >= data_inicio
-        )
+        # Qualquer agregação válida que comece no mesmo dia ou antes serve
+        for (url_cache, dia_cache), (geracao_cache, instante, linhas) in list(self._cache_agregados.items()):
+            if (url_cache == url and dia_cache <= dia_inicio and geracao_cache == geracao
+                    and time.monotonic() - instante < self.cache_ttl):
+                if dia_cache == dia_inicio:
+                    return linhas
+                return [linha for linha in linhas if linha["dia"] >= dia_inicio.isoformat()]
         
-        revisadas_query = total_query.filter(
-            ClassificacaoRevisao.status_revisao.in_(["APROVADO", "CORRIGIDO"])
-        )
+        conn = db.connection()
+        if materializacao_ativa(conn):
+            # Contadores mantidos por triggers: nenhuma varredura
+            linhas = ler_classificacoes_diarias(conn, dia_inicio)
+        else:
+            linhas = self._consultar_agregado_diario(db, dia_inicio)
         
-        # Contadores
-        total_classificacoes = total_query.count()
-        pendentes_revisao = total_query.filter(
-            ClassificacaoRevisao.status_revisao == "PENDENTE_REVISAO"
-        ).count()
-        
-        aprovadas = total_query.filter(
-            ClassificacaoRevisao.status_revisao == "APROVADO"
-        ).count()
-        
-        corrigidas = total_query.filter(
-            ClassificacaoRevisao.status_revisao == "CORRIGIDO"
-        ).count()
+        if len(self._cache_agregados) >= 32:
+            self._cache_agregados.clear()
+        self._cache_agregados[(url, dia_inicio)] = (geracao, time.monotonic(), linhas)
+        return linhas
+    
+    def _consultar_agregado_diario(self, db: Session, dia_inicio) -> List[Dict[str, Any]]:
+        """Um GROUP BY (dia, status) em classificacoes_revisao com as faixas em SQL"""
+        confianca = func.coalesce(ClassificacaoRevisao.confianca_sugerida, 0.0)
+        dia = func.date(ClassificacaoRevisao.data_classificacao)
+        limites = [(None, 0.5), (0.5, 0.7), (0.7, 0.8), (0.8, 0.9), (0.9, None)]
+        faixas = [
+            func.sum(case((and_(*(
+                ([confianca >= minimo] if minimo is not None else [])
+                + ([confianca < maximo] if maximo is not None else [])
+            )), 1), else_=0))
+            for minimo, maximo in limites
+        ]
         
-        total_revisadas = aprovadas + corrigidas
+        resultado = db.query(
+            dia,
+            ClassificacaoRevisao.status_revisao,
+            func.count(ClassificacaoRevisao.id),
+            func.sum(confianca),
+            func.count(ClassificacaoRevisao.confianca_sugerida),
+            func.sum(func.coalesce(ClassificacaoRevisao.tempo_revisao_segundos, 0)),
+            func.count(ClassificacaoRevisao.tempo_revisao_segundos),
+            *faixas
+        ).filter(
+            ClassificacaoRevisao.data_classificacao >= datetime.combine(dia_inicio, datetime.min.time())
+        ).group_by(dia, ClassificacaoRevisao.status_revisao).all()
         
-        # Cálculos de métricas
-        taxa_aprovacao = (aprovadas / total_revisadas * 100) if total_revisadas > 0 else 0
+        colunas = ["total", "soma_confianca", "qtd_confianca", "soma_tempo_revisao", "qtd_tempo_revisao"]
+        colunas += list(FAIXAS_CONFIANCA.values())
+        return [
+            {
+                "dia": str(linha[0])[:10],
+                "status_revisao": linha[1] or "",
+                **{coluna: float(valor or 0) if coluna.startswith("soma") else int(valor or 0)
+                   for coluna, valor in zip(colunas, linha[2:])}
+            }
+            for linha in resultado
+        ]
+    
+    @staticmethod
+    def _resumir(linhas: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Soma linhas (dia, status) em totais, médias e distribuição de confiança"""
+        resumo = {
+            "total": 0, "pendentes": 0, "aprovadas": 0, "corrigidas": 0,
+            "soma_confianca": 0.0, "qtd_confianca": 0, "soma_tempo": 0.0, "qtd_tempo": 0,
+            "distribuicao": {faixa: 0 for faixa in FAIXAS_CONFIANCA}
+        }
+        for linha in linhas:
+            status = linha["status_revisao"]
+            resumo["total"] += linha["total"]
+            if status == "PENDENTE_REVISAO":
+                resumo["pendentes"] += linha["total"]
+            elif status in ("APROVADO", "CORRIGIDO"):
+                resumo["aprovadas" if status == "APROVADO" else "corrigidas"] += linha["total"]
+                resumo["soma_tempo"] += linha["soma_tempo_revisao"]
+                resumo["qtd_tempo"] += linha["qtd_tempo_revisao"]
+            resumo["soma_confianca"] += linha["soma_confianca"]
+            resumo["qtd_confianca"] += linha["qtd_confianca"]
+            for faixa, coluna in FAIXAS_CONFIANCA.items():
+                resumo["distribuicao"][faixa] += linha[coluna]
         
-        # Confiança média
-        confianca_result = total_query.with_entities(
-            func.avg(ClassificacaoRevisao.confianca_sugerida)
-        ).scalar()
-        confianca_media = float(confianca_result) if confianca_result else 0.0
+        resumo["revisadas"] = resumo["aprovadas"] + resumo["corrigidas"]
+        resumo["taxa_aprovacao"] = (
+            resumo["aprovadas"] / resumo["revisadas"] * 100 if resumo["revisadas"] > 0 else 0
+        )
+        resumo["confianca_media"] = (
+            resumo["soma_confianca"] / resumo["qtd_confianca"] if resumo["qtd_confianca"] else 0.0
+        )
+        return resumo
+    
+    # =====================
+    # MÉTRICAS
+    # =====================
+    
+    def calcular_estatisticas(self, db: Session, periodo_dias: int = 30) -> Dict[str, Any]:
+        """
+        Calcula estatísticas gerais para o dashboard
         
-        # Tempo médio de revisão
-        tempo_result = revisadas_query.filter(
-            ClassificacaoRevisao.tempo_revisao_segundos.isnot(None)
-        ).with_entities(
-            func.avg(ClassificacaoRevisao.tempo_revisao_segundos)
-        ).scalar()
-        tempo_medio_revisao = float(tempo_result) if tempo_result else None
+        O período começa no início do dia de data_inicio (agregação por dia).
+        """
+        data_inicio = datetime.now() - timedelta(days=periodo_dias)
+        resumo = self._resumir(self._agregar_por_dia(db, data_inicio))
         
-        # Distribuição de confiança
-        distribuicao_confianca = self._calcular_distribuicao_confianca(db, data_inicio)
+        tempo_medio_revisao = resumo["soma_tempo"] / resumo["qtd_tempo"] if resumo["qtd_tempo"] else None
         
         # Contar entradas no Golden Set
-        total_golden = db.query(GoldenSetEntry).filter(
-            and_(
-                GoldenSetEntry.ativo == True,
-                GoldenSetEntry.data_adicao >= data_inicio
-            )
-        ).count()
+        conn = db.connection()
+        if materializacao_ativa(conn):
+            total_golden = somar_serie(conn, "golden_set:ativos", data_inicio)
+        else:
+            total_golden = db.query(func.count(GoldenSetEntry.id)).filter(
+                and_(
+                    GoldenSetEntry.ativo == True,
+                    GoldenSetEntry.data_adicao >= datetime.combine(data_inicio.date(), datetime.min.time())
+                )
+            ).scalar()
         
         return {
-            "total_classificacoes": total_classificacoes,
-            "pendentes_revisao": pendentes_revisao,
-            "aprovadas": aprovadas,
-            "corrigidas": corrigidas,
+            "total_classificacoes": resumo["total"],
+            "pendentes_revisao": resumo["pendentes"],
+            "aprovadas": resumo["aprovadas"],
+            "corrigidas": resumo["corrigidas"],
             "total_golden": total_golden,
-            "taxa_aprovacao": round(taxa_aprovacao, 2),
-            "confianca_media": round(confianca_media, 3),
+            "taxa_aprovacao": round(resumo["taxa_aprovacao"], 2),
+            "confianca_media": round(resumo["confianca_media"], 3),
             "tempo_medio_revisao": round(tempo_medio_revisao / 60, 2) if tempo_medio_revisao else None,  # em minutos
-            "distribuicao_confianca": distribuicao_confianca
+            "distribuicao_confianca": resumo["distribuicao"]
         }
     
     def _calcular_distribuicao_confianca(self, db: Session, data_inicio: datetime) -> Dict[str, int]:
         """
         Calcula a distribuição de confiança em faixas
         """
-        query = db.query(ClassificacaoRevisao).filter(
-            ClassificacaoRevisao.data_classificacao >= data_inicio
-        )
-        
-        distribuicao = {
-            "0.0-0.5": 0,
-            "0.5-0.7": 0,
-            "0.7-0.8": 0,
-            "0.8-0.9": 0,
-            "0.9-1.0": 0
-        }
-        
-        for classificacao in query.all():
-            confianca = classificacao.confianca_sugerida or 0.0
-            
-            if confianca < 0.5:
-                distribuicao["0.0-0.5"] += 1
-            elif confianca < 0.7:
-                distribuicao["0.5-0.7"] += 1
-            elif confianca < 0.8:
-                distribuicao["0.7-0.8"] += 1
-            elif confianca < 0.9:
-                distribuicao["0.8-0.9"] += 1
-            else:
-                distribuicao["0.9-1.0"] += 1
-        
-        return distribuicao
+        return self._resumir(self._agregar_por_dia(db, data_inicio))["distribuicao"]
     
     def calcular_acuracia_temporal(self, db: Session, periodo_dias: int = 90) -> List[Dict[str, Any]]:
         """
         Calcula a acurácia ao longo do tempo para análise de drift
+        
+        Semanas de 7 dias a partir do dia de data_inicio; a última semana vai
+        até hoje.
         """
         data_inicio = datetime.now() - timedelta(days=periodo_dias)
+        dia_inicio = data_inicio.date()
+        total_semanas = len(range(0, periodo_dias, 7))
+        if not total_semanas:
+            return []
         
         # Agrupar por semana
+        semanas = [[] for _ in range(total_semanas)]
+        for linha in self._agregar_por_dia(db, data_inicio):
+            dia = date.fromisoformat(linha["dia"])
+            semanas[min((dia - dia_inicio).days // 7, total_semanas - 1)].append(linha)
+        
         dados = []
-        for i in range(0, periodo_dias, 7):
-            semana_inicio = data_inicio + timedelta(days=i)
-            semana_fim = semana_inicio + timedelta(days=7)
-            
-            total_query = db.query(ClassificacaoRevisao).filter(
-                and_(
-                    ClassificacaoRevisao.data_classificacao >= semana_inicio,
-                    ClassificacaoRevisao.data_classificacao < semana_fim
-                )
-            )
-            
-            revisadas_query = total_query.filter(
-                ClassificacaoRevisao.status_revisao.in_(["APROVADO", "CORRIGIDO"])
-            )
-            
-            total_semana = total_query.count()
-            aprovadas_semana = total_query.filter(
-                ClassificacaoRevisao.status_revisao == "APROVADO"
-            ).count()
-            
-            revisadas_semana = revisadas_query.count()
-            
-            # Cálculos
-            acuracia = (aprovadas_semana / revisadas_semana * 100) if revisadas_semana > 0 else 0
-            
-            confianca_result = total_query.with_entities(
-                func.avg(ClassificacaoRevisao.confianca_sugerida)
-            ).scalar()
-            confianca_media = float(confianca_result) if confianca_result else 0.0
-            
+        for i, linhas in enumerate(semanas):
+            resumo = self._resumir(linhas)
             dados.append({
-                "semana": semana_inicio.strftime("%Y-%m-%d"),
-                "total_classificacoes": total_semana,
-                "total_revisadas": revisadas_semana,
-                "acuracia": round(acuracia, 2),
-                "confianca_media": round(confianca_media, 3)
+                "semana": (data_inicio + timedelta(days=7 * i)).strftime("%Y-%m-%d"),
+                "total_classificacoes": resumo["total"],
+                "total_revisadas": resumo["revisadas"],
+                "acuracia": round(resumo["taxa_aprovacao"], 2),
+                "confianca_media": round(resumo["confianca_media"], 3)
             })
         
         return dados
@@ -180,12 +223,15 @@ class MetricsService:
         Detecta drift na qualidade das classificações
         """
         data_limite = datetime.now() - timedelta(weeks=janela_semanas)
+        data_anterior_inicio = data_limite - timedelta(weeks=janela_semanas)
+        
+        # Uma agregação cobrindo os dois períodos (os recortes saem do cache)
+        self._agregar_por_dia(db, data_anterior_inicio)
         
         # Período atual (últimas X semanas)
         stats_atual = self._calcular_stats_periodo(db, data_limite, datetime.now())
         
         # Período anterior (X semanas anteriores)
-        data_anterior_inicio = data_limite - timedelta(weeks=janela_semanas)
         stats_anterior = self._calcular_stats_periodo(db, data_anterior_inicio, data_limite)
         
         # Calcular variações
@@ -225,35 +271,21 @@ class MetricsService:
     def _calcular_stats_periodo(self, db: Session, data_inicio: datetime, data_fim: datetime) -> Dict[str, float]:
         """
         Calcula estatísticas para um período específico
-        """
-        query = db.query(ClassificacaoRevisao).filter(
-            and_(
-                ClassificacaoRevisao.data_classificacao >= data_inicio,
-                ClassificacaoRevisao.data_classificacao < data_fim
-            )
-        )
-        
-        revisadas_query = query.filter(
-            ClassificacaoRevisao.status_revisao.in_(["APROVADO", "CORRIGIDO"])
-        )
-        
-        aprovadas = query.filter(
-            ClassificacaoRevisao.status_revisao == "APROVADO"
-        ).count()
         
-        total_revisadas = revisadas_query.count()
-        
-        taxa_aprovacao = (aprovadas / total_revisadas * 100) if total_revisadas > 0 else 0
-        
-        confianca_result = query.with_entities(
-            func.avg(ClassificacaoRevisao.confianca_sugerida)
-        ).scalar()
-        confianca_media = float(confianca_result) if confianca_result else 0.0
+        Dias de data_inicio (inclusive) a data_fim (exclusive); períodos que
+        terminam agora incluem o dia de hoje.
+        """
+        dia_fim = None if data_fim.date() >= date.today() else data_fim.date().isoformat()
+        linhas = [
+            linha for linha in self._agregar_por_dia(db, data_inicio)
+            if dia_fim is None or linha["dia"] < dia_fim
+        ]
+        resumo = self._resumir(linhas)
         
         return {
-            "taxa_aprovacao": taxa_aprovacao,
-            "confianca_media": confianca_media,
-            "total_revisadas": total_revisadas
+            "taxa_aprovacao": resumo["taxa_aprovacao"],
+            "confianca_media": resumo["confianca_media"],
+            "total_revisadas": resumo["revisadas"]
         }
     
     def salvar_metricas_historicas(self, db: Session, periodo_dias: int = 7):
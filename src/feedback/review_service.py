@@ -17,6 +17,11 @@ src_path = Path(__file__).parent.parent
 sys.path.insert(0, str(src_path))
 
 from database.models import ClassificacaoRevisao, GoldenSetEntry, EstadoOrdenacao
+from database.ordenacao_revisao import garantir_ordenacao_revisao, preencher_chaves_pendentes
+from database.paginacao_cursor import (
+    CacheTotais, assinatura_filtros, codificar_cursor, decodificar_cursor, garantir_indices_paginacao,
+    paginar_keyset, total_materializado
+)
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -28,6 +33,8 @@ class ReviewService:
     
     def __init__(self):
         self.config = Config()
+        self._bancos_ordenacao = set()  # URLs já verificadas por _garantir_ordenacao
+        self._cache_totais = CacheTotais(getattr(self.config, 'PAGINATION_TOTALS_TTL_SECONDS', 300))
     
     def listar_classificacoes(
         self,
@@ -35,11 +42,43 @@ class ReviewService:
         status: Optional[str] = None,
         confianca_min: Optional[float] = None,
         page: int = 1,
-        limit: int = 50
+        limit: int = 50,
+        cursor: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """
-        Lista classificações com filtros opcionais
+        Lista classificações com filtros opcionais (ver pagina_classificacoes)
         """
+        return self.pagina_classificacoes(
+            db, status, confianca_min, page, limit, cursor, incluir_total=False
+        )["itens"]
+    
+    def pagina_classificacoes(
+        self,
+        db: Session,
+        status: Optional[str] = None,
+        confianca_min: Optional[float] = None,
+        page: int = 1,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        incluir_total: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Página de classificações por data de classificação (mais recentes primeiro)
+        
+        Com `cursor` (o `proximo_cursor` da página anterior) a consulta continua
+        pelo índice (status, data_classificacao, id) a partir da última linha;
+        `page` > 1 sem cursor mantém a paginação por OFFSET.
+        Levanta CursorInvalidoError (ValueError) para cursor inválido.
+        """
+        assinatura = assinatura_filtros(
+            lista="classificacoes_revisao", status=status, confianca_min=confianca_min
+        )
+        posicao = decodificar_cursor(cursor, assinatura) if cursor else None
+        
+        url = str(db.get_bind().url)
+        if url not in self._bancos_ordenacao:
+            self._garantir_ordenacao(db)
+        
         query = db.query(ClassificacaoRevisao)
         
         # Aplicar filtros
@@ -49,10 +88,22 @@ class ReviewService:
         if confianca_min is not None:
             query = query.filter(ClassificacaoRevisao.confianca_sugerida >= confianca_min)
         
-        # Ordenação e paginação
-        query = query.order_by(desc(ClassificacaoRevisao.data_classificacao))
-        offset = (page - 1) * limit
-        classificacoes = query.offset(offset).limit(limit).all()
+        # Total: contador materializado quando só há filtro de status
+        total = None
+        if incluir_total:
+            if confianca_min is None:
+                total = total_materializado(db.connection(), ClassificacaoRevisao.__tablename__, status)
+            if total is None:
+                total = self._cache_totais.obter(
+                    db, ClassificacaoRevisao.__tablename__, assinatura,
+                    query.with_entities(func.count(ClassificacaoRevisao.id)).scalar
+                )
+        
+        # Ordenação e paginação por chave (data_classificacao, id)
+        classificacoes, proxima = paginar_keyset(
+            query, ClassificacaoRevisao.data_classificacao, ClassificacaoRevisao.id,
+            limit, posicao, offset=(page - 1) * limit
+        )
         
         # Converter para dict
         resultado = []
@@ -72,32 +123,22 @@ class ReviewService:
                 "justificativa_sistema": c.justificativa_sistema or "Nenhuma justificativa fornecida pelo sistema"
             })
         
-        return resultado
+        return {
+            "itens": resultado,
+            "proximo_cursor": codificar_cursor(proxima, assinatura) if proxima else None,
+            "total": total
+        }
     
     def obter_proximo_pendente(self, db: Session, produto_id_atual: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """
         Retorna o próximo produto pendente de revisão, ordenado alfabeticamente 
         e sempre começando com uma letra diferente da anterior
-        """
-        import string
-        import unicodedata
         
-        def remover_acentos(texto):
-            """Remove acentos e caracteres especiais para ordenação"""
-            if not texto:
-                return ""
-            # Normalizar e remover acentos
-            texto_norm = unicodedata.normalize('NFD', texto.upper())
-            texto_sem_acento = ''.join(c for c in texto_norm if unicodedata.category(c) != 'Mn')
-            return texto_sem_acento
-        
-        def primeira_letra_valida(texto):
-            """Retorna a primeira letra válida (A-Z) da descrição"""
-            texto_limpo = remover_acentos(texto)
-            for char in texto_limpo:
-                if char in string.ascii_uppercase:
-                    return char
-            return 'Z'  # Fallback para produtos que não começam com letra
+        Usa as colunas persistidas letra_ordenacao/chave_ordenacao e o índice
+        (status_revisao, letra_ordenacao, chave_ordenacao, id): no máximo
+        três consultas LIMIT 1, sem carregar a fila em memória.
+        """
+        self._garantir_ordenacao(db)
         
         # Obter estado atual da ordenação
         estado = db.query(EstadoOrdenacao).first()
@@ -110,63 +151,35 @@ class ReviewService:
         
         ultima_letra = estado.ultima_letra_usada or ""
         
-        # Buscar todos os produtos pendentes
+        # Produtos pendentes, exceto o atual se especificado
         query = db.query(ClassificacaoRevisao).filter(
             ClassificacaoRevisao.status_revisao == "PENDENTE_REVISAO"
         )
-        
-        # Excluir produto atual se especificado
         if produto_id_atual:
             query = query.filter(ClassificacaoRevisao.produto_id != produto_id_atual)
         
-        produtos_pendentes = query.all()
-        
-        if not produtos_pendentes:
-            return None
-        
-        # Organizar produtos por primeira letra
-        produtos_por_letra = {}
-        for produto in produtos_pendentes:
-            primeira_letra = primeira_letra_valida(produto.descricao_produto)
-            if primeira_letra not in produtos_por_letra:
-                produtos_por_letra[primeira_letra] = []
-            produtos_por_letra[primeira_letra].append(produto)
-        
-        # Ordenar produtos dentro de cada letra alfabeticamente
-        for letra in produtos_por_letra:
-            produtos_por_letra[letra].sort(
-                key=lambda p: remover_acentos(p.descricao_produto or "")
-            )
-        
-        # Encontrar próxima letra disponível (diferente da última usada)
-        letras_disponiveis = sorted(produtos_por_letra.keys())
+        fila = query.order_by(
+            ClassificacaoRevisao.letra_ordenacao,
+            ClassificacaoRevisao.chave_ordenacao,
+            ClassificacaoRevisao.id
+        )
         
         classificacao_escolhida = None
-        nova_letra = None
         
-        # Se há mais de uma letra disponível, escolher uma diferente da última
-        if len(letras_disponiveis) > 1 and ultima_letra in letras_disponiveis:
-            # Encontrar próxima letra na ordem alfabética
-            try:
-                indice_atual = letras_disponiveis.index(ultima_letra)
-                # Próxima letra (circular)
-                proximo_indice = (indice_atual + 1) % len(letras_disponiveis)
-                nova_letra = letras_disponiveis[proximo_indice]
-            except ValueError:
-                # Se última letra não está na lista, usar a primeira
-                nova_letra = letras_disponiveis[0]
-        else:
-            # Usar primeira letra disponível
-            nova_letra = letras_disponiveis[0]
+        # Se a última letra ainda tem pendentes, seguir para a próxima letra
+        # (circular); senão começar pela primeira letra disponível
+        if ultima_letra and query.filter(
+            ClassificacaoRevisao.letra_ordenacao == ultima_letra
+        ).with_entities(ClassificacaoRevisao.id).first() is not None:
+            classificacao_escolhida = fila.filter(ClassificacaoRevisao.letra_ordenacao > ultima_letra).first()
         
-        # Pegar primeiro produto da letra escolhida
-        if nova_letra and nova_letra in produtos_por_letra:
-            classificacao_escolhida = produtos_por_letra[nova_letra][0]
+        if not classificacao_escolhida:
+            classificacao_escolhida = fila.first()
         
         if not classificacao_escolhida:
-            # Fallback: usar qualquer produto disponível
-            classificacao_escolhida = produtos_pendentes[0]
-            nova_letra = primeira_letra_valida(classificacao_escolhida.descricao_produto)
+            return None
+        
+        nova_letra = classificacao_escolhida.letra_ordenacao
         
         # Atualizar estado da ordenação
         estado.ultima_letra_usada = nova_letra
@@ -202,10 +215,28 @@ class ReviewService:
             "_ordenacao_info": {
                 "letra_anterior": ultima_letra,
                 "letra_atual": nova_letra,
-                "primeira_letra_produto": primeira_letra_valida(classificacao_escolhida.descricao_produto)
+                "primeira_letra_produto": classificacao_escolhida.letra_ordenacao
             }
         }
     
+    def _garantir_ordenacao(self, db: Session):
+        """
+        Garante colunas e índice da fila no banco da sessão (uma vez por banco)
+        e calcula as chaves de pendentes gravados fora do ORM
+        """
+        url = str(db.get_bind().url)
+        if url not in self._bancos_ordenacao:
+            garantir_ordenacao_revisao(db.connection())
+            garantir_indices_paginacao(db.connection())
+            db.commit()
+            self._bancos_ordenacao.add(url)
+        elif db.query(ClassificacaoRevisao.id).filter(
+            ClassificacaoRevisao.status_revisao == "PENDENTE_REVISAO",
+            ClassificacaoRevisao.letra_ordenacao.is_(None)
+        ).first() is not None:
+            preencher_chaves_pendentes(db.connection())
+            db.commit()
+    
     def obter_classificacao_detalhe(self, db: Session, produto_id: int) -> Optional[Dict[str, Any]]:
         """
         Retorna todos os detalhes de uma classificação específica
@@ -397,7 +428,7 @@ class ReviewService:
                         existing.cest_sugerido = c.get('cest_classificado')
                         existing.confianca_sugerida = c.get('confianca_consolidada', 0.0)
                         existing.justificativa_sistema = c.get('justificativa_final', '')
-                        existing.dados_trace_json = json.dumps(c.get('traces', {})) if c.get('traces') else None
+                        existing.dados_trace_json = c.get('traces') or None
                         existing.data_classificacao = datetime.now()
                     else:
                         # Criar novo registro
@@ -414,7 +445,7 @@ class ReviewService:
                             confianca_sugerida=c.get('confianca_consolidada', 0.0),
                             justificativa_sistema=c.get('justificativa_final', ''),
                             status_revisao="PENDENTE_REVISAO",
-                            dados_trace_json=json.dumps(c.get('traces', {})) if c.get('traces') else None,
+                            dados_trace_json=c.get('traces') or None,
                             data_classificacao=datetime.now()
                         )
                         db.add(nova_classificacao)
@@ -6,24 +6,55 @@ import requests
 import json
 from typing import Dict, Any, Optional
 
+# Parâmetros de amostragem/contexto que a API do Ollama só respeita dentro de "options"
+OLLAMA_OPTION_KEYS = {
+    "temperature", "top_p", "top_k", "seed", "stop", "num_ctx",
+    "num_predict", "num_keep", "repeat_penalty", "mirostat"
+}
+
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3"):
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3",
+                 keep_alive: Optional[str] = "30m", options: Optional[Dict[str, Any]] = None):
         self.base_url = base_url
         self.model = model
+        # Mantém o modelo (e o cache KV do prefixo estático) residente entre requisições
+        self.keep_alive = keep_alive
+        # Opções fixas (ex.: num_ctx); mudar num_ctx entre chamadas força recarga do modelo
+        self.default_options = options or {}
         self.session = requests.Session()
-    
+
+    def _build_payload(self, extra: Dict[str, Any]) -> Dict[str, Any]:
+        """Monta o payload movendo parâmetros de amostragem para 'options'."""
+        payload = {"model": self.model, "stream": False}
+        options = dict(self.default_options)
+
+        for key, value in extra.items():
+            if key in OLLAMA_OPTION_KEYS:
+                options[key] = value
+            elif key == "options":
+                options.update(value or {})
+            else:
+                payload[key] = value
+
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None and "keep_alive" not in payload:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
     def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> Dict[str, Any]:
-        """Gera resposta usando Ollama."""
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": False,
-            **kwargs
-        }
-        
+        """
+        Gera resposta usando Ollama.
+
+        Para aproveitar o cache de prompt do servidor, o system e o início do
+        prompt devem ser idênticos byte a byte entre chamadas, com os dados
+        variáveis do produto no final.
+        """
+        payload = self._build_payload({"prompt": prompt, **kwargs})
+
         if system:
             payload["system"] = system
-        
+
         try:
             response = self.session.post(
                 f"{self.base_url}/api/generate",
@@ -32,19 +63,21 @@ class OllamaClient:
             )
             response.raise_for_status()
             return response.json()
-        
+
         except requests.exceptions.RequestException as e:
             return {"error": f"Erro na comunicação com Ollama: {e}"}
-    
+
+    def warm_up(self, system: Optional[str] = None, prefix: str = "") -> Dict[str, Any]:
+        """
+        Carrega o modelo e pré-processa um prefixo estático (system + instruções),
+        deixando-o no cache KV para as próximas requisições que o compartilham.
+        """
+        return self.generate(prompt=prefix, system=system, num_predict=1)
+
     def chat(self, messages: list, **kwargs) -> Dict[str, Any]:
         """Interface de chat com Ollama."""
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "stream": False,
-            **kwargs
-        }
-        
+        payload = self._build_payload({"messages": messages, **kwargs})
+
         try:
             response = self.session.post(
                 f"{self.base_url}/api/chat",
@@ -53,7 +86,7 @@ class OllamaClient:
             )
             response.raise_for_status()
             return response.json()
-        
+
         except requests.exceptions.RequestException as e:
             return {"error": f"Erro na comunicação com Ollama: {e}"}
 
@@ -0,0 +1,334 @@
+# ============================================================================
+# src/llm/request_scheduler.py - Agendador de Requisições ao Ollama
+# ============================================================================
+
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Classes de prioridade, da mais para a menos prioritária
+PRIORIDADE_INTERATIVA = "interativa"
+PRIORIDADE_LOTE = "lote"
+PRIORIDADES = (PRIORIDADE_INTERATIVA, PRIORIDADE_LOTE)
+
+# Empresa usada quando a requisição não informa uma
+EMPRESA_PADRAO = "padrao"
+
+# Limites padrão: com 2 slots no total e no máximo 1 para lote, sempre sobra
+# um slot para o revisor aguardando um produto
+DEFAULT_MAX_CONCORRENCIA = 2
+DEFAULT_LIMITES_POR_CLASSE = {PRIORIDADE_INTERATIVA: 2, PRIORIDADE_LOTE: 1}
+
+# (prioridade, empresa) da requisição em andamento na thread/tarefa atual
+_contexto_requisicao: ContextVar[Optional[Tuple[str, str]]] = ContextVar("contexto_requisicao_llm", default=None)
+
+
+class LLMQueueTimeout(TimeoutError):
+    """A requisição esperou na fila além do tempo máximo configurado."""
+
+
+@contextmanager
+def llm_request_context(prioridade: str, empresa_id: Any = None):
+    """
+    Define a classe de prioridade e a empresa das chamadas LLM feitas dentro
+    do bloco (inclusive as feitas pelos agentes, sem alterar suas assinaturas).
+    """
+    if prioridade not in PRIORIDADES:
+        raise ValueError(f"Prioridade inválida: {prioridade}. Use uma de {PRIORIDADES}")
+    empresa = str(empresa_id) if empresa_id is not None else EMPRESA_PADRAO
+    token = _contexto_requisicao.set((prioridade, empresa))
+    try:
+        yield
+    finally:
+        _contexto_requisicao.reset(token)
+
+
+def prioridade_padrao(prioridade: str):
+    """
+    Decorador que aplica uma prioridade às chamadas LLM da função quando
+    quem a chamou não definiu nenhuma via llm_request_context.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _contexto_requisicao.get() is not None:
+                return func(*args, **kwargs)
+            with llm_request_context(prioridade):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def contexto_atual() -> Tuple[str, str]:
+    """Retorna (prioridade, empresa) vigentes; lote para chamadas sem contexto."""
+    return _contexto_requisicao.get() or (PRIORIDADE_LOTE, EMPRESA_PADRAO)
+
+
+class _Pedido:
+    __slots__ = ("prioridade", "empresa", "liberado", "enfileirado_em")
+
+    def __init__(self, prioridade: str, empresa: str):
+        self.prioridade = prioridade
+        self.empresa = empresa
+        self.liberado = False
+        self.enfileirado_em = time.monotonic()
+
+
+class LLMRequestScheduler:
+    """
+    Agendador central das requisições ao LLM dentro do processo.
+
+    - Prioridade estrita entre classes: um slot livre vai sempre para a
+      classe interativa antes da de lote.
+    - Limite de concorrência por classe e limite global (slots do servidor).
+    - Fila justa por empresa dentro de cada classe (round-robin), para que
+      o lote grande de uma empresa não atrase as demais.
+    - Com `slots_compartilhados`, cada pedido liberado aqui ainda ocupa um
+      lease no banco: os mesmos limites valem somados entre a API e os
+      processos worker (cada um com seu próprio agendador).
+    """
+
+    def __init__(self, max_concorrencia: int = DEFAULT_MAX_CONCORRENCIA,
+                 limites_por_classe: Optional[Dict[str, int]] = None,
+                 timeout_fila: Optional[float] = None,
+                 slots_compartilhados=None):
+        self.max_concorrencia = max(1, max_concorrencia)
+        self.limites_por_classe = dict(DEFAULT_LIMITES_POR_CLASSE)
+        self.limites_por_classe.update(limites_por_classe or {})
+        self.timeout_fila = timeout_fila
+        self.slots_compartilhados = slots_compartilhados
+
+        self._cond = threading.Condition()
+        # classe -> empresa -> fila de pedidos; a ordem das empresas é a do round-robin
+        self._filas: Dict[str, "OrderedDict[str, deque]"] = {p: OrderedDict() for p in PRIORIDADES}
+        self._em_execucao = {p: 0 for p in PRIORIDADES}
+        self._total_em_execucao = 0
+        self._metricas = {
+            p: {"concluidas": 0, "timeouts": 0, "espera_total_s": 0.0, "espera_max_s": 0.0, "fila_maxima": 0}
+            for p in PRIORIDADES
+        }
+
+    @classmethod
+    def from_config(cls, config) -> "LLMRequestScheduler":
+        max_concorrencia = getattr(config, "LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCORRENCIA)
+        limites_por_classe = {**DEFAULT_LIMITES_POR_CLASSE, **(getattr(config, "LLM_CONCURRENCY_BY_PRIORITY", None) or {})}
+
+        slots_compartilhados = None
+        db_slots = getattr(config, "LLM_SHARED_SLOTS_DB", None)
+        if db_slots:
+            from llm.slots_compartilhados import SlotsCompartilhados
+            slots_compartilhados = SlotsCompartilhados(
+                db_slots, max_concorrencia, limites_por_classe,
+                duracao_lease=getattr(config, "LLM_SLOT_LEASE_SECONDS", 900)
+            )
+
+        return cls(
+            max_concorrencia=max_concorrencia,
+            limites_por_classe=limites_por_classe,
+            timeout_fila=getattr(config, "LLM_QUEUE_TIMEOUT", None),
+            slots_compartilhados=slots_compartilhados,
+        )
+
+    def _profundidade(self, prioridade: str) -> int:
+        return sum(len(fila) for fila in self._filas[prioridade].values())
+
+    def _despachar(self):
+        """Libera pedidos enquanto houver slots. Deve ser chamado com o lock."""
+        liberou = False
+        while self._total_em_execucao < self.max_concorrencia:
+            for prioridade in PRIORIDADES:
+                if self._filas[prioridade] and self._em_execucao[prioridade] < self.limites_por_classe.get(prioridade, 1):
+                    break
+            else:
+                break
+
+            filas = self._filas[prioridade]
+            empresa, fila = next(iter(filas.items()))
+            pedido = fila.popleft()
+            # A empresa atendida vai para o fim da rodada
+            del filas[empresa]
+            if fila:
+                filas[empresa] = fila
+
+            pedido.liberado = True
+            self._em_execucao[prioridade] += 1
+            self._total_em_execucao += 1
+
+            espera = time.monotonic() - pedido.enfileirado_em
+            metricas = self._metricas[prioridade]
+            metricas["espera_total_s"] += espera
+            metricas["espera_max_s"] = max(metricas["espera_max_s"], espera)
+            liberou = True
+
+        if liberou:
+            self._cond.notify_all()
+
+    def _remover(self, pedido: _Pedido):
+        filas = self._filas[pedido.prioridade]
+        fila = filas.get(pedido.empresa)
+        if fila is not None:
+            fila.remove(pedido)
+            if not fila:
+                del filas[pedido.empresa]
+
+    @contextmanager
+    def slot(self, prioridade: Optional[str] = None, empresa_id: Any = None):
+        """
+        Aguarda um slot de execução. Sem parâmetros, usa a prioridade e a
+        empresa definidas por llm_request_context.
+
+        Raises:
+            LLMQueueTimeout: se o tempo máximo de espera na fila for excedido.
+        """
+        prioridade_ctx, empresa_ctx = contexto_atual()
+        prioridade = prioridade or prioridade_ctx
+        empresa = str(empresa_id) if empresa_id is not None else empresa_ctx
+        if prioridade not in PRIORIDADES:
+            raise ValueError(f"Prioridade inválida: {prioridade}. Use uma de {PRIORIDADES}")
+
+        pedido = _Pedido(prioridade, empresa)
+        with self._cond:
+            self._filas[prioridade].setdefault(empresa, deque()).append(pedido)
+            metricas = self._metricas[prioridade]
+            metricas["fila_maxima"] = max(metricas["fila_maxima"], self._profundidade(prioridade))
+            self._despachar()
+
+            if not self._cond.wait_for(lambda: pedido.liberado, timeout=self.timeout_fila):
+                self._remover(pedido)
+                metricas["timeouts"] += 1
+                raise LLMQueueTimeout(
+                    f"Requisição {prioridade} da empresa {empresa} aguardou mais de {self.timeout_fila}s na fila do LLM"
+                )
+
+        try:
+            lease_id = self._adquirir_compartilhado(pedido)
+        except BaseException:
+            self._liberar_local(prioridade, concluida=False)
+            raise
+
+        try:
+            yield
+        finally:
+            if lease_id is not None:
+                self._liberar_compartilhado(lease_id)
+            self._liberar_local(prioridade, concluida=True)
+
+    def _adquirir_compartilhado(self, pedido: _Pedido) -> Optional[int]:
+        """Lease entre processos para um pedido já liberado localmente (None sem slots compartilhados)."""
+        if self.slots_compartilhados is None:
+            return None
+        restante = None
+        if self.timeout_fila is not None:
+            restante = max(0.0, self.timeout_fila - (time.monotonic() - pedido.enfileirado_em))
+        try:
+            return self.slots_compartilhados.adquirir(pedido.prioridade, restante)
+        except TimeoutError:
+            with self._cond:
+                self._metricas[pedido.prioridade]["timeouts"] += 1
+            raise LLMQueueTimeout(
+                f"Requisição {pedido.prioridade} da empresa {pedido.empresa} aguardou mais de "
+                f"{self.timeout_fila}s por um slot compartilhado do LLM"
+            )
+        except Exception as e:
+            # Banco de slots indisponível: segue só com o limite deste processo
+            logger.warning(f"⚠️ Slots compartilhados do LLM indisponíveis: {e}")
+            return None
+
+    def _liberar_compartilhado(self, lease_id: int):
+        try:
+            self.slots_compartilhados.liberar(lease_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao liberar slot compartilhado do LLM {lease_id} (expira sozinho): {e}")
+
+    def _liberar_local(self, prioridade: str, concluida: bool):
+        with self._cond:
+            self._em_execucao[prioridade] -= 1
+            self._total_em_execucao -= 1
+            if concluida:
+                self._metricas[prioridade]["concluidas"] += 1
+            self._despachar()
+
+    def submit(self, func, *args, prioridade: Optional[str] = None, empresa_id: Any = None, **kwargs):
+        """Executa func(*args, **kwargs) na thread atual assim que houver slot."""
+        with self.slot(prioridade, empresa_id):
+            return func(*args, **kwargs)
+
+    def obter_metricas(self) -> Dict[str, Any]:
+        """Profundidade das filas, requisições em execução e tempos de espera por classe."""
+        with self._cond:
+            classes = {}
+            for prioridade in PRIORIDADES:
+                metricas = self._metricas[prioridade]
+                atendidas = metricas["concluidas"] + self._em_execucao[prioridade]
+                classes[prioridade] = {
+                    "em_execucao": self._em_execucao[prioridade],
+                    "limite": self.limites_por_classe.get(prioridade, 1),
+                    "fila": self._profundidade(prioridade),
+                    "fila_por_empresa": {e: len(f) for e, f in self._filas[prioridade].items()},
+                    "fila_maxima": metricas["fila_maxima"],
+                    "concluidas": metricas["concluidas"],
+                    "timeouts": metricas["timeouts"],
+                    "espera_media_ms": round(metricas["espera_total_s"] / atendidas * 1000, 1) if atendidas else 0.0,
+                    "espera_max_ms": round(metricas["espera_max_s"] * 1000, 1),
+                }
+            metricas = {
+                "max_concorrencia": self.max_concorrencia,
+                "em_execucao": self._total_em_execucao,
+                "classes": classes,
+            }
+        if self.slots_compartilhados is not None:
+            try:
+                metricas["em_execucao_todos_processos"] = self.slots_compartilhados.em_uso()
+            except Exception as e:
+                logger.debug(f"Slots compartilhados indisponíveis: {e}")
+        return metricas
+
+
+class ScheduledLLMClient:
+    """
+    Envolve um cliente LLM (ex.: OllamaClient) fazendo cada chamada passar
+    pelo agendador. Os demais atributos são repassados ao cliente original.
+    """
+
+    def __init__(self, client, scheduler: LLMRequestScheduler):
+        self.client = client
+        self.scheduler = scheduler
+
+    def __getattr__(self, nome):
+        return getattr(self.client, nome)
+
+    def _executar(self, metodo, *args, **kwargs) -> Dict[str, Any]:
+        try:
+            return self.scheduler.submit(metodo, *args, **kwargs)
+        except LLMQueueTimeout as e:
+            logger.warning(str(e))
+            return {"error": f"Fila do LLM excedeu o tempo limite: {e}"}
+
+    def generate(self, prompt: str, system: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        return self._executar(self.client.generate, prompt, system, **kwargs)
+
+    def warm_up(self, system: Optional[str] = None, prefix: str = "") -> Dict[str, Any]:
+        return self._executar(self.client.warm_up, system, prefix)
+
+    def chat(self, messages: list, **kwargs) -> Dict[str, Any]:
+        return self._executar(self.client.chat, messages, **kwargs)
+
+
+_scheduler: Optional[LLMRequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler(config=None) -> LLMRequestScheduler:
+    """Agendador único do processo, compartilhado por todos os orquestradores."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMRequestScheduler.from_config(config) if config is not None else LLMRequestScheduler()
+        return _scheduler
@@ -0,0 +1,371 @@
+# ============================================================================
+# src/llm/response_parser.py - Extração e Validação de JSON das Respostas LLM
+# ============================================================================
+
+import json
+import threading
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# Aspas tipográficas que alguns modelos emitem no lugar das aspas retas
+# delimitadoras; dentro de strings JSON válidas são conteúdo ("Produto “X”")
+_SMART_QUOTES = "“”"
+
+# Literais Python que aparecem no lugar dos literais JSON
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+class ResponseParseError(ValueError):
+    """Resposta do LLM sem JSON utilizável ou fora do esquema do agente."""
+
+
+# Esquemas por agente: campo -> (tipo, obrigatório)
+AGENT_SCHEMAS = {
+    "expansion": {
+        "descricao_expandida": (str, False),
+        "categoria_principal": (str, False),
+        "material_predominante": (str, False),
+        "caracteristicas_tecnicas": (list, False),
+        "aplicacoes_uso": (list, False),
+        "palavras_chave_fiscais": (list, False),
+        "confianca": (float, False),
+    },
+    "ncm": {
+        "ncm_recomendado": (str, True),
+        "confianca": (float, False),
+        "justificativa": (str, False),
+        "ncm_alternativos": (list, False),
+        "capitulo_ncm": (str, False),
+    },
+    "cest": {
+        "tem_cest": (bool, True),
+        "cest_recomendado": (str, False),
+        "confianca": (float, False),
+        "justificativa": (str, False),
+        "cest_alternativos": (list, False),
+    },
+    "reconciler": {
+        "classificacao_final": (dict, True),
+        "auditoria": (dict, False),
+        "justificativa_final": (str, False),
+    },
+}
+
+
+def iter_json_spans(text: str, opener: str = "{") -> Iterator[Tuple[int, int]]:
+    """
+    Localiza, em uma única varredura linear, os trechos balanceados de nível
+    superior que começam com `opener`, respeitando strings e escapes.
+    Chaves dentro de strings não afetam o balanceamento. Aberturas nunca
+    fechadas (ex.: '{' solto na prosa) ficam registradas na pilha; os trechos
+    balanceados dentro delas são emitidos ao fim do texto.
+    """
+    closer = "}" if opener == "{" else "]"
+    abertos: List[int] = []
+    # Trechos fechados dentro de aberturas ainda pendentes (sem sobreposição)
+    internos: List[Tuple[int, int]] = []
+    in_string = False
+    escaped = False
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == opener:
+            abertos.append(i)
+        elif not abertos:
+            continue
+        elif char == '"':
+            in_string = True
+        elif char == closer:
+            start = abertos.pop()
+            if not abertos:
+                internos.clear()
+                yield start, i + 1
+                continue
+            while internos and internos[-1][0] > start:
+                internos.pop()
+            internos.append((start, i + 1))
+
+    # Aberturas sem fechamento: seus trechos internos são os de nível superior
+    yield from internos
+
+
+def _closes_string(fragment: str, i: int) -> bool:
+    """Aspa tipográfica em `i` fecha a string se vier seguida de , : } ] ou do fim."""
+    j = i + 1
+    while j < len(fragment) and fragment[j].isspace():
+        j += 1
+    return j >= len(fragment) or fragment[j] in ",:}]"
+
+
+def repair_json(fragment: str) -> str:
+    """
+    Corrige artefatos comuns de LLM fora de strings: comentários '//',
+    vírgulas finais antes de '}'/']', literais True/False/None e aspas
+    tipográficas usadas como delimitadoras (as de dentro das strings ficam).
+    """
+    out: List[str] = []
+    i = 0
+    n = len(fragment)
+    in_string = False
+    smart_string = False
+
+    while i < n:
+        char = fragment[i]
+        if in_string:
+            if smart_string:
+                # String aberta por aspa tipográfica: fecha na tipográfica
+                # delimitadora; aspas retas no meio viram conteúdo escapado
+                if char in _SMART_QUOTES and _closes_string(fragment, i):
+                    out.append('"')
+                    in_string = False
+                    i += 1
+                    continue
+                if char == '"':
+                    out.append('\\"')
+                    i += 1
+                    continue
+            out.append(char)
+            if char == "\\" and i + 1 < n:
+                out.append(fragment[i + 1])
+                i += 2
+                continue
+            if char == '"':
+                in_string = False
+            i += 1
+            continue
+
+        if char == '"' or char in _SMART_QUOTES:
+            in_string = True
+            smart_string = char != '"'
+            out.append('"')
+        elif char == "/" and fragment.startswith("//", i):
+            fim = fragment.find("\n", i)
+            i = n if fim == -1 else fim
+            continue
+        elif char == ",":
+            j = i + 1
+            while j < n and fragment[j].isspace():
+                j += 1
+            if j < n and fragment[j] in "}]":
+                i += 1
+                continue
+            out.append(char)
+        elif char.isalpha():
+            j = i
+            while j < n and fragment[j].isalnum():
+                j += 1
+            palavra = fragment[i:j]
+            out.append(_PY_LITERALS.get(palavra, palavra))
+            i = j
+            continue
+        else:
+            out.append(char)
+        i += 1
+
+    return "".join(out)
+
+
+def _loads(fragment: str) -> Tuple[Any, bool]:
+    """Carrega o fragmento; retorna (objeto, foi_reparado)."""
+    try:
+        return json.loads(fragment), False
+    except json.JSONDecodeError:
+        return json.loads(repair_json(fragment)), True
+
+
+def iter_json_objects(text: str) -> Iterator[Dict[str, Any]]:
+    """Itera sobre os objetos JSON de nível superior válidos do texto."""
+    for start, end in iter_json_spans(text):
+        try:
+            objeto, _ = _loads(text[start:end])
+        except json.JSONDecodeError:
+            continue
+        if isinstance(objeto, dict):
+            yield objeto
+
+
+def extract_json_object(text: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Retorna o primeiro objeto JSON válido do texto, ignorando prosa, blocos
+    ```json``` e texto posterior.
+
+    Raises:
+        ResponseParseError: se nenhum objeto JSON puder ser extraído.
+    """
+    if not text:
+        raise ResponseParseError("Resposta vazia")
+
+    for start, end in iter_json_spans(text):
+        try:
+            objeto, reparado = _loads(text[start:end])
+        except json.JSONDecodeError:
+            continue
+        if isinstance(objeto, dict):
+            return objeto, reparado
+
+    raise ResponseParseError("Nenhum objeto JSON encontrado na resposta")
+
+
+def _escala_unitaria(numero: float, percentual: bool) -> float:
+    """Confianças em escala 0-100 ("85" ou "85%") viram 0-1; acima da escala, 1.0."""
+    if percentual or 1 < numero <= 100:
+        numero /= 100
+    return min(numero, 1.0)
+
+
+def _coerce(valor: Any, tipo: type) -> Any:
+    """Converte valores em formatos comuns de LLM para o tipo esperado."""
+    if valor is None:
+        return valor
+    if tipo is float and not isinstance(valor, bool):
+        if isinstance(valor, (int, float)):
+            return _escala_unitaria(float(valor), False)
+        if isinstance(valor, str):
+            texto = valor.strip().replace(",", ".")
+            return _escala_unitaria(float(texto.rstrip("%")), texto.endswith("%"))
+    if isinstance(valor, tipo):
+        return valor
+    if tipo is str and isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return str(valor)
+    if tipo is bool and isinstance(valor, str):
+        texto = valor.strip().lower()
+        if texto in ("true", "sim", "yes", "1"):
+            return True
+        if texto in ("false", "nao", "não", "no", "0"):
+            return False
+    if tipo is list and isinstance(valor, (str, dict)):
+        return [valor]
+    raise ValueError(f"esperado {tipo.__name__}, recebido {type(valor).__name__}")
+
+
+def validate_schema(data: Dict[str, Any], schema: Dict[str, Tuple[type, bool]]) -> Dict[str, Any]:
+    """
+    Valida e normaliza os campos do esquema (os demais campos são mantidos).
+    Campos opcionais com tipo incompatível são descartados, para que os
+    valores padrão de quem consome o resultado sejam usados.
+
+    Raises:
+        ResponseParseError: campo obrigatório ausente ou com tipo incompatível.
+    """
+    erros = []
+    for campo, (tipo, obrigatorio) in schema.items():
+        if data.get(campo) is None:
+            if obrigatorio:
+                erros.append(f"campo obrigatório ausente: {campo}")
+            continue
+        try:
+            data[campo] = _coerce(data[campo], tipo)
+        except (ValueError, TypeError) as e:
+            if obrigatorio:
+                erros.append(f"{campo}: {e}")
+            else:
+                del data[campo]
+
+    if erros:
+        raise ResponseParseError("; ".join(erros))
+    return data
+
+
+class ParseStats:
+    """Contadores de parsing por (agente, modelo), seguros entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+    def registrar(self, agente: str, modelo: str, sucesso: bool, reparado: bool = False):
+        with self._lock:
+            contador = self._contadores.setdefault(
+                (agente, modelo or "desconhecido"), {"total": 0, "falhas": 0, "reparados": 0}
+            )
+            contador["total"] += 1
+            if not sucesso:
+                contador["falhas"] += 1
+            elif reparado:
+                contador["reparados"] += 1
+
+    def resumo(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "agente": agente,
+                    "modelo": modelo,
+                    **contador,
+                    "taxa_falha": round(contador["falhas"] / contador["total"], 4) if contador["total"] else 0.0
+                }
+                for (agente, modelo), contador in sorted(self._contadores.items())
+            ]
+
+    def limpar(self):
+        with self._lock:
+            self._contadores.clear()
+
+
+# Estatísticas globais do processo
+parse_stats = ParseStats()
+
+
+class ResponseParser:
+    """Extrai e valida o JSON das respostas de um agente, registrando falhas."""
+
+    def __init__(self, agente: str, schema: Optional[Dict[str, Tuple[type, bool]]] = None):
+        self.agente = agente
+        self.schema = schema if schema is not None else AGENT_SCHEMAS.get(agente, {})
+
+    def parse(self, response_text: str, modelo: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Retorna o objeto validado da resposta.
+
+        Raises:
+            ResponseParseError: se não houver JSON válido no esquema do agente.
+        """
+        try:
+            objeto, reparado = extract_json_object(response_text)
+            objeto = validate_schema(objeto, self.schema)
+        except ResponseParseError:
+            parse_stats.registrar(self.agente, modelo, sucesso=False)
+            raise
+        parse_stats.registrar(self.agente, modelo, sucesso=True, reparado=reparado)
+        return objeto
+
+    def parse_batch(self, response_text: str, total: int, modelo: Optional[str] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Extrai os itens de uma resposta em lote, um por produto, na ordem
+        original (campo 'indice' 1-based ou posição). Itens ausentes ou fora
+        do esquema ficam como None e contam como falha.
+        """
+        validos = []
+        for objeto in iter_json_objects(response_text or ""):
+            try:
+                validos.append(validate_schema(objeto, self.schema))
+            except ResponseParseError:
+                continue
+
+        resultados: List[Optional[Dict[str, Any]]] = [None] * total
+        usar_indice = any("indice" in objeto for objeto in validos)
+        for posicao, objeto in enumerate(validos):
+            if usar_indice:
+                try:
+                    indice = int(objeto.pop("indice")) - 1
+                except (KeyError, TypeError, ValueError):
+                    continue
+            else:
+                indice = posicao
+            if 0 <= indice < total and resultados[indice] is None:
+                resultados[indice] = objeto
+
+        for resultado in resultados:
+            parse_stats.registrar(self.agente, modelo, sucesso=resultado is not None)
+        return resultados
+
+
+def get_parse_stats() -> List[Dict[str, Any]]:
+    """Taxas de falha de parsing por agente e modelo desde o início do processo."""
+    return parse_stats.resumo()
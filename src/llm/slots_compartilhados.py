@@ -0,0 +1,148 @@
+# ============================================================================
+# src/llm/slots_compartilhados.py - Slots do LLM Compartilhados entre Processos
+# ============================================================================
+
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from database.sqlite_connection import conectar_sqlite, PERFIL_OLTP
+
+logger = logging.getLogger(__name__)
+
+SQL_TABELA_SLOTS = """
+    CREATE TABLE IF NOT EXISTS llm_slots (
+        id INTEGER PRIMARY KEY,
+        prioridade TEXT NOT NULL,
+        host TEXT NOT NULL,
+        pid INTEGER NOT NULL,
+        expira_em REAL NOT NULL
+    )
+"""
+
+# Espera entre tentativas de obter um slot (cresce até o máximo)
+INTERVALO_INICIAL = 0.02
+INTERVALO_MAXIMO = 0.5
+
+
+class SlotsIndisponiveis(TimeoutError):
+    """Nenhum slot compartilhado liberado dentro do tempo de espera."""
+
+
+def _processo_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SlotsCompartilhados:
+    """
+    Limite de requisições simultâneas ao LLM válido para todos os processos
+    que usam o mesmo banco (API e workers de lote).
+
+    Cada requisição em execução ocupa uma linha (lease) em llm_slots. A
+    concessão verifica, numa transação BEGIN IMMEDIATE, o total e o limite
+    da classe; com o limite de lote abaixo do total, sempre sobram slots para
+    a classe interativa, independentemente do número de workers.
+
+    Leases de processos mortos neste host são removidos na hora; os demais
+    expiram após `duracao_lease` segundos (deve superar a chamada mais longa).
+    """
+
+    def __init__(self, db_path: Union[str, Path], max_concorrencia: int,
+                 limites_por_classe: Dict[str, int], duracao_lease: float = 900.0):
+        self.db_path = str(db_path)
+        self.max_concorrencia = max(1, max_concorrencia)
+        self.limites_por_classe = dict(limites_por_classe)
+        self.duracao_lease = duracao_lease
+        self.host = socket.gethostname()
+        self._esquema_criado = False
+        self._lock = threading.Lock()
+
+    def _conectar(self):
+        # isolation_level=None: a transação é aberta explicitamente com BEGIN IMMEDIATE
+        conn = conectar_sqlite(self.db_path, PERFIL_OLTP, isolation_level=None)
+        if not self._esquema_criado:
+            with self._lock:
+                conn.execute(SQL_TABELA_SLOTS)
+                self._esquema_criado = True
+        return conn
+
+    def _limpar_leases_mortos(self, conn, agora: float):
+        conn.execute("DELETE FROM llm_slots WHERE expira_em < ?", (agora,))
+        locais = conn.execute("SELECT id, pid FROM llm_slots WHERE host = ?", (self.host,)).fetchall()
+        mortos = [(lease_id,) for lease_id, pid in locais if not _processo_vivo(pid)]
+        if mortos:
+            conn.executemany("DELETE FROM llm_slots WHERE id = ?", mortos)
+            logger.warning(f"⚠️ {len(mortos)} slot(s) do LLM de processos encerrados liberados")
+
+    def tentar_adquirir(self, prioridade: str) -> Optional[int]:
+        """Ocupa um slot se houver vaga no total e na classe; retorna o id do lease ou None."""
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            agora = time.time()
+            self._limpar_leases_mortos(conn, agora)
+            em_uso = dict(conn.execute(
+                "SELECT prioridade, COUNT(*) FROM llm_slots GROUP BY prioridade"
+            ).fetchall())
+            if (sum(em_uso.values()) >= self.max_concorrencia
+                    or em_uso.get(prioridade, 0) >= self.limites_por_classe.get(prioridade, 1)):
+                conn.execute("COMMIT")
+                return None
+            cursor = conn.execute(
+                "INSERT INTO llm_slots (prioridade, host, pid, expira_em) VALUES (?, ?, ?, ?)",
+                (prioridade, self.host, os.getpid(), agora + self.duracao_lease)
+            )
+            conn.execute("COMMIT")
+            return cursor.lastrowid
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def adquirir(self, prioridade: str, timeout: Optional[float] = None) -> int:
+        """
+        Aguarda um slot compartilhado.
+
+        Raises:
+            SlotsIndisponiveis: se timeout for excedido
+        """
+        limite = time.monotonic() + timeout if timeout is not None else None
+        intervalo = INTERVALO_INICIAL
+        while True:
+            lease_id = self.tentar_adquirir(prioridade)
+            if lease_id is not None:
+                return lease_id
+            if limite is not None and time.monotonic() + intervalo > limite:
+                raise SlotsIndisponiveis(f"Sem slot compartilhado do LLM para {prioridade} em {timeout}s")
+            time.sleep(intervalo)
+            intervalo = min(intervalo * 2, INTERVALO_MAXIMO)
+
+    def liberar(self, lease_id: int):
+        conn = self._conectar()
+        try:
+            conn.execute("DELETE FROM llm_slots WHERE id = ?", (lease_id,))
+        finally:
+            conn.close()
+
+    def em_uso(self) -> Dict[str, int]:
+        """Slots ocupados por classe em todos os processos (leases ainda válidos)."""
+        conn = self._conectar()
+        try:
+            return dict(conn.execute(
+                "SELECT prioridade, COUNT(*) FROM llm_slots WHERE expira_em >= ? GROUP BY prioridade",
+                (time.time(),)
+            ).fetchall())
+        finally:
+            conn.close()
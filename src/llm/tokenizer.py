@@ -0,0 +1,70 @@
+# ============================================================================
+# src/llm/tokenizer.py - Contagem de Tokens para Prompts
+# ============================================================================
+
+import re
+import math
+from functools import lru_cache
+from typing import Optional
+
+# Tokenizador BPE real (opcional)
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Segmentação aproximada ao pré-tokenizador dos modelos BPE (llama3/cl100k):
+# palavras, grupos de até 3 dígitos, pontuação isolada e quebras de linha
+_PIECE_RE = re.compile(r"[^\W\d_]+|\d{1,3}|\n+|[^\w\s]|_")
+
+
+class TokenCounter:
+    """
+    Conta tokens de prompts usando um tokenizador BPE real quando disponível
+    (tiktoken) e, caso contrário, uma estimativa baseada na segmentação BPE,
+    bem mais próxima do valor real que a regra len // 4.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.encoding_name = encoding_name
+        self._encoding = None
+
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except Exception:
+                self._encoding = None
+
+    @property
+    def metodo(self) -> str:
+        """Método de contagem em uso ('tiktoken' ou 'estimativa_bpe')."""
+        return "tiktoken" if self._encoding is not None else "estimativa_bpe"
+
+    def count(self, text: Optional[str]) -> int:
+        """Retorna o número de tokens do texto."""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return self._estimate(text)
+
+    @staticmethod
+    def _estimate(text: str) -> int:
+        """Estimativa por segmento: palavras longas viram vários sub-tokens."""
+        tokens = 0
+        for piece in _PIECE_RE.findall(text):
+            if piece[0].isalpha():
+                # Palavras curtas costumam ser 1 token; acentos e sufixos
+                # do português geram sub-tokens a cada ~5 caracteres
+                extra = sum(1 for c in piece if ord(c) > 127)
+                tokens += 1 + (len(piece) - 1) // 5 + math.ceil(extra / 2)
+            else:
+                tokens += 1
+        return tokens
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(encoding_name: str = "cl100k_base") -> TokenCounter:
+    """Retorna uma instância compartilhada do contador de tokens."""
+    return TokenCounter(encoding_name)
@@ -260,7 +260,7 @@ def _classify_with_legacy_system(args):
         print(f"[PACOTE] Classificando {len(produtos)} produtos...")
         
         # Executar classificação
-        resultados = router.classify_products(produtos)
+        resultados = router.classify_products(produtos, tamanho_lote=getattr(args, 'batch_size', None))
         
         # Salvar resultados
         _save_classification_results(resultados, 'legacy')
@@ -1332,6 +1332,8 @@ Exemplos de uso:
                                 help='Carregar produtos de arquivo JSON')
     parser_classify.add_argument('--limit', type=int, metavar='N',
                                 help='Limitar processamento a N produtos (apenas --from-db/--from-db-postgresql)')
+    parser_classify.add_argument('--batch-size', type=int, metavar='K',
+                                help='Classificar K produtos por chamada LLM nos agentes NCM/CEST (padrão: LLM_BATCH_SIZE)')
     
     # Comando test-mapping
     parser_test_mapping = subparsers.add_parser('test-mapping', 
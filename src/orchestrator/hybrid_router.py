@@ -14,6 +14,11 @@ from ingestion.data_loader import DataLoader
 from ingestion.chunker import TextChunker
 from vectorstore.faiss_store import FaissMetadataStore
 from llm.ollama_client import OllamaClient
+from llm.response_parser import get_parse_stats
+from llm.request_scheduler import (
+    ScheduledLLMClient, get_llm_scheduler, llm_request_context, prioridade_padrao,
+    PRIORIDADE_INTERATIVA, PRIORIDADE_LOTE
+)
 from agents.expansion_agent import ExpansionAgent
 from agents.aggregation_agent import AggregationAgent
 from agents.ncm_agent import NCMAgent
@@ -22,6 +27,9 @@ from agents.reconciler_agent import ReconcilerAgent
 
 # Importar novo serviço de base de conhecimento SQLite
 from services.knowledge_base_service import KnowledgeBaseService
+from services.eventos_progresso import (
+    emitir_progresso, ETAPA_EXPANSAO, ETAPA_AGRUPAMENTO, ETAPA_REPRESENTANTE, ETAPA_PROPAGACAO
+)
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -75,7 +83,17 @@ class HybridRouter:
         self.data_loader = DataLoader()
         
         # Componentes principais
-        self.llm_client = OllamaClient(self.config.OLLAMA_URL, self.config.OLLAMA_MODEL)
+        # Todas as chamadas dos agentes passam pelo agendador compartilhado do processo
+        self.llm_scheduler = get_llm_scheduler(self.config)
+        self.llm_client = ScheduledLLMClient(
+            OllamaClient(
+                self.config.OLLAMA_URL,
+                self.config.OLLAMA_MODEL,
+                keep_alive=self.config.OLLAMA_KEEP_ALIVE,
+                options={"num_ctx": self.config.OLLAMA_NUM_CTX} if self.config.OLLAMA_NUM_CTX else None
+            ),
+            self.llm_scheduler
+        )
         self.vector_store = FaissMetadataStore(self.config.VECTOR_DIMENSION)
         
         # Sistema de aprendizagem contínua (Fase 5)
@@ -501,6 +519,31 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
             logger.error(f"Erro na execução do {agent_name}: {e}")
             raise
     
+    def obter_estatisticas_tokens(self) -> Dict[str, Dict[str, Any]]:
+        """Retorna as estatísticas de tokens de prompt/resposta de cada agente LLM."""
+        agentes = {
+            "expansion": self.expansion_agent,
+            "ncm": self.ncm_agent,
+            "cest": self.cest_agent,
+            "reconciler": self.reconciler_agent
+        }
+        return {nome: agente.obter_estatisticas_tokens() for nome, agente in agentes.items()}
+    
+    def obter_estatisticas_parse(self) -> List[Dict[str, Any]]:
+        """Retorna as taxas de falha de parsing das respostas LLM por agente e modelo."""
+        return get_parse_stats()
+    
+    def obter_metricas_fila_llm(self) -> Dict[str, Any]:
+        """Retorna profundidade das filas e tempos de espera do agendador LLM."""
+        return self.llm_scheduler.obter_metricas()
+    
+    def contexto_requisicao_llm(self, prioridade: str = PRIORIDADE_INTERATIVA, empresa_id: Any = None):
+        """
+        Context manager que define a classe de prioridade ('interativa' ou
+        'lote') e a empresa das chamadas LLM feitas dentro do bloco.
+        """
+        return llm_request_context(prioridade, empresa_id)
+    
     def cleanup_resources(self) -> None:
         """Limpa recursos e conexões abertas."""
         try:
@@ -521,12 +564,46 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
         except Exception as e:
             logger.error(f"Erro durante limpeza de recursos: {e}")
     
-    def classify_products(self, produtos: List[Dict]) -> List[Dict]:
+    def _executar_agente_em_lotes(self, nome_agente: str, itens: List, tamanho_lote: int,
+                                  executar_item, executar_lote) -> List[Optional[Dict]]:
+        """
+        Executa um agente sobre os itens, individualmente ou em lotes de
+        tamanho_lote. Retorna um resultado por item (None em caso de erro).
+        
+        Emite ETAPA_REPRESENTANTE (agente, atual, total) a cada item ou lote
+        concluído, para o progresso avançar durante as chamadas NCM e CEST.
+        """
+        resultados = []
+        if tamanho_lote <= 1:
+            for item in itens:
+                try:
+                    resultados.append(executar_item(item))
+                except Exception as e:
+                    print(f"❌ ERRO no {nome_agente}: {e}")
+                    resultados.append(None)
+                emitir_progresso(ETAPA_REPRESENTANTE, agente=nome_agente, atual=len(resultados), total=len(itens))
+            return resultados
+        
+        for inicio in range(0, len(itens), tamanho_lote):
+            lote = itens[inicio:inicio + tamanho_lote]
+            print(f"   {nome_agente}: lote {inicio // tamanho_lote + 1} ({len(lote)} produtos)")
+            try:
+                resultados.extend(executar_lote(lote))
+            except Exception as e:
+                print(f"❌ ERRO no {nome_agente} (lote): {e}")
+                resultados.extend([None] * len(lote))
+            emitir_progresso(ETAPA_REPRESENTANTE, agente=nome_agente, atual=len(resultados), total=len(itens))
+        return resultados
+    
+    @prioridade_padrao(PRIORIDADE_LOTE)
+    def classify_products(self, produtos: List[Dict], tamanho_lote: Optional[int] = None) -> List[Dict]:
         """
         Classifica uma lista de produtos usando a arquitetura agêntica híbrida.
         
         Args:
             produtos: Lista de produtos com pelo menos 'descricao_produto'
+            tamanho_lote: Produtos por chamada LLM nos agentes NCM e CEST
+                          (padrão: LLM_BATCH_SIZE; 1 desativa o modo em lote)
             
         Returns:
             Lista de produtos classificados com NCM/CEST e traces de auditoria
@@ -554,6 +631,7 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
                 produto_expandido['descricao_expandida'] = expansion_data.get('descricao_expandida', descricao)
                 produto_expandido['expansion_data'] = expansion_data  # Guardar dados completos da expansão
                 produtos_expandidos.append(produto_expandido)
+                emitir_progresso(ETAPA_EXPANSAO, atual=i + 1, total=len(produtos))
             
             print(f"✅ {len(produtos_expandidos)} produtos expandidos.")
             
@@ -566,14 +644,22 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
             
             print(f"✅ {len(produtos)} produtos agrupados em {len(grupos)} grupos.")
             print(f"📊 Redução de processamento: {aggregation_result['estatisticas'].get('taxa_duplicacao', 0)*100:.1f}%")
+            emitir_progresso(ETAPA_AGRUPAMENTO, grupos=len(grupos), produtos=len(produtos))
             
             # ========================================================================
             # ETAPA 3: CLASSIFICAÇÃO DOS REPRESENTANTES
             # ========================================================================
             print("🧠 Etapa 3: Classificando representantes de cada grupo...")
             
+            if tamanho_lote is None:
+                tamanho_lote = self.config.LLM_BATCH_SIZE
+            if tamanho_lote > 1:
+                print(f"   Modo em lote ativo: {tamanho_lote} produtos por chamada LLM")
+            
+            # Preparar representantes e contextos semânticos
+            representantes = []
             for i, grupo in enumerate(grupos):
-                print(f"   Processando grupo {i+1}/{len(grupos)} (produtos: {len(grupo['produtos'])})")
+                print(f"   Preparando grupo {i+1}/{len(grupos)} (produtos: {len(grupo['produtos'])})")
                 
                 # Usar o representante do grupo
                 produto_expandido = grupo['representante']
@@ -600,23 +686,41 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
                     "structured_context": structured_context,
                     "semantic_context": semantic_context
                 }
-                
-                # Classificar NCM
-                try:
-                    ncm_result = self.ncm_agent.run(produto_expandido, context)
-                except Exception as e:
-                    print(f"❌ ERRO no NCM Agent: {e}")
+                representantes.append((grupo, produto_expandido, context))
+            
+            # Classificar NCM (agente por agente, para reaproveitar o prefixo em cache)
+            ncm_results = self._executar_agente_em_lotes(
+                "NCM Agent", representantes, tamanho_lote,
+                lambda item: self.ncm_agent.run(item[1], item[2]),
+                lambda lote: self.ncm_agent.run_batch([item[1] for item in lote], [item[2] for item in lote])
+            )
+            
+            # Atualizar contexto estruturado com NCM determinado
+            classificados = []
+            for item, ncm_result in zip(representantes, ncm_results):
+                if ncm_result is None:
                     continue
-                
-                # Atualizar contexto estruturado com NCM determinado
+                grupo, produto_expandido, context = item
                 ncm_determinado = ncm_result['result'].get('ncm_recomendado', '')
                 context['structured_context'] = self._get_structured_context(ncm_determinado, produto_expandido)
-                
-                # Classificar CEST
-                try:
-                    cest_result = self.cest_agent.run(produto_expandido, ncm_result['result'], context)
-                except Exception as e:
-                    print(f"❌ ERRO no CEST Agent: {e}")
+                classificados.append((grupo, produto_expandido, context, ncm_result))
+            
+            # Classificar CEST
+            cest_results = self._executar_agente_em_lotes(
+                "CEST Agent", classificados, tamanho_lote,
+                lambda item: self.cest_agent.run(item[1], item[3]['result'], item[2]),
+                lambda lote: self.cest_agent.run_batch(
+                    [item[1] for item in lote], [item[3]['result'] for item in lote], [item[2] for item in lote]
+                )
+            )
+            
+            # IDs de grupo são índices desta chamada: a propagação usa só os
+            # resultados obtidos aqui, nunca os de uma chamada anterior no cache
+            resultados_grupos = {}
+            for i, ((grupo, produto_expandido, context, ncm_result), cest_result) in enumerate(zip(classificados, cest_results)):
+                emitir_progresso(ETAPA_REPRESENTANTE, agente="Reconciler Agent", atual=i + 1,
+                                 total=len(classificados), grupo_id=grupo['id'])
+                if cest_result is None:
                     continue
                 
                 # Reconciliar
@@ -633,7 +737,7 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
                 
                 # Armazenar no cache usando o ID do grupo
                 cache_key = grupo['id']
-                self.classification_cache[cache_key] = {
+                resultados_grupos[cache_key] = self.classification_cache[cache_key] = {
                     'expansion': None,  # Já foi processado na etapa 1
                     'ncm': ncm_result,
                     'cest': cest_result,
@@ -659,8 +763,8 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
                         grupo_do_produto = grupo
                         break
                 
-                if grupo_do_produto and grupo_do_produto['id'] in self.classification_cache:
-                    cached_result = self.classification_cache[grupo_do_produto['id']]
+                if grupo_do_produto and grupo_do_produto['id'] in resultados_grupos:
+                    cached_result = resultados_grupos[grupo_do_produto['id']]
                     classificacao = cached_result['reconciliation']['result']['classificacao_final']
                     auditoria = cached_result['reconciliation']['result']['auditoria']
                     
@@ -683,7 +787,9 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
                     
                     resultados_finais.append(resultado_produto)
                 else:
-                    # Fallback para produto não agrupado
+                    # Fallback para produto não agrupado ou cujo grupo ficou sem NCM/CEST/reconciliação
+                    alerta = ('Grupo sem resultado de classificação nesta execução' if grupo_do_produto
+                              else 'Produto não foi agrupado corretamente')
                     resultados_finais.append({
                         **produto,
                         'ncm_classificado': '00000000',
@@ -691,11 +797,20 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
                         'confianca_consolidada': 0.0,
                         'grupo_id': -1,
                         'eh_representante': False,
-                        'auditoria': {'consistente': False, 'alertas': ['Produto não foi agrupado corretamente']},
-                        'justificativa': 'Produto não foi processado corretamente'
+                        'auditoria': {'consistente': False, 'alertas': [alerta]},
+                        'justificativa': 'Produto não foi processado corretamente',
+                        'erro': alerta
                     })
             
             print(f"✅ CLASSIFICAÇÃO CONCLUÍDA! {len(resultados_finais)} produtos processados.")
+            emitir_progresso(ETAPA_PROPAGACAO, produtos=len(resultados_finais), grupos=len(grupos))
+            for nome, stats in self.obter_estatisticas_tokens().items():
+                logger.info(f"Tokens {nome}: {stats['chamadas_llm']} chamadas, "
+                            f"{stats['tokens_prompt']} tokens de prompt (média {stats['media_tokens_prompt']})")
+            for stats in self.obter_estatisticas_parse():
+                if stats['falhas']:
+                    logger.warning(f"Parsing {stats['agente']} ({stats['modelo']}): {stats['falhas']}/{stats['total']} "
+                                   f"respostas inválidas ({stats['taxa_falha']*100:.1f}%)")
             
             return resultados_finais
             
@@ -710,6 +825,7 @@ INDICAÇÃO DE MEDICAMENTO DETECTADA:
                 'erro': str(e)
             } for produto in produtos]
     
+    @prioridade_padrao(PRIORIDADE_INTERATIVA)
     def classify_product_with_explanations(self, produto: Dict[str, Any], salvar_explicacoes: bool = True) -> Dict[str, Any]:
         """
         Classifica um único produto com explicações detalhadas de cada agente.
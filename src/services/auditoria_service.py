@@ -12,7 +12,14 @@ import json
 import threading
 import hashlib
 import uuid
+from collections import Counter
 from contextlib import contextmanager
+from pathlib import Path
+
+from src.config import Config
+from src.database.sqlite_connection import conectar_sqlite, PERFIL_AUDITORIA
+from src.database.particionamento_mensal import ParticionamentoMensal
+from src.database.write_behind import WriteBehindWriter, POLITICA_BLOQUEAR
 
 class AuditEventType(str, Enum):
     """Tipos de eventos de auditoria"""
@@ -97,6 +104,71 @@ class AuditEvent:
         if not self.timestamp:
             self.timestamp = datetime.utcnow()
 
+SQL_TABELA_EVENTOS = """
+    CREATE TABLE IF NOT EXISTS auditoria_eventos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_id TEXT UNIQUE NOT NULL,
+        event_type TEXT NOT NULL,
+        severity TEXT NOT NULL,
+        
+        -- Contexto organizacional
+        empresa_id INTEGER,
+        user_id TEXT,
+        session_id TEXT,
+        
+        -- Recurso afetado
+        resource_type TEXT,
+        resource_id TEXT,
+        action_performed TEXT NOT NULL,
+        
+        -- Contexto técnico
+        ip_address TEXT,
+        user_agent TEXT,
+        api_endpoint TEXT,
+        http_method TEXT,
+        
+        -- Dados da operação
+        before_data JSON,
+        after_data JSON,
+        metadata JSON,
+        
+        -- Resultado
+        success BOOLEAN NOT NULL,
+        error_message TEXT,
+        duration_ms REAL,
+        
+        -- Hash para integridade
+        data_hash TEXT,
+        
+        -- Timestamp
+        timestamp TIMESTAMP NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+SQL_INDICES_EVENTOS = [
+    "CREATE INDEX IF NOT EXISTS idx_eventos_empresa_timestamp ON auditoria_eventos(empresa_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_eventos_user_timestamp ON auditoria_eventos(user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_eventos_type ON auditoria_eventos(event_type)",
+    "CREATE INDEX IF NOT EXISTS idx_eventos_severity ON auditoria_eventos(severity)",
+    "CREATE INDEX IF NOT EXISTS idx_eventos_resource ON auditoria_eventos(resource_type, resource_id)",
+    "CREATE INDEX IF NOT EXISTS idx_eventos_timestamp ON auditoria_eventos(timestamp)",
+]
+
+COLUNAS_EVENTO = (
+    "event_id", "event_type", "severity", "empresa_id", "user_id", "session_id",
+    "resource_type", "resource_id", "action_performed",
+    "ip_address", "user_agent", "api_endpoint", "http_method",
+    "before_data", "after_data", "metadata",
+    "success", "error_message", "duration_ms", "data_hash", "timestamp"
+)
+INDICE_TIMESTAMP = COLUNAS_EVENTO.index("timestamp")
+
+SQL_INSERT_EVENTO = f"""
+    INSERT INTO auditoria_eventos ({", ".join(COLUNAS_EVENTO)})
+    VALUES ({", ".join("?" * len(COLUNAS_EVENTO))})
+"""
+
 class CentralAuditService:
     """Serviço centralizado de auditoria"""
     
@@ -105,6 +177,22 @@ class CentralAuditService:
         self._ensure_audit_database()
         self._thread_local = threading.local()
         self._session_context = {}
+        config = Config()
+        
+        # Eventos particionados por mês: um arquivo SQLite por mês em <pasta do banco>/eventos;
+        # consultas abrem só os meses do intervalo e meses antigos são arquivados inteiros
+        self.particoes = ParticionamentoMensal(
+            Path(audit_db_path).parent / "eventos", "auditoria_eventos",
+            [SQL_TABELA_EVENTOS, *SQL_INDICES_EVENTOS], PERFIL_AUDITORIA
+        )
+        self.meses_retencao = getattr(config, 'AUDIT_RETENTION_MONTHS', 12)
+        self.diretorio_arquivo = Path(getattr(config, 'ARCHIVE_DIR', Path(audit_db_path).parent / "archive")) / "auditoria"
+        
+        # Eventos gravados em lote por uma thread de escrita (write-behind)
+        self._escrita = WriteBehindWriter.from_config(
+            self._gravar_eventos, "auditoria-eventos", config,
+            politica=getattr(config, 'AUDIT_OVERFLOW_POLICY', POLITICA_BLOQUEAR)
+        )
     
     def _ensure_audit_database(self):
         """Garante que o banco de auditoria existe com schema correto"""
@@ -112,7 +200,7 @@ class CentralAuditService:
         import os
         os.makedirs(os.path.dirname(self.audit_db_path), exist_ok=True)
         
-        with sqlite3.connect(self.audit_db_path) as conn:
+        with conectar_sqlite(self.audit_db_path, PERFIL_AUDITORIA) as conn:
             cursor = conn.cursor()
             
             # Configurações de performance
@@ -120,48 +208,8 @@ class CentralAuditService:
             cursor.execute("PRAGMA synchronous = NORMAL")
             cursor.execute("PRAGMA cache_size = 20000")
             
-            # Tabela principal de auditoria
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS auditoria_eventos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    event_id TEXT UNIQUE NOT NULL,
-                    event_type TEXT NOT NULL,
-                    severity TEXT NOT NULL,
-                    
-                    -- Contexto organizacional
-                    empresa_id INTEGER,
-                    user_id TEXT,
-                    session_id TEXT,
-                    
-                    -- Recurso afetado
-                    resource_type TEXT,
-                    resource_id TEXT,
-                    action_performed TEXT NOT NULL,
-                    
-                    -- Contexto técnico
-                    ip_address TEXT,
-                    user_agent TEXT,
-                    api_endpoint TEXT,
-                    http_method TEXT,
-                    
-                    -- Dados da operação
-                    before_data JSON,
-                    after_data JSON,
-                    metadata JSON,
-                    
-                    -- Resultado
-                    success BOOLEAN NOT NULL,
-                    error_message TEXT,
-                    duration_ms REAL,
-                    
-                    -- Hash para integridade
-                    data_hash TEXT,
-                    
-                    -- Timestamp
-                    timestamp TIMESTAMP NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            # Tabela de eventos anterior ao particionamento (legado, ver migrar_eventos_legados)
+            cursor.execute(SQL_TABELA_EVENTOS)
             
             # Tabela de acessos a banco de dados
             cursor.execute("""
@@ -272,9 +320,17 @@ class CentralAuditService:
                 cursor.execute(index_sql)
             
             conn.commit()
+            
+            # Eventos gravados antes do particionamento continuam consultáveis até a migração
+            self._possui_legado = bool(cursor.execute(
+                "SELECT EXISTS(SELECT 1 FROM auditoria_eventos)"
+            ).fetchone()[0])
     
     def log_event(self, event: AuditEvent) -> str:
-        """Registra um evento de auditoria"""
+        """
+        Registra um evento de auditoria. A linha é gravada em lote pela thread
+        de escrita; o evento fica visível nas consultas após o próximo lote.
+        """
         
         try:
             # Calcular hash para integridade
@@ -282,30 +338,21 @@ class CentralAuditService:
             event_data['timestamp'] = event.timestamp.isoformat()
             data_hash = hashlib.sha256(json.dumps(event_data, sort_keys=True).encode()).hexdigest()
             
-            with sqlite3.connect(self.audit_db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    INSERT INTO auditoria_eventos (
-                        event_id, event_type, severity, empresa_id, user_id, session_id,
-                        resource_type, resource_id, action_performed,
-                        ip_address, user_agent, api_endpoint, http_method,
-                        before_data, after_data, metadata,
-                        success, error_message, duration_ms, data_hash, timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    event.event_id, event.event_type.value, event.severity.value,
-                    event.empresa_id, event.user_id, event.session_id,
-                    event.resource_type, event.resource_id, event.action_performed,
-                    event.ip_address, event.user_agent, event.api_endpoint, event.http_method,
-                    json.dumps(event.before_data) if event.before_data else None,
-                    json.dumps(event.after_data) if event.after_data else None,
-                    json.dumps(event.metadata) if event.metadata else None,
-                    event.success, event.error_message, event.duration_ms,
-                    data_hash, event.timestamp
-                ))
-                
-                conn.commit()
+            parametros = (
+                event.event_id, event.event_type.value, event.severity.value,
+                event.empresa_id, event.user_id, event.session_id,
+                event.resource_type, event.resource_id, event.action_performed,
+                event.ip_address, event.user_agent, event.api_endpoint, event.http_method,
+                json.dumps(event.before_data) if event.before_data else None,
+                json.dumps(event.after_data) if event.after_data else None,
+                json.dumps(event.metadata) if event.metadata else None,
+                event.success, event.error_message, event.duration_ms,
+                data_hash, event.timestamp
+            )
+            
+            if not self._escrita.enfileirar(parametros):
+                print(f"CRITICAL: Evento de auditoria {event.event_id} descartado (buffer de escrita cheio)")
+                return None
                 
             return event.event_id
             
@@ -314,6 +361,67 @@ class CentralAuditService:
             print(f"CRITICAL: Falha ao registrar evento de auditoria: {str(e)}")
             return None
     
+    def _gravar_eventos(self, lote: List[tuple]):
+        """Grava um lote de eventos (uma transação por partição mensal)"""
+        self.particoes.inserir(SQL_INSERT_EVENTO, lote, INDICE_TIMESTAMP)
+    
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Aguarda a gravação dos eventos pendentes"""
+        return self._escrita.flush(timeout)
+    
+    @contextmanager
+    def _conexao(self, db_path):
+        conn = conectar_sqlite(db_path, PERFIL_AUDITORIA)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _fontes_eventos(self, start_date: datetime = None, end_date: datetime = None) -> List[Path]:
+        """Bancos com eventos do intervalo: partições da mais recente para a mais antiga (+ legado)"""
+        fontes = [self.particoes.caminho(chave)
+                  for chave in reversed(self.particoes.particoes_no_intervalo(start_date, end_date))]
+        if self._possui_legado:
+            fontes.append(Path(self.audit_db_path))
+        return fontes
+    
+    def migrar_eventos_legados(self, lote: int = 5000) -> int:
+        """
+        Move os eventos da tabela única anterior para as partições mensais.
+        Idempotente: pode ser interrompida e executada de novo.
+        """
+        colunas = COLUNAS_EVENTO + ("created_at",)
+        sql_inserir = (
+            f"INSERT OR IGNORE INTO auditoria_eventos ({', '.join(colunas)}) "
+            f"VALUES ({', '.join('?' * len(colunas))})"
+        )
+        
+        migrados = 0
+        with self._conexao(self.audit_db_path) as conn:
+            while True:
+                linhas = conn.execute(
+                    f"SELECT {', '.join(colunas)}, id FROM auditoria_eventos ORDER BY id LIMIT ?", (lote,)
+                ).fetchall()
+                if not linhas:
+                    break
+                
+                self.particoes.inserir(sql_inserir, [linha[:-1] for linha in linhas], INDICE_TIMESTAMP)
+                conn.execute("DELETE FROM auditoria_eventos WHERE id <= ?", (linhas[-1][-1],))
+                conn.commit()
+                migrados += len(linhas)
+        
+        self._possui_legado = False
+        return migrados
+    
+    def arquivar_eventos_antigos(self, meses_manter: int = None) -> List[Dict[str, Any]]:
+        """
+        Arquiva em Parquet (ou NDJSON gzip) as partições mais antigas que
+        meses_manter meses e remove os arquivos das partições.
+        """
+        self.flush()
+        return self.particoes.arquivar(self.diretorio_arquivo, meses_manter or self.meses_retencao)
+    
     def log_database_access(self, empresa_id: int, user_id: str, database_path: str,
                           operation_type: str, table_name: str = None,
                           query_hash: str = None, affected_rows: int = 0,
@@ -322,7 +430,7 @@ class CentralAuditService:
         """Registra acesso a banco de dados"""
         
         try:
-            with sqlite3.connect(self.audit_db_path) as conn:
+            with conectar_sqlite(self.audit_db_path, PERFIL_AUDITORIA) as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -349,7 +457,7 @@ class CentralAuditService:
         session_id = str(uuid.uuid4())
         
         try:
-            with sqlite3.connect(self.audit_db_path) as conn:
+            with conectar_sqlite(self.audit_db_path, PERFIL_AUDITORIA) as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -398,7 +506,7 @@ class CentralAuditService:
         """Finaliza uma sessão de usuário"""
         
         try:
-            with sqlite3.connect(self.audit_db_path) as conn:
+            with conectar_sqlite(self.audit_db_path, PERFIL_AUDITORIA) as conn:
                 cursor = conn.cursor()
                 
                 # Buscar dados da sessão
@@ -463,64 +571,72 @@ class CentralAuditService:
         """Busca logs de auditoria com filtros"""
         
         try:
-            with sqlite3.connect(self.audit_db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                # Construir query com filtros
-                where_conditions = []
-                params = []
-                
-                if empresa_id:
-                    where_conditions.append("empresa_id = ?")
-                    params.append(empresa_id)
-                
-                if user_id:
-                    where_conditions.append("user_id = ?")
-                    params.append(user_id)
-                
-                if start_date:
-                    where_conditions.append("timestamp >= ?")
-                    params.append(start_date)
-                
-                if end_date:
-                    where_conditions.append("timestamp <= ?")
-                    params.append(end_date)
-                
-                if event_types:
-                    placeholders = ",".join(["?" for _ in event_types])
-                    where_conditions.append(f"event_type IN ({placeholders})")
-                    params.extend([et.value for et in event_types])
-                
-                if severity:
-                    where_conditions.append("severity = ?")
-                    params.append(severity.value)
-                
-                where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
-                
-                query = f"""
-                    SELECT * FROM auditoria_eventos 
-                    {where_clause}
-                    ORDER BY timestamp DESC 
-                    LIMIT ? OFFSET ?
-                """
-                
-                params.extend([limit, offset])
-                
-                cursor.execute(query, params)
-                logs = [dict(row) for row in cursor.fetchall()]
-                
-                # Parse JSON fields
-                for log in logs:
-                    for field in ['before_data', 'after_data', 'metadata']:
-                        if log[field]:
-                            try:
-                                log[field] = json.loads(log[field])
-                            except:
-                                pass
-                
-                return logs
-                
+            self.flush()
+            
+            # Construir query com filtros
+            where_conditions = []
+            params = []
+            
+            if empresa_id:
+                where_conditions.append("empresa_id = ?")
+                params.append(empresa_id)
+            
+            if user_id:
+                where_conditions.append("user_id = ?")
+                params.append(user_id)
+            
+            if start_date:
+                where_conditions.append("timestamp >= ?")
+                params.append(start_date)
+            
+            if end_date:
+                where_conditions.append("timestamp <= ?")
+                params.append(end_date)
+            
+            if event_types:
+                placeholders = ",".join(["?" for _ in event_types])
+                where_conditions.append(f"event_type IN ({placeholders})")
+                params.extend([et.value for et in event_types])
+            
+            if severity:
+                where_conditions.append("severity = ?")
+                params.append(severity.value)
+            
+            where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+            
+            query = f"""
+                SELECT * FROM auditoria_eventos 
+                {where_clause}
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            """
+            
+            params.append(limit + offset)
+            
+            logs = []
+            for db_path in self._fontes_eventos(start_date, end_date):
+                with self._conexao(db_path) as conn:
+                    conn.row_factory = sqlite3.Row
+                    logs.extend(dict(row) for row in conn.execute(query, params).fetchall())
+                
+                # Partições são meses disjuntos, da mais recente para a mais antiga
+                if len(logs) >= limit + offset and not self._possui_legado:
+                    break
+            
+            logs.sort(key=lambda log: log["timestamp"], reverse=True)
+            logs = logs[offset:offset + limit]
+            
+            # Parse JSON fields
+            for log in logs:
+                for field in ['before_data', 'after_data', 'metadata']:
+                    if log[field]:
+                        try:
+                            log[field] = json.loads(log[field])
+                        except:
+                            pass
+            
+            return logs
+            
         except Exception as e:
             print(f"Erro ao buscar logs de auditoria: {str(e)}")
             return []
@@ -530,79 +646,88 @@ class CentralAuditService:
         """Gera relatório de auditoria para período"""
         
         try:
-            with sqlite3.connect(self.audit_db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Estatísticas gerais
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_events,
-                        COUNT(DISTINCT user_id) as unique_users,
-                        COUNT(DISTINCT session_id) as total_sessions,
-                        SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_operations,
-                        SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as failed_operations,
-                        AVG(duration_ms) as avg_duration_ms
-                    FROM auditoria_eventos 
-                    WHERE empresa_id = ? AND timestamp BETWEEN ? AND ?
-                """, (empresa_id, start_date, end_date))
-                
-                stats = cursor.fetchone()
-                
-                # Eventos por tipo
-                cursor.execute("""
-                    SELECT event_type, COUNT(*) as count 
-                    FROM auditoria_eventos 
-                    WHERE empresa_id = ? AND timestamp BETWEEN ? AND ?
-                    GROUP BY event_type 
-                    ORDER BY count DESC
-                """, (empresa_id, start_date, end_date))
-                
-                events_by_type = dict(cursor.fetchall())
-                
-                # Usuários mais ativos
-                cursor.execute("""
-                    SELECT user_id, COUNT(*) as actions 
-                    FROM auditoria_eventos 
-                    WHERE empresa_id = ? AND timestamp BETWEEN ? AND ?
-                    GROUP BY user_id 
-                    ORDER BY actions DESC 
-                    LIMIT 10
-                """, (empresa_id, start_date, end_date))
-                
-                top_users = dict(cursor.fetchall())
-                
-                # Erros mais comuns
-                cursor.execute("""
-                    SELECT error_message, COUNT(*) as count 
-                    FROM auditoria_eventos 
-                    WHERE empresa_id = ? AND timestamp BETWEEN ? AND ? AND success = 0
-                    GROUP BY error_message 
-                    ORDER BY count DESC 
-                    LIMIT 10
-                """, (empresa_id, start_date, end_date))
-                
-                common_errors = dict(cursor.fetchall())
-                
-                return {
-                    "periodo": {
-                        "inicio": start_date.isoformat(),
-                        "fim": end_date.isoformat()
-                    },
-                    "estatisticas_gerais": {
-                        "total_eventos": stats[0],
-                        "usuarios_unicos": stats[1],
-                        "sessoes_totais": stats[2],
-                        "operacoes_sucesso": stats[3],
-                        "operacoes_falha": stats[4],
-                        "tempo_medio_ms": stats[5],
-                        "taxa_sucesso": (stats[3] / stats[0] * 100) if stats[0] > 0 else 0
-                    },
-                    "eventos_por_tipo": events_by_type,
-                    "usuarios_mais_ativos": top_users,
-                    "erros_mais_comuns": common_errors,
-                    "gerado_em": datetime.utcnow().isoformat()
-                }
-                
+            self.flush()
+            
+            filtro = "WHERE empresa_id = ? AND timestamp BETWEEN ? AND ?"
+            params = (empresa_id, start_date, end_date)
+            
+            # Agregados somados entre as partições do período
+            total = sucesso = falha = 0
+            soma_duracao, qtd_duracao = 0.0, 0
+            usuarios, sessoes = set(), set()
+            events_by_type, acoes_usuario, erros = Counter(), Counter(), Counter()
+            
+            for db_path in self._fontes_eventos(start_date, end_date):
+                with self._conexao(db_path) as conn:
+                    # Estatísticas gerais
+                    stats = conn.execute(f"""
+                        SELECT 
+                            COUNT(*) as total_events,
+                            SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) as successful_operations,
+                            SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) as failed_operations,
+                            SUM(duration_ms), COUNT(duration_ms)
+                        FROM auditoria_eventos 
+                        {filtro}
+                    """, params).fetchone()
+                    
+                    total += stats[0]
+                    sucesso += stats[1] or 0
+                    falha += stats[2] or 0
+                    soma_duracao += stats[3] or 0
+                    qtd_duracao += stats[4]
+                    
+                    # Usuários e sessões distintos (não somáveis entre partições)
+                    usuarios.update(row[0] for row in conn.execute(
+                        f"SELECT DISTINCT user_id FROM auditoria_eventos {filtro} AND user_id IS NOT NULL", params
+                    ))
+                    sessoes.update(row[0] for row in conn.execute(
+                        f"SELECT DISTINCT session_id FROM auditoria_eventos {filtro} AND session_id IS NOT NULL", params
+                    ))
+                    
+                    # Eventos por tipo
+                    events_by_type.update(dict(conn.execute(f"""
+                        SELECT event_type, COUNT(*) as count 
+                        FROM auditoria_eventos 
+                        {filtro}
+                        GROUP BY event_type
+                    """, params).fetchall()))
+                    
+                    # Usuários mais ativos
+                    acoes_usuario.update(dict(conn.execute(f"""
+                        SELECT user_id, COUNT(*) as actions 
+                        FROM auditoria_eventos 
+                        {filtro}
+                        GROUP BY user_id
+                    """, params).fetchall()))
+                    
+                    # Erros mais comuns
+                    erros.update(dict(conn.execute(f"""
+                        SELECT error_message, COUNT(*) as count 
+                        FROM auditoria_eventos 
+                        {filtro} AND success = 0
+                        GROUP BY error_message
+                    """, params).fetchall()))
+            
+            return {
+                "periodo": {
+                    "inicio": start_date.isoformat(),
+                    "fim": end_date.isoformat()
+                },
+                "estatisticas_gerais": {
+                    "total_eventos": total,
+                    "usuarios_unicos": len(usuarios),
+                    "sessoes_totais": len(sessoes),
+                    "operacoes_sucesso": sucesso,
+                    "operacoes_falha": falha,
+                    "tempo_medio_ms": soma_duracao / qtd_duracao if qtd_duracao else None,
+                    "taxa_sucesso": (sucesso / total * 100) if total > 0 else 0
+                },
+                "eventos_por_tipo": dict(events_by_type.most_common()),
+                "usuarios_mais_ativos": dict(acoes_usuario.most_common(10)),
+                "erros_mais_comuns": dict(erros.most_common(10)),
+                "gerado_em": datetime.utcnow().isoformat()
+            }
+            
         except Exception as e:
             print(f"Erro ao gerar relatório de auditoria: {str(e)}")
             return {}
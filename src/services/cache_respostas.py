@@ -0,0 +1,122 @@
+"""
+Cache de Respostas das Consultas de Referência
+LRU em memória com o corpo JSON já serializado das rotas de consulta (NCM,
+CEST, exemplos, golden set, explicações), por rota e parâmetros. Cada
+entrada guarda a geração das tabelas lidas (geracao_escritas) e deixa de
+valer quando ela muda; o TTL cobre escritas de outros processos. A ETag
+forte (hash do corpo) permite responder If-None-Match com 304 sem banco nem
+serialização
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
+
+from database.estatisticas_materializadas import avancar_geracao, geracao_escritas
+
+# Tabelas lidas por cada grupo de rotas
+TABELAS_NCM = ("ncm_hierarchy",)
+TABELAS_CEST = ("ncm_cest_mapping", "cest_categories")
+TABELAS_EXEMPLOS = ("produtos_exemplos",)
+TABELAS_GOLDEN_SET = ("golden_set",)
+TABELAS_EXPLICACOES = ("explicacoes_agentes",)
+
+
+@dataclass(frozen=True)
+class RespostaCacheada:
+    """Corpo serializado e seus validadores"""
+    corpo: bytes
+    etag: str
+    geracao: Tuple[int, ...]
+    criada_em: float
+    total_itens: Optional[int] = None
+
+
+def gerar_etag(corpo: bytes) -> str:
+    """ETag forte: muda com qualquer byte do corpo."""
+    return '"' + hashlib.sha1(corpo).hexdigest() + '"'
+
+
+def etag_corresponde(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparação fraca do If-None-Match (RFC 9110): aceita lista, W/ e '*'."""
+    if not if_none_match:
+        return False
+    for candidata in if_none_match.split(","):
+        candidata = candidata.strip()
+        if candidata == "*":
+            return True
+        if candidata.startswith("W/"):
+            candidata = candidata[2:]
+        if candidata == etag:
+            return True
+    return False
+
+
+class CacheRespostas:
+    """LRU de respostas serializadas, seguro entre threads"""
+
+    def __init__(self, max_entradas: int = 512, ttl_segundos: int = 300):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas: "OrderedDict[Hashable, RespostaCacheada]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    @staticmethod
+    def geracao(tabelas: Sequence[str]) -> Tuple[int, ...]:
+        """Geração atual das tabelas; ler antes de consultar o banco."""
+        return tuple(geracao_escritas(tabela) for tabela in tabelas)
+
+    def obter(self, chave: Hashable, tabelas: Sequence[str]) -> Optional[RespostaCacheada]:
+        """Entrada de `chave` se as tabelas não mudaram e o TTL não venceu."""
+        geracao = self.geracao(tabelas)
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if (entrada is not None and entrada.geracao == geracao
+                    and time.monotonic() - entrada.criada_em < self.ttl_segundos):
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return entrada
+            if entrada is not None:
+                del self._entradas[chave]
+            self.faltas += 1
+            return None
+
+    def guardar(self, chave: Hashable, geracao: Tuple[int, ...], corpo: bytes,
+                total_itens: Optional[int] = None) -> RespostaCacheada:
+        """
+        Guarda `corpo` com a geração lida ANTES da consulta: uma escrita
+        concorrente torna a entrada obsoleta em vez de mascará-la.
+        """
+        entrada = RespostaCacheada(corpo, gerar_etag(corpo), geracao, time.monotonic(), total_itens)
+        with self._lock:
+            self._entradas[chave] = entrada
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return entrada
+
+    @staticmethod
+    def invalidar(*tabelas: str):
+        """Escritas fora do ORM (SQL direto) nas tabelas de referência."""
+        for tabela in tabelas:
+            avancar_geracao(tabela)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "taxa_acerto": round(self.acertos / consultas, 4) if consultas else 0.0,
+            }
@@ -6,12 +6,59 @@ Integra o EmpresaDatabaseManager com o sistema de classificação existente
 import time
 import json
 import sqlite3
+import threading
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 
-from src.database.empresa_database_manager import EmpresaDatabaseManager
+from src.config import Config
+from src.database.empresa_database_manager import (
+    EmpresaDatabaseManager, parametros_agente_acao, parametros_agente_consulta
+)
+from src.database.write_behind import WriteBehindWriter, POLITICA_DESCARTAR_ANTIGOS
 from src.services.empresa_contexto_service import EmpresaContextoService
 
+# Rastreamento dos agentes: um writer (e uma thread) por processo, não por serviço
+_rastreamento: Optional[WriteBehindWriter] = None
+_rastreamento_lock = threading.Lock()
+
+
+def _gravar_rastreamento(itens: List[tuple]) -> int:
+    """
+    Grava um lote do rastreamento: uma transação por banco de empresa, de
+    modo que a falha em uma empresa não descarta as linhas das outras.
+    
+    Returns:
+        Número de itens não gravados
+    """
+    por_empresa: Dict[int, tuple] = {}
+    for empresa_id, tipo, parametros in itens:
+        acoes, consultas = por_empresa.setdefault(empresa_id, ([], []))
+        (acoes if tipo == "acao" else consultas).append(parametros)
+    
+    db_manager = EmpresaDatabaseManager()
+    nao_gravados = 0
+    for empresa_id, (acoes, consultas) in por_empresa.items():
+        try:
+            nao_gravados += db_manager.insert_rastreamento_lote(empresa_id, acoes, consultas)
+        except Exception as e:
+            print(f"❌ Rastreamento da empresa {empresa_id} não gravado: {e}")
+            nao_gravados += len(acoes) + len(consultas)
+    return nao_gravados
+
+
+def get_rastreamento_agentes() -> WriteBehindWriter:
+    """Writer write-behind único do processo para ações e consultas dos agentes"""
+    global _rastreamento
+    with _rastreamento_lock:
+        if _rastreamento is None:
+            config = Config()
+            _rastreamento = WriteBehindWriter.from_config(
+                _gravar_rastreamento, "rastreamento-agentes", config,
+                politica=getattr(config, 'TRACKING_OVERFLOW_POLICY', POLITICA_DESCARTAR_ANTIGOS)
+            )
+        return _rastreamento
+
+
 class EmpresaClassificacaoService:
     """Serviço que integra classificação com bancos segregados por empresa"""
     
@@ -19,6 +66,25 @@ class EmpresaClassificacaoService:
         self.db_manager = EmpresaDatabaseManager()
         self.contexto_service = EmpresaContextoService()
         
+        # Ações e consultas dos agentes gravadas em lote, fora do caminho da classificação
+        self.rastreamento = get_rastreamento_agentes()
+    
+    def _registrar_acao(self, empresa_id: int, acao_data: Dict[str, Any]):
+        # Parâmetros (e JSON) montados agora: o resultado pode ser alterado depois pelo chamador
+        self.rastreamento.enfileirar((empresa_id, "acao", parametros_agente_acao(acao_data)))
+    
+    def _registrar_consulta(self, empresa_id: int, consulta_data: Dict[str, Any]):
+        self.rastreamento.enfileirar((empresa_id, "consulta", parametros_agente_consulta(consulta_data)))
+    
+    def flush_rastreamento(self, timeout: Optional[float] = 5.0) -> bool:
+        """Aguarda a gravação do rastreamento pendente (False em timeout ou linhas perdidas)"""
+        return self.rastreamento.flush(timeout)
+    
+    def get_produto_detalhado(self, empresa_id: int, produto_id: int) -> Dict[str, Any]:
+        """Produto com classificações e ações dos agentes (incluindo as ainda no buffer)"""
+        self.flush_rastreamento()
+        return self.db_manager.get_produto_detalhado(empresa_id, produto_id)
+        
     def inicializar_empresa(self, empresa_data: Dict[str, Any]) -> Dict[str, Any]:
         """Inicializa uma nova empresa no sistema"""
         try:
@@ -57,11 +123,9 @@ class EmpresaClassificacaoService:
             produto_id = self.db_manager.insert_produto(empresa_id, produto_data)
             
             # 2. Obter contexto da empresa do banco
-            db_path = self.db_manager.get_empresa_db_path(empresa_id)
-            
-            with sqlite3.connect(db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self.db_manager.conexao_empresa(empresa_id) as conn:
                 cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
                 
                 cursor.execute("SELECT * FROM empresa_info WHERE id = ?", (empresa_id,))
                 empresa_info = dict(cursor.fetchone() or {})
@@ -133,7 +197,7 @@ class EmpresaClassificacaoService:
                     tempo_execucao = time.time() - start_time
                     
                     # Registrar ação
-                    self.db_manager.insert_agente_acao(empresa_id, {
+                    self._registrar_acao(empresa_id, {
                         "produto_id": produto_id,
                         "classificacao_id": None,  # Será atualizado depois
                         "agente_nome": agent_name,
@@ -152,7 +216,7 @@ class EmpresaClassificacaoService:
                     # Registrar erro
                     tempo_execucao = time.time() - start_time
                     
-                    self.db_manager.insert_agente_acao(empresa_id, {
+                    self._registrar_acao(empresa_id, {
                         "produto_id": produto_id,
                         "classificacao_id": None,
                         "agente_nome": agent_name,
@@ -172,7 +236,7 @@ class EmpresaClassificacaoService:
         
         # Rastrear consultas de busca semântica
         def track_semantic_search(agent_name: str, query: str, results: List[Any]) -> None:
-            self.db_manager.insert_agente_consulta(empresa_id, {
+            self._registrar_consulta(empresa_id, {
                 "produto_id": produto_id,
                 "agente_nome": agent_name,
                 "tipo_consulta": "semantic_search",
@@ -207,10 +271,11 @@ class EmpresaClassificacaoService:
             print(f"Aviso: Não foi possível instrumentar todos os agentes: {e}")
         
         try:
-            # Executar classificação
-            resultado = hybrid_router.classify_product_with_explanations(
-                nome_produto, contexto_empresa
-            )
+            # Executar classificação (fila interativa do LLM, justa entre empresas)
+            with hybrid_router.contexto_requisicao_llm(empresa_id=empresa_id):
+                resultado = hybrid_router.classify_product_with_explanations(
+                    nome_produto, contexto_empresa
+                )
             
             return resultado
             
@@ -226,9 +291,7 @@ class EmpresaClassificacaoService:
                             usuario: str, observacoes: str = "") -> Dict[str, Any]:
         """Aprova uma classificação"""
         try:
-            db_path = self.db_manager.get_empresa_db_path(empresa_id)
-            
-            with sqlite3.connect(db_path) as conn:
+            with self.db_manager.conexao_empresa(empresa_id) as conn:
                 cursor = conn.cursor()
                 
                 # Atualizar status
@@ -261,9 +324,7 @@ class EmpresaClassificacaoService:
                              usuario: str, motivo: str) -> Dict[str, Any]:
         """Rejeita uma classificação"""
         try:
-            db_path = self.db_manager.get_empresa_db_path(empresa_id)
-            
-            with sqlite3.connect(db_path) as conn:
+            with self.db_manager.conexao_empresa(empresa_id) as conn:
                 cursor = conn.cursor()
                 
                 # Atualizar status
@@ -296,7 +357,7 @@ class EmpresaClassificacaoService:
         """Adiciona um produto aprovado ao Golden Set compartilhado"""
         try:
             # Obter dados do produto da empresa
-            produto_detalhado = self.db_manager.get_produto_detalhado(empresa_id, produto_id)
+            produto_detalhado = self.get_produto_detalhado(empresa_id, produto_id)
             
             if not produto_detalhado or "erro" in produto_detalhado:
                 return {"sucesso": False, "erro": "Produto não encontrado"}
@@ -315,7 +376,7 @@ class EmpresaClassificacaoService:
                 return {"sucesso": False, "erro": "Nenhuma classificação aprovada encontrada"}
             
             # Inserir no Golden Set
-            with sqlite3.connect(self.db_manager.golden_set_db) as conn:
+            with self.db_manager.conexao_golden_set() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -367,7 +428,8 @@ class EmpresaClassificacaoService:
     def get_relatorio_empresa(self, empresa_id: int) -> Dict[str, Any]:
         """Gera relatório completo da empresa"""
         try:
-            # Estatísticas gerais
+            # Estatísticas gerais (incluindo o rastreamento ainda no buffer)
+            self.flush_rastreamento()
             stats = self.db_manager.get_empresa_stats(empresa_id)
             
             # Informações da empresa (simulado)
@@ -378,10 +440,9 @@ class EmpresaClassificacaoService:
             }
             
             # Últimas classificações
-            db_path = self.db_manager.get_empresa_db_path(empresa_id)
-            with sqlite3.connect(db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self.db_manager.conexao_empresa(empresa_id) as conn:
                 cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
                 
                 # Últimas 10 classificações
                 cursor.execute("""
@@ -0,0 +1,164 @@
+"""
+Barramento de Eventos de Progresso
+Pub/sub em memória por tópico (sessão de processamento): o motor de lote e o
+HybridRouter publicam eventos de etapa e os canais WebSocket/SSE da API os
+repassam aos clientes sem consultar o banco. Workers em outros processos
+enviam seus eventos por uma multiprocessing.Queue que o supervisor descarrega
+no barramento
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Tipos de evento
+EVENTO_SESSAO = "sessao"      # mudança de status da sessão
+EVENTO_BLOCO = "bloco"        # bloco concluído, com contadores e ETA
+EVENTO_ETAPA = "etapa"        # etapa interna da classificação
+
+# Etapas publicadas pelo HybridRouter
+ETAPA_EXPANSAO = "expansao"
+ETAPA_AGRUPAMENTO = "agrupamento"
+ETAPA_REPRESENTANTE = "representante"
+ETAPA_PROPAGACAO = "propagacao"
+
+Publicador = Callable[[Dict[str, Any]], None]
+
+_publicador_atual: ContextVar[Optional[Publicador]] = ContextVar("publicador_progresso", default=None)
+
+
+# =====================
+# PUBLICAÇÃO DE ETAPAS
+# =====================
+
+@contextmanager
+def contexto_progresso(publicar: Publicador):
+    """
+    Direciona para `publicar` os eventos de etapa emitidos dentro do bloco
+    (HybridRouter e agentes não recebem a sessão como parâmetro).
+    """
+    token = _publicador_atual.set(publicar)
+    try:
+        yield
+    finally:
+        _publicador_atual.reset(token)
+
+
+def emitir_progresso(etapa: str, **dados):
+    """Evento de etapa para o publicador do contexto atual; sem contexto não faz nada."""
+    publicar = _publicador_atual.get()
+    if publicar is None:
+        return
+    try:
+        publicar({"tipo": EVENTO_ETAPA, "etapa": etapa, **dados})
+    except Exception as e:
+        # Progresso nunca interrompe a classificação
+        logger.debug(f"Evento de progresso descartado: {e}")
+
+
+# =====================
+# BARRAMENTO
+# =====================
+
+class Assinatura:
+    """
+    Fila de eventos de um cliente, ligada ao event loop que a criou. Quando o
+    cliente não acompanha, os eventos mais antigos são descartados: o evento
+    seguinte já traz os contadores atualizados
+    """
+
+    def __init__(self, barramento: "BarramentoEventos", topico: str, max_eventos: int):
+        self.topico = topico
+        self.descartados = 0
+        self._barramento = barramento
+        self._loop = asyncio.get_running_loop()
+        self._fila: asyncio.Queue = asyncio.Queue(maxsize=max_eventos)
+
+    def _entregar(self, evento: Dict[str, Any]):
+        if self._fila.full():
+            self._fila.get_nowait()
+            self.descartados += 1
+        self._fila.put_nowait(evento)
+
+    def agendar(self, evento: Dict[str, Any]) -> bool:
+        """Entrega o evento no loop da assinatura (chamável de qualquer thread)."""
+        try:
+            self._loop.call_soon_threadsafe(self._entregar, evento)
+            return True
+        except RuntimeError:
+            # Loop encerrado
+            return False
+
+    async def proximo(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Próximo evento; None se nada chegar em `timeout` segundos."""
+        try:
+            return await asyncio.wait_for(self._fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def cancelar(self):
+        self._barramento.cancelar(self)
+
+
+class BarramentoEventos:
+    """Pub/sub em memória, seguro entre threads; guarda o último evento de cada tópico"""
+
+    def __init__(self, max_eventos_assinatura: int = 100, max_topicos: int = 256):
+        self.max_eventos_assinatura = max_eventos_assinatura
+        self.max_topicos = max_topicos
+        self._assinaturas: Dict[str, Set[Assinatura]] = {}
+        self._ultimos: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sequencia = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publicar(self, topico: str, evento: Dict[str, Any]) -> int:
+        """Publica `evento` em `topico`; retorna quantos assinantes o receberam."""
+        evento = {**evento, "topico": topico, "sequencia": next(self._sequencia),
+                  "timestamp": evento.get("timestamp") or time.time()}
+        with self._lock:
+            self._ultimos[topico] = evento
+            self._ultimos.move_to_end(topico)
+            while len(self._ultimos) > self.max_topicos:
+                self._ultimos.popitem(last=False)
+            assinaturas = list(self._assinaturas.get(topico, ()))
+
+        entregues = 0
+        for assinatura in assinaturas:
+            if assinatura.agendar(evento):
+                entregues += 1
+            else:
+                self.cancelar(assinatura)
+        return entregues
+
+    def assinar(self, topico: str) -> Assinatura:
+        """Nova assinatura de `topico` (chamar dentro do event loop do consumidor)."""
+        assinatura = Assinatura(self, topico, self.max_eventos_assinatura)
+        with self._lock:
+            self._assinaturas.setdefault(topico, set()).add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura):
+        with self._lock:
+            assinaturas = self._assinaturas.get(assinatura.topico)
+            if assinaturas is not None:
+                assinaturas.discard(assinatura)
+                if not assinaturas:
+                    del self._assinaturas[assinatura.topico]
+
+    def ultimo_evento(self, topico: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._ultimos.get(topico)
+
+    def total_assinantes(self, topico: Optional[str] = None) -> int:
+        with self._lock:
+            if topico is not None:
+                return len(self._assinaturas.get(topico, ()))
+            return sum(len(assinaturas) for assinaturas in self._assinaturas.values())
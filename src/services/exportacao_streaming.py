@@ -0,0 +1,180 @@
+"""
+Exportação em Streaming
+Converte lotes de registros em blocos de bytes NDJSON, JSON, CSV ou Parquet,
+sem montar o arquivo inteiro em memória
+"""
+
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# formato -> (media type, extensão do arquivo)
+FORMATOS_EXPORTACAO = {
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class FormatoIndisponivelError(ValueError):
+    """Formato desconhecido ou dependente de biblioteca não instalada."""
+
+
+def _json_padrao(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _dumps(valor) -> str:
+    return json.dumps(valor, ensure_ascii=False, default=_json_padrao)
+
+
+def validar_formato(formato: str):
+    """Valida o formato antes de iniciar a resposta (erros depois do início não mudam o status HTTP)."""
+    if formato not in FORMATOS_EXPORTACAO:
+        raise FormatoIndisponivelError(
+            f"Formato {formato} não suportado (use {', '.join(FORMATOS_EXPORTACAO)})"
+        )
+    if formato == "parquet" and not PYARROW_AVAILABLE:
+        raise FormatoIndisponivelError("Exportação Parquet requer pyarrow instalado")
+
+
+def gerar_ndjson(lotes: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """Um registro JSON por linha; um bloco por lote."""
+    for lote in lotes:
+        if lote:
+            yield "".join(_dumps(registro) + "\n" for registro in lote).encode("utf-8")
+
+
+def gerar_json(lotes: Iterable[List[Dict[str, Any]]], metadados: Optional[Dict[str, Any]] = None) -> Iterator[bytes]:
+    """
+    Documento {"dados": [...], "total_registros": N, ...} no mesmo formato da
+    resposta JSON anterior, emitido incrementalmente.
+    """
+    yield b'{"dados": ['
+    total = 0
+    for lote in lotes:
+        if not lote:
+            continue
+        bloco = ", ".join(_dumps(registro) for registro in lote)
+        yield (", " + bloco if total else bloco).encode("utf-8")
+        total += len(lote)
+
+    rodape = {"total_registros": total, **(metadados or {})}
+    yield ("], " + _dumps(rodape)[1:]).encode("utf-8")
+
+
+def _valor_csv(valor):
+    if isinstance(valor, (dict, list)):
+        return _dumps(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def gerar_csv(lotes: Iterable[List[Dict[str, Any]]], colunas: Sequence[str]) -> Iterator[bytes]:
+    """CSV com cabeçalho; campos aninhados (explicações, consultas) viram JSON na célula."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(colunas), extrasaction="ignore")
+    writer.writeheader()
+
+    for lote in lotes:
+        writer.writerows({k: _valor_csv(v) for k, v in registro.items()} for registro in lote)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _SaidaEmPartes(io.RawIOBase):
+    """Destino de escrita que acumula os bytes até serem drenados (posição contínua)."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        dados = bytes(dados)
+        self._partes.append(dados)
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self._posicao
+
+    def drenar(self) -> bytes:
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _schema_parquet(colunas: Sequence[str], tipos: Dict[str, str]):
+    """Schema Arrow declarado: tipos por alias ("int64", "float64"...), texto para as demais colunas."""
+    return pa.schema([pa.field(coluna, pa.type_for_alias(tipos.get(coluna, "string"))) for coluna in colunas])
+
+
+def _valor_parquet(valor, texto: bool, json_aninhado: bool):
+    if valor is None:
+        return None
+    if json_aninhado:
+        return _dumps(valor)
+    if texto and not isinstance(valor, str):
+        return valor.isoformat() if isinstance(valor, (datetime, date)) else str(valor)
+    return valor
+
+
+def gerar_parquet(lotes: Iterable[List[Dict[str, Any]]], colunas: Sequence[str],
+                  colunas_json: Sequence[str] = (),
+                  tipos: Optional[Dict[str, str]] = None) -> Iterator[bytes]:
+    """
+    Parquet com um row group por lote (record batches do pyarrow).
+
+    O schema é declarado antes do primeiro lote: uma coluna nula no início
+    da exportação mantém o tipo (ex.: confiança float64), e todos os row
+    groups e exportações vazias têm o mesmo schema.
+
+    Args:
+        colunas: Colunas exportadas
+        colunas_json: Colunas aninhadas gravadas como texto JSON
+        tipos: coluna -> alias de tipo Arrow ("int64", "float64", "bool"...);
+            colunas ausentes são texto
+    """
+    validar_formato("parquet")
+    tipos = {c: t for c, t in (tipos or {}).items() if c not in colunas_json}
+    schema = _schema_parquet(colunas, tipos)
+    texto = {c: c not in tipos for c in colunas}
+    saida = _SaidaEmPartes()
+    writer = pq.ParquetWriter(saida, schema, compression="zstd")
+    try:
+        for lote in lotes:
+            if not lote:
+                continue
+            dados = {
+                coluna: [_valor_parquet(r.get(coluna), texto[coluna], coluna in colunas_json) for r in lote]
+                for coluna in colunas
+            }
+            writer.write_batch(pa.RecordBatch.from_pydict(dados, schema=schema))
+            yield saida.drenar()
+
+        writer.close()
+        writer = None
+        yield saida.drenar()
+    finally:
+        if writer is not None:
+            writer.close()
@@ -4,7 +4,7 @@ Substitui o carregamento de JSON por consultas SQL eficientes
 """
 
 import sqlite3
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, Iterator
 from sqlalchemy import create_engine, and_, or_, func, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
@@ -17,27 +17,58 @@ from database.knowledge_models import (
     KnowledgeBase, NCMHierarchy, CestCategory, NCMCestMapping, 
     ProdutoExemplo, KnowledgeBaseMetadata, create_performance_indexes
 )
+from database.sqlite_connection import criar_engine_sqlite, conectar_sqlite, PERFIL_LEITURA
+from services.knowledge_graph import FiscalKnowledgeGraph
+from services.knowledge_snapshot import SnapshotError, ler_checksum
 
 logger = logging.getLogger(__name__)
 
+
+class _AgrupadorOrdenado:
+    """
+    Percorre linhas ordenadas pela primeira coluna (código NCM) entregando o
+    grupo de cada código, para merge join com outra sequência ordenada.
+    """
+    
+    def __init__(self, linhas):
+        self._linhas = iter(linhas)
+        self._atual = next(self._linhas, None)
+    
+    def grupo(self, codigo: str) -> List[Any]:
+        # Descarta linhas de códigos sem NCM ativo correspondente
+        while self._atual is not None and self._atual[0] < codigo:
+            self._atual = next(self._linhas, None)
+        
+        grupo = []
+        while self._atual is not None and self._atual[0] == codigo:
+            grupo.append(self._atual)
+            self._atual = next(self._linhas, None)
+        return grupo
+
+
 class KnowledgeBaseService:
     """
     Serviço para acesso eficiente à base de conhecimento SQLite
     """
     
-    def __init__(self, db_path: str = "data/knowledge_base/knowledge_base.sqlite"):
+    def __init__(self, db_path: str = "data/knowledge_base/knowledge_base.sqlite",
+                 carregar_grafo: bool = True, snapshot_path: Optional[str] = None):
         """
         Inicializa o serviço da base de conhecimento
         
         Args:
             db_path: Caminho para o arquivo SQLite
+            carregar_grafo: Carrega o grafo fiscal em memória na inicialização
+            snapshot_path: Snapshot binário do grafo (padrão: ao lado do SQLite)
         """
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else self.db_path.with_suffix(".snapshot")
         
         # Configuração do SQLAlchemy
-        self.engine = create_engine(
-            f"sqlite:///{self.db_path}",
+        self.engine = criar_engine_sqlite(
+            self.db_path,
+            PERFIL_LEITURA,
             poolclass=StaticPool,
             pool_pre_ping=True,
             connect_args={
@@ -53,8 +84,85 @@ class KnowledgeBaseService:
         self._cache_cest_mappings = {}
         self._cache_enabled = True
         
+        # Grafo imutável NCM/CEST em memória (None = consultas vão ao SQLite)
+        self._grafo: Optional[FiscalKnowledgeGraph] = None
+        if carregar_grafo:
+            self.carregar_grafo()
+        
         logger.info(f"KnowledgeBaseService inicializado com: {self.db_path}")
     
+    def carregar_grafo(self) -> bool:
+        """
+        (Re)carrega o grafo fiscal. Usa o snapshot binário quando seu checksum
+        confere com o registrado em KnowledgeBaseMetadata; caso contrário,
+        monta o grafo a partir do SQLite. Sem base construída, as consultas
+        continuam sendo feitas diretamente no banco.
+        """
+        if not self.db_path.exists():
+            logger.info("Base de conhecimento ainda não construída; grafo em memória não carregado")
+            self._grafo = None
+            return False
+        
+        checksum_registrado = self._checksum_snapshot_registrado()
+        if checksum_registrado and ler_checksum(self.snapshot_path) == checksum_registrado:
+            try:
+                self._grafo = FiscalKnowledgeGraph.from_snapshot(self.snapshot_path)
+                logger.info(f"Grafo fiscal carregado do snapshot {self.snapshot_path}")
+                return True
+            except SnapshotError as e:
+                logger.warning(f"Snapshot inválido, usando SQLite: {e}")
+        elif self.snapshot_path.exists():
+            logger.warning(f"Snapshot {self.snapshot_path} desatualizado em relação à base; usando SQLite")
+        
+        try:
+            self._grafo = FiscalKnowledgeGraph.from_sqlite(self.db_path)
+            return True
+        except sqlite3.Error as e:
+            logger.warning(f"Não foi possível carregar o grafo fiscal em memória: {e}")
+            self._grafo = None
+            return False
+    
+    @property
+    def grafo(self) -> Optional[FiscalKnowledgeGraph]:
+        return self._grafo
+    
+    def _checksum_snapshot_registrado(self) -> Optional[str]:
+        """Checksum do snapshot registrado nos metadados ativos mais recentes."""
+        try:
+            conn = conectar_sqlite(self.db_path, PERFIL_LEITURA, somente_leitura=True)
+            try:
+                row = conn.execute("""
+                    SELECT checksum_snapshot FROM knowledge_metadata
+                    WHERE ativo = 1 ORDER BY id DESC LIMIT 1
+                """).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            # Base anterior à coluna checksum_snapshot
+            return None
+        return row[0] if row else None
+    
+    def gerar_snapshot(self) -> str:
+        """
+        Gera o snapshot binário do grafo a partir do SQLite e registra seu
+        checksum nos metadados ativos mais recentes.
+        """
+        grafo = FiscalKnowledgeGraph.from_sqlite(self.db_path)
+        checksum = grafo.salvar_snapshot(self.snapshot_path)
+        
+        with self.get_session() as session:
+            metadata = session.query(KnowledgeBaseMetadata).filter(
+                KnowledgeBaseMetadata.ativo == True
+            ).order_by(KnowledgeBaseMetadata.id.desc()).first()
+            
+            if metadata is None:
+                raise ValueError("Nenhum registro ativo em knowledge_metadata para registrar o snapshot")
+            
+            metadata.checksum_snapshot = checksum
+            session.commit()
+        
+        return checksum
+    
     @contextmanager
     def get_session(self):
         """
@@ -75,18 +183,32 @@ class KnowledgeBaseService:
         """
         try:
             KnowledgeBase.metadata.create_all(bind=self.engine)
+            self._migrar_metadados()
             create_performance_indexes(self.engine)
             logger.info("Tabelas da base de conhecimento criadas com sucesso")
         except Exception as e:
             logger.error(f"Erro ao criar tabelas: {e}")
             raise
     
+    def _migrar_metadados(self):
+        """
+        Adiciona colunas novas de knowledge_metadata em bases criadas antes delas
+        """
+        with self.engine.connect() as conn:
+            colunas = {row[1] for row in conn.execute(text("PRAGMA table_info(knowledge_metadata)"))}
+            if 'checksum_snapshot' not in colunas:
+                conn.execute(text("ALTER TABLE knowledge_metadata ADD COLUMN checksum_snapshot VARCHAR(64)"))
+                conn.commit()
+    
     # === CONSULTAS NCM ===
     
     def buscar_ncm_por_codigo(self, codigo_ncm: str) -> Optional[Dict]:
         """
         Busca um NCM específico por código
         """
+        if self._grafo is not None:
+            return self._grafo.ncm(codigo_ncm)
+        
         if self._cache_enabled and codigo_ncm in self._cache_ncm_hierarchy:
             return self._cache_ncm_hierarchy[codigo_ncm]
         
@@ -118,6 +240,13 @@ class KnowledgeBaseService:
         """
         Busca todos os NCMs em uma hierarquia (ex: todos os NCMs que começam com '8542')
         """
+        if self._grafo is not None:
+            # Linhas sem nível (bancos legados) vão para o fim em vez de quebrar a ordenação
+            return sorted(
+                self._grafo.ncms_com_prefixo(codigo_base),
+                key=lambda ncm: (ncm['nivel_hierarquico'] is None, ncm['nivel_hierarquico'] or 0, ncm['codigo_ncm'])
+            )
+        
         with self.get_session() as session:
             ncms = session.query(NCMHierarchy).filter(
                 and_(
@@ -175,9 +304,12 @@ class KnowledgeBaseService:
         """
         Busca todos os CESTs associados a um NCM
         """
+        if self._grafo is not None:
+            return self._grafo.cests_diretos(codigo_ncm)
+        
         cache_key = f"cest_{codigo_ncm}"
         if self._cache_enabled and cache_key in self._cache_cest_mappings:
-            return self._cache_cest_mappings[cache_key]
+            return [dict(cest) for cest in self._cache_cest_mappings[cache_key]]
         
         with self.get_session() as session:
             # Busca direto e por hierarquia
@@ -211,7 +343,7 @@ class KnowledgeBaseService:
             ]
             
             if self._cache_enabled:
-                self._cache_cest_mappings[cache_key] = result
+                self._cache_cest_mappings[cache_key] = [dict(cest) for cest in result]
             
             return result
     
@@ -219,6 +351,9 @@ class KnowledgeBaseService:
         """
         Busca CESTs incluindo hierarquia do NCM (busca em NCMs pais)
         """
+        if self._grafo is not None:
+            return self._grafo.cests_hierarquia(codigo_ncm)
+        
         all_cests = []
         
         # Primeiro busca CESTs diretos
@@ -231,12 +366,11 @@ class KnowledgeBaseService:
             codigo_pai = ncm_info['codigo_pai']
             cests_herdados = self.buscar_cests_por_ncm(codigo_pai)
             
-            # Marca como herdados
-            for cest in cests_herdados:
-                cest['tipo_relacao'] = 'HERDADO'
-                cest['confianca'] = cest['confianca'] * 0.8  # Reduz confiança para herdados
-            
-            all_cests.extend(cests_herdados)
+            # Marca como herdados (em cópias, sem alterar o cache)
+            all_cests.extend(
+                {**cest, 'tipo_relacao': 'HERDADO', 'confianca': cest['confianca'] * 0.8}  # Reduz confiança para herdados
+                for cest in cests_herdados
+            )
         
         # Remove duplicatas e ordena por confiança
         cests_unicos = {}
@@ -251,6 +385,9 @@ class KnowledgeBaseService:
         """
         Busca um CEST específico por código
         """
+        if self._grafo is not None:
+            return self._grafo.cest(codigo_cest)
+        
         with self.get_session() as session:
             cest = session.query(CestCategory).filter(
                 and_(
@@ -275,6 +412,9 @@ class KnowledgeBaseService:
         """
         Busca produtos exemplo para um NCM
         """
+        if self._grafo is not None and self._grafo.cobre_exemplos(limite):
+            return self._grafo.exemplos(codigo_ncm, limite)
+        
         with self.get_session() as session:
             exemplos = session.query(ProdutoExemplo).filter(
                 and_(
@@ -354,35 +494,116 @@ class KnowledgeBaseService:
     
     # === MÉTODOS DE COMPATIBILIDADE ===
     
-    def get_ncm_mapping(self) -> Dict:
+    def get_ncm_mapping(self, limite_exemplos: int = 5) -> Dict:
         """
         Método de compatibilidade para substituir o carregamento do ncm_mapping.json
         Retorna estrutura similar ao JSON original para facilitar migração
         """
-        mapping = {}
+        mapping = dict(self.iter_ncm_mapping(limite_exemplos))
         
+        logger.info(f"Mapeamento NCM carregado com {len(mapping)} entradas")
+        return mapping
+    
+    def iter_ncm_mapping(self, limite_exemplos: int = 5, tamanho_lote: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        """
+        Gera (codigo_ncm, entrada) do mapeamento NCM em ordem de código.
+        
+        Usa três consultas em conjunto (NCMs, mapeamentos com CESTs e os
+        melhores exemplos por NCM via ROW_NUMBER), percorridas em paralelo
+        por merge join, sem consultas por NCM e sem alterar o cache.
+        """
         with self.get_session() as session:
-            # Busca todos os NCMs ativos
-            ncms = session.query(NCMHierarchy).filter(NCMHierarchy.ativo == True).all()
+            ncms = session.query(
+                NCMHierarchy.codigo_ncm,
+                NCMHierarchy.descricao_oficial,
+                NCMHierarchy.descricao_curta,
+                NCMHierarchy.nivel_hierarquico
+            ).filter(
+                NCMHierarchy.ativo == True
+            ).order_by(NCMHierarchy.codigo_ncm).yield_per(tamanho_lote)
+            
+            cests = session.query(
+                NCMCestMapping.ncm_codigo,
+                CestCategory.codigo_cest,
+                CestCategory.descricao_cest,
+                CestCategory.descricao_resumida,
+                CestCategory.categoria_produto,
+                NCMCestMapping.tipo_relacao,
+                NCMCestMapping.confianca_mapeamento
+            ).join(
+                NCMCestMapping, CestCategory.codigo_cest == NCMCestMapping.cest_codigo
+            ).filter(
+                and_(
+                    NCMCestMapping.ativo == True,
+                    CestCategory.ativo == True
+                )
+            ).order_by(
+                NCMCestMapping.ncm_codigo,
+                NCMCestMapping.confianca_mapeamento.desc()
+            ).yield_per(tamanho_lote)
+            
+            ranking = session.query(
+                ProdutoExemplo.ncm_codigo,
+                ProdutoExemplo.gtin,
+                ProdutoExemplo.descricao_produto,
+                ProdutoExemplo.marca,
+                ProdutoExemplo.modelo,
+                ProdutoExemplo.categoria_produto,
+                ProdutoExemplo.material_predominante,
+                ProdutoExemplo.aplicacao_uso,
+                ProdutoExemplo.qualidade_classificacao,
+                ProdutoExemplo.verificado_humano,
+                func.row_number().over(
+                    partition_by=ProdutoExemplo.ncm_codigo,
+                    order_by=(
+                        ProdutoExemplo.qualidade_classificacao.desc(),
+                        ProdutoExemplo.verificado_humano.desc(),
+                        ProdutoExemplo.id
+                    )
+                ).label('posicao')
+            ).filter(ProdutoExemplo.ativo == True).subquery()
+            
+            exemplos = session.query(ranking).filter(
+                ranking.c.posicao <= limite_exemplos
+            ).order_by(ranking.c.ncm_codigo, ranking.c.posicao).yield_per(tamanho_lote)
+            
+            cursor_cests = _AgrupadorOrdenado(cests)
+            cursor_exemplos = _AgrupadorOrdenado(exemplos)
             
             for ncm in ncms:
-                # Busca CESTs associados
-                cests = self.buscar_cests_por_ncm(ncm.codigo_ncm)
-                
-                # Busca exemplos
-                exemplos = self.buscar_exemplos_por_ncm(ncm.codigo_ncm, limite=5)
+                cests_detalhado = [
+                    {
+                        'codigo_cest': cest.codigo_cest,
+                        'descricao_cest': cest.descricao_cest,
+                        'descricao_resumida': cest.descricao_resumida,
+                        'categoria_produto': cest.categoria_produto,
+                        'tipo_relacao': cest.tipo_relacao,
+                        'confianca': cest.confianca_mapeamento
+                    }
+                    for cest in cursor_cests.grupo(ncm.codigo_ncm)
+                ]
                 
-                mapping[ncm.codigo_ncm] = {
+                yield ncm.codigo_ncm, {
                     'descricao': ncm.descricao_oficial,
                     'descricao_curta': ncm.descricao_curta,
                     'nivel': ncm.nivel_hierarquico,
-                    'cests': [cest['codigo_cest'] for cest in cests],
-                    'cests_detalhado': cests,
-                    'exemplos': exemplos
+                    'cests': [cest['codigo_cest'] for cest in cests_detalhado],
+                    'cests_detalhado': cests_detalhado,
+                    'exemplos': [
+                        {
+                            'gtin': exemplo.gtin,
+                            'descricao_produto': exemplo.descricao_produto,
+                            'marca': exemplo.marca,
+                            'modelo': exemplo.modelo,
+                            'categoria_produto': exemplo.categoria_produto,
+                            'material_predominante': exemplo.material_predominante,
+                            'aplicacao_uso': exemplo.aplicacao_uso,
+                            'qualidade_classificacao': exemplo.qualidade_classificacao,
+                            'verificado_humano': exemplo.verificado_humano
+                        }
+                        for exemplo in cursor_exemplos.grupo(ncm.codigo_ncm)
+                    ]
                 }
-        
-        logger.info(f"Mapeamento NCM carregado com {len(mapping)} entradas")
-        return mapping
     
     # === CACHE ===
     
@@ -477,6 +698,9 @@ class KnowledgeBaseService:
         """
         Busca NCMs que correspondem a um padrão
         """
+        if self._grafo is not None:
+            return [{**ncm, 'ativo': True} for ncm in self._grafo.ncms_com_prefixo(padrao)]
+        
         with self.get_session() as session:
             ncms = session.query(NCMHierarchy).filter(
                 and_(
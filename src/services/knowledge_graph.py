@@ -0,0 +1,354 @@
+"""
+Grafo Fiscal em Memória (NCM → CEST)
+Carrega a base de conhecimento uma única vez em estruturas imutáveis
+baseadas em arrays, respondendo às consultas de hierarquia sem acessar o banco
+"""
+
+import math
+import logging
+from array import array
+from bisect import bisect_left
+from typing import List, Dict, Optional, Iterable, Sequence, Tuple, Any
+
+from database.sqlite_connection import conectar_sqlite, PERFIL_LEITURA
+from services.knowledge_snapshot import Snapshot, escrever_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Campos devolvidos por cada tipo de nó (mesmos nomes do KnowledgeBaseService)
+NCM_CAMPOS = ('codigo_ncm', 'descricao_oficial', 'descricao_curta', 'nivel_hierarquico', 'codigo_pai')
+CEST_CAMPOS = ('codigo_cest', 'descricao_cest', 'descricao_resumida', 'categoria_produto')
+EXEMPLO_CAMPOS = (
+    'gtin', 'descricao_produto', 'marca', 'modelo', 'categoria_produto',
+    'material_predominante', 'aplicacao_uso', 'qualidade_classificacao', 'verificado_humano'
+)
+
+# Redução de confiança aplicada aos CESTs herdados do NCM pai
+FATOR_CONFIANCA_HERDADO = 0.8
+
+# Exemplos por NCM mantidos no snapshot (consultas maiores vão ao SQLite)
+SNAPSHOT_MAX_EXEMPLOS = 10
+
+# Colunas do grafo: nome -> tipo ('i' int32, 'd' float64, 's' texto).
+# Inteiros ausentes usam -1 e reais ausentes usam NaN.
+COLUNAS_GRAFO = {
+    'ncm.codigo': 's', 'ncm.descricao_oficial': 's', 'ncm.descricao_curta': 's',
+    'ncm.nivel': 'i', 'ncm.codigo_pai': 's', 'ncm.na_hierarquia': 'i', 'ncm.pai': 'i',
+    'cest.codigo': 's', 'cest.descricao': 's', 'cest.resumida': 's', 'cest.categoria': 's',
+    'diretos.offsets': 'i', 'diretos.cest': 'i', 'diretos.confianca': 'd', 'diretos.tipo': 's',
+    'hierarquia.offsets': 'i', 'hierarquia.cest': 'i', 'hierarquia.confianca': 'd', 'hierarquia.tipo': 's',
+    'exemplos.offsets': 'i',
+    **{f'exemplos.{campo}': 's' for campo in EXEMPLO_CAMPOS[:-2]},
+    'exemplos.qualidade_classificacao': 'd', 'exemplos.verificado_humano': 'i',
+    'meta': 'i',  # [total_ncms, total_mapeamentos, limite_exemplos (-1 = todos)]
+}
+
+
+def _posicao(codigos: Sequence[str], codigo: str) -> Optional[int]:
+    """Busca binária do código no array ordenado."""
+    i = bisect_left(codigos, codigo)
+    if i < len(codigos) and codigos[i] == codigo:
+        return i
+    return None
+
+
+def _adicionar_csr(colunas: Dict[str, list], prefixo: str, listas: Sequence[Sequence[Tuple]]):
+    """Achata listas de adjacência (cest, confiança, tipo) no formato CSR."""
+    offsets = colunas[f'{prefixo}.offsets']
+    offsets.append(0)
+    for lista in listas:
+        for cest, confianca, tipo_relacao in lista:
+            colunas[f'{prefixo}.cest'].append(cest)
+            colunas[f'{prefixo}.confianca'].append(confianca)
+            colunas[f'{prefixo}.tipo'].append(tipo_relacao)
+        offsets.append(len(colunas[f'{prefixo}.cest']))
+
+
+class FiscalKnowledgeGraph:
+    """
+    Grafo imutável da base de conhecimento fiscal, em colunas.
+
+    - Nós NCM em arrays paralelos ordenados por código: consulta por código é
+      uma busca binária e por prefixo é um intervalo contíguo (trie achatada)
+    - Ponteiros para o NCM pai (índice no array, -1 se ausente)
+    - Adjacência NCM → CEST em formato CSR, já ordenada por confiança
+    - CESTs herdados do pai pré-calculados, sem mutação em consultas
+    - Exemplos por NCM pré-ordenados por qualidade
+
+    As colunas podem ser listas em memória ou views sobre o snapshot mapeado
+    (ver knowledge_snapshot). Todas as consultas devolvem dicionários novos.
+    """
+
+    __slots__ = ('_c', '_total_ncms', '_total_mapeamentos', 'limite_exemplos', 'checksum')
+
+    def __init__(self, colunas: Dict[str, Sequence], checksum: Optional[str] = None):
+        self._c = colunas
+        meta = colunas['meta']
+        self._total_ncms = meta[0]
+        self._total_mapeamentos = meta[1]
+        self.limite_exemplos = meta[2] if meta[2] >= 0 else None
+        self.checksum = checksum
+
+    @classmethod
+    def from_rows(cls, ncms: Iterable[Sequence], cests: Iterable[Sequence],
+                  mapeamentos: Iterable[Sequence], exemplos: Iterable[Sequence]) -> "FiscalKnowledgeGraph":
+        """
+        Monta o grafo a partir das linhas da base.
+
+        Args:
+            ncms: Linhas (codigo_ncm, descricao_oficial, descricao_curta, nivel_hierarquico, codigo_pai)
+            cests: Linhas (codigo_cest, descricao_cest, descricao_resumida, categoria_produto)
+            mapeamentos: Linhas (ncm_codigo, cest_codigo, tipo_relacao, confianca_mapeamento)
+            exemplos: Linhas (ncm_codigo, *EXEMPLO_CAMPOS)
+        """
+        colunas: Dict[str, list] = {nome: [] for nome in COLUNAS_GRAFO}
+
+        cests = sorted((tuple(linha) for linha in cests), key=lambda linha: linha[0])
+        indice_cest = {linha[0]: i for i, linha in enumerate(cests)}
+        for linha in cests:
+            for nome, valor in zip(('cest.codigo', 'cest.descricao', 'cest.resumida', 'cest.categoria'), linha):
+                colunas[nome].append(valor)
+
+        ncm_linhas = {linha[0]: tuple(linha) for linha in ncms}
+        mapeamentos = [m for m in mapeamentos if m[1] in indice_cest]
+        exemplos = list(exemplos)
+
+        # Nós: NCMs da hierarquia e códigos referenciados por mapeamentos/exemplos
+        codigos = set(ncm_linhas)
+        codigos.update(m[0] for m in mapeamentos)
+        codigos.update(e[0] for e in exemplos)
+        codigos = sorted(codigos)
+        indice = {codigo: i for i, codigo in enumerate(codigos)}
+
+        for codigo in codigos:
+            linha = ncm_linhas.get(codigo)
+            colunas['ncm.codigo'].append(codigo)
+            colunas['ncm.descricao_oficial'].append(linha[1] if linha else None)
+            colunas['ncm.descricao_curta'].append(linha[2] if linha else None)
+            colunas['ncm.nivel'].append(linha[3] if linha and linha[3] is not None else -1)
+            colunas['ncm.codigo_pai'].append(linha[4] if linha else None)
+            colunas['ncm.na_hierarquia'].append(1 if linha else 0)
+            colunas['ncm.pai'].append(indice.get(linha[4], -1) if linha and linha[4] else -1)
+
+        # Adjacência direta NCM → (cest, confiança, tipo), por confiança decrescente
+        diretos: List[List[Tuple[int, float, str]]] = [[] for _ in codigos]
+        for ncm_codigo, cest_codigo, tipo_relacao, confianca in mapeamentos:
+            confianca = float(confianca) if confianca is not None else 1.0
+            diretos[indice[ncm_codigo]].append((indice_cest[cest_codigo], confianca, tipo_relacao))
+        for lista in diretos:
+            lista.sort(key=lambda item: item[1], reverse=True)
+        _adicionar_csr(colunas, 'diretos', diretos)
+
+        # Diretos + herdados do pai, sem duplicatas (maior confiança vence)
+        hierarquia = []
+        for i, lista in enumerate(diretos):
+            candidatos = list(lista)
+            pai = colunas['ncm.pai'][i]
+            if colunas['ncm.na_hierarquia'][i] and pai >= 0:
+                candidatos.extend(
+                    (cest, confianca * FATOR_CONFIANCA_HERDADO, 'HERDADO')
+                    for cest, confianca, _ in diretos[pai]
+                )
+            unicos: Dict[int, Tuple[int, float, str]] = {}
+            for item in candidatos:
+                atual = unicos.get(item[0])
+                if atual is None or item[1] > atual[1]:
+                    unicos[item[0]] = item
+            hierarquia.append(sorted(unicos.values(), key=lambda item: item[1], reverse=True))
+        _adicionar_csr(colunas, 'hierarquia', hierarquia)
+
+        # Exemplos por NCM: qualidade desc, verificados primeiro (NULLs por último)
+        por_ncm: List[List[Tuple]] = [[] for _ in codigos]
+        for linha in exemplos:
+            por_ncm[indice[linha[0]]].append(tuple(linha[1:]))
+        colunas['exemplos.offsets'].append(0)
+        for lista in por_ncm:
+            lista.sort(key=lambda e: (e[-2] is not None, e[-2] or 0.0, e[-1] is not None, bool(e[-1])), reverse=True)
+            for exemplo in lista:
+                for campo, valor in zip(EXEMPLO_CAMPOS[:-2], exemplo):
+                    colunas[f'exemplos.{campo}'].append(valor)
+                qualidade, verificado = exemplo[-2], exemplo[-1]
+                colunas['exemplos.qualidade_classificacao'].append(float('nan') if qualidade is None else float(qualidade))
+                colunas['exemplos.verificado_humano'].append(-1 if verificado is None else int(bool(verificado)))
+            colunas['exemplos.offsets'].append(len(colunas['exemplos.gtin']))
+
+        colunas['meta'] = [len(ncm_linhas), len(mapeamentos), -1]
+        for nome, tipo in COLUNAS_GRAFO.items():
+            colunas[nome] = array(tipo, colunas[nome]) if tipo in ('i', 'd') else tuple(colunas[nome])
+        return cls(colunas)
+
+    @classmethod
+    def from_sqlite(cls, db_path) -> "FiscalKnowledgeGraph":
+        """Carrega o grafo a partir do knowledge_base.sqlite (somente leitura)."""
+        conn = conectar_sqlite(db_path, PERFIL_LEITURA, somente_leitura=True)
+        try:
+            ncms = conn.execute("""
+                SELECT codigo_ncm, descricao_oficial, descricao_curta, nivel_hierarquico, codigo_pai
+                FROM ncm_hierarchy WHERE ativo = 1
+            """).fetchall()
+            cests = conn.execute("""
+                SELECT codigo_cest, descricao_cest, descricao_resumida, categoria_produto
+                FROM cest_categories WHERE ativo = 1
+            """).fetchall()
+            mapeamentos = conn.execute("""
+                SELECT ncm_codigo, cest_codigo, tipo_relacao, confianca_mapeamento
+                FROM ncm_cest_mapping WHERE ativo = 1 ORDER BY id
+            """).fetchall()
+            exemplos = conn.execute(f"""
+                SELECT ncm_codigo, {', '.join(EXEMPLO_CAMPOS)}
+                FROM produtos_exemplos WHERE ativo = 1 ORDER BY id
+            """).fetchall()
+        finally:
+            conn.close()
+
+        grafo = cls.from_rows(ncms, cests, mapeamentos, exemplos)
+        logger.info(
+            f"Grafo fiscal carregado do SQLite: {len(ncms)} NCMs, {len(cests)} CESTs, "
+            f"{grafo._total_mapeamentos} mapeamentos, {len(exemplos)} exemplos"
+        )
+        return grafo
+
+    @classmethod
+    def from_snapshot(cls, path) -> "FiscalKnowledgeGraph":
+        """
+        Abre o snapshot via mmap. Nenhuma coluna é desserializada na carga;
+        os valores são lidos do arquivo mapeado a cada consulta.
+
+        Raises:
+            SnapshotError: snapshot ausente, corrompido ou de outra versão.
+        """
+        snapshot = Snapshot(path)
+        colunas = {nome: snapshot.coluna(nome) for nome in COLUNAS_GRAFO}
+        return cls(colunas, checksum=snapshot.checksum)
+
+    def salvar_snapshot(self, path, max_exemplos: int = SNAPSHOT_MAX_EXEMPLOS) -> str:
+        """Grava o grafo como snapshot, mantendo os max_exemplos melhores por NCM. Retorna o checksum."""
+        c = self._c
+        colunas = {nome: list(c[nome]) for nome in COLUNAS_GRAFO if not nome.startswith('exemplos.')}
+
+        campos_exemplo = [nome for nome in COLUNAS_GRAFO if nome.startswith('exemplos.') and nome != 'exemplos.offsets']
+        exemplos = {nome: [] for nome in campos_exemplo}
+        offsets = [0]
+        for i in range(len(c['ncm.codigo'])):
+            inicio = c['exemplos.offsets'][i]
+            fim = min(c['exemplos.offsets'][i + 1], inicio + max_exemplos)
+            for nome in campos_exemplo:
+                exemplos[nome].extend(c[nome][k] for k in range(inicio, fim))
+            offsets.append(len(exemplos['exemplos.gtin']))
+        colunas.update(exemplos)
+        colunas['exemplos.offsets'] = offsets
+
+        limite = max_exemplos if self.limite_exemplos is None else min(max_exemplos, self.limite_exemplos)
+        colunas['meta'] = [self._total_ncms, self._total_mapeamentos, limite]
+
+        checksum = escrever_snapshot(path, {nome: (COLUNAS_GRAFO[nome], valores) for nome, valores in colunas.items()})
+        logger.info(f"Snapshot do grafo fiscal gravado em {path} (checksum {checksum[:12]})")
+        return checksum
+
+    # === CONSULTAS ===
+
+    def _indice_ncm(self, codigo_ncm: str) -> Optional[int]:
+        return _posicao(self._c['ncm.codigo'], codigo_ncm)
+
+    def _ncm_dict(self, i: int) -> Dict:
+        c = self._c
+        nivel = c['ncm.nivel'][i]
+        return {
+            'codigo_ncm': c['ncm.codigo'][i],
+            'descricao_oficial': c['ncm.descricao_oficial'][i],
+            'descricao_curta': c['ncm.descricao_curta'][i],
+            'nivel_hierarquico': nivel if nivel >= 0 else None,
+            'codigo_pai': c['ncm.codigo_pai'][i],
+        }
+
+    def _cest_dict(self, i: int) -> Dict:
+        c = self._c
+        return {
+            'codigo_cest': c['cest.codigo'][i],
+            'descricao_cest': c['cest.descricao'][i],
+            'descricao_resumida': c['cest.resumida'][i],
+            'categoria_produto': c['cest.categoria'][i],
+        }
+
+    def ncm(self, codigo_ncm: str) -> Optional[Dict]:
+        i = self._indice_ncm(codigo_ncm)
+        if i is None or not self._c['ncm.na_hierarquia'][i]:
+            return None
+        return self._ncm_dict(i)
+
+    def cest(self, codigo_cest: str) -> Optional[Dict]:
+        i = _posicao(self._c['cest.codigo'], codigo_cest)
+        return self._cest_dict(i) if i is not None else None
+
+    def _cests_de(self, prefixo: str, codigo_ncm: str) -> List[Dict]:
+        i = self._indice_ncm(codigo_ncm)
+        if i is None:
+            return []
+        c = self._c
+        offsets, cests = c[f'{prefixo}.offsets'], c[f'{prefixo}.cest']
+        confiancas, tipos = c[f'{prefixo}.confianca'], c[f'{prefixo}.tipo']
+        resultado = []
+        for k in range(offsets[i], offsets[i + 1]):
+            registro = self._cest_dict(cests[k])
+            registro['tipo_relacao'] = tipos[k]
+            registro['confianca'] = confiancas[k]
+            resultado.append(registro)
+        return resultado
+
+    def cests_diretos(self, codigo_ncm: str) -> List[Dict]:
+        """CESTs mapeados diretamente ao NCM, por confiança decrescente."""
+        return self._cests_de('diretos', codigo_ncm)
+
+    def cests_hierarquia(self, codigo_ncm: str) -> List[Dict]:
+        """CESTs diretos e herdados do NCM pai (confiança × 0,8), sem duplicatas."""
+        return self._cests_de('hierarquia', codigo_ncm)
+
+    def cobre_exemplos(self, limite: int) -> bool:
+        """Indica se o grafo guarda exemplos suficientes para atender o limite."""
+        return self.limite_exemplos is None or limite <= self.limite_exemplos
+
+    def exemplos(self, codigo_ncm: str, limite: int = 10) -> List[Dict]:
+        i = self._indice_ncm(codigo_ncm)
+        if i is None:
+            return []
+        c = self._c
+        inicio = c['exemplos.offsets'][i]
+        fim = min(c['exemplos.offsets'][i + 1], inicio + max(limite, 0))
+        resultado = []
+        for k in range(inicio, fim):
+            exemplo = {campo: c[f'exemplos.{campo}'][k] for campo in EXEMPLO_CAMPOS[:-2]}
+            qualidade = c['exemplos.qualidade_classificacao'][k]
+            verificado = c['exemplos.verificado_humano'][k]
+            exemplo['qualidade_classificacao'] = None if math.isnan(qualidade) else qualidade
+            exemplo['verificado_humano'] = None if verificado < 0 else bool(verificado)
+            resultado.append(exemplo)
+        return resultado
+
+    def ncms_com_prefixo(self, prefixo: str) -> List[Dict]:
+        """NCMs da hierarquia cujo código começa com o prefixo, em ordem de código."""
+        codigos = self._c['ncm.codigo']
+        inicio = bisect_left(codigos, prefixo)
+        fim = bisect_left(codigos, prefixo + '\uffff', inicio)
+        na_hierarquia = self._c['ncm.na_hierarquia']
+        return [self._ncm_dict(i) for i in range(inicio, fim) if na_hierarquia[i]]
+
+    def ancestrais(self, codigo_ncm: str) -> List[str]:
+        """Códigos dos NCMs ancestrais seguindo os ponteiros de pai (do mais próximo ao mais geral)."""
+        i = self._indice_ncm(codigo_ncm)
+        pais = self._c['ncm.pai']
+        caminho = []
+        visitados = set()
+        while i is not None and i >= 0 and i not in visitados:
+            visitados.add(i)
+            i = pais[i]
+            if i >= 0:
+                caminho.append(self._c['ncm.codigo'][i])
+        return caminho
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            'total_ncms': self._total_ncms,
+            'total_cests': len(self._c['cest.codigo']),
+            'total_mapeamentos': self._total_mapeamentos,
+            'total_exemplos': len(self._c['exemplos.gtin']),
+        }
@@ -0,0 +1,171 @@
+"""
+Snapshot Binário da Base de Conhecimento
+Formato colunar versionado, lido via mmap sem desserialização prévia
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Sequence, Tuple, Optional
+
+# Layout do arquivo (little-endian):
+#   cabeçalho: magic, versão, checksum sha256 (hex), número de seções
+#   diretório: nome, tipo e posição de cada seção
+#   dados:     seções alinhadas em 8 bytes
+SNAPSHOT_MAGIC = b"FKGSNAP\x00"
+SNAPSHOT_VERSAO = 1
+_CABECALHO = struct.Struct("<8sI64sI")
+_SECAO = struct.Struct("<48scQQ")
+_TAMANHO_NOME = 48
+_ALINHAMENTO = 8
+
+# Tipos de coluna: 'i' int32, 'd' float64, 's' texto UTF-8 opcional
+TIPOS_COLUNA = ("i", "d", "s")
+
+
+class SnapshotError(Exception):
+    """Snapshot ausente, corrompido ou de versão incompatível."""
+
+
+def _secoes_da_coluna(nome: str, tipo: str, valores: Sequence) -> list:
+    if tipo in ("i", "d"):
+        return [(nome, tipo, array(tipo, valores).tobytes())]
+
+    # Texto: offsets no blob + marcador de nulos + blob UTF-8
+    offsets = array("i", [0])
+    nulos = bytearray()
+    blob = bytearray()
+    for valor in valores:
+        nulos.append(valor is None)
+        if valor is not None:
+            blob += str(valor).encode("utf-8")
+        offsets.append(len(blob))
+    return [
+        (f"{nome}.off", "i", offsets.tobytes()),
+        (f"{nome}.nul", "b", bytes(nulos)),
+        (f"{nome}.txt", "b", bytes(blob)),
+    ]
+
+
+def escrever_snapshot(path, colunas: Dict[str, Tuple[str, Sequence]]) -> str:
+    """
+    Grava as colunas no arquivo de forma atômica (arquivo temporário + rename).
+
+    Args:
+        path: Caminho do snapshot
+        colunas: nome -> (tipo, valores), tipo em TIPOS_COLUNA
+
+    Returns:
+        Checksum sha256 do conteúdo, também gravado no cabeçalho.
+    """
+    if sys.byteorder != "little":
+        raise SnapshotError("Snapshot suportado apenas em plataformas little-endian")
+
+    secoes = []
+    for nome, (tipo, valores) in colunas.items():
+        if tipo not in TIPOS_COLUNA:
+            raise ValueError(f"Tipo de coluna inválido para {nome}: {tipo}")
+        secoes.extend(_secoes_da_coluna(nome, tipo, valores))
+
+    digest = hashlib.sha256()
+    for nome, tipo, dados in secoes:
+        digest.update(nome.encode("ascii"))
+        digest.update(dados)
+    checksum = digest.hexdigest()
+
+    posicao = _CABECALHO.size + _SECAO.size * len(secoes)
+    diretorio = []
+    for nome, tipo, dados in secoes:
+        if len(nome.encode("ascii")) > _TAMANHO_NOME:
+            raise ValueError(f"Nome de seção excede {_TAMANHO_NOME} bytes: {nome}")
+        posicao += -posicao % _ALINHAMENTO
+        diretorio.append(_SECAO.pack(nome.encode("ascii"), tipo.encode("ascii"), posicao, len(dados)))
+        posicao += len(dados)
+
+    path = Path(path)
+    temporario = path.with_name(path.name + ".tmp")
+    with open(temporario, "wb") as f:
+        f.write(_CABECALHO.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSAO, checksum.encode("ascii"), len(secoes)))
+        f.write(b"".join(diretorio))
+        for nome, tipo, dados in secoes:
+            f.write(b"\x00" * (-f.tell() % _ALINHAMENTO))
+            f.write(dados)
+    os.replace(temporario, path)
+    return checksum
+
+
+def ler_checksum(path) -> Optional[str]:
+    """Lê apenas o checksum do cabeçalho (None se o arquivo não for um snapshot válido)."""
+    try:
+        with open(path, "rb") as f:
+            magic, versao, checksum, _ = _CABECALHO.unpack(f.read(_CABECALHO.size))
+    except (OSError, struct.error):
+        return None
+    if magic != SNAPSHOT_MAGIC or versao != SNAPSHOT_VERSAO:
+        return None
+    return checksum.decode("ascii")
+
+
+class _ColunaTexto:
+    """Coluna de texto decodificada sob demanda a partir do mmap."""
+
+    __slots__ = ("_offsets", "_nulos", "_blob")
+
+    def __init__(self, offsets, nulos, blob):
+        self._offsets = offsets
+        self._nulos = nulos
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._nulos)
+
+    def __getitem__(self, i: int):
+        if self._nulos[i]:
+            return None
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+
+class Snapshot:
+    """Snapshot mapeado em memória; as colunas são views sobre o arquivo."""
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise SnapshotError("Snapshot suportado apenas em plataformas little-endian")
+        try:
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Não foi possível abrir o snapshot {path}: {e}")
+
+        self._view = memoryview(self._mmap)
+        try:
+            magic, versao, checksum, total = _CABECALHO.unpack_from(self._view, 0)
+        except struct.error:
+            raise SnapshotError(f"Snapshot truncado: {path}")
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"Arquivo não é um snapshot da base de conhecimento: {path}")
+        if versao != SNAPSHOT_VERSAO:
+            raise SnapshotError(f"Versão de snapshot {versao} incompatível (esperada {SNAPSHOT_VERSAO})")
+
+        self.checksum = checksum.decode("ascii")
+        self._secoes: Dict[str, Tuple[str, int, int]] = {}
+        for k in range(total):
+            nome, tipo, offset, tamanho = _SECAO.unpack_from(self._view, _CABECALHO.size + k * _SECAO.size)
+            nome = nome.rstrip(b"\x00").decode("ascii")
+            if offset + tamanho > len(self._view):
+                raise SnapshotError(f"Snapshot truncado na seção {nome}")
+            self._secoes[nome] = (tipo.decode("ascii"), offset, tamanho)
+
+    def coluna(self, nome: str):
+        """Retorna a coluna como memoryview tipado (números) ou leitor de texto."""
+        if nome in self._secoes:
+            tipo, offset, tamanho = self._secoes[nome]
+            view = self._view[offset:offset + tamanho]
+            return view.cast(tipo) if tipo in ("i", "d") else view
+        if f"{nome}.off" in self._secoes:
+            return _ColunaTexto(self.coluna(f"{nome}.off"), self.coluna(f"{nome}.nul"), self.coluna(f"{nome}.txt"))
+        raise SnapshotError(f"Coluna ausente no snapshot: {nome}")
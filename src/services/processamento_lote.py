@@ -0,0 +1,537 @@
+"""
+Motor de Processamento em Lote
+Workers em processos separados consomem a fila durável (sessoes_processamento):
+classificação em blocos pelo HybridRouter com prioridade de lote, checkpoint
+por bloco, retomada após queda do worker, cancelamento e limite de concorrência.
+Eventos de progresso dos workers chegam ao barramento do supervisor por uma
+multiprocessing.Queue
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+
+# Adicionar src ao path para imports absolutos (execução como script)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import Config
+from database.fila_processamento import (
+    STATUS_CANCELADO, STATUS_CONCLUIDO, STATUS_ERRO, SessaoPerdidaError, atualizar_total_itens,
+    cancelamento_solicitado, concluir_bloco, criar_sessao, devolver_sessao, finalizar_sessao,
+    listar_sessoes, obter_status_sessao, proximo_bloco, recuperar_sessoes_orfas, registrar_heartbeat,
+    reivindicar_sessao, retomar_sessao, solicitar_cancelamento
+)
+from database.unified_sqlite_models import ClassificacaoRevisao
+from services.eventos_progresso import BarramentoEventos, EVENTO_BLOCO, EVENTO_SESSAO, contexto_progresso
+from services.unified_sqlite_service import UnifiedSQLiteService
+
+logger = logging.getLogger(__name__)
+
+# Tipos de sessão
+TIPO_CLASSIFICACAO = "classificacao"
+TIPO_SINCRONIZACAO = "sincronizacao"
+
+# NCM devolvido pelo HybridRouter quando o produto não foi classificado
+NCM_NAO_CLASSIFICADO = "00000000"
+
+Classificador = Callable[[List[Dict[str, Any]], Optional[str]], List[Dict[str, Any]]]
+CarregadorProdutos = Callable[[Optional[int]], List[Dict[str, Any]]]
+PublicadorEventos = Callable[[str, Dict[str, Any]], None]
+
+# Campos do status da sessão repassados nos eventos de progresso
+CAMPOS_PROGRESSO = (
+    'status', 'progresso', 'mensagem', 'total_itens', 'itens_processados', 'itens_erro',
+    'total_blocos', 'blocos_concluidos', 'itens_por_minuto', 'eta_segundos'
+)
+
+
+def evento_progresso(status: Dict[str, Any], tipo: str = EVENTO_SESSAO) -> Dict[str, Any]:
+    """Evento com os contadores de `status` (obter_status_sessao)."""
+    return {'tipo': tipo, **{campo: status.get(campo) for campo in CAMPOS_PROGRESSO}}
+
+
+# =====================
+# FUNÇÕES PADRÃO DOS WORKERS
+# =====================
+# Funções de módulo (serializáveis para o processo filho); o HybridRouter é
+# criado uma vez por processo worker, na primeira sessão de classificação.
+# Cada worker tem seu próprio agendador LLM; os limites globais e a reserva
+# da classe interativa valem entre processos pelos leases de llm_slots
+# (LLM_SHARED_SLOTS_DB)
+
+_router = None
+
+
+def classificar_com_hybrid_router(produtos: List[Dict[str, Any]], empresa_id: Optional[str]) -> List[Dict[str, Any]]:
+    """Classifica um bloco pelo HybridRouter com prioridade de lote no agendador LLM."""
+    global _router
+    from llm.request_scheduler import PRIORIDADE_LOTE
+    if _router is None:
+        from orchestrator.hybrid_router import HybridRouter
+        _router = HybridRouter()
+    # IDs de grupo são por chamada: nada do bloco anterior pode ser propagado
+    _router.classification_cache.clear()
+    with _router.contexto_requisicao_llm(PRIORIDADE_LOTE, empresa_id):
+        return _router.classify_products(produtos)
+
+
+def carregar_produtos_externos(limite: Optional[int]) -> List[Dict[str, Any]]:
+    """Produtos do banco da empresa (PostgreSQL, com fallback do DataLoader)."""
+    from ingestion.data_loader import DataLoader
+    return DataLoader().load_produtos_from_db(limit=limite).to_dict('records')
+
+
+# =====================
+# WORKER
+# =====================
+
+class ProcessadorLote:
+    """Executa sessões da fila, uma por vez, no processo atual"""
+
+    def __init__(self, db_path: str, worker_id: Optional[str] = None,
+                 classificar: Optional[Classificador] = None,
+                 carregar_produtos: Optional[CarregadorProdutos] = None,
+                 config: Optional[Config] = None,
+                 publicar_evento: Optional[PublicadorEventos] = None):
+        config = config or Config()
+        self.service = UnifiedSQLiteService(db_path)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.classificar = classificar or classificar_com_hybrid_router
+        self.carregar_produtos = carregar_produtos or carregar_produtos_externos
+        self.publicar_evento = publicar_evento
+        self.max_por_empresa = getattr(config, 'BATCH_JOB_MAX_PER_EMPRESA', 1)
+        self.segundos_orfa = getattr(config, 'BATCH_JOB_STALE_SECONDS', 300)
+        self.max_tentativas = getattr(config, 'BATCH_JOB_MAX_ATTEMPTS', 3)
+        self.intervalo_fila = getattr(config, 'BATCH_JOB_POLL_SECONDS', 2.0)
+        self.intervalo_heartbeat = max(1.0, self.segundos_orfa / 3)
+
+    def _publicar(self, sessao_id: str, evento: Dict[str, Any]):
+        if self.publicar_evento is None:
+            return
+        try:
+            self.publicar_evento(sessao_id, evento)
+        except Exception as e:
+            logger.debug(f"Evento da sessão {sessao_id} descartado: {e}")
+
+    def _publicar_status(self, sessao_id: str, tipo: str = EVENTO_SESSAO):
+        if self.publicar_evento is None:
+            return
+        with self.service.engine.connect() as conn:
+            status = obter_status_sessao(conn, sessao_id)
+        if status:
+            self._publicar(sessao_id, evento_progresso(status, tipo))
+
+    def recuperar_orfas(self) -> int:
+        """Devolve à fila as sessões cujo worker parou de dar sinal."""
+        with self.service.engine.begin() as conn:
+            return recuperar_sessoes_orfas(
+                conn, datetime.now() - timedelta(seconds=self.segundos_orfa), self.max_tentativas
+            )
+
+    def executar(self, parar: threading.Event):
+        """Laço do worker: reivindica e executa sessões até `parar`."""
+        logger.info(f"🔧 Worker de processamento {self.worker_id} iniciado")
+        proxima_recuperacao = 0.0
+        while not parar.is_set():
+            if time.monotonic() >= proxima_recuperacao:
+                try:
+                    self.recuperar_orfas()
+                except Exception as e:
+                    logger.warning(f"Erro ao recuperar sessões órfãs: {e}")
+                proxima_recuperacao = time.monotonic() + self.intervalo_heartbeat
+            try:
+                sessao_id = self.executar_proxima(parar)
+            except Exception as e:
+                logger.error(f"❌ Erro no worker {self.worker_id}: {e}")
+                sessao_id = None
+            if sessao_id is None:
+                parar.wait(self.intervalo_fila)
+        logger.info(f"🔧 Worker de processamento {self.worker_id} encerrado")
+
+    def executar_proxima(self, parar: Optional[threading.Event] = None) -> Optional[str]:
+        """Reivindica a próxima sessão pendente e a executa; None se a fila está vazia."""
+        with self.service.engine.begin() as conn:
+            sessao = reivindicar_sessao(conn, self.worker_id, self.max_por_empresa)
+        if sessao is None:
+            return None
+        self._executar_sessao(sessao, parar)
+        return sessao['sessao_id']
+
+    def _executar_sessao(self, sessao: Dict[str, Any], parar: Optional[threading.Event]):
+        sessao_id = sessao['sessao_id']
+        logger.info(f"▶️ Sessão {sessao_id} ({sessao['tipo']}) no worker {self.worker_id}")
+        try:
+            self._publicar_status(sessao_id)
+            with self._manter_heartbeat(sessao_id):
+                while True:
+                    with self.service.engine.connect() as conn:
+                        if cancelamento_solicitado(conn, sessao_id):
+                            self._finalizar(sessao_id, STATUS_CANCELADO, "Cancelada pelo usuário")
+                            return
+                        bloco = proximo_bloco(conn, sessao_id)
+                    if bloco is None:
+                        break
+                    if parar is not None and parar.is_set():
+                        with self.service.engine.begin() as conn:
+                            devolver_sessao(conn, sessao_id, self.worker_id)
+                        self._publicar_status(sessao_id)
+                        return
+                    self._executar_bloco(sessao, bloco)
+                    self._publicar_status(sessao_id, EVENTO_BLOCO)
+
+            with self.service.engine.connect() as conn:
+                status = obter_status_sessao(conn, sessao_id)
+            self._finalizar(sessao_id, STATUS_CONCLUIDO,
+                            f"{status['itens_processados']} itens processados, {status['itens_erro']} com erro")
+            logger.info(f"✅ Sessão {sessao_id} concluída")
+        except SessaoPerdidaError as e:
+            logger.warning(f"⚠️ {e}")
+        except Exception as e:
+            logger.error(f"❌ Erro na sessão {sessao_id}: {e}")
+            self._finalizar(sessao_id, STATUS_ERRO, f"Erro: {e}")
+
+    def _finalizar(self, sessao_id: str, status: str, mensagem: str):
+        with self.service.engine.begin() as conn:
+            finalizar_sessao(conn, sessao_id, self.worker_id, status, mensagem)
+        self._publicar_status(sessao_id)
+
+    @contextmanager
+    def _manter_heartbeat(self, sessao_id: str):
+        """Renova a posse da sessão enquanto um bloco (chamadas LLM) demora."""
+        parar = threading.Event()
+
+        def renovar():
+            while not parar.wait(self.intervalo_heartbeat):
+                try:
+                    with self.service.engine.begin() as conn:
+                        registrar_heartbeat(conn, sessao_id, self.worker_id)
+                except Exception as e:
+                    logger.warning(f"Erro no heartbeat da sessão {sessao_id}: {e}")
+
+        thread = threading.Thread(target=renovar, name=f"heartbeat-{sessao_id[:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            parar.set()
+            thread.join()
+
+    def _executar_bloco(self, sessao: Dict[str, Any], bloco: Dict[str, Any]):
+        if sessao['tipo'] == TIPO_SINCRONIZACAO:
+            self._executar_sincronizacao(sessao, bloco)
+        else:
+            self._executar_classificacao(sessao, bloco)
+
+    # =====================
+    # CLASSIFICAÇÃO
+    # =====================
+
+    @staticmethod
+    def _produto(classificacao: ClassificacaoRevisao) -> Dict[str, Any]:
+        return {
+            'id': classificacao.produto_id,
+            'produto_id': classificacao.produto_id,
+            'classificacao_id': classificacao.id,
+            'descricao_produto': classificacao.descricao_produto,
+            'descricao_completa': classificacao.descricao_completa,
+            'codigo_produto': classificacao.codigo_produto,
+            'codigo_barra': classificacao.codigo_barra,
+            'ncm': classificacao.ncm_original,
+            'cest': classificacao.cest_original,
+        }
+
+    def _executar_classificacao(self, sessao: Dict[str, Any], bloco: Dict[str, Any]):
+        ids = bloco['itens']
+        inicio = time.perf_counter()
+        with self.service.get_session() as session:
+            produtos = [self._produto(c) for c in session.query(ClassificacaoRevisao).filter(
+                ClassificacaoRevisao.id.in_(ids)
+            ).order_by(ClassificacaoRevisao.id).all()]
+
+        # Chamadas LLM fora de qualquer transação; etapas do HybridRouter viram eventos do bloco
+        def publicar_etapa(evento):
+            self._publicar(sessao['sessao_id'], {**evento, 'bloco': bloco['indice'] + 1,
+                                                 'total_blocos': sessao['total_blocos']})
+
+        with contexto_progresso(publicar_etapa):
+            resultados = self.classificar(produtos, sessao['empresa_id']) if produtos else []
+
+        with self.service.get_session() as session:
+            por_id = {c.id: c for c in session.query(ClassificacaoRevisao).filter(
+                ClassificacaoRevisao.id.in_([p['classificacao_id'] for p in produtos])
+            ).all()}
+            processados, erros = 0, len(ids) - len(produtos)
+            for produto, resultado in zip(produtos, resultados):
+                classificacao = por_id.get(produto['classificacao_id'])
+                if (classificacao is None or not resultado or resultado.get('erro')
+                        or resultado.get('ncm_classificado') in (None, '', NCM_NAO_CLASSIFICADO)):
+                    erros += 1
+                    continue
+                classificacao.ncm_sugerido = resultado.get('ncm_classificado')
+                classificacao.cest_sugerido = resultado.get('cest_classificado')
+                classificacao.confianca_sugerida = resultado.get('confianca_consolidada')
+                classificacao.justificativa_sistema = resultado.get('justificativa')
+                classificacao.dados_trace_json = {
+                    'sessao_processamento': sessao['sessao_id'],
+                    'grupo_id': resultado.get('grupo_id'),
+                    'eh_representante': resultado.get('eh_representante'),
+                    'auditoria': resultado.get('auditoria'),
+                }
+                classificacao.status_revisao = "PENDENTE_REVISAO"
+                classificacao.data_classificacao = datetime.now()
+                processados += 1
+            erros += max(len(produtos) - len(resultados), 0)
+            session.flush()
+
+            # Checkpoint na mesma transação dos resultados
+            concluir_bloco(session.connection(), sessao['sessao_id'], self.worker_id, bloco['indice'],
+                           processados, erros, int((time.perf_counter() - inicio) * 1000))
+
+    # =====================
+    # SINCRONIZAÇÃO
+    # =====================
+
+    def _executar_sincronizacao(self, sessao: Dict[str, Any], bloco: Dict[str, Any]):
+        """Insere como pendentes os produtos externos ainda sem classificação (idempotente)."""
+        parametros = json.loads(sessao.get('parametros_json') or '{}')
+        inicio = time.perf_counter()
+        produtos = self.carregar_produtos(parametros.get('limite'))
+
+        with self.service.get_session() as session:
+            existentes = {produto_id for (produto_id,) in session.query(ClassificacaoRevisao.produto_id)}
+            novos = {}
+            for produto in produtos:
+                produto_id = produto.get('produto_id')
+                if produto_id is None or produto_id in existentes or produto_id in novos:
+                    continue
+                novos[produto_id] = ClassificacaoRevisao(
+                    produto_id=produto_id,
+                    descricao_produto=produto.get('descricao_produto') or '',
+                    codigo_produto=produto.get('codigo_produto') or None,
+                    codigo_barra=produto.get('codigo_barra') or None,
+                    ncm_original=produto.get('ncm') or None,
+                    cest_original=produto.get('cest') or None,
+                    status_revisao="PENDENTE_REVISAO"
+                )
+            session.add_all(novos.values())
+            session.flush()
+
+            conn = session.connection()
+            atualizar_total_itens(conn, sessao['sessao_id'], len(produtos))
+            concluir_bloco(conn, sessao['sessao_id'], self.worker_id, bloco['indice'],
+                           len(produtos), 0, int((time.perf_counter() - inicio) * 1000))
+        logger.info(f"📥 Sincronização {sessao['sessao_id']}: {len(novos)} produtos novos de {len(produtos)}")
+
+
+def _executar_worker(db_path: str, worker_id: str, parar, classificar: Optional[Classificador],
+                     carregar_produtos: Optional[CarregadorProdutos], eventos=None):
+    """Alvo do processo worker; `eventos` é a fila de eventos para o supervisor."""
+    logging.basicConfig(level=logging.INFO)
+    publicar = (lambda topico, evento: eventos.put_nowait((topico, evento))) if eventos is not None else None
+    ProcessadorLote(db_path, worker_id, classificar, carregar_produtos,
+                    publicar_evento=publicar).executar(parar)
+
+
+# =====================
+# SUPERVISOR
+# =====================
+
+class MotorProcessamento:
+    """
+    Enfileira sessões e mantém os processos worker (limite de concorrência =
+    número de workers; por empresa, BATCH_JOB_MAX_PER_EMPRESA sessões) e
+    repassa os eventos de progresso dos workers para `barramento`
+    """
+
+    def __init__(self, service: UnifiedSQLiteService, workers: Optional[int] = None,
+                 config: Optional[Config] = None, classificar: Optional[Classificador] = None,
+                 carregar_produtos: Optional[CarregadorProdutos] = None,
+                 barramento: Optional[BarramentoEventos] = None):
+        config = config or Config()
+        self.service = service
+        self.workers = getattr(config, 'BATCH_JOB_WORKERS', 1) if workers is None else workers
+        self.tamanho_bloco = max(1, getattr(config, 'BATCH_JOB_CHUNK_SIZE', 25))
+        self.classificar = classificar
+        self.carregar_produtos = carregar_produtos
+        self._contexto = multiprocessing.get_context("spawn")
+        self._parar = self._contexto.Event()
+        self._processos: List[multiprocessing.Process] = []
+        self._lock = threading.Lock()
+        self.barramento = barramento or BarramentoEventos()
+        self._eventos = None
+        self._repasse: Optional[threading.Thread] = None
+
+    @property
+    def eventos_locais(self) -> bool:
+        """Workers deste processo publicam no barramento (False com workers externos)."""
+        return self.workers > 0
+
+    def iniciar(self):
+        """Sobe os processos worker (BATCH_JOB_WORKERS=0 deixa a fila para workers externos)."""
+        if self.workers <= 0:
+            logger.info("Workers de processamento desativados neste processo")
+            return
+        self._parar.clear()
+        self._eventos = self._contexto.Queue()
+        self._repasse = threading.Thread(target=self._repassar_eventos, name="repasse-eventos-lote", daemon=True)
+        self._repasse.start()
+        with self._lock:
+            for indice in range(self.workers):
+                self._processos.append(self._iniciar_processo(indice))
+        logger.info(f"✅ {self.workers} worker(s) de processamento em lote iniciados")
+
+    def _iniciar_processo(self, indice: int):
+        worker_id = f"{socket.gethostname()}:w{indice + 1}:{uuid.uuid4().hex[:6]}"
+        processo = self._contexto.Process(
+            target=_executar_worker,
+            args=(str(self.service.db_path), worker_id, self._parar, self.classificar, self.carregar_produtos,
+                  self._eventos),
+            name=f"processamento-lote-{indice + 1}",
+            daemon=True
+        )
+        processo.start()
+        return processo
+
+    def _repassar_eventos(self):
+        """Descarrega a fila de eventos dos workers no barramento até a parada."""
+        while True:
+            try:
+                topico, evento = self._eventos.get(timeout=0.5)
+            except queue.Empty:
+                if self._parar.is_set():
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            self.barramento.publicar(topico, evento)
+
+    def _publicar_status(self, sessao_id: str):
+        status = self.status(sessao_id)
+        if status:
+            self.barramento.publicar(sessao_id, evento_progresso(status))
+
+    def verificar_workers(self) -> int:
+        """Substitui workers que morreram (as sessões deles voltam à fila pelo heartbeat)."""
+        reiniciados = 0
+        with self._lock:
+            if self._parar.is_set():
+                return 0
+            for indice, processo in enumerate(self._processos):
+                if not processo.is_alive():
+                    logger.warning(f"⚠️ Worker {processo.name} morreu (código {processo.exitcode}); reiniciando")
+                    self._processos[indice] = self._iniciar_processo(indice)
+                    reiniciados += 1
+        return reiniciados
+
+    def parar(self, timeout: float = 30.0):
+        """Pede aos workers que devolvam as sessões após o bloco atual e aguarda."""
+        self._parar.set()
+        with self._lock:
+            for processo in self._processos:
+                processo.join(timeout)
+                if processo.is_alive():
+                    processo.terminate()
+            self._processos.clear()
+        if self._repasse is not None:
+            self._repasse.join(timeout)
+            self._repasse = None
+
+    # =====================
+    # SESSÕES
+    # =====================
+
+    def _blocos(self, itens: List[Any]) -> List[List[Any]]:
+        return [itens[i:i + self.tamanho_bloco] for i in range(0, len(itens), self.tamanho_bloco)]
+
+    def enfileirar_classificacao(self, limite_produtos: Optional[int] = None, apenas_pendentes: bool = True,
+                                 empresa_id: Any = None, classificacao_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Planeja os blocos de classificacoes_revisao e grava a sessão pendente."""
+        sessao_id = str(uuid.uuid4())
+        with self.service.engine.begin() as conn:
+            if classificacao_ids is None:
+                sql = "SELECT id FROM classificacoes_revisao"
+                if apenas_pendentes:
+                    sql += " WHERE status_revisao = 'PENDENTE_REVISAO'"
+                sql += " ORDER BY id"
+                parametros = {}
+                if limite_produtos:
+                    sql += " LIMIT :limite"
+                    parametros["limite"] = limite_produtos
+                classificacao_ids = [linha[0] for linha in conn.execute(text(sql), parametros).fetchall()]
+            blocos = self._blocos(classificacao_ids)
+            criar_sessao(conn, sessao_id, TIPO_CLASSIFICACAO, blocos, parametros={
+                'limite_produtos': limite_produtos, 'apenas_pendentes': apenas_pendentes,
+                'tamanho_bloco': self.tamanho_bloco
+            }, empresa_id=empresa_id)
+        self._publicar_status(sessao_id)
+        self.verificar_workers()
+        return {'sessao_id': sessao_id, 'total_itens': len(classificacao_ids), 'total_blocos': len(blocos)}
+
+    def enfileirar_sincronizacao(self, limite: Optional[int] = None) -> Dict[str, Any]:
+        """Sessão de um bloco: carga dos produtos externos e inserção dos novos."""
+        sessao_id = str(uuid.uuid4())
+        with self.service.engine.begin() as conn:
+            criar_sessao(conn, sessao_id, TIPO_SINCRONIZACAO, [[]], parametros={'limite': limite})
+        self._publicar_status(sessao_id)
+        self.verificar_workers()
+        return {'sessao_id': sessao_id, 'total_itens': None, 'total_blocos': 1}
+
+    def status(self, sessao_id: str) -> Optional[Dict[str, Any]]:
+        with self.service.engine.connect() as conn:
+            return obter_status_sessao(conn, sessao_id)
+
+    def listar(self, limite: int = 20, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self.service.engine.connect() as conn:
+            return listar_sessoes(conn, limite, status)
+
+    def cancelar(self, sessao_id: str) -> Optional[str]:
+        with self.service.engine.begin() as conn:
+            status = solicitar_cancelamento(conn, sessao_id)
+        if status is not None:
+            self._publicar_status(sessao_id)
+        return status
+
+    def retomar(self, sessao_id: str) -> bool:
+        with self.service.engine.begin() as conn:
+            retomada = retomar_sessao(conn, sessao_id)
+        if retomada:
+            self._publicar_status(sessao_id)
+            self.verificar_workers()
+        return retomada
+
+
+def main():
+    """Workers avulsos (API com BATCH_JOB_WORKERS=0)."""
+    parser = argparse.ArgumentParser(description="Workers da fila de processamento em lote")
+    parser.add_argument("--db", default=str(Path("data") / "unified_rag_system.db"), help="Banco SQLite unificado")
+    parser.add_argument("--workers", type=int, default=None, help="Processos worker (padrão: BATCH_JOB_WORKERS)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    motor = MotorProcessamento(UnifiedSQLiteService(args.db), workers=args.workers or None)
+    motor.workers = max(motor.workers, 1)
+    motor.iniciar()
+    try:
+        while True:
+            time.sleep(10)
+            motor.verificar_workers()
+    except KeyboardInterrupt:
+        motor.parar()
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,7 @@ from database.unified_sqlite_models import (
 )
 from sqlalchemy import create_engine, text, func, and_, or_
 from sqlalchemy.orm import sessionmaker
+from database.sqlite_connection import criar_engine_sqlite, PERFIL_LEITURA
 from sentence_transformers import SentenceTransformer
 
 logger = logging.getLogger(__name__)
@@ -31,7 +32,7 @@ class UnifiedRAGService:
     
     def __init__(self, db_path: str = "unified_rag_system.db"):
         self.db_path = db_path
-        self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
+        self.engine = criar_engine_sqlite(db_path, PERFIL_LEITURA, echo=False)
         self.Session = sessionmaker(bind=self.engine)
         
         # Modelo de embeddings (carregado sob demanda)
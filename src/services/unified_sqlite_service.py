@@ -8,13 +8,29 @@ import sys
 import json
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Union, Tuple
+from typing import Dict, List, Optional, Any, Union, Tuple, Iterator
 from pathlib import Path
 import sqlite3
 from sqlalchemy import create_engine, func, text, and_, or_, desc
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker, Session, load_only
 from contextlib import contextmanager
 
+from database.sqlite_connection import criar_engine_sqlite, PERFIL_OLTP
+from database.payload_codec import (
+    PayloadCodec, carregar_codec, garantir_esquema_payload, payload_explicacao
+)
+from database.ordenacao_revisao import garantir_ordenacao_revisao
+from database.estatisticas_materializadas import (
+    garantir_estatisticas_materializadas, reconciliar_estatisticas, ler_contadores, somar_serie,
+    ler_desempenho_agentes
+)
+from database.paginacao_cursor import (
+    CacheTotais, assinatura_filtros, codificar_cursor, decodificar_cursor, garantir_indices_paginacao,
+    paginar_keyset, total_materializado
+)
+from database.fila_processamento import garantir_fila_processamento
+from config import Config
+
 # Configurar path
 sys.path.append('src')
 
@@ -37,17 +53,41 @@ class UnifiedSQLiteService:
             db_path = Path("data") / "unified_rag_system.db"
         
         self.db_path = Path(db_path)
-        self.engine = create_engine(
-            f"sqlite:///{self.db_path}",
+        self.engine = criar_engine_sqlite(
+            self.db_path,
+            PERFIL_OLTP,
             connect_args={"check_same_thread": False},
             echo=False
         )
         self.SessionLocal = sessionmaker(bind=self.engine)
+        self._codec: Optional[PayloadCodec] = None
+        self._cache_totais = CacheTotais(getattr(Config(), 'PAGINATION_TOTALS_TTL_SECONDS', 300))
         
         # Verificar se banco existe
         if not self.db_path.exists():
             logger.warning(f"Banco SQLite não encontrado: {self.db_path}")
             self._create_database()
+        
+        # Bancos anteriores ao payload compactado de explicações, aos índices
+        # das listagens e à fila de processamento em lote
+        with self.engine.begin() as conn:
+            garantir_esquema_payload(conn)
+            self._garantir_indices(conn)
+            garantir_ordenacao_revisao(conn)
+            garantir_indices_paginacao(conn)
+            garantir_fila_processamento(conn)
+            garantir_estatisticas_materializadas(conn)
+    
+    def _garantir_indices(self, conn):
+        """Índices adicionados depois da criação de bancos existentes"""
+        tabelas = {linha[0] for linha in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+        ).fetchall()}
+        if "classificacoes_revisao" in tabelas:
+            # Paginação por chave (status, id) da exportação
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS idx_classificacao_status_id ON classificacoes_revisao(status_revisao, id)"
+            )
     
     def _create_database(self):
         """Cria banco de dados se não existir"""
@@ -233,13 +273,64 @@ class UnifiedSQLiteService:
             return False
     
     def buscar_classificacoes_pendentes(self, limite: int = 50, offset: int = 0) -> List[Dict]:
-        """Busca classificações pendentes de revisão"""
+        """Busca classificações pendentes de revisão (ver pagina_classificacoes)"""
+        return self.pagina_classificacoes(
+            "PENDENTE_REVISAO", limite, offset=offset, incluir_total=False
+        )["itens"]
+    
+    def pagina_classificacoes(self, status: Optional[str] = None, limite: int = 50,
+                              cursor: Optional[str] = None, offset: int = 0,
+                              busca: Optional[str] = None, classificado: Optional[bool] = None,
+                              incluir_total: bool = True) -> Dict:
+        """
+        Página de classificações por data de criação (mais recentes primeiro).
+        
+        Com `cursor` (o `proximo_cursor` da página anterior) a consulta segue o
+        índice (status, data_criacao, id) a partir da última linha: a página N
+        custa o mesmo que a primeira. `offset` só é usado sem cursor.
+        O total vem dos contadores materializados quando o filtro é só o status,
+        senão de um COUNT(*) em cache. CursorInvalidoError para cursor inválido.
+        """
+        assinatura = assinatura_filtros(
+            lista="classificacoes_criacao", status=status, busca=busca, classificado=classificado
+        )
+        posicao = decodificar_cursor(cursor, assinatura) if cursor else None
+        
         with self.get_session() as session:
-            classificacoes = session.query(ClassificacaoRevisao).filter(
-                ClassificacaoRevisao.status_revisao == "PENDENTE_REVISAO"
-            ).order_by(desc(ClassificacaoRevisao.data_criacao)).offset(offset).limit(limite).all()
+            query = session.query(ClassificacaoRevisao)
+            if status:
+                query = query.filter(ClassificacaoRevisao.status_revisao == status)
+            if busca:
+                query = query.filter(ClassificacaoRevisao.descricao_produto.like(f"%{busca}%"))
+            if classificado is not None:
+                ncm = ClassificacaoRevisao.ncm_sugerido
+                if classificado:
+                    query = query.filter(ncm.isnot(None), ncm != '',
+                                         ClassificacaoRevisao.status_revisao != "PENDENTE_REVISAO")
+                else:
+                    query = query.filter(or_(ncm.is_(None), ncm == '',
+                                             ClassificacaoRevisao.status_revisao == "PENDENTE_REVISAO"))
+            
+            total = None
+            if incluir_total:
+                if not busca and classificado is None:
+                    total = total_materializado(session.connection(), ClassificacaoRevisao.__tablename__, status)
+                if total is None:
+                    total = self._cache_totais.obter(
+                        session, ClassificacaoRevisao.__tablename__, assinatura,
+                        query.with_entities(func.count(ClassificacaoRevisao.id)).scalar
+                    )
             
-            return [self._classificacao_to_dict(c) for c in classificacoes]
+            classificacoes, proxima = paginar_keyset(
+                query, ClassificacaoRevisao.data_criacao, ClassificacaoRevisao.id,
+                limite, posicao, offset
+            )
+            
+            return {
+                'itens': [self._classificacao_to_dict(c) for c in classificacoes],
+                'proximo_cursor': codificar_cursor(proxima, assinatura) if proxima else None,
+                'total': total
+            }
     
     def buscar_classificacao_por_id(self, classificacao_id: int) -> Optional[Dict]:
         """Busca classificação por ID"""
@@ -332,27 +423,29 @@ class UnifiedSQLiteService:
     # AGENT EXPLANATIONS
     # =====================
     
+    def _obter_codec(self, session: Session) -> PayloadCodec:
+        if self._codec is None:
+            self._codec = carregar_codec(session.connection())
+        return self._codec
+    
     def salvar_explicacao_agente(self, explicacao_data: Dict) -> int:
-        """Salva explicação de um agente"""
+        """Salva explicação de um agente (campos volumosos compactados)"""
         with self.get_session() as session:
+            payload = self._obter_codec(session).codificar(payload_explicacao(explicacao_data))
             explicacao = ExplicacaoAgente(
                 produto_id=explicacao_data.get('produto_id'),
                 classificacao_id=explicacao_data.get('classificacao_id'),
                 agente_nome=explicacao_data.get('agente_nome'),
                 agente_versao=explicacao_data.get('agente_versao', '1.0'),
                 input_original=explicacao_data.get('input_original'),
-                contexto_utilizado=explicacao_data.get('contexto_utilizado'),
-                etapas_processamento=explicacao_data.get('etapas_processamento'),
                 palavras_chave_identificadas=explicacao_data.get('palavras_chave_identificadas'),
-                produtos_similares_encontrados=explicacao_data.get('produtos_similares_encontrados'),
-                resultado_agente=explicacao_data.get('resultado_agente'),
+                payload_compactado=payload,
                 explicacao_detalhada=explicacao_data.get('explicacao_detalhada'),
                 justificativa_tecnica=explicacao_data.get('justificativa_tecnica'),
                 nivel_confianca=explicacao_data.get('nivel_confianca'),
                 rag_consultado=explicacao_data.get('rag_consultado', False),
                 golden_set_utilizado=explicacao_data.get('golden_set_utilizado', False),
                 base_ncm_consultada=explicacao_data.get('base_ncm_consultada', False),
-                exemplos_utilizados=explicacao_data.get('exemplos_utilizados'),
                 tempo_processamento_ms=explicacao_data.get('tempo_processamento_ms'),
                 memoria_utilizada_mb=explicacao_data.get('memoria_utilizada_mb'),
                 tokens_llm_utilizados=explicacao_data.get('tokens_llm_utilizados'),
@@ -427,37 +520,92 @@ class UnifiedSQLiteService:
             
             return [self._classificacao_to_dict(c) for c in classificacoes]
     
-    def buscar_classificacoes_para_exportacao(self, filtros: Optional[Dict] = None, 
-                                            incluir_explicacoes: bool = True,
-                                            incluir_consultas: bool = True) -> List[Dict]:
-        """Busca classificações para exportação"""
-        with self.get_session() as session:
-            query = session.query(ClassificacaoRevisao)
-            
-            # Aplicar filtros se fornecidos
-            if filtros:
-                if 'status_revisao' in filtros:
-                    query = query.filter(ClassificacaoRevisao.status_revisao == filtros['status_revisao'])
-                if 'data_inicio' in filtros:
-                    query = query.filter(ClassificacaoRevisao.data_criacao >= filtros['data_inicio'])
-                if 'data_fim' in filtros:
-                    query = query.filter(ClassificacaoRevisao.data_criacao <= filtros['data_fim'])
-            
-            classificacoes = query.all()
-            
-            resultados = []
-            for c in classificacoes:
-                dados = self._classificacao_to_dict(c)
+    # Colunas lidas na exportação (sem os payloads volumosos)
+    _COLUNAS_EXPLICACAO_EXPORTACAO = (
+        'id', 'produto_id', 'agente_nome', 'explicacao_detalhada', 'nivel_confianca',
+        'tempo_processamento_ms', 'data_execucao'
+    )
+    _COLUNAS_CONSULTA_EXPORTACAO = (
+        'id', 'produto_id', 'agente_nome', 'tipo_consulta', 'query_original',
+        'total_resultados_encontrados', 'tempo_consulta_ms', 'consulta_bem_sucedida', 'data_consulta'
+    )
+    
+    def iterar_classificacoes_para_exportacao(self, filtros: Optional[Dict] = None,
+                                             incluir_explicacoes: bool = True,
+                                             incluir_consultas: bool = True,
+                                             tamanho_lote: int = 500) -> Iterator[List[Dict]]:
+        """
+        Percorre as classificações para exportação em lotes, com memória constante.
+        
+        Paginação por chave (id > último id do lote anterior) e, por lote, uma
+        consulta IN para explicações e outra para consultas dos produtos:
+        3 consultas por lote em vez de 2N+1 no total.
+        """
+        ultimo_id = 0
+        while True:
+            with self.get_session() as session:
+                query = session.query(ClassificacaoRevisao).filter(ClassificacaoRevisao.id > ultimo_id)
+                
+                # Aplicar filtros se fornecidos
+                if filtros:
+                    if 'status_revisao' in filtros:
+                        query = query.filter(ClassificacaoRevisao.status_revisao == filtros['status_revisao'])
+                    if 'data_inicio' in filtros:
+                        query = query.filter(ClassificacaoRevisao.data_criacao >= filtros['data_inicio'])
+                    if 'data_fim' in filtros:
+                        query = query.filter(ClassificacaoRevisao.data_criacao <= filtros['data_fim'])
+                
+                classificacoes = query.order_by(ClassificacaoRevisao.id).limit(tamanho_lote).all()
+                if not classificacoes:
+                    return
+                
+                produto_ids = list({c.produto_id for c in classificacoes})
                 
+                explicacoes_por_produto: Dict[int, List[Dict]] = {}
                 if incluir_explicacoes:
-                    dados['explicacoes'] = self.buscar_explicacoes_produto(c.produto_id)
+                    explicacoes = session.query(ExplicacaoAgente).options(
+                        load_only(*[getattr(ExplicacaoAgente, c) for c in self._COLUNAS_EXPLICACAO_EXPORTACAO])
+                    ).filter(
+                        ExplicacaoAgente.produto_id.in_(produto_ids)
+                    ).order_by(ExplicacaoAgente.data_execucao).all()
+                    for e in explicacoes:
+                        explicacoes_por_produto.setdefault(e.produto_id, []).append(self._explicacao_to_dict(e))
                 
+                consultas_por_produto: Dict[int, List[Dict]] = {}
                 if incluir_consultas:
-                    dados['consultas'] = self.buscar_consultas_produto(c.produto_id)
+                    consultas = session.query(ConsultaAgente).options(
+                        load_only(*[getattr(ConsultaAgente, c) for c in self._COLUNAS_CONSULTA_EXPORTACAO])
+                    ).filter(
+                        ConsultaAgente.produto_id.in_(produto_ids)
+                    ).order_by(ConsultaAgente.data_consulta).all()
+                    for c in consultas:
+                        consultas_por_produto.setdefault(c.produto_id, []).append(self._consulta_to_dict(c))
                 
-                resultados.append(dados)
+                lote = []
+                for c in classificacoes:
+                    dados = self._classificacao_to_dict(c)
+                    
+                    if incluir_explicacoes:
+                        dados['explicacoes'] = explicacoes_por_produto.get(c.produto_id, [])
+                    
+                    if incluir_consultas:
+                        dados['consultas'] = consultas_por_produto.get(c.produto_id, [])
+                    
+                    lote.append(dados)
+                
+                ultimo_id = classificacoes[-1].id
             
-            return resultados
+            yield lote
+    
+    def buscar_classificacoes_para_exportacao(self, filtros: Optional[Dict] = None, 
+                                            incluir_explicacoes: bool = True,
+                                            incluir_consultas: bool = True) -> List[Dict]:
+        """Busca classificações para exportação (lista completa; ver iterar_classificacoes_para_exportacao)"""
+        return [
+            dados
+            for lote in self.iterar_classificacoes_para_exportacao(filtros, incluir_explicacoes, incluir_consultas)
+            for dados in lote
+        ]
     
     def get_revision_stats(self) -> Dict:
         """Obtém estatísticas específicas de revisão"""
@@ -636,31 +784,40 @@ class UnifiedSQLiteService:
             }
     
     def get_dashboard_stats(self) -> Dict:
-        """Obtém estatísticas para o dashboard"""
-        with self.get_session() as session:
+        """
+        Obtém estatísticas para o dashboard a partir dos contadores
+        materializados (mantidos por triggers), sem varrer as tabelas
+        """
+        with self.engine.connect() as conn:
+            contadores = ler_contadores(conn)
+            
             # Estatísticas gerais
             stats = {
-                'total_ncms': session.query(NCMHierarchy).filter(NCMHierarchy.ativo == True).count(),
-                'total_cests': session.query(CestCategory).filter(CestCategory.ativo == True).count(),
-                'total_mapeamentos': session.query(NCMCestMapping).filter(NCMCestMapping.ativo == True).count(),
-                'total_exemplos': session.query(ProdutoExemplo).filter(ProdutoExemplo.ativo == True).count(),
-                'total_classificacoes': session.query(ClassificacaoRevisao).count(),
-                'classificacoes_pendentes': session.query(ClassificacaoRevisao).filter(
-                    ClassificacaoRevisao.status_revisao == 'PENDENTE_REVISAO'
-                ).count(),
-                'golden_set_entries': session.query(GoldenSetEntry).filter(GoldenSetEntry.ativo == True).count(),
-                'explicacoes_agentes': session.query(ExplicacaoAgente).count(),
-                'consultas_agentes': session.query(ConsultaAgente).count()
+                'total_ncms': contadores.get('ncm_hierarchy:ativos', 0),
+                'total_cests': contadores.get('cest_categories:ativos', 0),
+                'total_mapeamentos': contadores.get('ncm_cest_mapping:ativos', 0),
+                'total_exemplos': contadores.get('produtos_exemplos:ativos', 0),
+                'total_classificacoes': contadores.get('classificacoes_revisao', 0),
+                'classificacoes_pendentes': contadores.get('classificacoes_revisao:PENDENTE_REVISAO', 0),
+                'golden_set_entries': contadores.get('golden_set:ativos', 0),
+                'explicacoes_agentes': contadores.get('explicacoes_agentes', 0),
+                'consultas_agentes': contadores.get('consultas_agentes', 0)
             }
             
-            # Estatísticas recentes (últimos 7 dias)
+            # Estatísticas recentes (últimos 7 dias, por dia de criação)
             data_limite = datetime.now() - timedelta(days=7)
-            stats['classificacoes_recentes'] = session.query(ClassificacaoRevisao).filter(
-                ClassificacaoRevisao.data_criacao >= data_limite
-            ).count()
+            stats['classificacoes_recentes'] = somar_serie(conn, 'classificacoes_revisao:criadas', data_limite)
+            
+            # Desempenho dos agentes (últimos 30 dias)
+            stats['agentes_performance'] = ler_desempenho_agentes(conn, datetime.now() - timedelta(days=30))
             
             return stats
     
+    def reconciliar_estatisticas(self, corrigir: bool = True) -> Dict:
+        """Confere os contadores do dashboard com a varredura completa (e corrige)"""
+        with self.engine.begin() as conn:
+            return reconciliar_estatisticas(conn, corrigir=corrigir)
+    
     # =====================
     # WEB INTERFACE TRACKING
     # =====================
@@ -718,6 +875,7 @@ class UnifiedSQLiteService:
             'ncm_sugerido': classificacao.ncm_sugerido,
             'cest_sugerido': classificacao.cest_sugerido,
             'confianca_sugerida': classificacao.confianca_sugerida,
+            'justificativa_sistema': classificacao.justificativa_sistema,
             'status_revisao': classificacao.status_revisao,
             'ncm_corrigido': classificacao.ncm_corrigido,
             'cest_corrigido': classificacao.cest_corrigido,
@@ -8,6 +8,7 @@ import numpy as np
 import json
 from typing import List, Dict, Any, Optional
 from .embedder import Embedder
+from database.sqlite_connection import conectar_sqlite, PERFIL_LEITURA
 
 class FaissMetadataStore:
     def __init__(self, dimension: int = 384):
@@ -18,7 +19,7 @@ class FaissMetadataStore:
         
     def initialize_metadata_db(self, db_path: str):
         """Inicializa banco de metadados SQLite."""
-        self.metadata_db = sqlite3.connect(db_path, check_same_thread=False)
+        self.metadata_db = conectar_sqlite(db_path, PERFIL_LEITURA, check_same_thread=False)
         
         # Criar tabela de metadados
         self.metadata_db.execute("""
@@ -116,7 +117,7 @@ class FaissMetadataStore:
     
     def _connect_metadata_db(self, db_path: str):
         """Conecta à base de metadados existente."""
-        self.metadata_db = sqlite3.connect(db_path)
+        self.metadata_db = conectar_sqlite(db_path, PERFIL_LEITURA)
         print(f"✅ Base de metadados conectada: {db_path}")
     
     def get_stats(self):
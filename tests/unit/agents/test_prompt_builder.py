@@ -0,0 +1,86 @@
+"""
+Testes unitários para a montagem compacta de prompts dos agentes
+"""
+import json
+from pathlib import Path
+import sys
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from agents.prompt_builder import PromptBuilder, compact_json
+from llm.tokenizer import TokenCounter
+
+
+class TestTokenCounter:
+    """Testes para a contagem de tokens"""
+
+    def test_texto_vazio(self):
+        assert TokenCounter().count("") == 0
+        assert TokenCounter().count(None) == 0
+
+    def test_estimativa_mais_precisa_que_caracteres(self):
+        """Números e pontuação pesam mais que len // 4 sugere"""
+        texto = '{"ncm":"30049069","cest":"13.001.00"}'
+        assert TokenCounter._estimate(texto) > len(texto) // 4
+
+
+class TestPromptBuilder:
+    """Testes para seleção de campos e orçamento de tokens"""
+
+    def setup_method(self):
+        self.builder = PromptBuilder("ncm", token_budget=400)
+        self.produto = {
+            "produto_original": "DIPIRONA 500MG 10 COMP",
+            "descricao_produto": "DIPIRONA 500MG 10 COMP",
+            "descricao_expandida": "Analgésico à base de dipirona sódica",
+            "_duplicate_descriptions": ["DIPIRONA 500 MG"] * 20,
+            "expansion_data": {
+                "categoria_principal": "Medicamento",
+                "palavras_chave_fiscais": ["analgésico", "dipirona"],
+                "confianca": 0.9
+            }
+        }
+
+    def test_seleciona_apenas_campos_do_agente(self):
+        selecionados = self.builder.select_product_fields(self.produto)
+
+        assert "_duplicate_descriptions" not in selecionados
+        assert "expansion_data" not in selecionados
+        assert "descricao_produto" not in selecionados  # igual ao produto_original
+        assert selecionados["categoria_principal"] == "Medicamento"
+
+    def test_json_compacto(self):
+        assert compact_json({"a": [1, 2], "b": "ç"}) == '{"a":[1,2],"b":"ç"}'
+
+    def test_contexto_semantico_ordenado_e_sem_repeticao(self):
+        resultados = [
+            {"text": "exemplo fraco", "score": 0.2, "metadata": {"ncm": "1"}},
+            {"text": "exemplo forte", "score": 0.9, "metadata": {"ncm": "2"}},
+            {"text": "exemplo  forte", "score": 0.5, "metadata": {"ncm": "2"}},
+        ]
+        itens = [json.loads(i) for i in self.builder.rank_semantic_context(resultados)]
+
+        assert [i["texto"] for i in itens] == ["exemplo forte", "exemplo fraco"]
+
+    def test_respeita_orcamento_descartando_itens_inteiros(self):
+        itens = [compact_json({"texto": f"produto exemplo número {i} " * 5}) for i in range(30)]
+        prompt = self.builder.render(
+            "Produto: {produto}\nExemplos:\n{exemplos}",
+            fixed={"produto": "DIPIRONA"},
+            flexible=[("exemplos", itens, "Nenhum.")]
+        )
+        relatorio = self.builder.ultimo_relatorio
+
+        assert relatorio["tokens_prompt"] <= 400
+        assert not relatorio["excedeu_orcamento"]
+        assert 0 < relatorio["itens_descartados"]["exemplos"] < 30
+        assert itens[0] in prompt
+        assert itens[-1] not in prompt
+
+    def test_texto_vazio_quando_nada_cabe(self):
+        builder = PromptBuilder("ncm", token_budget=10)
+        prompt = builder.render(
+            "{exemplos}", fixed={}, flexible=[("exemplos", ["x " * 50], "Nenhum.")]
+        )
+        assert prompt == "Nenhum."
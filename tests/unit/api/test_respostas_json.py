@@ -0,0 +1,64 @@
+"""
+Testes unitários para a serialização rápida e a projeção enxuta das respostas
+"""
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+import json
+import sys
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from pydantic import BaseModel
+
+from api.respostas_json import enxugar, opcoes_campos, serializar_json
+
+
+class Sugestao(BaseModel):
+    ncm: str
+    confianca: float
+
+
+class TestSerializacao:
+    """Mesmo conteúdo que o JSON padrão para os tipos usados nas rotas"""
+
+    def test_tipos_das_rotas(self):
+        conteudo = {
+            "descricao": "Sabão em pó",
+            "criado": datetime(2024, 1, 2, 3, 4, 5),
+            "valor": Decimal("1.5"),
+            "sugestao": Sugestao(ncm="34022000", confianca=0.9),
+            "tags": ("a", "b"),
+        }
+
+        resultado = json.loads(serializar_json(conteudo))
+
+        assert resultado == {
+            "descricao": "Sabão em pó",
+            "criado": "2024-01-02T03:04:05",
+            "valor": 1.5,
+            "sugestao": {"ncm": "34022000", "confianca": 0.9},
+            "tags": ["a", "b"],
+        }
+
+
+class TestProjecao:
+    """fields= escolhe campos; trace só com include="""
+
+    ITEM = {"id": 1, "ncm_sugerido": "30049069", "dados_trace_json": "{...}", "interno": "x"}
+
+    def test_trace_omitido_por_padrao_e_incluido_sob_pedido(self):
+        permitidos = {"id", "ncm_sugerido", "dados_trace_json"}
+
+        campos, incluir = opcoes_campos(None, None)
+        assert enxugar(self.ITEM, campos, incluir, permitidos=permitidos) == {"id": 1, "ncm_sugerido": "30049069"}
+
+        campos, incluir = opcoes_campos(None, "dados_trace_json")
+        assert "dados_trace_json" in enxugar(self.ITEM, campos, incluir, permitidos=permitidos)
+
+    def test_fields_seleciona_campos_permitidos(self):
+        campos, incluir = opcoes_campos(" id , interno,", None)
+
+        assert campos == {"id", "interno"}
+        assert enxugar(self.ITEM, campos, incluir, permitidos={"id", "ncm_sugerido"}) == {"id": 1}
@@ -0,0 +1,58 @@
+"""
+Testes unitários para o arquivamento de linhas antigas (Parquet / NDJSON)
+"""
+from datetime import datetime
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer, LargeBinary, MetaData, String, Table, Text
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from database.arquivamento import (
+    ArquivadorLinhas, ler_arquivo_morto, tipos_arrow_sqlite, tipos_arrow_sqlalchemy
+)
+from database.payload_codec import TraceCompactado
+
+
+def test_tipos_pela_afinidade_sqlite():
+    tipos = tipos_arrow_sqlite({
+        "id": "INTEGER", "empresa_id": "BIGINT", "user_id": "TEXT", "nome": "VARCHAR(50)",
+        "duration_ms": "REAL", "success": "BOOLEAN", "after_data": "JSON",
+        "timestamp": "TIMESTAMP", "payload": "BLOB", "livre": ""
+    })
+    assert tipos == {
+        "id": "int64", "empresa_id": "int64", "duration_ms": "float64", "success": "bool", "payload": "binary"
+    }
+
+
+def test_tipos_pelas_colunas_sqlalchemy():
+    tabela = Table(
+        "explicacoes", MetaData(),
+        Column("id", Integer, primary_key=True), Column("agente", String(50)), Column("texto", Text),
+        Column("confianca", Float), Column("rag", Boolean), Column("data", DateTime),
+        Column("bruto", LargeBinary), Column("trace", TraceCompactado)
+    )
+    assert tipos_arrow_sqlalchemy(tabela.columns) == {
+        "id": "int64", "confianca": "float64", "rag": "bool", "bruto": "binary"
+    }
+
+
+def test_coluna_nula_no_primeiro_lote_mantem_o_tipo(tmp_path):
+    pytest.importorskip("pyarrow")
+    colunas = ["id", "duration_ms", "success", "error_message", "after_data", "timestamp"]
+    tipos = {"id": "int64", "duration_ms": "float64", "success": "bool"}
+
+    with ArquivadorLinhas(tmp_path / "auditoria_2024_01", colunas, tipos=tipos) as arquivo:
+        arquivo.escrever([(1, None, None, None, None, None)])
+        arquivo.escrever([(2, 12.5, 1, "falha", {"campo": 1}, datetime(2024, 1, 2, 10, 0))])
+
+    assert arquivo.caminho.suffix == ".parquet"
+    assert ler_arquivo_morto(arquivo.caminho) == [
+        {"id": 1, "duration_ms": None, "success": None, "error_message": None,
+         "after_data": None, "timestamp": None},
+        {"id": 2, "duration_ms": 12.5, "success": True, "error_message": "falha",
+         "after_data": '{"campo": 1}', "timestamp": "2024-01-02T10:00:00"},
+    ]
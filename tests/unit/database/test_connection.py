@@ -0,0 +1,61 @@
+"""
+Testes unitários para o engine e as sessões das rotas de revisão
+"""
+import threading
+from pathlib import Path
+import sys
+
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from database import connection
+from database.models import Base, ClassificacaoRevisao
+
+
+def test_engine_padrao_sem_conexao_compartilhada():
+    assert not isinstance(connection.engine.pool, StaticPool)
+
+
+def test_sessoes_concorrentes_isoladas(tmp_path, monkeypatch):
+    engine = connection.criar_engine(f"sqlite:///{tmp_path / 'revisao.db'}")
+    Base.metadata.create_all(engine)
+    monkeypatch.setattr(connection, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+
+    gravou, leu = threading.Event(), threading.Event()
+    conexoes, vistos = [], []
+
+    def gravar():
+        sessoes = connection.get_db()
+        db = next(sessoes)
+        db.add(ClassificacaoRevisao(produto_id=1, descricao_produto="DIPIRONA 500MG"))
+        db.flush()
+        conexoes.append(db.connection().connection.dbapi_connection)
+        gravou.set()
+        leu.wait(5)
+        db.commit()
+        sessoes.close()
+
+    def ler_e_desfazer():
+        gravou.wait(5)
+        sessoes = connection.get_db()
+        db = next(sessoes)
+        vistos.append(db.query(ClassificacaoRevisao).count())
+        conexoes.append(db.connection().connection.dbapi_connection)
+        db.rollback()
+        leu.set()
+        sessoes.close()
+
+    threads = [threading.Thread(target=gravar), threading.Thread(target=ler_e_desfazer)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert conexoes[0] is not conexoes[1]
+    assert vistos == [0]  # insert ainda não confirmado não aparece na outra sessão
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM classificacoes_revisao").scalar() == 1
+    engine.dispose()
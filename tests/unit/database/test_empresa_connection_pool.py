@@ -0,0 +1,117 @@
+"""
+Testes unitários para o pool de conexões por empresa
+"""
+import threading
+import pytest
+from pathlib import Path
+import sys
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from database.empresa_connection_pool import EmpresaConnectionPool, get_empresa_pool
+from database.empresa_database_manager import EmpresaDatabaseManager
+
+
+class TestEmpresaConnectionPool:
+    """Testes de reaproveitamento, afinidade por thread e fechamento LRU"""
+
+    def test_reaproveita_conexao_da_mesma_thread(self, tmp_path):
+        pool = EmpresaConnectionPool()
+        with pool.conexao(tmp_path / "empresa_1.db") as primeira:
+            primeira.execute("CREATE TABLE t (x)")
+        with pool.conexao(tmp_path / "empresa_1.db") as segunda:
+            segunda.execute("INSERT INTO t VALUES (1)")
+
+        assert primeira is segunda
+        assert pool.obter_metricas()["aberturas"] == 1
+        assert pool.obter_metricas()["reutilizacoes"] == 1
+
+    def test_threads_nao_compartilham_conexao(self, tmp_path):
+        pool = EmpresaConnectionPool()
+        conexoes = []
+
+        def usar():
+            with pool.conexao(tmp_path / "empresa_1.db") as conn:
+                conexoes.append(conn)
+
+        usar()
+        thread = threading.Thread(target=usar)
+        thread.start()
+        thread.join(2)
+
+        assert conexoes[0] is not conexoes[1]
+
+    def test_fecha_menos_usada_acima_do_limite(self, tmp_path):
+        pool = EmpresaConnectionPool(max_conexoes=2)
+        for empresa in (1, 2, 1, 3):
+            with pool.conexao(tmp_path / f"empresa_{empresa}.db"):
+                pass
+
+        metricas = pool.obter_metricas()
+        assert metricas["conexoes_abertas"] == 2
+        assert metricas["fechamentos_lru"] == 1
+        # empresa_2 era a menos usada recentemente
+        with pool.conexao(tmp_path / "empresa_1.db"):
+            pass
+        assert pool.obter_metricas()["aberturas"] == 3
+
+    def test_rollback_em_excecao_e_transacao_no_bloco_externo(self, tmp_path):
+        pool = EmpresaConnectionPool()
+        with pool.conexao(tmp_path / "e.db") as conn:
+            conn.execute("CREATE TABLE t (x)")
+
+        with pytest.raises(RuntimeError):
+            with pool.conexao(tmp_path / "e.db") as conn:
+                conn.execute("INSERT INTO t VALUES (1)")
+                with pool.conexao(tmp_path / "e.db") as interna:
+                    interna.execute("INSERT INTO t VALUES (2)")
+                raise RuntimeError("falha")
+
+        with pool.conexao(tmp_path / "e.db") as conn:
+            assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+    def test_fechar_ociosas(self, tmp_path):
+        pool = EmpresaConnectionPool()
+        with pool.conexao(tmp_path / "e.db"):
+            pass
+
+        assert pool.fechar_ociosas(0) == 1
+        assert pool.obter_metricas()["conexoes_abertas"] == 0
+
+
+def test_manager_reaproveita_conexao_entre_escritas(tmp_path):
+    manager = EmpresaDatabaseManager(base_path=str(tmp_path), pool=EmpresaConnectionPool())
+    manager.create_empresa_database(1, {})
+    produto_id = manager.insert_produto(1, {"nome_produto": "DIPIRONA 500MG"})
+    for _ in range(3):
+        manager.insert_agente_acao(1, {
+            "produto_id": produto_id, "classificacao_id": 0, "agente_nome": "ncm_agent", "acao_tipo": "classificacao"
+        })
+
+    assert manager.get_empresa_stats(1)["acoes_por_agente"] == {"ncm_agent": 3}
+    assert manager.get_produto_detalhado(1, produto_id)["produto"]["nome_produto"] == "DIPIRONA 500MG"
+    assert manager.obter_metricas_pool()["aberturas"] == 1
+
+
+def test_managers_compartilham_o_pool_do_processo(tmp_path):
+    primeiro = EmpresaDatabaseManager(base_path=str(tmp_path))
+    primeiro.create_empresa_database(1, {})
+    aberturas = get_empresa_pool().obter_metricas()["aberturas"]
+
+    # Um manager por requisição: a conexão já aberta é reaproveitada
+    EmpresaDatabaseManager(base_path=str(tmp_path)).insert_produto(1, {"nome_produto": "SABAO EM PO"})
+
+    assert get_empresa_pool().obter_metricas()["aberturas"] == aberturas
+
+
+def test_inserts_aninhados_seguem_a_transacao_externa(tmp_path):
+    manager = EmpresaDatabaseManager(base_path=str(tmp_path), pool=EmpresaConnectionPool())
+    manager.create_empresa_database(1, {})
+
+    with pytest.raises(RuntimeError):
+        with manager.conexao_empresa(1):
+            manager.insert_produto(1, {"nome_produto": "DIPIRONA 500MG"})
+            raise RuntimeError("falha após o insert")
+
+    assert manager.get_empresa_stats(1)["total_produtos"] == 0
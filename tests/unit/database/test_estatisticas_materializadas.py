@@ -0,0 +1,117 @@
+"""
+Testes unitários para os contadores materializados do dashboard
+"""
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import text
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from services.unified_sqlite_service import UnifiedSQLiteService
+from database.estatisticas_materializadas import (
+    ler_classificacoes_diarias, ler_desempenho_agentes, materializacao_ativa
+)
+
+STATUS = ["PENDENTE_REVISAO", "APROVADO", "CORRIGIDO"]
+
+
+@pytest.fixture
+def service(tmp_path):
+    return UnifiedSQLiteService(str(tmp_path / "unified.db"))
+
+
+def _popular(service, quantidade=60, semente=7):
+    rnd = random.Random(semente)
+    hoje = datetime.now()
+    with service.engine.begin() as conn:
+        for produto_id in range(1, quantidade + 1):
+            data = hoje - timedelta(days=rnd.randint(0, 40), hours=rnd.randint(0, 23))
+            conn.execute(text(
+                "INSERT INTO classificacoes_revisao (produto_id, descricao_produto, status_revisao, "
+                "confianca_sugerida, tempo_revisao_segundos, data_classificacao, data_criacao) "
+                "VALUES (:p, 'PRODUTO', :s, :c, :t, :d, :d)"
+            ), {"p": produto_id, "s": rnd.choice(STATUS), "c": rnd.choice([None, rnd.random()]),
+                "t": rnd.choice([None, rnd.randint(10, 600)]), "d": data})
+            conn.execute(text(
+                "INSERT INTO explicacoes_agentes (produto_id, agente_nome, nivel_confianca, "
+                "tempo_processamento_ms, data_execucao) VALUES (:p, :a, :c, :t, :d)"
+            ), {"p": produto_id, "a": rnd.choice(["ncm", "cest"]), "c": rnd.random(),
+                "t": rnd.randint(10, 900), "d": data})
+    for produto_id in range(1, 11):
+        service.adicionar_ao_golden_set({
+            "produto_id": produto_id, "descricao_produto": "PRODUTO", "ncm_final": "30049069"
+        })
+    with service.engine.begin() as conn:
+        # Revisões e remoções depois da carga
+        conn.execute(text("UPDATE classificacoes_revisao SET status_revisao = 'APROVADO', "
+                          "tempo_revisao_segundos = 120 WHERE produto_id % 5 = 0"))
+        conn.execute(text("DELETE FROM classificacoes_revisao WHERE produto_id % 7 = 0"))
+        conn.execute(text("UPDATE golden_set SET ativo = 0 WHERE produto_id <= 3"))
+
+
+class TestContadoresMaterializados:
+    """Triggers mantêm os mesmos números das varreduras completas"""
+
+    def test_dashboard_igual_as_contagens(self, service):
+        _popular(service)
+        stats = service.get_dashboard_stats()
+
+        with service.engine.connect() as conn:
+            def contar(sql):
+                return conn.execute(text(sql)).scalar()
+
+            assert stats["total_classificacoes"] == contar("SELECT COUNT(*) FROM classificacoes_revisao")
+            assert stats["classificacoes_pendentes"] == contar(
+                "SELECT COUNT(*) FROM classificacoes_revisao WHERE status_revisao = 'PENDENTE_REVISAO'")
+            assert stats["golden_set_entries"] == contar("SELECT COUNT(*) FROM golden_set WHERE ativo = 1") == 7
+            assert stats["explicacoes_agentes"] == contar("SELECT COUNT(*) FROM explicacoes_agentes")
+            assert stats["classificacoes_recentes"] == contar(
+                "SELECT COUNT(*) FROM classificacoes_revisao WHERE date(data_criacao) >= "
+                f"'{(datetime.now() - timedelta(days=7)).date().isoformat()}'")
+
+            inicio = (datetime.now() - timedelta(days=30)).date().isoformat()
+            por_agente = {a["nome"]: a["total_execucoes"] for a in ler_desempenho_agentes(conn, inicio)}
+            assert por_agente == dict(conn.execute(text(
+                "SELECT agente_nome, COUNT(*) FROM explicacoes_agentes "
+                f"WHERE date(data_execucao) >= '{inicio}' GROUP BY agente_nome")).fetchall())
+
+            diarias = ler_classificacoes_diarias(conn, "2000-01-01")
+            assert sum(linha["faixa_0_50"] + linha["faixa_50_70"] + linha["faixa_70_80"]
+                       + linha["faixa_80_90"] + linha["faixa_90_100"] for linha in diarias) \
+                == stats["total_classificacoes"]
+
+        assert service.reconciliar_estatisticas()["consistente"]
+
+    def test_reconciliacao_corrige_divergencia(self, service):
+        _popular(service, quantidade=10)
+        with service.engine.begin() as conn:
+            assert materializacao_ativa(conn)
+            conn.execute(text("UPDATE estatisticas_contadores SET valor = valor + 5 "
+                              "WHERE chave = 'classificacoes_revisao'"))
+            conn.execute(text("DELETE FROM estatisticas_agentes_diarias"))
+
+        relatorio = service.reconciliar_estatisticas(corrigir=False)
+        assert not relatorio["consistente"] and not relatorio["corrigido"]
+        assert set(relatorio["divergencias"]) == {"estatisticas_contadores", "estatisticas_agentes_diarias"}
+
+        assert service.reconciliar_estatisticas()["corrigido"]
+        assert service.reconciliar_estatisticas()["consistente"]
+        assert service.get_dashboard_stats()["total_classificacoes"] == 10 - 1  # produto 7 removido
+
+    def test_banco_existente_recebe_contadores(self, tmp_path, service):
+        _popular(service, quantidade=12)
+        with service.engine.begin() as conn:
+            for (nome,) in conn.execute(text(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger'")).fetchall():
+                conn.execute(text(f"DROP TRIGGER {nome}"))
+            conn.execute(text("DROP TABLE estatisticas_contadores"))
+        service.engine.dispose()
+
+        reaberto = UnifiedSQLiteService(str(tmp_path / "unified.db"))
+        assert reaberto.get_dashboard_stats()["total_classificacoes"] == 12 - 1
+        assert reaberto.reconciliar_estatisticas()["consistente"]
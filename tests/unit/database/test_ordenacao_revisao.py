@@ -0,0 +1,79 @@
+"""
+Testes unitários para as chaves persistidas da fila de revisão
+"""
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from database.models import Base, ClassificacaoRevisao
+from database.ordenacao_revisao import (
+    chave_ordenacao, letra_ordenacao, garantir_ordenacao_revisao, INDICE_FILA_REVISAO
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'revisao.db'}")
+    yield engine
+    engine.dispose()
+
+
+class TestChavesOrdenacao:
+    """Normalização usada na rotação alfabética"""
+
+    def test_chave_e_letra(self):
+        assert chave_ordenacao("ágUA sanitária") == "AGUA SANITARIA"
+        assert letra_ordenacao("ÉTER") == "E"
+        assert letra_ordenacao("123 - óleo") == "O"
+        assert letra_ordenacao("1234") == "Z"
+        assert chave_ordenacao(None) == "" and letra_ordenacao("") == "Z"
+
+    def test_mantidas_no_insert_e_update(self, engine):
+        Base.metadata.create_all(engine)
+        with sessionmaker(bind=engine)() as db:
+            classificacao = ClassificacaoRevisao(produto_id=1, descricao_produto="órgão")
+            db.add(classificacao)
+            db.commit()
+            assert (classificacao.chave_ordenacao, classificacao.letra_ordenacao) == ("ORGAO", "O")
+
+            classificacao.descricao_produto = "álcool 70"
+            db.commit()
+            assert (classificacao.chave_ordenacao, classificacao.letra_ordenacao) == ("ALCOOL 70", "A")
+
+
+class TestMigracaoOrdenacao:
+    """Bancos criados antes das colunas de ordenação"""
+
+    def test_adiciona_colunas_indice_e_preenche(self, engine):
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE classificacoes_revisao (id INTEGER PRIMARY KEY, produto_id INTEGER, "
+                "descricao_produto TEXT, status_revisao VARCHAR(20))"
+            ))
+            conn.execute(text(
+                "INSERT INTO classificacoes_revisao (produto_id, descricao_produto, status_revisao) "
+                "VALUES (1, 'Éter', 'PENDENTE_REVISAO'), (2, '99 bananas', 'PENDENTE_REVISAO')"
+            ))
+
+        with engine.begin() as conn:
+            garantir_ordenacao_revisao(conn)
+            garantir_ordenacao_revisao(conn)  # idempotente
+
+        with engine.connect() as conn:
+            linhas = conn.execute(text(
+                "SELECT chave_ordenacao, letra_ordenacao FROM classificacoes_revisao ORDER BY id"
+            )).fetchall()
+            assert [tuple(linha) for linha in linhas] == [("ETER", "E"), ("99 BANANAS", "B")]
+
+            plano = " ".join(str(linha[-1]) for linha in conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT id FROM classificacoes_revisao "
+                "WHERE status_revisao = 'PENDENTE_REVISAO' AND letra_ordenacao > 'B' "
+                "ORDER BY letra_ordenacao, chave_ordenacao, id LIMIT 1"
+            )))
+            assert INDICE_FILA_REVISAO in plano and "TEMP B-TREE" not in plano
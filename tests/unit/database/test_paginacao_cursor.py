@@ -0,0 +1,102 @@
+"""
+Testes unitários para a paginação por chave com cursores opacos
+"""
+import random
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import text
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from services.unified_sqlite_service import UnifiedSQLiteService
+from database.paginacao_cursor import (
+    CursorInvalidoError, assinatura_filtros, codificar_cursor, decodificar_cursor
+)
+
+DATAS = [None, "2024-01-01 10:00:00", "2024-01-02 10:00:00.123456", "2024-02-15 08:00:00"]
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = UnifiedSQLiteService(str(tmp_path / "unified.db"))
+    rnd = random.Random(11)
+    with service.engine.begin() as conn:
+        for produto_id in range(1, 121):
+            conn.execute(text(
+                "INSERT INTO classificacoes_revisao (produto_id, descricao_produto, status_revisao, "
+                "ncm_sugerido, data_criacao) VALUES (:p, :d, :s, :n, :dt)"
+            ), {"p": produto_id, "d": f"PRODUTO {produto_id}",
+                "s": rnd.choice(["PENDENTE_REVISAO", "APROVADO"]),
+                "n": rnd.choice([None, "30049069"]), "dt": rnd.choice(DATAS)})
+    return service
+
+
+def _percorrer(service, limite, **filtros):
+    ids, cursor, paginas = [], None, 0
+    while True:
+        pagina = service.pagina_classificacoes(limite=limite, cursor=cursor, **filtros)
+        ids += [item["id"] for item in pagina["itens"]]
+        paginas += 1
+        cursor = pagina["proximo_cursor"]
+        if not cursor:
+            return ids, paginas, pagina["total"]
+
+
+class TestCursor:
+    """Token opaco amarrado aos filtros"""
+
+    def test_ida_e_volta(self):
+        assinatura = assinatura_filtros(status="APROVADO")
+        token = codificar_cursor(("2024-01-01 10:00:00", 42), assinatura)
+        assert decodificar_cursor(token, assinatura) == ("2024-01-01 10:00:00", 42)
+        assert decodificar_cursor(codificar_cursor((None, 7), assinatura), assinatura) == (None, 7)
+
+    def test_rejeita_outros_filtros_e_lixo(self):
+        token = codificar_cursor(("2024-01-01", 1), assinatura_filtros(status="APROVADO"))
+        with pytest.raises(CursorInvalidoError):
+            decodificar_cursor(token, assinatura_filtros(status="CORRIGIDO"))
+        for lixo in ("", "nao-e-base64!", token[:-4], codificar_cursor(("x", "1"), "f")):
+            with pytest.raises(CursorInvalidoError):
+                decodificar_cursor(lixo, "f")
+
+
+class TestPaginacaoKeyset:
+    """Mesma ordem que ORDER BY data DESC, id DESC com OFFSET, datas nulas por último"""
+
+    def test_paginas_percorrem_a_ordem_completa(self, service):
+        with service.engine.connect() as conn:
+            esperado = [linha[0] for linha in conn.execute(text(
+                "SELECT id FROM classificacoes_revisao WHERE status_revisao = 'PENDENTE_REVISAO' "
+                "ORDER BY data_criacao IS NULL, data_criacao DESC, id DESC"
+            ))]
+
+        for limite in (1, 7, 1000):
+            ids, paginas, total = _percorrer(service, limite, status="PENDENTE_REVISAO")
+            assert ids == esperado
+            assert paginas == max(1, -(-len(esperado) // limite))
+            assert total == len(esperado)
+
+        # Página numérica antiga continua valendo e já devolve o cursor
+        pagina = service.pagina_classificacoes("PENDENTE_REVISAO", 10, offset=20)
+        assert [item["id"] for item in pagina["itens"]] == esperado[20:30]
+        seguinte = service.pagina_classificacoes("PENDENTE_REVISAO", 10, cursor=pagina["proximo_cursor"])
+        assert [item["id"] for item in seguinte["itens"]] == esperado[30:40]
+
+    def test_totais_com_busca_e_situacao(self, service):
+        classificados, _, total = _percorrer(service, 25, classificado=True)
+        nao_classificados, _, total_nao = _percorrer(service, 25, classificado=False)
+        assert (total, total_nao) == (len(classificados), len(nao_classificados))
+        assert total + total_nao == 120
+        assert _percorrer(service, 5, busca="PRODUTO 1")[2] == 1 + 10 + 21  # 1, 10-19, 100-120
+
+    def test_consultas_usam_indices(self, service):
+        with service.engine.connect() as conn:
+            plano = " ".join(str(linha[-1]) for linha in conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT id FROM classificacoes_revisao "
+                "WHERE status_revisao = 'PENDENTE_REVISAO' AND data_criacao IS NOT NULL "
+                "AND (data_criacao, id) < ('2024-02-01', 60) ORDER BY data_criacao DESC, id DESC LIMIT 51"
+            )))
+        assert "INDEX idx_classificacao_status (" in plano and "TEMP B-TREE" not in plano
@@ -0,0 +1,102 @@
+"""
+Testes unitários para as partições mensais da auditoria e o arquivamento
+"""
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+import sys
+
+import pytest
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+from database.arquivamento import ler_arquivo_morto
+from src.services.auditoria_service import (
+    CentralAuditService, AuditEvent, AuditEventType, AuditSeverity, SQL_INSERT_EVENTO
+)
+
+
+def _evento(timestamp, user_id="u1", success=True, empresa_id=1):
+    return AuditEvent(
+        event_id=None, event_type=AuditEventType.CREATE_RECORD, severity=AuditSeverity.LOW,
+        empresa_id=empresa_id, user_id=user_id, session_id=None, resource_type="produto",
+        resource_id="1", action_performed="criar", ip_address=None, user_agent=None,
+        api_endpoint=None, http_method=None, before_data=None, after_data=None, metadata=None,
+        success=success, error_message=None if success else "falha", duration_ms=10.0,
+        timestamp=timestamp
+    )
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = CentralAuditService(str(tmp_path / "central_audit.db"))
+    service.diretorio_arquivo = tmp_path / "archive"
+    yield service
+    service._escrita.fechar()
+
+
+class TestParticoesAuditoria:
+    """Roteamento das consultas para as partições do período"""
+
+    def test_eventos_gravados_por_mes(self, service):
+        for ts in (datetime(2024, 1, 10), datetime(2024, 1, 20), datetime(2024, 2, 5), datetime(2024, 3, 1)):
+            service.log_event(_evento(ts))
+        service.flush()
+
+        assert service.particoes.particoes() == ["2024_01", "2024_02", "2024_03"]
+        assert service.particoes.particoes_no_intervalo(datetime(2024, 2, 1), datetime(2024, 2, 28)) == ["2024_02"]
+
+    def test_logs_e_relatorio_entre_particoes(self, service):
+        service.log_event(_evento(datetime(2024, 1, 10), user_id="a"))
+        service.log_event(_evento(datetime(2024, 2, 10), user_id="a", success=False))
+        service.log_event(_evento(datetime(2024, 2, 11), user_id="b"))
+        service.log_event(_evento(datetime(2024, 3, 11), user_id="c"))
+
+        logs = service.get_audit_logs(empresa_id=1, start_date=datetime(2024, 1, 1), end_date=datetime(2024, 2, 29))
+        assert [log["timestamp"][:10] for log in logs] == ["2024-02-11", "2024-02-10", "2024-01-10"]
+        assert len(service.get_audit_logs(limit=2, offset=1)) == 2
+
+        relatorio = service.generate_audit_report(1, datetime(2024, 1, 1), datetime(2024, 2, 29))
+        estatisticas = relatorio["estatisticas_gerais"]
+        assert estatisticas["total_eventos"] == 3
+        assert estatisticas["usuarios_unicos"] == 2  # "a" aparece em duas partições
+        assert estatisticas["operacoes_falha"] == 1
+        assert relatorio["usuarios_mais_ativos"] == {"a": 2, "b": 1}
+
+    def test_arquivamento_remove_particoes_antigas(self, service):
+        for ts in (datetime(2023, 11, 1), datetime(2023, 12, 1), datetime(2024, 3, 1)):
+            service.log_event(_evento(ts))
+        service.flush()
+
+        arquivadas = service.particoes.arquivar(service.diretorio_arquivo, meses_manter=3,
+                                                referencia=datetime(2024, 3, 15))
+
+        assert [a["particao"] for a in arquivadas] == ["2023_11", "2023_12"]
+        assert service.particoes.particoes() == ["2024_03"]
+        registros = ler_arquivo_morto(arquivadas[0]["arquivo"])
+        assert len(registros) == 1 and registros[0]["user_id"] == "u1"
+
+    def test_migracao_de_eventos_legados(self, tmp_path):
+        db_path = tmp_path / "central_audit.db"
+        service = CentralAuditService(str(db_path))
+        evento = _evento(datetime(2024, 5, 2))
+        conn = sqlite3.connect(db_path)
+        conn.execute(SQL_INSERT_EVENTO, (
+            evento.event_id, evento.event_type.value, evento.severity.value, 1, "legado", None,
+            "produto", "1", "criar", None, None, None, None, None, None, None, True, None, 1.0,
+            "hash", evento.timestamp
+        ))
+        conn.commit()
+        conn.close()
+        service._escrita.fechar()
+
+        service = CentralAuditService(str(db_path))
+        assert service._possui_legado
+        assert [log["user_id"] for log in service.get_audit_logs()] == ["legado"]
+
+        assert service.migrar_eventos_legados() == 1
+        assert service.particoes.particoes() == ["2024_05"]
+        assert [log["user_id"] for log in service.get_audit_logs()] == ["legado"]
+        service._escrita.fechar()
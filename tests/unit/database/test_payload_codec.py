@@ -0,0 +1,183 @@
+"""
+Testes unitários para o payload compactado das explicações, traces e ações dos agentes
+"""
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+import sys
+
+import pytest
+
+# Adicionar src e scripts ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "scripts"))
+
+from database.payload_codec import (
+    PayloadCodec, PayloadError, expandir_explicacao, carregar_codec, CAMPOS_PAYLOAD_EXPLICACAO,
+    eh_payload, expandir_json
+)
+from database.empresa_connection_pool import EmpresaConnectionPool
+from database.empresa_database_manager import EmpresaDatabaseManager
+from database.unified_sqlite_models import ClassificacaoRevisao
+from services.unified_sqlite_service import UnifiedSQLiteService
+from migrar_explicacoes_compactas import migrar_explicacoes, migrar_traces_revisao, migrar_acoes_empresas
+
+
+TRACE = {
+    "etapas_processamento": [{"etapa": i, "prompt": "Classifique o produto " * 20} for i in range(10)],
+    "resultado_agente": {"ncm": "30049069", "confianca": 0.92},
+}
+
+
+class TestPayloadCodec:
+    """Ida e volta, tipos não JSON e payloads inválidos"""
+
+    def test_ida_e_volta_menor_que_json(self):
+        codec = PayloadCodec()
+        payload = codec.codificar(TRACE)
+
+        assert codec.decodificar(payload) == TRACE
+        assert len(payload) < len(json.dumps(TRACE)) / 5
+
+    def test_tipos_nao_json_convertidos(self):
+        codec = PayloadCodec()
+        decodificado = codec.decodificar(codec.codificar({"quando": datetime(2024, 1, 2), "tags": {"a"}}))
+
+        assert decodificado == {"quando": "2024-01-02T00:00:00", "tags": ["a"]}
+
+    def test_payload_sem_cabecalho(self):
+        with pytest.raises(PayloadError):
+            PayloadCodec().decodificar(b"{}")
+
+    def test_referencia_circular_levanta_erro(self):
+        ciclo = {}
+        ciclo["self"] = ciclo
+
+        with pytest.raises((ValueError, TypeError, RecursionError)):
+            PayloadCodec().codificar(ciclo)
+
+
+def _criar_banco_legado(db_path, linhas=20):
+    """explicacoes_agentes no formato anterior (JSON, sem payload_compactado)"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE explicacoes_agentes (
+            id INTEGER PRIMARY KEY, produto_id INTEGER NOT NULL, agente_nome TEXT NOT NULL,
+            contexto_utilizado TEXT, etapas_processamento TEXT, produtos_similares_encontrados TEXT,
+            resultado_agente TEXT, exemplos_utilizados TEXT, nivel_confianca REAL,
+            tempo_processamento_ms INTEGER
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO explicacoes_agentes (produto_id, agente_nome, etapas_processamento, resultado_agente, "
+        "nivel_confianca, tempo_processamento_ms) VALUES (?, ?, ?, ?, ?, ?)",
+        [(i, "ncm", json.dumps(TRACE["etapas_processamento"], indent=2),
+          json.dumps({"ncm": f"3004{i:04d}"}, indent=2), 0.9, 120) for i in range(linhas)]
+    )
+    conn.commit()
+    conn.close()
+
+
+class TestMigracaoExplicacoes:
+    """Conversão das linhas JSON existentes"""
+
+    def test_migracao_preserva_conteudo_e_escalares(self, tmp_path):
+        db_path = tmp_path / "unified.db"
+        _criar_banco_legado(db_path)
+
+        stats = migrar_explicacoes(db_path, lote=7)
+
+        assert stats["linhas"] == 20
+        assert stats["bytes_compactados"] < stats["bytes_json"]
+
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        codec = carregar_codec(conn)
+        linhas = conn.execute("SELECT * FROM explicacoes_agentes ORDER BY id").fetchall()
+        conn.close()
+
+        campos = expandir_explicacao(SimpleNamespace(**dict(linhas[3])), codec)
+        assert campos["resultado_agente"] == {"ncm": "30040003"}
+        assert campos["etapas_processamento"] == TRACE["etapas_processamento"]
+        assert all(linhas[3][c] is None for c in CAMPOS_PAYLOAD_EXPLICACAO)
+        assert (linhas[3]["agente_nome"], linhas[3]["nivel_confianca"], linhas[3]["tempo_processamento_ms"]) == \
+            ("ncm", 0.9, 120)
+
+        # Retomada: nada mais a migrar
+        assert migrar_explicacoes(db_path)["linhas"] == 0
+
+    def test_servico_unificado_grava_compactado(self, tmp_path):
+        service = UnifiedSQLiteService(str(tmp_path / "unified.db"))
+        explicacao_id = service.salvar_explicacao_agente({
+            "produto_id": 1, "agente_nome": "ncm", "nivel_confianca": 0.8, **TRACE
+        })
+
+        conn = sqlite3.connect(tmp_path / "unified.db")
+        payload, resultado = conn.execute(
+            "SELECT payload_compactado, resultado_agente FROM explicacoes_agentes WHERE id = ?", (explicacao_id,)
+        ).fetchone()
+        conn.close()
+
+        assert resultado is None
+        assert PayloadCodec().decodificar(payload)["resultado_agente"] == TRACE["resultado_agente"]
+        assert service.buscar_explicacoes_produto(1)[0]["nivel_confianca"] == 0.8
+
+
+class TestTracesEAcoes:
+    """dados_trace_json e agente_acoes compactados na própria coluna"""
+
+    def test_trace_de_revisao_compactado_e_legado_legivel(self, tmp_path):
+        db_path = tmp_path / "unified.db"
+        service = UnifiedSQLiteService(str(db_path))
+        with service.get_session() as session:
+            session.execute(ClassificacaoRevisao.__table__.insert(), [
+                {"produto_id": 1, "descricao_produto": "legado", "dados_trace_json": None},
+                {"produto_id": 2, "descricao_produto": "novo", "dados_trace_json": TRACE},
+            ])
+            session.commit()
+
+        conn = sqlite3.connect(db_path)
+        conn.execute(
+            "UPDATE classificacoes_revisao SET dados_trace_json = ? WHERE produto_id = 1",
+            (json.dumps(TRACE, indent=2),)
+        )
+        conn.commit()
+        assert eh_payload(conn.execute(
+            "SELECT dados_trace_json FROM classificacoes_revisao WHERE produto_id = 2").fetchone()[0])
+        conn.close()
+
+        with service.get_session() as session:
+            traces = [c.dados_trace_json for c in session.query(ClassificacaoRevisao).order_by(ClassificacaoRevisao.produto_id)]
+        assert traces == [TRACE, TRACE]
+
+        assert migrar_traces_revisao(db_path)["linhas"] == 1
+        assert migrar_traces_revisao(db_path)["linhas"] == 0
+        with service.get_session() as session:
+            assert session.query(ClassificacaoRevisao).filter_by(produto_id=1).one().dados_trace_json == TRACE
+
+    def test_acoes_de_agentes_compactadas_e_migradas(self, tmp_path):
+        manager = EmpresaDatabaseManager(str(tmp_path), pool=EmpresaConnectionPool())
+        manager.create_empresa_database(1, {})
+        produto_id = manager.insert_produto(1, {"nome_produto": "DIPIRONA 500MG"})
+        manager.insert_agente_acao(1, {
+            "produto_id": produto_id, "classificacao_id": 0, "agente_nome": "ncm", "acao_tipo": "classificacao",
+            "input_dados": TRACE, "output_resultado": {"ncm": "30049069"}
+        })
+
+        conn = sqlite3.connect(manager.get_empresa_db_path(1))
+        entrada, saida = conn.execute("SELECT input_dados, output_resultado FROM agente_acoes").fetchone()
+        assert eh_payload(entrada) and expandir_json(saida) == {"ncm": "30049069"}
+
+        # Linha gravada antes do codec
+        conn.execute(
+            "INSERT INTO agente_acoes (produto_id, classificacao_id, agente_nome, acao_tipo, input_dados, output_resultado) "
+            "VALUES (?, 0, 'cest', 'classificacao', ?, '{}')", (produto_id, json.dumps(TRACE, indent=2))
+        )
+        conn.commit()
+        conn.close()
+
+        assert migrar_acoes_empresas(tmp_path)["linhas"] == 1
+        acoes = manager.get_produto_detalhado(1, produto_id)["acoes_agentes"]
+        assert sorted((a["agente_nome"], a["input_dados"] == TRACE) for a in acoes) == [("cest", True), ("ncm", True)]
@@ -0,0 +1,58 @@
+"""
+Testes unitários para a fábrica de conexões SQLite com perfis
+"""
+import pytest
+from pathlib import Path
+import sys
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from sqlalchemy import text
+from database.sqlite_connection import (
+    conectar_sqlite,
+    criar_engine_sqlite,
+    pragmas_efetivos,
+    verificar_perfil_sqlite,
+    PERFIL_LEITURA,
+    PERFIL_AUDITORIA,
+    PERFIL_OLTP,
+)
+
+
+class TestPerfisSQLite:
+    """Testes de aplicação e verificação dos perfis"""
+
+    def test_conexao_direta_recebe_perfil(self, tmp_path):
+        with conectar_sqlite(tmp_path / "empresa_1.db", PERFIL_OLTP) as conn:
+            pragmas = pragmas_efetivos(conn)
+
+        assert pragmas["journal_mode"] == "wal"
+        assert pragmas["synchronous"] == "NORMAL"
+        assert pragmas["temp_store"] == "MEMORY"
+        assert pragmas["cache_size"] == -8192
+
+    def test_engine_aplica_perfil_em_cada_conexao(self, tmp_path):
+        engine = criar_engine_sqlite(tmp_path / "audit.db", PERFIL_AUDITORIA)
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA wal_autocheckpoint")).scalar() == 4000
+
+        resultado = verificar_perfil_sqlite(engine)
+        assert resultado["perfil"] == PERFIL_AUDITORIA
+        assert resultado["divergencias"] == {}
+
+    def test_somente_leitura_mantem_journal_do_arquivo(self, tmp_path):
+        db_path = tmp_path / "kb.sqlite"
+        conectar_sqlite(db_path, PERFIL_LEITURA).close()
+
+        conn = conectar_sqlite(db_path, PERFIL_LEITURA, somente_leitura=True)
+        try:
+            assert pragmas_efetivos(conn)["journal_mode"] == "wal"
+            with pytest.raises(Exception):
+                conn.execute("CREATE TABLE t (x)")
+        finally:
+            conn.close()
+
+    def test_perfil_desconhecido(self, tmp_path):
+        with pytest.raises(ValueError):
+            conectar_sqlite(tmp_path / "x.db", "inexistente")
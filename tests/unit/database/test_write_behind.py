@@ -0,0 +1,132 @@
+"""
+Testes unitários para a gravação em lote (write-behind) de rastreamento e auditoria
+"""
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
+
+import pytest
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+from database.write_behind import (
+    WriteBehindWriter, POLITICA_DESCARTAR_ANTIGOS, POLITICA_DESCARTAR_NOVOS
+)
+
+
+class TestWriteBehindWriter:
+    """Agrupamento, overflow e drenagem do buffer"""
+
+    def test_itens_agrupados_em_um_lote(self):
+        lotes = []
+        writer = WriteBehindWriter(lotes.append, capacidade=100, max_lote=50, intervalo_ms=5000)
+        for i in range(20):
+            assert writer.enfileirar(i)
+
+        assert writer.flush(timeout=5)
+        assert lotes == [list(range(20))]
+        writer.fechar()
+
+    def test_lote_limitado_a_max_lote(self):
+        lotes = []
+        writer = WriteBehindWriter(lotes.append, capacidade=100, max_lote=10, intervalo_ms=5000)
+        for i in range(25):
+            writer.enfileirar(i)
+        writer.fechar()
+
+        assert [item for lote in lotes for item in lote] == list(range(25))
+        assert max(len(lote) for lote in lotes) <= 10
+
+    @pytest.mark.parametrize("politica, esperados", [
+        (POLITICA_DESCARTAR_ANTIGOS, [2, 3, 4]),
+        (POLITICA_DESCARTAR_NOVOS, [0, 1, 2]),
+    ])
+    def test_politicas_de_overflow(self, politica, esperados):
+        liberar = threading.Event()
+        gravados = []
+
+        def gravar(lote):
+            liberar.wait(5)
+            gravados.extend(lote)
+
+        writer = WriteBehindWriter(gravar, capacidade=3, max_lote=3, intervalo_ms=5000, politica=politica)
+        # Ocupa a thread de escrita com um lote para que o buffer encha
+        writer.enfileirar("ocupado")
+        writer.enfileirar("ocupado")
+        writer.enfileirar("ocupado")
+        while writer.obter_metricas()["pendentes"] != 3 or writer._buffer:
+            pass
+
+        resultados = [writer.enfileirar(i) for i in range(5)]
+        liberar.set()
+        writer.fechar()
+
+        assert [g for g in gravados if g != "ocupado"] == esperados
+        assert writer.obter_metricas()["descartados"] == 2
+        if politica == POLITICA_DESCARTAR_NOVOS:
+            assert resultados == [True, True, True, False, False]
+
+    def test_falha_na_gravacao_nao_interrompe_o_writer(self):
+        chamadas = []
+
+        def gravar(lote):
+            chamadas.append(lote)
+            if len(chamadas) == 1:
+                raise RuntimeError("disco cheio")
+
+        writer = WriteBehindWriter(gravar, max_lote=1, intervalo_ms=5000)
+        writer.enfileirar("a")
+        writer.flush(timeout=5)
+        writer.enfileirar("b")
+        writer.fechar()
+
+        metricas = writer.obter_metricas()
+        assert metricas["erros"] == 1 and metricas["gravados"] == 1
+        assert not writer.enfileirar("c")
+
+    def test_flush_informa_itens_nao_gravados(self):
+        # gravar_lote retorna quantos itens do lote não conseguiu gravar
+        writer = WriteBehindWriter(lambda lote: lote.count("invalido"), max_lote=10, intervalo_ms=5000)
+        for item in ("a", "invalido", "b"):
+            writer.enfileirar(item)
+
+        assert not writer.flush(timeout=5)
+        metricas = writer.obter_metricas()
+        assert (metricas["gravados"], metricas["nao_gravados"], metricas["erros"]) == (2, 1, 1)
+
+        # A falha é informada uma vez; o flush seguinte sem erros volta a ser True
+        writer.enfileirar("c")
+        assert writer.flush(timeout=5)
+        writer.fechar()
+
+
+class TestAuditoriaWriteBehind:
+    """Eventos de auditoria gravados em lote e visíveis nas consultas"""
+
+    def test_eventos_visiveis_apos_log(self, tmp_path):
+        from src.services.auditoria_service import (
+            CentralAuditService, AuditEvent, AuditEventType, AuditSeverity
+        )
+
+        service = CentralAuditService(str(tmp_path / "audit.db"))
+        for i in range(5):
+            assert service.log_event(AuditEvent(
+                event_id=None, event_type=AuditEventType.CREATE_RECORD, severity=AuditSeverity.LOW,
+                empresa_id=1, user_id="u1", session_id=None, resource_type="produto",
+                resource_id=str(i), action_performed="criar", ip_address=None, user_agent=None,
+                api_endpoint=None, http_method=None, before_data=None, after_data={"i": i},
+                metadata=None, success=True, error_message=None, duration_ms=None, timestamp=None
+            ))
+
+        logs = service.get_audit_logs(empresa_id=1)
+        relatorio = service.generate_audit_report(
+            1, datetime.utcnow() - timedelta(days=1), datetime.utcnow() + timedelta(days=1)
+        )
+        service._escrita.fechar()
+
+        assert len(logs) == 5
+        assert service._escrita.obter_metricas()["lotes"] == 1
+        assert relatorio
@@ -0,0 +1,137 @@
+"""
+Testes unitários para a agregação diária das métricas de qualidade
+"""
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import and_, create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+# Adicionar src ao path para importar módulos
+SRC_PATH = Path(__file__).parent.parent.parent.parent / "src"
+sys.path.append(str(SRC_PATH))
+
+from database.models import Base, ClassificacaoRevisao
+
+# Carregado pelo arquivo: o __init__ de feedback importa a aprendizagem contínua
+_spec = importlib.util.spec_from_file_location("metrics_service", SRC_PATH / "feedback" / "metrics_service.py")
+metrics_service = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(metrics_service)
+MetricsService = metrics_service.MetricsService
+
+# (dias atrás, status, confiança); nenhum dia múltiplo de 7 a partir do início
+# do período, onde a semana alinhada ao dia difere da semana alinhada ao instante
+CLASSIFICACOES = [
+    (27, "APROVADO", 0.95), (26, "CORRIGIDO", 0.55), (25, "PENDENTE_REVISAO", None),
+    (19, "APROVADO", 0.85), (18, "APROVADO", 0.75), (16, "CORRIGIDO", 0.45),
+    (12, "APROVADO", 0.92), (10, "PENDENTE_REVISAO", 0.65), (9, "CORRIGIDO", 0.35),
+    (5, "APROVADO", 0.88), (3, "CORRIGIDO", 0.72), (2, "APROVADO", None),
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'metricas.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    agora = datetime.now()
+    for i, (dias, status, confianca) in enumerate(CLASSIFICACOES):
+        session.add(ClassificacaoRevisao(
+            produto_id=i, descricao_produto=f"PRODUTO {i}", status_revisao=status,
+            confianca_sugerida=confianca, data_classificacao=agora - timedelta(days=dias)
+        ))
+    # Hoje: cai na última semana (min(dias // 7, total_semanas - 1))
+    session.add(ClassificacaoRevisao(
+        produto_id=99, descricao_produto="HOJE", status_revisao="CORRIGIDO",
+        confianca_sugerida=0.6, data_classificacao=agora - timedelta(seconds=1)
+    ))
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def _stats_antigas(db, inicio, fim):
+    """Consultas por período da implementação anterior (uma por contagem)"""
+    query = db.query(ClassificacaoRevisao).filter(and_(
+        ClassificacaoRevisao.data_classificacao >= inicio, ClassificacaoRevisao.data_classificacao < fim
+    ))
+    revisadas = query.filter(ClassificacaoRevisao.status_revisao.in_(["APROVADO", "CORRIGIDO"])).count()
+    aprovadas = query.filter(ClassificacaoRevisao.status_revisao == "APROVADO").count()
+    confianca = query.with_entities(func.avg(ClassificacaoRevisao.confianca_sugerida)).scalar()
+    return {
+        "total": query.count(),
+        "revisadas": revisadas,
+        "taxa_aprovacao": aprovadas / revisadas * 100 if revisadas else 0,
+        "confianca_media": float(confianca) if confianca else 0.0,
+    }
+
+
+class TestAcuraciaTemporal:
+    """Mesmas contagens semanais das consultas por semana anteriores"""
+
+    def test_semanas_iguais_as_consultas_por_semana(self, db):
+        semanas = MetricsService().calcular_acuracia_temporal(db, periodo_dias=28)
+        data_inicio = datetime.now() - timedelta(days=28)
+
+        esperadas = []
+        for i in range(0, 28, 7):
+            fim = data_inicio + timedelta(days=i + 7) if i + 7 < 28 else datetime.now()
+            stats = _stats_antigas(db, data_inicio + timedelta(days=i), fim)
+            esperadas.append({
+                "semana": (data_inicio + timedelta(days=i)).strftime("%Y-%m-%d"),
+                "total_classificacoes": stats["total"],
+                "total_revisadas": stats["revisadas"],
+                "acuracia": round(stats["taxa_aprovacao"], 2),
+                "confianca_media": round(stats["confianca_media"], 3),
+            })
+
+        assert semanas == esperadas
+        assert semanas[-1]["total_classificacoes"] == 4  # dias 5, 3, 2 e hoje (dia 28 -> semana 3)
+
+    def test_stats_de_periodo_iguais_as_consultas_anteriores(self, db):
+        service = MetricsService()
+        agora = datetime.now()
+
+        for inicio, fim in ((agora - timedelta(days=14), agora),
+                            (agora - timedelta(days=28), agora - timedelta(days=14))):
+            stats = service._calcular_stats_periodo(db, inicio, fim)
+            antigas = _stats_antigas(db, inicio, fim)
+            assert stats["total_revisadas"] == antigas["revisadas"]
+            assert stats["taxa_aprovacao"] == pytest.approx(antigas["taxa_aprovacao"])
+            assert stats["confianca_media"] == pytest.approx(antigas["confianca_media"])
+
+
+class TestCacheAgregados:
+    """Reaproveitamento para inícios posteriores e invalidação por commit"""
+
+    def test_inicio_posterior_reaproveita_agregacao(self, db, monkeypatch):
+        service = MetricsService()
+        service.calcular_acuracia_temporal(db, periodo_dias=28)
+        esperado = MetricsService().calcular_estatisticas(db, periodo_dias=7)
+
+        consultas = []
+        original = service._consultar_agregado_diario
+        monkeypatch.setattr(service, "_consultar_agregado_diario",
+                            lambda *args: consultas.append(args) or original(*args))
+
+        assert service.calcular_estatisticas(db, periodo_dias=7) == esperado
+        assert service._calcular_stats_periodo(db, datetime.now() - timedelta(days=14), datetime.now())
+        assert consultas == []
+
+    def test_commit_invalida_agregacao(self, db):
+        service = MetricsService()
+        antes = service.calcular_estatisticas(db, periodo_dias=7)
+
+        db.add(ClassificacaoRevisao(
+            produto_id=100, descricao_produto="NOVO", status_revisao="APROVADO",
+            confianca_sugerida=0.9, data_classificacao=datetime.now() - timedelta(days=1)
+        ))
+        db.commit()
+
+        depois = service.calcular_estatisticas(db, periodo_dias=7)
+        assert depois["total_classificacoes"] == antes["total_classificacoes"] + 1
+        assert depois["aprovadas"] == antes["aprovadas"] + 1
@@ -0,0 +1,214 @@
+"""
+Testes unitários para o agendador de requisições ao LLM
+"""
+import sqlite3
+import threading
+import time
+import pytest
+from pathlib import Path
+import sys
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from llm.request_scheduler import (
+    LLMRequestScheduler,
+    LLMQueueTimeout,
+    ScheduledLLMClient,
+    llm_request_context,
+    prioridade_padrao,
+    contexto_atual,
+    PRIORIDADE_INTERATIVA,
+    PRIORIDADE_LOTE,
+)
+from llm.slots_compartilhados import SlotsCompartilhados
+
+
+def aguardar(condicao, timeout=2.0):
+    limite = time.monotonic() + timeout
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida"
+        time.sleep(0.005)
+
+
+class TestLLMRequestScheduler:
+    """Testes de prioridade, limites e justiça entre empresas"""
+
+    def _ocupar(self, scheduler, prioridade, empresa="padrao"):
+        """Ocupa um slot até o evento retornado ser liberado."""
+        liberar = threading.Event()
+        thread = threading.Thread(
+            target=scheduler.submit, args=(liberar.wait,),
+            kwargs={"prioridade": prioridade, "empresa_id": empresa}
+        )
+        thread.start()
+        return liberar, thread
+
+    def _enfileirar(self, scheduler, ordem, prioridade, empresa):
+        thread = threading.Thread(
+            target=scheduler.submit, args=(ordem.append, (prioridade, empresa)),
+            kwargs={"prioridade": prioridade, "empresa_id": empresa}
+        )
+        thread.start()
+        return thread
+
+    def _fila(self, scheduler, prioridade):
+        return scheduler.obter_metricas()["classes"][prioridade]["fila"]
+
+    def test_interativa_passa_a_frente_do_lote(self):
+        scheduler = LLMRequestScheduler(max_concorrencia=1, limites_por_classe={PRIORIDADE_LOTE: 1})
+        liberar, ocupante = self._ocupar(scheduler, PRIORIDADE_LOTE)
+        aguardar(lambda: scheduler.obter_metricas()["em_execucao"] == 1)
+
+        ordem = []
+        threads = [self._enfileirar(scheduler, ordem, PRIORIDADE_LOTE, "1")]
+        aguardar(lambda: self._fila(scheduler, PRIORIDADE_LOTE) == 1)
+        threads.append(self._enfileirar(scheduler, ordem, PRIORIDADE_INTERATIVA, "1"))
+        aguardar(lambda: self._fila(scheduler, PRIORIDADE_INTERATIVA) == 1)
+
+        liberar.set()
+        for thread in [ocupante] + threads:
+            thread.join(2)
+
+        assert ordem == [(PRIORIDADE_INTERATIVA, "1"), (PRIORIDADE_LOTE, "1")]
+
+    def test_limite_do_lote_reserva_slot_interativo(self):
+        scheduler = LLMRequestScheduler(max_concorrencia=2, limites_por_classe={PRIORIDADE_LOTE: 1})
+        liberar, ocupante = self._ocupar(scheduler, PRIORIDADE_LOTE)
+        aguardar(lambda: scheduler.obter_metricas()["em_execucao"] == 1)
+
+        ordem = []
+        lote = self._enfileirar(scheduler, ordem, PRIORIDADE_LOTE, "1")
+        aguardar(lambda: self._fila(scheduler, PRIORIDADE_LOTE) == 1)
+        interativa = self._enfileirar(scheduler, ordem, PRIORIDADE_INTERATIVA, "1")
+        interativa.join(2)
+
+        # A interativa executou mesmo com o lote ocupando seu único slot
+        assert ordem == [(PRIORIDADE_INTERATIVA, "1")]
+
+        liberar.set()
+        for thread in (ocupante, lote):
+            thread.join(2)
+        assert ordem[-1] == (PRIORIDADE_LOTE, "1")
+
+    def test_fila_justa_entre_empresas(self):
+        scheduler = LLMRequestScheduler(max_concorrencia=1)
+        liberar, ocupante = self._ocupar(scheduler, PRIORIDADE_LOTE)
+        aguardar(lambda: scheduler.obter_metricas()["em_execucao"] == 1)
+
+        ordem = []
+        threads = []
+        for empresa in ("A", "A", "A", "B"):
+            threads.append(self._enfileirar(scheduler, ordem, PRIORIDADE_LOTE, empresa))
+            aguardar(lambda: self._fila(scheduler, PRIORIDADE_LOTE) == len(threads))
+
+        fila_por_empresa = scheduler.obter_metricas()["classes"][PRIORIDADE_LOTE]["fila_por_empresa"]
+        assert fila_por_empresa == {"A": 3, "B": 1}
+
+        liberar.set()
+        for thread in [ocupante] + threads:
+            thread.join(2)
+
+        assert [empresa for _, empresa in ordem] == ["A", "B", "A", "A"]
+
+    def test_timeout_na_fila(self):
+        scheduler = LLMRequestScheduler(max_concorrencia=1, timeout_fila=0.05)
+        liberar, ocupante = self._ocupar(scheduler, PRIORIDADE_LOTE)
+        aguardar(lambda: scheduler.obter_metricas()["em_execucao"] == 1)
+
+        with pytest.raises(LLMQueueTimeout):
+            scheduler.submit(lambda: None, prioridade=PRIORIDADE_LOTE)
+
+        liberar.set()
+        ocupante.join(2)
+        metricas = scheduler.obter_metricas()["classes"][PRIORIDADE_LOTE]
+        assert metricas["timeouts"] == 1
+        assert metricas["fila"] == 0
+
+
+class TestContextoRequisicao:
+    """Testes da propagação de prioridade e empresa"""
+
+    def test_cliente_usa_contexto_da_requisicao(self):
+        scheduler = LLMRequestScheduler()
+        recebidos = []
+
+        class FakeLLM:
+            model = "fake"
+
+            def generate(self, prompt, system=None, **kwargs):
+                recebidos.append(contexto_atual())
+                return {"response": "{}"}
+
+        client = ScheduledLLMClient(FakeLLM(), scheduler)
+        with llm_request_context(PRIORIDADE_INTERATIVA, empresa_id=7):
+            client.generate("teste")
+
+        assert client.model == "fake"
+        assert recebidos == [(PRIORIDADE_INTERATIVA, "7")]
+        assert scheduler.obter_metricas()["classes"][PRIORIDADE_INTERATIVA]["concluidas"] == 1
+
+    def test_prioridade_padrao_nao_rebaixa_contexto(self):
+        @prioridade_padrao(PRIORIDADE_LOTE)
+        def classificar():
+            return contexto_atual()[0]
+
+        assert classificar() == PRIORIDADE_LOTE
+        with llm_request_context(PRIORIDADE_INTERATIVA):
+            assert classificar() == PRIORIDADE_INTERATIVA
+
+
+class TestSlotsCompartilhados:
+    """Limites somados entre agendadores de processos diferentes (mesmo banco)"""
+
+    def _agendador(self, db_path, timeout_fila=None):
+        limites = {PRIORIDADE_INTERATIVA: 2, PRIORIDADE_LOTE: 1}
+        return LLMRequestScheduler(
+            max_concorrencia=2, limites_por_classe=limites, timeout_fila=timeout_fila,
+            slots_compartilhados=SlotsCompartilhados(db_path, 2, limites)
+        )
+
+    def test_lote_limitado_entre_processos_sem_bloquear_interativa(self, tmp_path):
+        worker_1, worker_2 = self._agendador(tmp_path / "slots.db"), self._agendador(tmp_path / "slots.db")
+        api = self._agendador(tmp_path / "slots.db")
+        ordem = []
+
+        liberar = threading.Event()
+        ocupante = threading.Thread(target=worker_1.submit, args=(liberar.wait,), kwargs={"prioridade": PRIORIDADE_LOTE})
+        ocupante.start()
+        aguardar(lambda: worker_1.slots_compartilhados.em_uso() == {PRIORIDADE_LOTE: 1})
+
+        lote = threading.Thread(target=worker_2.submit, args=(ordem.append, PRIORIDADE_LOTE),
+                                kwargs={"prioridade": PRIORIDADE_LOTE})
+        lote.start()
+        api.submit(ordem.append, PRIORIDADE_INTERATIVA, prioridade=PRIORIDADE_INTERATIVA)
+        time.sleep(0.1)
+        assert ordem == [PRIORIDADE_INTERATIVA]
+
+        liberar.set()
+        ocupante.join()
+        lote.join(timeout=2)
+        assert ordem == [PRIORIDADE_INTERATIVA, PRIORIDADE_LOTE]
+        assert api.slots_compartilhados.em_uso() == {}
+
+    def test_timeout_devolve_slot_local(self, tmp_path):
+        worker_1 = self._agendador(tmp_path / "slots.db")
+        worker_2 = self._agendador(tmp_path / "slots.db", timeout_fila=0.1)
+        lease = worker_1.slots_compartilhados.adquirir(PRIORIDADE_LOTE)
+
+        with pytest.raises(LLMQueueTimeout):
+            worker_2.submit(lambda: None, prioridade=PRIORIDADE_LOTE)
+
+        assert worker_2.obter_metricas()["em_execucao"] == 0
+        worker_1.slots_compartilhados.liberar(lease)
+        assert worker_2.submit(lambda: "ok", prioridade=PRIORIDADE_LOTE) == "ok"
+
+    def test_lease_de_processo_encerrado_liberado(self, tmp_path):
+        slots = SlotsCompartilhados(tmp_path / "slots.db", 2, {PRIORIDADE_LOTE: 1})
+        slots.adquirir(PRIORIDADE_LOTE)
+        conn = sqlite3.connect(tmp_path / "slots.db")
+        conn.execute("UPDATE llm_slots SET pid = ?", (2 ** 22 + 12345,))
+        conn.commit()
+        conn.close()
+
+        assert slots.tentar_adquirir(PRIORIDADE_LOTE) is not None
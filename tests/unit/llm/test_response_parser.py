@@ -0,0 +1,133 @@
+"""
+Testes unitários para a extração de JSON das respostas LLM
+"""
+import json
+import pytest
+from pathlib import Path
+import sys
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from llm.response_parser import (
+    ResponseParser,
+    ResponseParseError,
+    extract_json_object,
+    iter_json_spans,
+    parse_stats,
+)
+
+
+class TestExtracaoJson:
+    """Testes para localização do objeto JSON na resposta"""
+
+    def test_prosa_e_bloco_de_codigo(self):
+        texto = 'Claro! Segue a análise:\n```json\n{"ncm_recomendado": "30049069"}\n```\nEspero ter ajudado.'
+        objeto, reparado = extract_json_object(texto)
+
+        assert objeto == {"ncm_recomendado": "30049069"}
+        assert not reparado
+
+    def test_chaves_dentro_de_strings(self):
+        texto = '{"justificativa": "usa {chaves} e \\"aspas\\"", "ncm_recomendado": "1"} texto final }'
+        objeto, _ = extract_json_object(texto)
+
+        assert objeto["justificativa"] == 'usa {chaves} e "aspas"'
+
+    def test_chave_solta_na_prosa(self):
+        texto = 'Formato { esperado abaixo\n{"tem_cest": false}'
+        objeto, _ = extract_json_object(texto)
+
+        assert objeto == {"tem_cest": False}
+
+    def test_artefatos_comuns_reparados(self):
+        texto = '{"tem_cest": True, // comentário\n "cest_alternativos": ["13.001.00",], "cest_recomendado": None,}'
+        objeto, reparado = extract_json_object(texto)
+
+        assert reparado
+        assert objeto == {"tem_cest": True, "cest_alternativos": ["13.001.00"], "cest_recomendado": None}
+
+    def test_aspas_tipograficas_dentro_de_strings(self):
+        texto = '{"ncm_recomendado": "30049069", "justificativa": "Produto “Dipirona” é o ‘analgésico’"}'
+        objeto, reparado = extract_json_object(texto)
+
+        assert not reparado
+        assert objeto["justificativa"] == "Produto “Dipirona” é o ‘analgésico’"
+
+    def test_aspas_tipograficas_delimitadoras_reparadas(self):
+        texto = '{“ncm_recomendado”: “30049069”, “justificativa”: “Produto “Dipirona” com "aspas"”}'
+        objeto, reparado = extract_json_object(texto)
+
+        assert reparado
+        assert objeto == {"ncm_recomendado": "30049069", "justificativa": 'Produto “Dipirona” com "aspas"'}
+
+    def test_objeto_dentro_de_abertura_sem_fechamento(self):
+        texto = 'Resposta { incompleta {"a": {"b": 1}} e [ {"tem_cest": true}'
+        assert [texto[i:j] for i, j in iter_json_spans(texto)] == ['{"a": {"b": 1}}', '{"tem_cest": true}']
+
+    def test_aberturas_soltas_em_varredura_linear(self):
+        # Com recomeço após cada abertura solta, a varredura seria quadrática
+        texto = "{ " * 50000 + '{"tem_cest": false}'
+        objeto, _ = extract_json_object(texto)
+
+        assert objeto == {"tem_cest": False}
+
+    def test_sem_json(self):
+        with pytest.raises(ResponseParseError):
+            extract_json_object("Não foi possível classificar o produto.")
+
+
+class TestResponseParser:
+    """Testes para validação por esquema e estatísticas"""
+
+    def setup_method(self):
+        parse_stats.limpar()
+
+    def test_normaliza_tipos_do_esquema(self):
+        resultado = ResponseParser("ncm").parse(
+            '{"ncm_recomendado": 30049069, "confianca": "85%", "ncm_alternativos": "30049099"}'
+        )
+
+        assert resultado["ncm_recomendado"] == "30049069"
+        assert resultado["confianca"] == pytest.approx(0.85)
+        assert resultado["ncm_alternativos"] == ["30049099"]
+
+    @pytest.mark.parametrize("confianca, esperada", [
+        (0.85, 0.85), (1, 1.0), (85, 0.85), (85.5, 0.855), ("85", 0.85), ("0,9", 0.9),
+        ("0.5%", 0.005), ("120%", 1.0), (150, 1.0), (8500.0, 1.0),
+    ])
+    def test_confianca_em_escala_unitaria(self, confianca, esperada):
+        resultado = ResponseParser("ncm").parse(
+            json.dumps({"ncm_recomendado": "30049069", "confianca": confianca})
+        )
+
+        assert resultado["confianca"] == pytest.approx(esperada)
+
+    def test_campo_obrigatorio_ausente(self):
+        with pytest.raises(ResponseParseError):
+            ResponseParser("cest").parse('{"cest_recomendado": "13.001.00"}')
+
+    def test_opcional_invalido_e_descartado(self):
+        resultado = ResponseParser("ncm").parse('{"ncm_recomendado": "30049069", "confianca": "alta"}')
+
+        assert "confianca" not in resultado
+
+    def test_taxa_de_falha_por_agente_e_modelo(self):
+        parser = ResponseParser("ncm")
+        parser.parse('{"ncm_recomendado": "1"}', modelo="llama3")
+        with pytest.raises(ResponseParseError):
+            parser.parse("sem json", modelo="llama3")
+
+        resumo = parse_stats.resumo()
+        assert resumo == [{
+            "agente": "ncm", "modelo": "llama3", "total": 2, "falhas": 1,
+            "reparados": 0, "taxa_falha": 0.5
+        }]
+
+    def test_lote_por_indice(self):
+        resposta = '[{"indice": 2, "tem_cest": false}, {"indice": 1, "tem_cest": "sim"}, {"indice": 3}]'
+        itens = ResponseParser("cest").parse_batch(resposta, 3)
+
+        assert itens[0] == {"tem_cest": True}
+        assert itens[1] == {"tem_cest": False}
+        assert itens[2] is None
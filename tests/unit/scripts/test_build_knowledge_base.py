@@ -0,0 +1,119 @@
+"""
+Testes unitários para a construção bulk da base de conhecimento
+"""
+import sqlite3
+import pandas as pd
+import pytest
+from pathlib import Path
+import sys
+
+# Adicionar src e scripts ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "scripts"))
+
+from build_knowledge_base import SQLiteKnowledgeBaseBuilder, NCMMatcher, PipelineEstagios
+
+
+class FakeDataLoader:
+    """Fontes mínimas cobrindo normalização, correspondência parcial e herança"""
+
+    def load_ncm_descriptions(self):
+        return [
+            {"Código": "30", "Descricao_Completa": "Produtos farmacêuticos"},
+            {"Código": "30.04", "Descricao_Completa": " Medicamentos "},
+            {"Código": "3004.90.69", "Descricao_Completa": "Outros medicamentos"},
+            {"Código": "3004.90.99", "Descricao_Completa": "Outros"},
+            {"Código": "3004.90.99", "Descricao_Completa": "Duplicado"},
+            {"Código": "2202.10.00", "Descricao_Completa": "Águas com açúcar"},
+            {"Código": "", "Descricao_Completa": "Sem código"},
+        ]
+
+    def load_cest_mapping(self):
+        return pd.DataFrame([
+            {"CEST": "13.001.00", "DESCRICAO": "Medicamentos de referência", "NCM_SH": "3004"},
+            {"CEST": "13.001.00", "DESCRICAO": "Repetido", "NCM_SH": "3004.90.69"},
+            {"CEST": "03.007.00", "DESCRICAO": "", "DESCRIÇÃO": "Bebidas adoçadas", "NCM_SH": "2202.10"},
+            {"CEST": "28.001.00", "DESCRICAO": "Material de construção", "NCM_SH": "9999"},
+            {"CEST": float("nan"), "DESCRICAO": "Sem CEST", "NCM_SH": "3004"},
+        ])
+
+    def load_produtos_selecionados(self):
+        return pd.DataFrame([
+            {"ncm": "30049069", "gtin": "789000000001", "descricao": " DIPIRONA "},
+            {"ncm": "3004906", "gtin": "789000000002", "descricao": "PARACETAMOL"},
+            {"ncm": "22021000", "gtin": "789000000003", "descricao": "REFRIGERANTE"},
+            {"ncm": "87032100", "gtin": "789000000004", "descricao": "SEM NCM NA BASE"},
+            {"ncm": "30049069", "gtin": "", "descricao": "SEM GTIN"},
+        ])
+
+
+CONSULTAS = {
+    "ncm_hierarchy": "SELECT codigo_ncm, descricao_oficial, descricao_curta, nivel_hierarquico, codigo_pai, ativo "
+                     "FROM ncm_hierarchy",
+    "cest_categories": "SELECT codigo_cest, descricao_cest, categoria_produto, ativo FROM cest_categories",
+    "ncm_cest_mapping": "SELECT ncm_codigo, cest_codigo, tipo_relacao, confianca_mapeamento, fonte_dados, ativo "
+                        "FROM ncm_cest_mapping",
+    "produtos_exemplos": "SELECT ncm_codigo, gtin, descricao_produto, fonte_dados, qualidade_classificacao, ativo "
+                         "FROM produtos_exemplos",
+    "knowledge_metadata": "SELECT versao_base, total_ncms, total_cests, total_mapeamentos, total_exemplos, ativo "
+                          "FROM knowledge_metadata",
+}
+
+
+def construir(diretorio, monkeypatch, bulk, max_workers=1):
+    monkeypatch.chdir(diretorio)
+    builder = SQLiteKnowledgeBaseBuilder(max_workers=max_workers)
+    builder.data_loader = FakeDataLoader()
+    builder.data_loader_factory = FakeDataLoader
+    sucesso = builder.build_sqlite_knowledge_base_bulk() if bulk else builder.build_sqlite_knowledge_base()
+    assert sucesso
+
+    conn = sqlite3.connect(diretorio / "data" / "knowledge_base" / "knowledge_base.sqlite")
+    try:
+        return {tabela: sorted(conn.execute(sql).fetchall(), key=repr) for tabela, sql in CONSULTAS.items()}
+    finally:
+        conn.close()
+
+
+class TestConstrucaoBulk:
+    """Paridade entre a construção bulk e a construção linha a linha"""
+
+    def test_mesmo_conteudo_da_construcao_orm(self, tmp_path, monkeypatch):
+        (tmp_path / "orm").mkdir()
+        (tmp_path / "bulk").mkdir()
+        orm = construir(tmp_path / "orm", monkeypatch, bulk=False)
+        bulk = construir(tmp_path / "bulk", monkeypatch, bulk=True, max_workers=2)
+
+        assert bulk == orm
+        assert ("30049099", "13.001.00", "HERDADO", pytest.approx(0.8), "HERANCA_CEST_RO", 1) in bulk["ncm_cest_mapping"]
+
+    def test_reconstrucao_substitui_base_e_snapshot(self, tmp_path, monkeypatch):
+        construir(tmp_path, monkeypatch, bulk=True)
+        tabelas = construir(tmp_path, monkeypatch, bulk=True)
+
+        base = tmp_path / "data" / "knowledge_base"
+        assert len(tabelas["knowledge_metadata"]) == 1
+        assert (base / "knowledge_base.snapshot").exists()
+        assert not (base / "knowledge_base.sqlite.building").exists()
+
+
+def test_pipeline_registra_tempo_de_cada_estagio():
+    with PipelineEstagios(max_workers=1) as pipeline:
+        pipeline.submeter("ncms", FakeDataLoader().load_cest_mapping)
+        assert len(pipeline.resultado("ncms")) == 5
+    with pipeline.medir("escrita"):
+        pass
+
+    assert [(nome, execucao, linhas) for nome, execucao, _, linhas in pipeline.tempos] == [
+        ("ncms", "principal", 5), ("escrita", "principal", 0)
+    ]
+    assert pipeline.tabela()[-1].startswith("total (parede)")
+
+
+def test_matcher_prefere_exato_depois_mais_especifico_depois_prefixo():
+    matcher = NCMMatcher(["30", "3004", "30049069", "30049099"])
+
+    assert matcher.melhor("3004") == "3004"
+    assert matcher.melhor("300490") == "30049069"
+    assert matcher.melhor("30059999") == "30"
+    assert matcher.melhor("87") is None
@@ -0,0 +1,66 @@
+"""
+Testes unitários para a verificação de chamadas bloqueantes em corrotinas
+"""
+import ast
+import textwrap
+from pathlib import Path
+import sys
+
+# Adicionar scripts ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "scripts"))
+
+from validate_code_quality import find_blocking_calls
+
+API_DIR = Path(__file__).parent.parent.parent.parent / "src" / "api"
+
+
+def _bloqueantes(codigo: str):
+    codigo = textwrap.dedent(codigo)
+    return [(corrotina, chamada) for _, corrotina, chamada in find_blocking_calls(ast.parse(codigo), codigo)]
+
+
+class TestChamadasBloqueantes:
+    """Banco/LLM síncronos só em rotas def ou via asyncio.to_thread"""
+
+    def test_detecta_chamadas_diretas_e_indiretas(self):
+        codigo = '''
+        def consultar_total(service):
+            return service.contar_registros()
+
+        async def rota_bloqueante(session):
+            session.execute("SELECT 1")
+            return consultar_total(None)
+
+        async def rota_com_consulta_adiada(request):
+            return responder(request, lambda: unified_service.buscar_ncm("3004"))
+        '''
+
+        assert _bloqueantes(codigo) == [
+            ("rota_bloqueante", "session.execute"),
+            ("rota_bloqueante", "consultar_total"),
+            ("rota_com_consulta_adiada", "responder"),
+        ]
+
+    def test_ignora_rotas_sincronas_threadpool_e_marcadas(self):
+        codigo = '''
+        def rota_sincrona():
+            return unified_service.get_dashboard_stats()
+
+        async def rota_com_thread(background_tasks):
+            background_tasks.add_task(unified_service.registrar_interacao_web, {})
+            assinatura = motor_processamento.barramento.assinar("s1")
+            service.contadores_em_memoria()  # nao-bloqueante
+            return await asyncio.to_thread(unified_service.reconciliar_estatisticas)
+        '''
+
+        assert _bloqueantes(codigo) == []
+
+    def test_apis_sem_bloqueio_do_event_loop(self):
+        encontradas = {}
+        for arquivo in sorted(API_DIR.glob("*.py")):
+            codigo = arquivo.read_text(encoding="utf-8")
+            chamadas = find_blocking_calls(ast.parse(codigo), codigo)
+            if chamadas:
+                encontradas[arquivo.name] = chamadas
+
+        assert encontradas == {}
@@ -0,0 +1,52 @@
+"""
+Testes unitários para o cache de respostas das consultas de referência
+"""
+from pathlib import Path
+import sys
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from services.cache_respostas import CacheRespostas, etag_corresponde, gerar_etag, TABELAS_GOLDEN_SET
+from services.unified_sqlite_service import UnifiedSQLiteService
+
+
+class TestCacheRespostas:
+    """Validade por geração das tabelas, TTL e LRU"""
+
+    def test_commit_orm_invalida_a_entrada(self, tmp_path):
+        service = UnifiedSQLiteService(str(tmp_path / "unified.db"))
+        cache = CacheRespostas()
+        chave = ("golden-set", None, 50)
+
+        cache.guardar(chave, cache.geracao(TABELAS_GOLDEN_SET), b"[]", total_itens=0)
+        assert cache.obter(chave, TABELAS_GOLDEN_SET).corpo == b"[]"
+
+        service.adicionar_ao_golden_set({'produto_id': 1, 'descricao_produto': 'DIPIRONA 500MG',
+                                         'ncm_final': '30049069', 'revisado_por': 'teste'})
+        assert cache.obter(chave, TABELAS_GOLDEN_SET) is None
+        assert len(service.buscar_golden_set()) == 1
+
+        cache.guardar(chave, cache.geracao(TABELAS_GOLDEN_SET), b"[1]")
+        CacheRespostas.invalidar(*TABELAS_GOLDEN_SET)
+        assert cache.obter(chave, TABELAS_GOLDEN_SET) is None
+        assert cache.estatisticas()["acertos"] == 1
+
+    def test_ttl_e_lru(self):
+        cache = CacheRespostas(max_entradas=2, ttl_segundos=300)
+        for chave in ("a", "b", "c"):
+            cache.guardar(chave, cache.geracao(()), chave.encode())
+        assert cache.obter("a", ()) is None
+        assert cache.obter("c", ()).corpo == b"c"
+
+        expirado = CacheRespostas(ttl_segundos=0)
+        expirado.guardar("a", (), b"a")
+        assert expirado.obter("a", ()) is None
+
+    def test_if_none_match(self):
+        etag = gerar_etag(b'{"total":0}')
+        assert etag.startswith('"') and etag != gerar_etag(b'{"total":1}')
+        assert etag_corresponde(etag, etag)
+        assert etag_corresponde(f'"outra", W/{etag}', etag)
+        assert etag_corresponde("*", etag)
+        assert not etag_corresponde(None, etag) and not etag_corresponde('"outra"', etag)
@@ -0,0 +1,104 @@
+"""
+Testes unitários para o rastreamento de agentes do serviço por empresa
+"""
+from pathlib import Path
+import sys
+import threading
+
+# Adicionar raiz e src ao path (o serviço importa via src.*)
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from src.services.empresa_classificacao_service import EmpresaClassificacaoService
+from src.database.empresa_database_manager import SQL_TABELA_AGENTE_ACOES
+
+
+class TestRastreamentoAgentes:
+    """Writer compartilhado e leitura consistente com o buffer"""
+
+    def test_servicos_por_requisicao_compartilham_o_writer(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        primeiro = EmpresaClassificacaoService()
+        threads = threading.active_count()
+
+        servicos = [EmpresaClassificacaoService() for _ in range(10)]
+
+        assert threading.active_count() == threads
+        assert all(servico.rastreamento is primeiro.rastreamento for servico in servicos)
+
+    def test_produto_detalhado_inclui_acoes_no_buffer(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        servico = EmpresaClassificacaoService()
+        servico.db_manager.create_empresa_database(1, {})
+        produto_id = servico.db_manager.insert_produto(1, {"nome_produto": "DIPIRONA 500MG"})
+
+        servico._registrar_acao(1, {
+            "produto_id": produto_id, "classificacao_id": 0, "agente_nome": "ncm_agent", "acao_tipo": "classificacao"
+        })
+
+        acoes = servico.get_produto_detalhado(1, produto_id)["acoes_agentes"]
+        assert [acao["agente_nome"] for acao in acoes] == ["ncm_agent"]
+
+    def test_acoes_sem_classificacao_gravadas(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        servico = EmpresaClassificacaoService()
+        servico.db_manager.create_empresa_database(1, {})
+        produto_id = servico.db_manager.insert_produto(1, {"nome_produto": "DIPIRONA 500MG"})
+
+        # Como em _classificar_com_rastreamento: a classificação ainda não existe
+        servico._registrar_acao(1, {
+            "produto_id": produto_id, "classificacao_id": None, "agente_nome": "ncm_agent", "acao_tipo": "classificacao"
+        })
+        servico._registrar_consulta(1, {
+            "produto_id": produto_id, "agente_nome": "ncm_agent", "tipo_consulta": "semantic_search",
+            "query_original": "dipirona"
+        })
+
+        assert servico.flush_rastreamento()
+        detalhes = servico.get_produto_detalhado(1, produto_id)
+        assert [acao["classificacao_id"] for acao in detalhes["acoes_agentes"]] == [None]
+        assert len(detalhes["consultas_agentes"]) == 1
+
+    def test_banco_anterior_convertido_na_gravacao(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        servico = EmpresaClassificacaoService()
+        servico.db_manager.create_empresa_database(2, {})
+        produto_id = servico.db_manager.insert_produto(2, {"nome_produto": "DIPIRONA 500MG"})
+        # Layout anterior: classificacao_id NOT NULL, com uma ação já gravada
+        with servico.db_manager.conexao_empresa(2) as conn:
+            conn.execute("DROP TABLE agente_acoes")
+            conn.execute(SQL_TABELA_AGENTE_ACOES.replace("classificacao_id INTEGER,", "classificacao_id INTEGER NOT NULL,"))
+            conn.execute(
+                "INSERT INTO agente_acoes (produto_id, classificacao_id, agente_nome, acao_tipo) VALUES (?, 7, 'cest_agent', 'busca')",
+                (produto_id,)
+            )
+
+        servico._registrar_acao(2, {
+            "produto_id": produto_id, "classificacao_id": None, "agente_nome": "ncm_agent", "acao_tipo": "classificacao"
+        })
+
+        assert servico.flush_rastreamento()
+        acoes = servico.get_produto_detalhado(2, produto_id)["acoes_agentes"]
+        assert sorted((acao["agente_nome"], acao["classificacao_id"]) for acao in acoes) == [
+            ("cest_agent", 7), ("ncm_agent", None)
+        ]
+
+    def test_falha_em_uma_empresa_nao_descarta_as_outras(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        servico = EmpresaClassificacaoService()
+        servico.db_manager.create_empresa_database(3, {})
+        produto_id = servico.db_manager.insert_produto(3, {"nome_produto": "DIPIRONA 500MG"})
+        metricas = servico.rastreamento.obter_metricas()
+
+        # Empresa 4 sem banco criado; na 3, uma linha inválida no meio do lote
+        servico._registrar_acao(4, {"produto_id": 1, "agente_nome": "ncm_agent", "acao_tipo": "classificacao"})
+        servico._registrar_acao(3, {"produto_id": produto_id, "agente_nome": "ncm_agent", "acao_tipo": "classificacao"})
+        servico._registrar_acao(3, {"produto_id": produto_id, "agente_nome": None, "acao_tipo": "classificacao"})
+        servico._registrar_acao(3, {"produto_id": produto_id, "agente_nome": "cest_agent", "acao_tipo": "classificacao"})
+
+        assert not servico.flush_rastreamento()
+        acoes = servico.get_produto_detalhado(3, produto_id)["acoes_agentes"]
+        assert sorted(acao["agente_nome"] for acao in acoes) == ["cest_agent", "ncm_agent"]
+        depois = servico.rastreamento.obter_metricas()
+        assert depois["nao_gravados"] - metricas["nao_gravados"] == 2
+        assert depois["gravados"] - metricas["gravados"] == 2
@@ -0,0 +1,124 @@
+"""
+Testes unitários para o barramento de eventos de progresso
+"""
+import asyncio
+import threading
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import text
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from services.eventos_progresso import (
+    BarramentoEventos, contexto_progresso, emitir_progresso, ETAPA_EXPANSAO, ETAPA_PROPAGACAO,
+    ETAPA_REPRESENTANTE
+)
+from services.processamento_lote import MotorProcessamento, ProcessadorLote
+from services.unified_sqlite_service import UnifiedSQLiteService
+
+
+class TestBarramento:
+    """Pub/sub entre threads e event loop"""
+
+    def test_entrega_de_outra_thread_e_descarta_antigos(self):
+        async def cenario():
+            barramento = BarramentoEventos(max_eventos_assinatura=3)
+            assinatura = barramento.assinar("s1")
+            outra = barramento.assinar("s2")
+
+            thread = threading.Thread(target=lambda: [
+                barramento.publicar("s1", {"tipo": "bloco", "n": n}) for n in range(5)
+            ])
+            thread.start()
+            thread.join()
+            await asyncio.sleep(0)
+
+            recebidos = [(await assinatura.proximo(1))["n"] for _ in range(3)]
+            vazio = await outra.proximo(0.01)
+            assinatura.cancelar()
+            return recebidos, assinatura.descartados, vazio, barramento
+
+        recebidos, descartados, vazio, barramento = asyncio.run(cenario())
+        assert recebidos == [2, 3, 4] and descartados == 2 and vazio is None
+        assert barramento.ultimo_evento("s1")["n"] == 4
+        assert barramento.total_assinantes("s1") == 0
+
+    def test_emitir_sem_contexto_nao_faz_nada(self):
+        emitir_progresso(ETAPA_EXPANSAO, atual=1, total=2)
+
+        eventos = []
+        with contexto_progresso(eventos.append):
+            emitir_progresso(ETAPA_EXPANSAO, atual=1, total=2)
+        emitir_progresso(ETAPA_PROPAGACAO, produtos=2)
+        assert eventos == [{"tipo": "etapa", "etapa": ETAPA_EXPANSAO, "atual": 1, "total": 2}]
+
+    def test_representantes_avancam_a_cada_lote_do_agente(self):
+        hybrid_router = pytest.importorskip("orchestrator.hybrid_router")
+        eventos = []
+
+        def executar_lote(lote):
+            if 2 in lote:
+                raise RuntimeError("falha do LLM")
+            return [{"result": item} for item in lote]
+
+        with contexto_progresso(eventos.append):
+            resultados = hybrid_router.HybridRouter._executar_agente_em_lotes(
+                None, "NCM Agent", list(range(5)), 2, None, executar_lote
+            )
+
+        assert resultados == [{"result": 0}, {"result": 1}, None, None, {"result": 4}]
+        assert [(e["etapa"], e["agente"], e["atual"], e["total"]) for e in eventos] == [
+            (ETAPA_REPRESENTANTE, "NCM Agent", 2, 5), (ETAPA_REPRESENTANTE, "NCM Agent", 4, 5),
+            (ETAPA_REPRESENTANTE, "NCM Agent", 5, 5),
+        ]
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = UnifiedSQLiteService(str(tmp_path / "unified.db"))
+    with service.engine.begin() as conn:
+        for produto_id in range(1, 6):
+            conn.execute(text(
+                "INSERT INTO classificacoes_revisao (produto_id, descricao_produto, status_revisao) "
+                "VALUES (:p, :d, 'PENDENTE_REVISAO')"
+            ), {"p": produto_id, "d": f"PRODUTO {produto_id}"})
+    return service
+
+
+def _classificar(produtos, empresa_id):
+    for i in range(len(produtos)):
+        emitir_progresso(ETAPA_EXPANSAO, atual=i + 1, total=len(produtos))
+    emitir_progresso(ETAPA_PROPAGACAO, produtos=len(produtos))
+    return [{**p, 'ncm_classificado': '30049069', 'confianca_consolidada': 0.9} for p in produtos]
+
+
+class TestEventosDoWorker:
+    """Sessão executada publica status, etapas do classificador e blocos"""
+
+    def test_sequencia_de_eventos_da_sessao(self, service):
+        motor = MotorProcessamento(service, workers=0)
+        motor.tamanho_bloco = 3
+        sessao_id = motor.enfileirar_classificacao()['sessao_id']
+        assert motor.barramento.ultimo_evento(sessao_id)['status'] == 'pendente'
+
+        eventos = []
+        processador = ProcessadorLote(str(service.db_path), "w1", _classificar,
+                                      publicar_evento=lambda topico, evento: eventos.append((topico, evento)))
+        processador.executar_proxima()
+
+        assert {topico for topico, _ in eventos} == {sessao_id}
+        resumo = [(e['tipo'], e.get('etapa') or e.get('status'), e.get('bloco')) for _, e in eventos]
+        assert resumo == [
+            ('sessao', 'executando', None),
+            ('etapa', 'expansao', 1), ('etapa', 'expansao', 1), ('etapa', 'expansao', 1),
+            ('etapa', 'propagacao', 1), ('bloco', 'executando', None),
+            ('etapa', 'expansao', 2), ('etapa', 'expansao', 2),
+            ('etapa', 'propagacao', 2), ('bloco', 'executando', None),
+            ('sessao', 'concluido', None),
+        ]
+        bloco = eventos[5][1]
+        assert (bloco['blocos_concluidos'], bloco['total_blocos'], bloco['itens_processados']) == (1, 2, 3)
+        assert eventos[-1][1]['progresso'] == 100
@@ -0,0 +1,115 @@
+"""
+Testes unitários para a exportação de classificações em streaming
+"""
+import csv
+import io
+import json
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import event
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from services.unified_sqlite_service import UnifiedSQLiteService
+from services.exportacao_streaming import (
+    FormatoIndisponivelError, validar_formato, gerar_json, gerar_ndjson, gerar_csv, gerar_parquet
+)
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = UnifiedSQLiteService(str(tmp_path / "unified.db"))
+    for produto_id in range(1, 8):
+        classificacao_id = service.criar_classificacao({
+            "produto_id": produto_id, "descricao_produto": f"PRODUTO {produto_id}",
+            "ncm_sugerido": "30049069", "confianca_sugerida": 0.8,
+        })
+        with service.engine.begin() as conn:
+            conn.exec_driver_sql(
+                "UPDATE classificacoes_revisao SET status_revisao = ? WHERE id = ?",
+                ("APROVADO" if produto_id % 2 else "PENDENTE_REVISAO", classificacao_id)
+            )
+        service.salvar_explicacao_agente({"produto_id": produto_id, "agente_nome": "ncm"})
+        if produto_id <= 3:
+            service.registrar_consulta_agente({
+                "produto_id": produto_id, "agente_nome": "ncm", "tipo_consulta": "RAG"
+            })
+    return service
+
+
+def _contar_consultas(engine):
+    consultas = []
+    event.listen(engine, "before_cursor_execute", lambda *args: consultas.append(args[2]))
+    return consultas
+
+
+class TestExportacaoEmLotes:
+    """Paginação por chave e carga em lote de explicações e consultas"""
+
+    def test_mesmo_conteudo_das_consultas_por_produto(self, service):
+        lotes = list(service.iterar_classificacoes_para_exportacao(tamanho_lote=3))
+
+        assert [len(lote) for lote in lotes] == [3, 3, 1]
+        registros = [r for lote in lotes for r in lote]
+        assert [r["produto_id"] for r in registros] == list(range(1, 8))
+        for r in registros:
+            assert r["explicacoes"] == service.buscar_explicacoes_produto(r["produto_id"])
+            assert r["consultas"] == service.buscar_consultas_produto(r["produto_id"])
+
+    def test_tres_consultas_por_lote(self, service):
+        consultas = _contar_consultas(service.engine)
+        registros = service.buscar_classificacoes_para_exportacao()
+
+        assert len(registros) == 7
+        selects = [sql for sql in consultas if sql.lstrip().upper().startswith("SELECT")]
+        assert len(selects) == 3 + 1  # um lote cheio + a página vazia final
+
+    def test_filtro_por_status(self, service):
+        registros = service.buscar_classificacoes_para_exportacao(
+            {"status_revisao": "APROVADO"}, incluir_explicacoes=False, incluir_consultas=False
+        )
+
+        assert [r["produto_id"] for r in registros] == [1, 3, 5, 7]
+        assert "explicacoes" not in registros[0]
+
+
+class TestFormatosExportacao:
+    """Documentos gerados a partir dos lotes"""
+
+    LOTES = [[{"id": 1, "consultas": [{"q": "a"}]}, {"id": 2, "consultas": []}], [], [{"id": 3, "consultas": None}]]
+
+    def test_json_compativel_com_resposta_anterior(self):
+        documento = json.loads(b"".join(gerar_json(iter(self.LOTES), {"data_exportacao": "hoje"})))
+
+        assert [r["id"] for r in documento["dados"]] == [1, 2, 3]
+        assert documento["total_registros"] == 3 and documento["data_exportacao"] == "hoje"
+        assert json.loads(b"".join(gerar_json(iter([]))))["total_registros"] == 0
+
+    def test_ndjson_e_csv(self):
+        linhas = b"".join(gerar_ndjson(iter(self.LOTES))).decode().splitlines()
+        assert [json.loads(linha)["id"] for linha in linhas] == [1, 2, 3]
+
+        tabela = list(csv.DictReader(io.StringIO(b"".join(gerar_csv(iter(self.LOTES), ["id", "consultas"])).decode())))
+        assert [r["id"] for r in tabela] == ["1", "2", "3"]
+        assert json.loads(tabela[0]["consultas"]) == [{"q": "a"}]
+
+    def test_parquet_com_schema_declarado(self):
+        pq = pytest.importorskip("pyarrow.parquet")
+        lotes = [[{"id": 1, "confianca_sugerida": None, "codigo_barra": None, "consultas": None}],
+                 [{"id": 2, "confianca_sugerida": 0.9, "codigo_barra": 789, "consultas": [{"q": "a"}]}]]
+
+        tabela = pq.read_table(io.BytesIO(b"".join(gerar_parquet(
+            iter(lotes), ["id", "confianca_sugerida", "codigo_barra", "consultas"], colunas_json=["consultas"],
+            tipos={"id": "int64", "confianca_sugerida": "float64"}
+        ))))
+
+        assert [str(campo.type) for campo in tabela.schema] == ["int64", "double", "string", "string"]
+        assert tabela.column("confianca_sugerida").to_pylist() == [None, 0.9]
+        assert tabela.column("codigo_barra").to_pylist() == [None, "789"]
+
+    def test_formato_invalido(self):
+        with pytest.raises(FormatoIndisponivelError):
+            validar_formato("excel")
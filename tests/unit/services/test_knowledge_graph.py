@@ -0,0 +1,161 @@
+"""
+Testes unitários para o grafo fiscal em memória da base de conhecimento
+"""
+import pytest
+from pathlib import Path
+import sys
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from database.knowledge_models import (
+    NCMHierarchy, CestCategory, NCMCestMapping, ProdutoExemplo, KnowledgeBaseMetadata
+)
+from services.knowledge_base_service import KnowledgeBaseService
+from services.knowledge_graph import FiscalKnowledgeGraph
+
+
+@pytest.fixture
+def kb_path(tmp_path):
+    """Base de conhecimento mínima com hierarquia de dois níveis"""
+    db_path = tmp_path / "knowledge_base.sqlite"
+    service = KnowledgeBaseService(str(db_path), carregar_grafo=False)
+    service.create_tables()
+
+    with service.get_session() as session:
+        session.add_all([
+            NCMHierarchy(codigo_ncm="3004", descricao_oficial="Medicamentos", nivel_hierarquico=4),
+            NCMHierarchy(codigo_ncm="30049069", descricao_oficial="Outros medicamentos",
+                         nivel_hierarquico=8, codigo_pai="3004"),
+            NCMHierarchy(codigo_ncm="30049099", descricao_oficial="Outros", nivel_hierarquico=8,
+                         codigo_pai="3004"),
+            NCMHierarchy(codigo_ncm="30050000", descricao_oficial="Inativo", nivel_hierarquico=8,
+                         codigo_pai="3005", ativo=False),
+            CestCategory(codigo_cest="13.001.00", descricao_cest="Medicamentos referência"),
+            CestCategory(codigo_cest="13.002.00", descricao_cest="Medicamentos genéricos"),
+            CestCategory(codigo_cest="13.099.00", descricao_cest="CEST inativo", ativo=False),
+            NCMCestMapping(ncm_codigo="3004", cest_codigo="13.001.00", confianca_mapeamento=1.0),
+            NCMCestMapping(ncm_codigo="3004", cest_codigo="13.002.00", confianca_mapeamento=0.5),
+            NCMCestMapping(ncm_codigo="30049069", cest_codigo="13.002.00", confianca_mapeamento=0.9),
+            NCMCestMapping(ncm_codigo="30049069", cest_codigo="13.099.00", confianca_mapeamento=1.0),
+            ProdutoExemplo(ncm_codigo="30049069", descricao_produto="DIPIRONA", qualidade_classificacao=0.7),
+            ProdutoExemplo(ncm_codigo="30049069", descricao_produto="PARACETAMOL", qualidade_classificacao=0.9,
+                           verificado_humano=True),
+            ProdutoExemplo(ncm_codigo="30049069", descricao_produto="INATIVO", ativo=False),
+            KnowledgeBaseMetadata(versao_base="1.0.0"),
+        ])
+        session.commit()
+
+    return str(db_path)
+
+
+class TestFiscalKnowledgeGraph:
+    """Paridade entre o grafo em memória e as consultas SQL"""
+
+    CODIGOS = ["3004", "30049069", "30049099", "30050000", "99999999"]
+
+    def test_mesmos_resultados_que_sqlite(self, kb_path):
+        com_grafo = KnowledgeBaseService(kb_path)
+        sem_grafo = KnowledgeBaseService(kb_path, carregar_grafo=False)
+        assert com_grafo.grafo is not None
+
+        for codigo in self.CODIGOS:
+            assert com_grafo.buscar_ncm_por_codigo(codigo) == sem_grafo.buscar_ncm_por_codigo(codigo)
+            assert com_grafo.buscar_cests_por_ncm(codigo) == sem_grafo.buscar_cests_por_ncm(codigo)
+            assert com_grafo.buscar_cests_hierarquia_ncm(codigo) == sem_grafo.buscar_cests_hierarquia_ncm(codigo)
+            assert com_grafo.buscar_exemplos_por_ncm(codigo) == sem_grafo.buscar_exemplos_por_ncm(codigo)
+
+        assert com_grafo.buscar_ncms_hierarquia("3004") == sem_grafo.buscar_ncms_hierarquia("3004")
+        assert com_grafo.buscar_cest_por_codigo("13.099.00") is None
+
+    def test_cests_herdados_pre_calculados(self, kb_path):
+        service = KnowledgeBaseService(kb_path)
+        cests = service.buscar_cests_hierarquia_ncm("30049069")
+
+        assert [(c["codigo_cest"], c["tipo_relacao"], c["confianca"]) for c in cests] == [
+            ("13.002.00", "DIRETO", 0.9),
+            ("13.001.00", "HERDADO", pytest.approx(0.8)),
+        ]
+
+    def test_consultas_nao_alteram_o_grafo(self, kb_path):
+        service = KnowledgeBaseService(kb_path)
+        primeira = service.buscar_cests_hierarquia_ncm("30049099")
+        primeira[0]["confianca"] = 0.0
+        service.buscar_cests_por_ncm("3004")[0]["confianca"] = 0.0
+
+        # Antes, cada chamada reduzia de novo a confiança dos CESTs herdados em cache
+        assert service.buscar_cests_hierarquia_ncm("30049099")[0]["confianca"] == pytest.approx(0.8)
+        assert service.buscar_cests_por_ncm("3004")[0]["confianca"] == 1.0
+
+    def test_exemplos_ordenados_por_qualidade(self, kb_path):
+        service = KnowledgeBaseService(kb_path)
+        exemplos = service.buscar_exemplos_por_ncm("30049069", limite=1)
+
+        assert [e["descricao_produto"] for e in exemplos] == ["PARACETAMOL"]
+        assert exemplos[0]["verificado_humano"] is True
+
+    def test_hierarquia_com_nivel_ausente(self, tmp_path):
+        service = KnowledgeBaseService(str(tmp_path / "inexistente.sqlite"), carregar_grafo=False)
+        service._grafo = FiscalKnowledgeGraph.from_rows(
+            [("30049099", "Outros", None, 8, "3004"), ("3004", "Medicamentos", None, 4, None),
+             ("300490", "Sem nível", None, None, "3004")],
+            [], [], []
+        )
+
+        assert [n["codigo_ncm"] for n in service.buscar_ncms_hierarquia("3004")] == ["3004", "30049099", "300490"]
+
+    def test_sem_base_usa_sqlite(self, tmp_path):
+        service = KnowledgeBaseService(str(tmp_path / "inexistente.sqlite"))
+
+        assert service.grafo is None
+
+
+class TestSnapshotGrafo:
+    """Testes do snapshot binário e da detecção de snapshot desatualizado"""
+
+    def test_snapshot_carregado_com_mesmos_resultados(self, kb_path):
+        checksum = KnowledgeBaseService(kb_path, carregar_grafo=False).gerar_snapshot()
+
+        com_snapshot = KnowledgeBaseService(kb_path)
+        sem_grafo = KnowledgeBaseService(kb_path, carregar_grafo=False)
+        assert com_snapshot.grafo.checksum == checksum
+
+        for codigo in TestFiscalKnowledgeGraph.CODIGOS:
+            assert com_snapshot.buscar_ncm_por_codigo(codigo) == sem_grafo.buscar_ncm_por_codigo(codigo)
+            assert com_snapshot.buscar_cests_hierarquia_ncm(codigo) == sem_grafo.buscar_cests_hierarquia_ncm(codigo)
+            assert com_snapshot.buscar_exemplos_por_ncm(codigo) == sem_grafo.buscar_exemplos_por_ncm(codigo)
+        assert com_snapshot.buscar_ncms_hierarquia("30") == sem_grafo.buscar_ncms_hierarquia("30")
+
+    def test_snapshot_desatualizado_usa_sqlite(self, kb_path):
+        service = KnowledgeBaseService(kb_path, carregar_grafo=False)
+        service.gerar_snapshot()
+        with service.get_session() as session:
+            session.query(KnowledgeBaseMetadata).update({"checksum_snapshot": "0" * 64})
+            session.commit()
+
+        recarregado = KnowledgeBaseService(kb_path)
+
+        assert recarregado.grafo is not None
+        assert recarregado.grafo.checksum is None  # montado a partir do SQLite
+        assert len(recarregado.buscar_cests_hierarquia_ncm("30049069")) == 2
+
+
+class TestNcmMappingEmLote:
+    """Testes do get_ncm_mapping baseado em consultas em conjunto"""
+
+    def test_mesmo_conteudo_das_consultas_por_ncm(self, kb_path):
+        service = KnowledgeBaseService(kb_path, carregar_grafo=False)
+        mapping = service.get_ncm_mapping()
+
+        assert list(mapping) == ["3004", "30049069", "30049099"]
+        for codigo, entrada in mapping.items():
+            assert entrada["cests_detalhado"] == service.buscar_cests_por_ncm(codigo)
+            assert entrada["exemplos"] == service.buscar_exemplos_por_ncm(codigo, limite=5)
+        assert mapping["30049069"]["cests"] == ["13.002.00"]
+
+    def test_streaming_limita_exemplos_e_nao_usa_cache(self, kb_path):
+        service = KnowledgeBaseService(kb_path, carregar_grafo=False)
+        entradas = dict(service.iter_ncm_mapping(limite_exemplos=1))
+
+        assert [e["descricao_produto"] for e in entradas["30049069"]["exemplos"]] == ["PARACETAMOL"]
+        assert service._cache_cest_mappings == {}
@@ -0,0 +1,189 @@
+"""
+Testes unitários para a fila durável de processamento em lote
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+
+# Adicionar src ao path para importar módulos
+sys.path.append(str(Path(__file__).parent.parent.parent.parent / "src"))
+
+from services.unified_sqlite_service import UnifiedSQLiteService
+from database.unified_sqlite_models import UnifiedBase
+from services.processamento_lote import MotorProcessamento, ProcessadorLote
+from database.fila_processamento import (
+    recuperar_sessoes_orfas, reivindicar_sessao
+)
+
+
+class Queda(BaseException):
+    """Simula a morte do processo worker no meio da sessão"""
+
+
+class ClassificadorFalso:
+    def __init__(self, cair_na_chamada=None, ao_chamar=None):
+        self.chamadas = []
+        self.cair_na_chamada = cair_na_chamada
+        self.ao_chamar = ao_chamar
+
+    def __call__(self, produtos, empresa_id):
+        self.chamadas.append([p['classificacao_id'] for p in produtos])
+        if self.ao_chamar:
+            self.ao_chamar()
+        if len(self.chamadas) == self.cair_na_chamada:
+            raise Queda()
+        return [{**p, 'ncm_classificado': '30049069', 'cest_classificado': None,
+                 'confianca_consolidada': 0.9, 'justificativa': 'teste', 'grupo_id': 1} for p in produtos]
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = UnifiedSQLiteService(str(tmp_path / "unified.db"))
+    with service.engine.begin() as conn:
+        for produto_id in range(1, 10):
+            conn.execute(text(
+                "INSERT INTO classificacoes_revisao (produto_id, descricao_produto, status_revisao) "
+                "VALUES (:p, :d, :s)"
+            ), {"p": produto_id, "d": f"PRODUTO {produto_id}",
+                "s": "APROVADO" if produto_id > 7 else "PENDENTE_REVISAO"})
+    return service
+
+
+@pytest.fixture
+def motor(service):
+    motor = MotorProcessamento(service, workers=0)
+    motor.tamanho_bloco = 3
+    return motor
+
+
+def _processador(service, classificar, worker_id="w1"):
+    return ProcessadorLote(str(service.db_path), worker_id, classificar)
+
+
+def _ncms(service):
+    with service.engine.connect() as conn:
+        return dict(conn.execute(text("SELECT id, ncm_sugerido FROM classificacoes_revisao")).fetchall())
+
+
+class TestSessaoClassificacao:
+    """Blocos com checkpoint, retomada e cancelamento"""
+
+    def test_executa_todos_os_blocos(self, service, motor):
+        sessao = motor.enfileirar_classificacao()
+        assert (sessao['total_itens'], sessao['total_blocos']) == (7, 3)
+
+        classificar = ClassificadorFalso()
+        assert _processador(service, classificar).executar_proxima() == sessao['sessao_id']
+
+        status = motor.status(sessao['sessao_id'])
+        assert status['status'] == 'concluido' and status['progresso'] == 100
+        assert (status['itens_processados'], status['itens_erro'], status['blocos_concluidos']) == (7, 0, 3)
+        assert classificar.chamadas == [[1, 2, 3], [4, 5, 6], [7]]
+        ncms = _ncms(service)
+        assert all(ncms[i] == '30049069' for i in range(1, 8)) and ncms[8] is None
+
+    def test_retoma_apos_queda_sem_repetir_blocos(self, service, motor):
+        sessao_id = motor.enfileirar_classificacao()['sessao_id']
+        classificar = ClassificadorFalso(cair_na_chamada=2)
+        with pytest.raises(Queda):
+            _processador(service, classificar, "morto").executar_proxima()
+
+        status = motor.status(sessao_id)
+        assert status['status'] == 'executando' and status['blocos_concluidos'] == 1
+
+        with service.engine.begin() as conn:
+            assert recuperar_sessoes_orfas(conn, datetime.now() + timedelta(seconds=5), 3) == 1
+        segundo = ClassificadorFalso()
+        _processador(service, segundo, "w2").executar_proxima()
+
+        assert segundo.chamadas == [[4, 5, 6], [7]]
+        status = motor.status(sessao_id)
+        assert (status['status'], status['itens_processados'], status['tentativas']) == ('concluido', 7, 2)
+
+    def test_cancelamento_e_retomada(self, service, motor):
+        pendente = motor.enfileirar_classificacao(limite_produtos=2)['sessao_id']
+        assert motor.cancelar(pendente) == 'cancelado'
+
+        sessao_id = motor.enfileirar_classificacao()['sessao_id']
+        classificar = ClassificadorFalso(ao_chamar=lambda: motor.cancelar(sessao_id))
+        _processador(service, classificar).executar_proxima()
+
+        status = motor.status(sessao_id)
+        assert (status['status'], status['blocos_concluidos']) == ('cancelado', 1)
+
+        assert motor.retomar(sessao_id)
+        _processador(service, ClassificadorFalso()).executar_proxima()
+        assert motor.status(sessao_id)['status'] == 'concluido'
+        assert not motor.retomar(sessao_id)
+
+    def test_limite_por_empresa(self, service, motor):
+        motor.enfileirar_classificacao(empresa_id=1)
+        motor.enfileirar_classificacao(empresa_id=1)
+        outra = motor.enfileirar_classificacao(empresa_id=2)['sessao_id']
+
+        with service.engine.begin() as conn:
+            assert reivindicar_sessao(conn, "a", max_por_empresa=1)['empresa_id'] == '1'
+            assert reivindicar_sessao(conn, "b", max_por_empresa=1)['sessao_id'] == outra
+            assert reivindicar_sessao(conn, "c", max_por_empresa=1) is None
+
+
+# DDL de scripts/create_sessoes_table.py antes da fila durável
+SQL_SESSOES_LAYOUT_ANTERIOR = """
+    CREATE TABLE sessoes_processamento (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sessao_id TEXT UNIQUE NOT NULL,
+        tipo_processo TEXT NOT NULL,
+        status TEXT DEFAULT 'iniciado',
+        progresso INTEGER DEFAULT 0,
+        total_items INTEGER DEFAULT 0,
+        items_processados INTEGER DEFAULT 0,
+        mensagem TEXT,
+        parametros TEXT,
+        data_inicio TEXT NOT NULL,
+        data_atualizacao TEXT NOT NULL,
+        data_conclusao TEXT,
+        erro_detalhes TEXT
+    )
+"""
+
+
+class TestLayoutAnterior:
+    """Bancos criados por scripts/create_sessoes_table.py antes da fila"""
+
+    def test_tabela_anterior_migrada_na_inicializacao(self, tmp_path):
+        import sqlite3
+        db_path = tmp_path / "unified.db"
+        engine = create_engine(f"sqlite:///{db_path}")
+        UnifiedBase.metadata.create_all(engine)
+        engine.dispose()
+        conn = sqlite3.connect(db_path)
+        conn.execute(SQL_SESSOES_LAYOUT_ANTERIOR)
+        conn.execute("CREATE INDEX idx_status ON sessoes_processamento(status)")
+        conn.executemany(
+            "INSERT INTO sessoes_processamento (sessao_id, tipo_processo, status, progresso, total_items, "
+            "items_processados, mensagem, parametros, data_inicio, data_atualizacao, data_conclusao) "
+            "VALUES (?, 'classificacao', ?, ?, 10, ?, ?, '{}', '2024-01-01 10:00:00', '2024-01-01 10:05:00', ?)",
+            [("antiga", "concluido", 100, 10, "Concluído", "2024-01-01 10:05:00"),
+             ("interrompida", "processando", 40, 4, "Processando", None)]
+        )
+        conn.commit()
+        conn.close()
+
+        service = UnifiedSQLiteService(str(db_path))
+        motor = MotorProcessamento(service, workers=0)
+
+        antiga, interrompida = motor.status("antiga"), motor.status("interrompida")
+        assert (antiga['status'], antiga['itens_processados'], antiga['total_itens']) == ('concluido', 10, 10)
+        assert interrompida['status'] == 'erro'
+
+        with service.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO classificacoes_revisao (produto_id, descricao_produto, status_revisao) "
+                "VALUES (1, 'PRODUTO 1', 'PENDENTE_REVISAO')"
+            ))
+        sessao_id = motor.enfileirar_classificacao()['sessao_id']
+        assert _processador(service, ClassificadorFalso()).executar_proxima() == sessao_id
+        assert motor.status(sessao_id)['status'] == 'concluido'